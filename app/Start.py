@@ -1,22 +1,55 @@
-import logging
+"""
+QuickNovel 服务入口
+
+单进程启动: python Start.py
+多进程启动: QUICKNOVEL_WORKERS=4 python Start.py
+也可以使用 gunicorn 启动多个进程，需要为各进程指定同一个指标快照目录:
+QUICKNOVEL_METRICS_DIR=/tmp/quicknovel-metrics gunicorn Start:app -w 4 -k uvicorn.workers.UvicornWorker
+
+多个进程共用同一个 SQLite 文件，写入由数据库的写锁依次排队（见 core/mapper/config/DatabaseConfig.py），
+建表和迁移只由最先启动的进程执行。并发写入较多时可以设置 QUICKNOVEL_DB_PROVIDER=postgres 改用 PostgreSQL。
+每个进程缓存最近读取的小说详情（见 core/mapper/config/NovelCache.py），本进程的写入直接修改缓存；每次读取先查询小说的
+汇总字段和 revision，与缓存不一致（其他进程写入或删除了数据）时重新查询，因此每个请求仍然读到已提交的最新数据。
+数据库中的其他数据不在进程内缓存。
+"""
+import asyncio
+import os
+import tempfile
 from contextlib import asynccontextmanager
 
+from anyio import to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
-from starlette.responses import JSONResponse
 
+from controller.AvatarController import avatar_router
 from controller.ChapterController import chapter_router
 from controller.CharacterController import character_router
 from controller.ConversationController import conversation_router
+from controller.DeletionController import deletion_router
+from controller.JobController import job_router
+from controller.MetricsController import metrics_router
 from controller.NovelController import novel_router
 from controller.SceneController import scene_router
+from controller.TokenUsageController import usage_router
 from controller.WorldController import world_router
 from core.entity.ResponseEntity import error
-from core.mapper.config.DatabaseConfig import db
+from core.mapper.config.CreateDatabase import generate_table_mapping
+from core.mapper.config.ReadReplica import start_replica_heartbeat, stop_replica_heartbeat
+from core.service.DeletionService import start_deletion_worker, stop_deletion_worker
+from core.service.JobService import start_job_runner, stop_job_runner
+from core.service.ProviderService import preload_llm_stack
+from core.utils import AppConfig
+from core.utils.CompressionMiddleware import CompressionMiddleware
 from core.utils.CustomizeException import ApiError
-from core.utils.LogConfig import init_log, get_logger
+from core.utils.ImagePipeline import shutdown_image_pool
+from core.utils.JsonResponse import DtoJSONResponse
+from core.utils.LogConfig import init_log, get_logger, shutdown_log
+from core.utils.Metrics import start_metrics_export, stop_metrics_export
+from core.utils.ReadConsistencyMiddleware import ReadConsistencyMiddleware, WRITE_HEADER
+from core.utils.TraceMiddleware import TraceMiddleware
+from core.utils.UploadLimitMiddleware import UploadLimitMiddleware
 
 logger = get_logger(__name__)
 
@@ -24,13 +57,36 @@ logger = get_logger(__name__)
 async def lifespan(api: FastAPI):
     # 配置日志
     init_log()
+    # 多进程部署时定期写入本进程的指标快照
+    start_metrics_export()
+    # 同步接口在线程池中执行，Pony 为每个线程保持一个数据库连接，线程数即本进程的连接数上限
+    to_thread.current_default_thread_limiter().total_tokens = AppConfig.DATABASE_POOL_SIZE
 
     # 确保在应用启动时生成数据库映射
     logger.info("生成数据库映射...")
-    # Pony ORM 的 generate_mapping 不需要 await
-    db.generate_mapping(create_tables=True)
+    # Pony ORM 的 generate_mapping 不需要 await，结构未变化时跳过建表
+    generate_table_mapping()
+    # 配置了只读副本时定期在主库写入心跳
+    start_replica_heartbeat()
+    # 后台分批执行删除任务，包括上次退出时未完成的任务
+    start_deletion_worker()
+    # 在事件循环中执行后台模型任务，包括上次退出时未完成的任务
+    start_job_runner()
+
+    # 在 lifespan 启动阶段（服务开始接受连接之前）把 LLM 相关模块的导入提交到线程池，不等待其完成，
+    # 因此不阻塞启动；导入完成前到达的对话请求在导入模块时等待其完成
+    if AppConfig.PRELOAD_LLM:
+        asyncio.get_running_loop().run_in_executor(None, preload_llm_stack)
     yield
     logger.info("数据库映射生成完毕。")
+    shutdown_image_pool()
+    # 正在执行的模型任务放回队列
+    await stop_job_runner()
+    # 正在执行的删除任务放回队列，下次启动或由其他进程继续执行
+    stop_deletion_worker()
+    stop_replica_heartbeat()
+    stop_metrics_export()
+    shutdown_log()
 
 app = FastAPI(
     title="QuickNovel API",
@@ -39,6 +95,10 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# 提前拒绝超出大小的上传请求。后添加的中间件在外层，先于 CORS 添加，拒绝的响应同样带有 CORS 响应头，
+# 跨域的前端能读到错误信息
+app.add_middleware(UploadLimitMiddleware, max_bytes=AppConfig.AVATAR_MAX_BYTES)
+
 # 配置CORS
 app.add_middleware(
     CORSMiddleware,
@@ -46,8 +106,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 前端读取写入时间后在之后的请求中带回，见 ReadConsistencyMiddleware；生成被限流时读取 Retry-After 等待重试
+    expose_headers=[WRITE_HEADER, "Retry-After"],
 )
 
+# 配置了只读副本时，保证客户端写入后的读请求能读到自己的写入
+app.add_middleware(ReadConsistencyMiddleware)
+
+# 压缩较大的 JSON 响应，流式响应不压缩
+app.add_middleware(CompressionMiddleware)
+
+# 记录每个请求的链路耗时，放在最外层以便覆盖全部中间件
+app.add_middleware(TraceMiddleware)
+
 # 挂载静态文件目录
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
@@ -57,6 +128,11 @@ app.include_router(novel_router)
 app.include_router(scene_router)
 app.include_router(conversation_router)
 app.include_router(world_router)
+app.include_router(avatar_router)
+app.include_router(metrics_router)
+app.include_router(deletion_router)
+app.include_router(usage_router)
+app.include_router(job_router)
 
 @app.get("/")
 async def root():
@@ -65,12 +141,18 @@ async def root():
 
 @app.exception_handler(ApiError)
 async def api_error_handler(request, exc: ApiError):
-    logging.error(f"api error: {exc.message}, code: {exc.error_code}")
-    return JSONResponse(
+    logger.error("api error: %s, code: %s", exc.message, exc.error_code)
+    return DtoJSONResponse(
         status_code=exc.status_code,
-        content=error(code=exc.status_code, message=exc.message).model_dump()
+        content=error(code=exc.status_code, message=exc.message, data=exc.data),
+        headers=exc.headers
     )
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=9000)
+    if AppConfig.WORKERS > 1:
+        # 工作进程由 uvicorn 重新导入 Start:app，环境变量会传递给工作进程
+        os.environ.setdefault("QUICKNOVEL_METRICS_DIR", tempfile.mkdtemp(prefix="quicknovel-metrics-"))
+        uvicorn.run("Start:app", host=AppConfig.HOST, port=AppConfig.PORT, workers=AppConfig.WORKERS)
+    else:
+        uvicorn.run(app, host=AppConfig.HOST, port=AppConfig.PORT)
@@ -0,0 +1,153 @@
+"""
+测试头像缩略图流水线
+
+1. 上传多张大尺寸头像，统计上传耗时和缩略图生成完成的耗时
+2. 对比列表页加载全部原图和加载缩略图（WebP / JPEG）的传输字节数
+3. 验证协商缓存（304）、相同内容只保存一份、更换头像后旧文件被删除
+
+运行方式（在 app 目录下）: python -m benchmark.AvatarBenchmark --avatars 10 --edge 1600
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import asgi_client, summarize
+
+
+def make_photo(edge: int, seed: int) -> bytes:
+    """
+    生成类似照片的 JPEG：渐变背景加随机色块和噪点，压缩率接近真实照片
+    """
+    from PIL import Image, ImageDraw, ImageFilter
+
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize((edge, edge)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(60):
+        x, y = rng.randrange(edge), rng.randrange(edge)
+        r = rng.randrange(edge // 20, edge // 4)
+        draw.ellipse((x - r, y - r, x + r, y + r),
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    image = image.filter(ImageFilter.GaussianBlur(3))
+    noise = Image.effect_noise((edge, edge), 40).convert("RGB")
+    image = Image.blend(image, noise, 0.15)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=92)
+    return buffer.getvalue()
+
+
+async def get_avatar_name(client, character_id: int) -> str:
+    response = await client.get(f"/api/character/{character_id}")
+    return response.json()["data"]["avatar"]
+
+
+async def wait_variants(client, names, timeout: float = 60) -> float:
+    """
+    轮询直到全部缩略图可用，返回等待的秒数
+    """
+    start = time.perf_counter()
+    remaining = set(names)
+    while remaining and time.perf_counter() - start < timeout:
+        for name in list(remaining):
+            response = await client.get(f"/api/avatar/medium/{name}", headers={"accept": "image/webp"})
+            if "immutable" in response.headers.get("cache-control", ""):
+                remaining.discard(name)
+        if remaining:
+            await asyncio.sleep(0.05)
+    if remaining:
+        raise TimeoutError(f"{timeout} 秒内缩略图没有生成完成")
+    return time.perf_counter() - start
+
+
+async def list_bytes(client, names, variant: str, accept: str) -> int:
+    total = 0
+    for name in names:
+        response = await client.get(f"/api/avatar/{variant}/{name}", headers={"accept": accept})
+        total += len(response.content)
+    return total
+
+
+async def run(avatars: int, edge: int) -> dict:
+    from benchmark.DataGenerator import DataScale, generate
+    from benchmark.FakeLLM import FakeChatModel
+    from core.utils.ImagePipeline import avatar_dir, variant_dir, shutdown_image_pool
+
+    ids = generate(DataScale(chapters=1, scenes=1, turns=1, characters=avatars + 1))
+    photos = [make_photo(edge, seed) for seed in range(avatars)]
+
+    try:
+        async with asgi_client(FakeChatModel("")) as client:
+            upload_samples = []
+            for character_id, photo in zip(ids["characters"], photos):
+                start = time.perf_counter()
+                response = await client.post(f"/api/character/{character_id}/avatar",
+                                             files={"avatar": ("avatar.jpg", photo, "image/jpeg")})
+                upload_samples.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+
+            names = [await get_avatar_name(client, character_id) for character_id in ids["characters"][:avatars]]
+            variants_seconds = await wait_variants(client, names)
+
+            sizes = {
+                "original": await list_bytes(client, names, "original", "image/*"),
+                "small_webp": await list_bytes(client, names, "small", "image/webp"),
+                "small_jpeg": await list_bytes(client, names, "small", "image/jpeg"),
+                "thumb_webp": await list_bytes(client, names, "thumb", "image/webp"),
+            }
+
+            # 协商缓存
+            first = await client.get(f"/api/avatar/small/{names[0]}", headers={"accept": "image/webp"})
+            revalidate = await client.get(f"/api/avatar/small/{names[0]}", headers={
+                "accept": "image/webp", "if-none-match": first.headers["etag"]})
+
+            # 相同内容上传给另一个角色，只保存一份
+            shared_id = ids["characters"][avatars]
+            await client.post(f"/api/character/{shared_id}/avatar",
+                              files={"avatar": ("copy.jpg", photos[0], "image/jpeg")})
+            deduplicated = await get_avatar_name(client, shared_id) == names[0]
+
+            # 第一个角色更换头像后，旧头像仍被共用，不删除；再更换共用角色的头像后删除
+            replacement = make_photo(edge // 2, seed=avatars)
+            await client.post(f"/api/character/{ids['characters'][0]}/avatar",
+                              files={"avatar": ("new.jpg", replacement, "image/jpeg")})
+            kept_while_shared = (avatar_dir() / names[0]).exists()
+            await client.post(f"/api/character/{shared_id}/avatar",
+                              files={"avatar": ("new.jpg", replacement, "image/jpeg")})
+            removed_after_release = not (avatar_dir() / names[0]).exists() and not any(
+                variant_dir(avatar_dir()).glob(f"{Path(names[0]).stem}_*"))
+    finally:
+        shutdown_image_pool(wait=True)
+
+    return {
+        "avatars": avatars,
+        "edge": edge,
+        "upload": summarize(upload_samples),
+        "variants_ready_seconds": round(variants_seconds, 3),
+        "list_view_bytes": sizes,
+        "small_webp_ratio": round(sizes["small_webp"] / sizes["original"], 4),
+        "revalidate_status": revalidate.status_code,
+        "cache_control": first.headers["cache-control"],
+        "deduplicated": deduplicated,
+        "kept_while_shared": kept_while_shared,
+        "removed_after_release": removed_after_release,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="头像缩略图流水线测试")
+    parser.add_argument("--avatars", type=int, default=10, help="上传的头像数量")
+    parser.add_argument("--edge", type=int, default=1600, help="原图边长（像素）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-avatar-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "avatar.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "WARNING")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        print(json.dumps(asyncio.run(run(args.avatars, args.edge)), ensure_ascii=False, indent=2))
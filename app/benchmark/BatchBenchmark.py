@@ -0,0 +1,110 @@
+"""
+批量创建接口与逐条 POST 的吞吐对比
+
+1. 吞吐：章节、情景、详细世界观、性格特征分别逐条 POST 和一次批量 POST 同样数量的数据，
+   统计耗时、每秒写入条数和批量接口的加速倍数。详细世界观和性格特征没有单条创建的接口，
+   逐条 POST 时每次发送只有一条数据的批量请求
+2. 正确性：批量写入后小说的章节数、情景数汇总字段与写入数量一致；
+   批量数据中有一条无效时返回 400，错误定位到该条数据的下标，整批都没有写入
+
+请求通过进程内的 ASGI 客户端发送，不包含网络往返，实际部署中逐条 POST 的开销更大。
+
+运行方式（在 app 目录下）: python -m benchmark.BatchBenchmark --chapters 40 --scenes 300 --details 100 --traits 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+
+async def timed_requests(client, url: str, payloads: list) -> float:
+    start = time.perf_counter()
+    for payload in payloads:
+        response = await client.post(url, json=payload)
+        assert response.status_code == 200, response.text
+    return time.perf_counter() - start
+
+
+async def compare(client, url: str, payloads: list, single: bool = True) -> dict:
+    """
+    single 为 False 时没有单条创建的接口，逐条 POST 使用只有一条数据的批量请求
+    """
+    if single:
+        sequential = await timed_requests(client, url, payloads)
+    else:
+        sequential = await timed_requests(client, url + "batch", [[payload] for payload in payloads])
+    batch = await timed_requests(client, url + "batch", [payloads])
+    return {
+        "items": len(payloads),
+        "sequential_seconds": round(sequential, 4),
+        "batch_seconds": round(batch, 4),
+        "sequential_items_per_second": round(len(payloads) / sequential, 1),
+        "batch_items_per_second": round(len(payloads) / batch, 1),
+        "speedup": round(sequential / batch, 1),
+    }
+
+
+async def summary(client, novel_id: int) -> dict:
+    return (await client.get(f"/api/novel/{novel_id}/summary")).json()["data"]
+
+
+async def run(ids: dict, args) -> dict:
+    from benchmark.FakeLLM import FakeChatModel
+    from benchmark.BenchmarkRunner import asgi_client
+
+    novel_id, chapter_id = ids["novels"][0], ids["chapters"][0]
+    world_id, character_id = ids["worlds"][0], ids["characters"][0]
+    result = {}
+
+    async with asgi_client(FakeChatModel("")) as client:
+        before = await summary(client, novel_id)
+        result["chapter"] = await compare(client, "/api/chapter/", [
+            {"chapter_title": f"章节{i}", "chapter_number": None, "novel": novel_id} for i in range(args.chapters)])
+        result["scene"] = await compare(client, "/api/scene/", [
+            {"scene_name": f"情景{i}", "chapter": chapter_id} for i in range(args.scenes)])
+        result["world_detail"] = await compare(client, "/api/world/detail/", [
+            {"world_detail_name": f"设定{i}", "world_detail_desc": "描述", "world": world_id}
+            for i in range(args.details)], single=False)
+        result["trait"] = await compare(client, "/api/character/trait/", [
+            {"label": f"性格{i}", "description": "描述", "character": character_id} for i in range(args.traits)],
+            single=False)
+        after = await summary(client, novel_id)
+
+        # 逐条和批量各写入一次，汇总字段应增加两倍的数量
+        result["counters_consistent"] = (
+                after["chapter_count"] - before["chapter_count"] == 2 * args.chapters
+                and after["scene_count"] - before["scene_count"] == 2 * args.scenes)
+
+        # 第 3 条引用了不存在的章节，整批都不写入
+        invalid = [{"scene_name": f"无效批次{i}", "chapter": chapter_id} for i in range(5)]
+        invalid[3]["chapter"] = -1
+        response = await client.post("/api/scene/batch", json=invalid)
+        items = response.json()["data"]["items"]
+        result["invalid_batch_rejected"] = (
+                response.status_code == 400
+                and [item["index"] for item in items if item["error"]] == [3]
+                and (await summary(client, novel_id))["scene_count"] == after["scene_count"])
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="批量创建接口与逐条 POST 的吞吐对比")
+    parser.add_argument("--chapters", type=int, default=40)
+    parser.add_argument("--scenes", type=int, default=300)
+    parser.add_argument("--details", type=int, default=100)
+    parser.add_argument("--traits", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-batch-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "batch.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "WARNING")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        # 设置数据库路径之后才能导入 core 下的模块
+        from benchmark.DataGenerator import DataScale, generate
+
+        data_ids = generate(DataScale(chapters=2, scenes=2, turns=2))
+        print(json.dumps(asyncio.run(run(data_ids, args)), ensure_ascii=False, indent=2))
@@ -0,0 +1,518 @@
+"""
+QuickNovel 压测工具
+
+在临时目录中生成指定规模的合成数据，然后分别统计每个 mapper 方法、每个 HTTP 接口（进程内 ASGI 调用）
+以及 prompt 构建流程（使用假模型）的耗时，结果以 JSON 格式写入 benchmark/results，便于不同提交之间对比。
+
+运行方式（在 app 目录下）:
+python -m benchmark.BenchmarkRunner --chapters 10 --scenes 5 --turns 20 --repeat 20
+python -m benchmark.BenchmarkRunner --compare benchmark/results/旧结果.json benchmark/results/新结果.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+RESULT_DIR = BENCHMARK_DIR / "results"
+
+# 一个 1x1 的 PNG 图片，用于上传头像
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000100e221bc330000000049454e44ae426082"
+)
+
+
+class BenchmarkCase:
+
+    def __init__(self, group: str, name: str, func: Callable, setup: Callable = None, repeat: int = None):
+        self.group = group
+        self.name = name
+        self.func = func
+        # setup 的返回值作为 func 的参数，不计入耗时
+        self.setup = setup
+        self.repeat = repeat
+
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    ordered = sorted(samples)
+    p95_index = min(len(ordered) - 1, int(round(len(ordered) * 0.95)) - 1)
+    return {
+        "repeat": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 4),
+        "median_ms": round(statistics.median(samples) * 1000, 4),
+        "p95_ms": round(ordered[max(p95_index, 0)] * 1000, 4),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+    }
+
+
+async def run_case(case: BenchmarkCase, repeat: int) -> Dict[str, Any]:
+    samples = []
+    try:
+        for _ in range(case.repeat or repeat):
+            args = case.setup() if case.setup else ()
+            if asyncio.iscoroutine(args):
+                args = await args
+            start = time.perf_counter()
+            result = case.func(*args)
+            if asyncio.iscoroutine(result):
+                await result
+            samples.append(time.perf_counter() - start)
+    except Exception as e:
+        return {"group": case.group, "name": case.name, "error": f"{type(e).__name__}: {e}"}
+    return {"group": case.group, "name": case.name, **summarize(samples)}
+
+
+def mapper_cases(ids: Dict[str, List[int]]) -> List[BenchmarkCase]:
+    from core.entity.dto.ChapterDto import CreateChapterDto
+    from core.entity.dto.CharacterDto import CreateCharacterDto, PatchCharacterDto, TraitDto, SpeakingDto, \
+        DistinctiveDto, CreateTraitDto
+    from core.entity.dto.ConversationDto import CreateConversationDto
+    from core.entity.dto.NovelDto import CreateNovelDto, CreateCharacter2NovelDto
+    from core.entity.dto.SceneDto import CreateSceneDto
+    from core.entity.dto.WorldDto import CreateWorldDto, CreateWorldDetailDto
+    from core.mapper.ChapterMapper import ChapterMapper
+    from core.mapper.CharacterMapper import CharacterMapper
+    from core.mapper.CharacterNovelMapper import CharacterNovelMapper
+    from core.mapper.ConversationMapper import ConversationMapper
+    from core.mapper.DeletionMapper import CHARACTER_JOB, DeletionMapper
+    from core.entity.dto.LlmJobDto import CreateLlmJobDto
+    from core.mapper.LlmJobMapper import LlmJobMapper
+    from core.mapper.NovelMapper import NovelMapper
+    from core.mapper.config.NovelCache import clear_novel_cache
+    from core.entity.dto.TokenUsageDto import CreateTokenUsageDto
+    from core.mapper.SceneMapper import SceneMapper
+    from core.mapper.TokenUsageMapper import TokenUsageMapper
+    from core.mapper.WorldDetailMapper import WorldDetailMapper
+    from core.mapper.WorldMapper import WorldMapper
+
+    now = datetime.now()
+    novel_id = ids["novels"][0]
+    chapter_id = ids["chapters"][0]
+    scene_id = ids["scenes"][0]
+    character_id = ids["characters"][0]
+    world_id = ids["worlds"][0]
+
+    novel_mapper = NovelMapper()
+    character_mapper = CharacterMapper()
+    character_novel_mapper = CharacterNovelMapper(character_mapper, novel_mapper)
+    chapter_mapper = ChapterMapper()
+    scene_mapper = SceneMapper()
+    conversation_mapper = ConversationMapper()
+    world_mapper = WorldMapper()
+    world_detail_mapper = WorldDetailMapper()
+    deletion_mapper = DeletionMapper()
+    usage_mapper = TokenUsageMapper()
+    job_mapper = LlmJobMapper()
+
+    character = CreateCharacterDto(
+        name="压测角色",
+        description="描述",
+        background_story="背景",
+        trait=[TraitDto(label="性格", description="描述")] * 5,
+        speak=[SpeakingDto(role="user", content="你好", reply="你好")] * 5,
+        distinctive=[DistinctiveDto(name="特征", content="内容")] * 5,
+    )
+
+    def create_character_for_delete():
+        return (character_mapper.create_character(character),)
+
+    def claim_character_deletion():
+        deletion_mapper.create_job(CHARACTER_JOB, character_mapper.create_character(character))
+        return (deletion_mapper.claim_next_job("benchmark", 60),)
+
+    def create_llm_job():
+        job_mapper.create_job(CreateLlmJobDto(kind="benchmark", params={"chapter_id": chapter_id}, novel_id=novel_id))
+        return ()
+
+    def claim_llm_job():
+        create_llm_job()
+        return (job_mapper.claim_next_job("benchmark", 60).job_id,)
+
+    def create_conversation_for_delete():
+        return (conversation_mapper.create_conversation(
+            CreateConversationDto(role="user", content="压测对话", create_time=now, scene=scene_id)),)
+
+    def clear_cache():
+        clear_novel_cache()
+        return ()
+
+    def create_novel_for_connect():
+        return (novel_mapper.create_novel(CreateNovelDto(novel_name="压测小说", novel_desc="描述", create_time=now)),)
+
+    def connect_novel_for_disconnect():
+        new_novel_id = create_novel_for_connect()[0]
+        character_novel_mapper.connect_character_2_novel(
+            CreateCharacter2NovelDto(novel_id=new_novel_id, character_id=character_id))
+        return new_novel_id, character_id
+
+    def create_world_detail_for_delete():
+        return (world_detail_mapper.create_world_detail(
+            CreateWorldDetailDto(world_detail_name="设定", world_detail_desc="描述", world=world_id)),)
+
+    # 先执行只读用例，避免写入的数据影响读取耗时
+    return [
+        BenchmarkCase("mapper", "NovelMapper.get_all_novels", novel_mapper.get_all_novels),
+        # 每次先清空小说详情缓存，统计完整读取的耗时；cached 为缓存命中时的耗时
+        BenchmarkCase("mapper", "NovelMapper.get_novel_by_id", lambda: novel_mapper.get_novel_by_id(novel_id),
+                      setup=clear_cache),
+        BenchmarkCase("mapper", "NovelMapper.get_novel_by_id.cached", lambda: novel_mapper.get_novel_by_id(novel_id)),
+        BenchmarkCase("mapper", "NovelMapper.get_novel_summary", lambda: novel_mapper.get_novel_summary(novel_id)),
+        BenchmarkCase("mapper", "ConversationMapper.get_conversation_by_scene_id",
+                      lambda: conversation_mapper.get_conversation_by_scene_id(scene_id)),
+        BenchmarkCase("mapper", "CharacterMapper.get_all_characters", character_mapper.get_all_characters),
+        BenchmarkCase("mapper", "CharacterMapper.select_character_by_id",
+                      lambda: character_mapper.select_character_by_id(character_id)),
+        BenchmarkCase("mapper", "CharacterNovelMapper.get_connect_characters_by_novel_id",
+                      lambda: character_novel_mapper.get_connect_characters_by_novel_id(novel_id)),
+        BenchmarkCase("mapper", "CharacterNovelMapper.get_connect_characters_by_novel_id.filtered",
+                      lambda: character_novel_mapper.get_connect_characters_by_novel_id(novel_id, [character_id])),
+        BenchmarkCase("mapper", "SceneMapper.get_scene_context",
+                      lambda: scene_mapper.get_scene_context(scene_id, 3, 8, 100)),
+        BenchmarkCase("mapper", "CharacterNovelMapper.get_character_memories",
+                      lambda: character_novel_mapper.get_character_memories(novel_id)),
+        BenchmarkCase("mapper", "WorldMapper.get_all_worlds", world_mapper.get_all_worlds),
+        BenchmarkCase("mapper", "WorldMapper.get_world_by_id", lambda: world_mapper.get_world_by_id(world_id)),
+        BenchmarkCase("mapper", "TokenUsageMapper.get_novel_usage", lambda: usage_mapper.get_novel_usage(novel_id)),
+        BenchmarkCase("mapper", "TokenUsageMapper.get_scene_usage", lambda: usage_mapper.get_scene_usage(scene_id)),
+        BenchmarkCase("mapper", "TokenUsageMapper.get_character_usage",
+                      lambda: usage_mapper.get_character_usage(character_id)),
+        BenchmarkCase("mapper", "LlmJobMapper.get_jobs_by_novel_id", lambda: job_mapper.get_jobs_by_novel_id(novel_id)),
+        BenchmarkCase("mapper", "NovelMapper.create_novel", lambda: novel_mapper.create_novel(
+            CreateNovelDto(novel_name="压测小说", novel_desc="描述", create_time=now))),
+        BenchmarkCase("mapper", "ChapterMapper.create_chapter", lambda: chapter_mapper.create_chapter(
+            CreateChapterDto(chapter_title="压测章节", chapter_number=999, create_time=now, novel=novel_id))),
+        BenchmarkCase("mapper", "ChapterMapper.create_chapter_auto_number", lambda: chapter_mapper.create_chapter(
+            CreateChapterDto(chapter_title="压测章节", chapter_number=None, create_time=now, novel=novel_id))),
+        BenchmarkCase("mapper", "SceneMapper.create_scene", lambda: scene_mapper.create_scene(
+            CreateSceneDto(scene_name="压测情景", create_time=now, chapter=chapter_id))),
+        BenchmarkCase("mapper", "ConversationMapper.create_conversation",
+                      lambda: conversation_mapper.create_conversation(
+                          CreateConversationDto(role="user", content="压测对话", create_time=now, scene=scene_id))),
+        BenchmarkCase("mapper", "CharacterMapper.create_character",
+                      lambda: character_mapper.create_character(character)),
+        BenchmarkCase("mapper", "CharacterMapper.update_character",
+                      lambda: character_mapper.update_character(
+                          character_id, PatchCharacterDto(**character.model_dump()))),
+        BenchmarkCase("mapper", "CharacterMapper.update_avatar",
+                      lambda: character_mapper.update_avatar(character_id, "benchmark.png")),
+        BenchmarkCase("mapper", "DeletionMapper.create_job",
+                      lambda new_character_id: deletion_mapper.create_job(CHARACTER_JOB, new_character_id),
+                      setup=create_character_for_delete),
+        BenchmarkCase("mapper", "DeletionMapper.delete_batch",
+                      lambda job_id: deletion_mapper.delete_batch(job_id, "benchmark", 500, 60),
+                      setup=claim_character_deletion),
+        BenchmarkCase("mapper", "ConversationMapper.delete_conversation",
+                      conversation_mapper.delete_conversation, setup=create_conversation_for_delete),
+        BenchmarkCase("mapper", "CharacterNovelMapper.connect_character_2_novel",
+                      lambda new_novel_id: character_novel_mapper.connect_character_2_novel(
+                          CreateCharacter2NovelDto(novel_id=new_novel_id, character_id=character_id)),
+                      setup=create_novel_for_connect),
+        BenchmarkCase("mapper", "CharacterNovelMapper.disconnect_character_from_novel",
+                      character_novel_mapper.disconnect_character_from_novel, setup=connect_novel_for_disconnect),
+        BenchmarkCase("mapper", "WorldMapper.create_world", lambda: world_mapper.create_world(
+            CreateWorldDto(world_name="压测世界", world_desc="描述", create_time=now))),
+        BenchmarkCase("mapper", "WorldDetailMapper.create_world_detail",
+                      lambda: world_detail_mapper.create_world_detail(
+                          CreateWorldDetailDto(world_detail_name="设定", world_detail_desc="描述", world=world_id))),
+        BenchmarkCase("mapper", "WorldDetailMapper.delete_world_detail", world_detail_mapper.delete_world_detail,
+                      setup=create_world_detail_for_delete),
+        # 批量写入 5 条，校验引用只查询一次，汇总字段按上级合并更新
+        BenchmarkCase("mapper", "ChapterMapper.create_chapters", lambda: chapter_mapper.create_chapters(
+            [CreateChapterDto(chapter_title="压测章节", chapter_number=None, create_time=now, novel=novel_id)] * 5)),
+        BenchmarkCase("mapper", "SceneMapper.create_scenes", lambda: scene_mapper.create_scenes(
+            [CreateSceneDto(scene_name="压测情景", create_time=now, chapter=chapter_id)] * 5)),
+        BenchmarkCase("mapper", "ConversationMapper.create_conversations",
+                      lambda: conversation_mapper.create_conversations(
+                          [CreateConversationDto(role="assistant", content="压测对话", create_time=now,
+                                                 scene=scene_id)] * 5)),
+        BenchmarkCase("mapper", "WorldDetailMapper.create_world_details",
+                      lambda: world_detail_mapper.create_world_details(
+                          [CreateWorldDetailDto(world_detail_name="设定", world_detail_desc="描述", world=world_id)] * 5)),
+        BenchmarkCase("mapper", "CharacterMapper.create_traits", lambda: character_mapper.create_traits(
+            [CreateTraitDto(label="性格", description="描述", character=character_id)] * 5)),
+        BenchmarkCase("mapper", "CharacterNovelMapper.reserve_memory_consolidation",
+                      lambda: character_novel_mapper.reserve_memory_consolidation(novel_id, 40)),
+        BenchmarkCase("mapper", "CharacterNovelMapper.save_character_memory",
+                      lambda: character_novel_mapper.save_character_memory(novel_id, character_id, "压测记忆", "压测状态",
+                                                                           0)),
+        BenchmarkCase("mapper", "LlmJobMapper.create_job", lambda: job_mapper.create_job(
+            CreateLlmJobDto(kind="benchmark", params={"chapter_id": chapter_id}, novel_id=novel_id))),
+        BenchmarkCase("mapper", "LlmJobMapper.claim_next_job", lambda: job_mapper.claim_next_job("benchmark", 60),
+                      setup=create_llm_job),
+        BenchmarkCase("mapper", "LlmJobMapper.get_job", job_mapper.get_job, setup=claim_llm_job),
+        BenchmarkCase("mapper", "LlmJobMapper.update_progress",
+                      lambda job_id: job_mapper.update_progress(job_id, "benchmark", 0.5, "压测", 60),
+                      setup=claim_llm_job),
+        BenchmarkCase("mapper", "LlmJobMapper.complete_job",
+                      lambda job_id: job_mapper.complete_job(job_id, "benchmark", {"summary": "压测"}),
+                      setup=claim_llm_job),
+        BenchmarkCase("mapper", "LlmJobMapper.fail_job",
+                      lambda job_id: job_mapper.fail_job(job_id, "benchmark", "压测", 3, 0), setup=claim_llm_job),
+        BenchmarkCase("mapper", "TokenUsageMapper.record_usage", lambda: usage_mapper.record_usage(
+            CreateTokenUsageDto(novel_id=novel_id, scene_id=scene_id, character_id=character_id, model="fake",
+                                prompt_tokens=1000, completion_tokens=100, create_time=now))),
+    ]
+
+
+def build_provider_service(fake_llm):
+    from core.mapper.CharacterMapper import CharacterMapper
+    from core.mapper.CharacterNovelMapper import CharacterNovelMapper
+    from core.mapper.NovelMapper import NovelMapper
+    from core.mapper.SceneMapper import SceneMapper
+    from core.mapper.TokenUsageMapper import TokenUsageMapper
+    from core.service.ProviderService import ProviderService
+
+    return ProviderService(
+        novel_mapper=NovelMapper(),
+        character_novel_mapper=CharacterNovelMapper(
+            character_mapper=CharacterMapper(),
+            novel_mapper=NovelMapper(),
+        ),
+        model="fake",
+        streaming=True,
+        llm=fake_llm,
+        usage_mapper=TokenUsageMapper(),
+        scene_mapper=SceneMapper())
+
+
+def prompt_cases(ids: Dict[str, List[int]]) -> List[BenchmarkCase]:
+    from benchmark.FakeLLM import FakeChatModel
+
+    novel_id = ids["novels"][0]
+    provider_service = build_provider_service(FakeChatModel(chunk_size=1000))
+
+    async def full_generation():
+        async for _ in provider_service.generate_llm_response("继续", novel_id):
+            pass
+
+    return [
+        BenchmarkCase("prompt", "ProviderService.generate_scene_messages",
+                      lambda: provider_service.generate_scene_messages(novel_id)),
+        BenchmarkCase("prompt", "ProviderService.generate_character_messages",
+                      lambda: provider_service.generate_character_messages(novel_id)),
+        BenchmarkCase("prompt", "ProviderService.generate_llm_response", full_generation),
+    ]
+
+
+def http_cases(ids: Dict[str, List[int]], client) -> List[BenchmarkCase]:
+    novel_id = ids["novels"][0]
+    chapter_id = ids["chapters"][0]
+    scene_id = ids["scenes"][0]
+    character_id = ids["characters"][0]
+    world_id = ids["worlds"][0]
+
+    character = {
+        "name": "压测角色",
+        "description": "描述",
+        "background_story": "背景",
+        "trait": [{"label": "性格", "description": "描述"}] * 5,
+        "speak": [{"role": "user", "content": "你好", "reply": "你好"}] * 5,
+        "distinctive": [{"name": "特征", "content": "内容"}] * 5,
+    }
+
+    def request(method: str, url: str, **kwargs):
+        async def call(*args):
+            target = url.format(*args)
+            response = await client.request(method, target, **kwargs)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{method} {target} 返回 {response.status_code}: {response.text[:200]}")
+            return response
+
+        return call
+
+    async def create_character_for_delete():
+        response = await client.post("/api/character/", json=character)
+        # 创建接口只在 message 中返回 id
+        return (int(response.json()["message"].rsplit("为", 1)[-1]),)
+
+    return [
+        BenchmarkCase("http", "GET /api/novel/", request("GET", "/api/novel/")),
+        BenchmarkCase("http", "GET /api/novel/{novel_id}", request("GET", f"/api/novel/{novel_id}")),
+        BenchmarkCase("http", "GET /api/novel/{novel_id}/summary", request("GET", f"/api/novel/{novel_id}/summary")),
+        BenchmarkCase("http", "POST /api/novel/", request("POST", "/api/novel/", json={
+            "novel_name": "压测小说", "novel_desc": "描述", "create_time": datetime.now().isoformat()})),
+        BenchmarkCase("http", "POST /api/chapter/", request("POST", "/api/chapter/", json={
+            "chapter_title": "压测章节", "chapter_number": 999, "novel": novel_id})),
+        BenchmarkCase("http", "POST /api/scene/", request("POST", "/api/scene/", json={
+            "scene_name": "压测情景", "chapter": chapter_id})),
+        BenchmarkCase("http", "GET /api/character/", request("GET", "/api/character/")),
+        BenchmarkCase("http", "GET /api/character/{character_id}",
+                      request("GET", f"/api/character/{character_id}")),
+        BenchmarkCase("http", "POST /api/character/", request("POST", "/api/character/", json=character)),
+        BenchmarkCase("http", "POST /api/character/{character_id}",
+                      request("POST", f"/api/character/{character_id}", json={"id": character_id, **character})),
+        BenchmarkCase("http", "POST /api/character/{character_id}/avatar",
+                      request("POST", f"/api/character/{character_id}/avatar",
+                              files={"avatar": ("avatar.png", PNG_BYTES, "image/png")})),
+        BenchmarkCase("http", "DELETE /api/character/{character_id}", request("DELETE", "/api/character/{}"),
+                      setup=create_character_for_delete),
+        BenchmarkCase("http", "GET /api/world/", request("GET", "/api/world/")),
+        BenchmarkCase("http", "GET /api/world/{world_id}", request("GET", f"/api/world/{world_id}")),
+        BenchmarkCase("http", "POST /api/world/", request("POST", "/api/world/", json={
+            "world_name": "压测世界", "world_desc": "描述"})),
+        BenchmarkCase("http", "GET /api/conversation/{scene_id}", request("GET", f"/api/conversation/{scene_id}")),
+        BenchmarkCase("http", "POST /api/conversation/", request("POST", "/api/conversation/", json={
+            "role": "user", "content": "继续", "scene": scene_id, "novel": novel_id}), repeat=5),
+        BenchmarkCase("http", "GET /metrics", request("GET", "/metrics")),
+    ]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+async def run_cases(cases: List[BenchmarkCase], repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for case in cases:
+        result = await run_case(case, repeat)
+        results.append(result)
+        if "error" in result:
+            print(f"[{case.group}] {case.name}: 失败 {result['error']}")
+        else:
+            print(f"[{case.group}] {case.name}: median {result['median_ms']} ms, p95 {result['p95_ms']} ms")
+    return results
+
+
+def asgi_client(fake_llm, scheduler=None):
+    """
+    创建进程内的 ASGI 客户端，对话接口使用假模型。scheduler 为空时对话接口不限流
+    """
+    import httpx
+
+    import Start
+    from controller.ConversationController import get_conversation_service
+    from core.mapper.ConversationMapper import ConversationMapper
+    from core.service.ConversationService import ConversationService
+
+    Start.app.dependency_overrides[get_conversation_service] = lambda: ConversationService(
+        ConversationMapper(), build_provider_service(fake_llm), scheduler)
+
+    transport = httpx.ASGITransport(app=Start.app)
+    return httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60)
+
+
+async def run_http(ids: Dict[str, List[int]], repeat: int) -> List[Dict[str, Any]]:
+    from benchmark.FakeLLM import FakeChatModel
+
+    async with asgi_client(FakeChatModel(chunk_size=1000)) as client:
+        return await run_cases(http_cases(ids, client), repeat)
+
+
+def run(scale, repeat: int, groups: List[str]) -> Dict[str, Any]:
+    from benchmark.DataGenerator import generate
+    from core.utils.LogConfig import init_log, shutdown_log
+
+    # 压测时只输出警告，避免日志影响耗时
+    init_log(level="WARNING", module_levels="")
+
+    start = time.perf_counter()
+    ids = generate(scale)
+    generate_seconds = time.perf_counter() - start
+    print(f"生成数据耗时 {generate_seconds:.2f} 秒")
+
+    results = []
+    if "prompt" in groups:
+        results.extend(asyncio.run(run_cases(prompt_cases(ids), repeat)))
+    if "http" in groups:
+        results.extend(asyncio.run(run_http(ids, repeat)))
+    # 各分组内都先执行只读用例，写入的少量数据相对于生成的规模可以忽略
+    if "mapper" in groups:
+        results.extend(asyncio.run(run_cases(mapper_cases(ids), repeat)))
+
+    shutdown_log()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "scale": scale.model_dump(),
+            "repeat": repeat,
+            "generate_seconds": round(generate_seconds, 3),
+        },
+        "results": results,
+    }
+
+
+def compare(base: Dict[str, Any], current: Dict[str, Any], threshold: float) -> bool:
+    """
+    按中位数对比两次压测结果，返回是否存在超过阈值的退化
+    """
+    base_results = {(r["group"], r["name"]): r for r in base["results"] if "error" not in r}
+    regressed = False
+    print(f"对比 {base['meta']['commit']} -> {current['meta']['commit']}")
+    for result in current["results"]:
+        key = (result["group"], result["name"])
+        if "error" in result or key not in base_results:
+            continue
+        before = base_results[key]["median_ms"]
+        after = result["median_ms"]
+        ratio = after / before if before else float("inf")
+        mark = ""
+        if ratio > threshold:
+            mark = "  <-- 退化"
+            regressed = True
+        print(f"[{key[0]}] {key[1]}: {before} ms -> {after} ms ({ratio:.2f}x){mark}")
+    return regressed
+
+
+def main():
+    from benchmark.DataGenerator import DataScale
+
+    parser = argparse.ArgumentParser(description="QuickNovel 压测")
+    for field, info in DataScale.model_fields.items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=int, default=info.default)
+    parser.add_argument("--repeat", type=int, default=20, help="每个用例的执行次数")
+    parser.add_argument("--groups", default="mapper,http,prompt", help="要执行的用例分组，逗号分隔")
+    parser.add_argument("--output", default=None, help="结果文件路径，默认写入 benchmark/results")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "CURRENT"), help="对比两个结果文件")
+    parser.add_argument("--threshold", type=float, default=1.2, help="判定为退化的耗时倍数")
+    args = parser.parse_args()
+
+    if args.compare:
+        base, current = (json.loads(Path(path).read_text(encoding="utf-8")) for path in args.compare)
+        sys.exit(1 if compare(base, current, args.threshold) else 0)
+
+    scale = DataScale(**{field: getattr(args, field) for field in DataScale.model_fields})
+    output = Path(args.output) if args.output else None
+
+    # 在临时目录中运行，数据库与上传文件都不会影响正式数据
+    with tempfile.TemporaryDirectory(prefix="quicknovel-benchmark-") as workdir:
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        report = run(scale, args.repeat, args.groups.split(","))
+
+    if output is None:
+        RESULT_DIR.mkdir(parents=True, exist_ok=True)
+        output = RESULT_DIR / f"{datetime.now():%Y%m%d-%H%M%S}_{report['meta']['commit']}.json"
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"结果已写入 {output}")
+
+
+if __name__ == '__main__':
+    # 必须在导入任何 core 模块之前指定压测数据库
+    scratch_db = None
+    if "QUICKNOVEL_DB_PATH" not in os.environ:
+        scratch_db = Path(tempfile.gettempdir()) / f"quicknovel-benchmark-{os.getpid()}.sqlite"
+        os.environ["QUICKNOVEL_DB_PATH"] = str(scratch_db)
+    try:
+        main()
+    finally:
+        if scratch_db is not None:
+            scratch_db.unlink(missing_ok=True)
@@ -0,0 +1,188 @@
+"""
+批量起草章节（core/service/ChapterDraftJob.py）的耗时，模型使用固定延迟的假模型
+
+1. 耗时：同一规模的章节分别以不同的并发数起草，对比实际耗时与逐个生成的耗时（各次调用耗时之和）
+2. 写入：全部草稿通过一次批量写入保存为对话，每个情景一条，汇总字段同步更新；已有对话的情景跳过
+3. 前缀：各情景的 prompt 除最后一条消息外完全相同
+4. 失败：第一次执行时有一个情景调用失败，不写入任何对话，重试后每个情景仍只有一条草稿
+
+任意一项检查不满足时以非零状态码退出。运行方式（在 app 目录下）: python -m benchmark.ChapterDraftBenchmark
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import build_provider_service
+
+
+class FlakyChatModel:
+    """
+    前 failures 次调用失败的假模型
+    """
+
+    def __init__(self, model, failures: int):
+        self.model = model
+        self.failures = failures
+        self.calls = model.calls
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        if self.failures > 0:
+            self.failures -= 1
+            self.calls.append(list(messages))
+            raise RuntimeError("模型调用失败")
+        return await self.model.ainvoke(messages, *args, **kwargs)
+
+
+class CountingConversationMapper:
+    """
+    记录批量写入的次数
+    """
+
+    def __init__(self):
+        from core.mapper.ConversationMapper import ConversationMapper
+
+        self.mapper = ConversationMapper()
+        self.batches = []
+
+    def create_conversations(self, conversations):
+        self.batches.append(len(conversations))
+        return self.mapper.create_conversations(conversations)
+
+
+def chapter_state(novel_id: int, chapter_id: int) -> dict:
+    from core.mapper.NovelMapper import NovelMapper
+
+    novel = NovelMapper().get_novel_by_id(novel_id)
+    chapter = next(c for c in novel.chapter if c.chapter_id == chapter_id)
+    return {scene.scene_id: len(scene.conversation or []) for scene in chapter.scene}
+
+
+def chapter_counter(chapter_id: int) -> int:
+    from pony.orm import db_session
+
+    from core.entity.po.NovelEntity import ChapterEntity
+
+    with db_session:
+        return ChapterEntity[chapter_id].conversation_count
+
+
+async def draft(llm, novel_id: int, chapter_id: int, concurrency: int, mapper: CountingConversationMapper):
+    from core.entity.dto.LlmJobDto import CreateLlmJobDto
+    from core.mapper.LlmJobMapper import LlmJobMapper
+    from core.mapper.NovelMapper import NovelMapper
+    from core.service.ChapterDraftJob import CHAPTER_DRAFT, ChapterDraftJob
+    from core.service.JobService import JobService, register_job_handler
+    from core.utils import AppConfig
+
+    AppConfig.CHAPTER_DRAFT_CONCURRENCY = concurrency
+    register_job_handler(CHAPTER_DRAFT, lambda: ChapterDraftJob(NovelMapper(), mapper, build_provider_service(llm)))
+    job_mapper = LlmJobMapper()
+    job_id = JobService(job_mapper).create_job(
+        CreateLlmJobDto(kind=CHAPTER_DRAFT, novel_id=novel_id, params={"chapter_id": chapter_id})).data.job_id
+    start = time.perf_counter()
+    while time.perf_counter() - start < 60:
+        job = job_mapper.get_job(job_id)
+        if job.status in ("done", "failed"):
+            return job
+        await asyncio.sleep(0.01)
+    return job_mapper.get_job(job_id)
+
+
+async def timing(ids: dict, chapters: list, levels: list, delay: float) -> dict:
+    from benchmark.FakeLLM import FakeChatModel
+
+    novel_id = ids["novels"][0]
+    result = {}
+    for chapter_id, concurrency in zip(chapters, levels):
+        llm = FakeChatModel(reply="夜色渐深，灯火在长街尽头摇曳。" * 20, first_token_delay=delay)
+        mapper = CountingConversationMapper()
+        counter_before = chapter_counter(chapter_id)
+        job = await draft(llm, novel_id, chapter_id, concurrency, mapper)
+        state = chapter_state(novel_id, chapter_id)
+        prefixes = {json.dumps([m.content for m in call[:-1]], ensure_ascii=False) for call in llm.calls}
+        drafts = len(job.result["drafts"]) if job.result else 0
+        result[f"concurrency_{concurrency}"] = {
+            "status": job.status,
+            "scenes": drafts,
+            "wall_ms": job.result["wall_ms"] if job.result else None,
+            "sequential_ms": job.result["sequential_ms"] if job.result else None,
+            "speedup": round(job.result["sequential_ms"] / job.result["wall_ms"], 2) if job.result else None,
+            "batched_writes": mapper.batches,
+            "shared_prefix": len(prefixes) == 1,
+            "ok": job.status == "done" and drafts == len(state) and all(n == 1 for n in state.values())
+                  and mapper.batches == [drafts] and len(prefixes) == 1
+                  and chapter_counter(chapter_id) == counter_before + drafts
+                  # 实际耗时接近 ceil(情景数 / 并发数) 次调用的耗时
+                  and job.result["wall_ms"] < (-(-drafts // concurrency) + 1) * delay * 1000,
+        }
+    return result
+
+
+async def skipped(ids: dict, chapter_id: int) -> dict:
+    from benchmark.FakeLLM import FakeChatModel
+
+    # 再次起草已起草的章节：全部情景已有对话，直接完成
+    llm = FakeChatModel()
+    job = await draft(llm, ids["novels"][0], chapter_id, 4, CountingConversationMapper())
+    return {"status": job.status, "skipped": len(job.result["skipped"]), "llm_calls": len(llm.calls),
+            "ok": job.status == "done" and not job.result["drafts"] and job.result["skipped"] and not llm.calls}
+
+
+async def failure(ids: dict, chapter_id: int, delay: float) -> dict:
+    from benchmark.FakeLLM import FakeChatModel
+
+    llm = FlakyChatModel(FakeChatModel(first_token_delay=delay), failures=1)
+    mapper = CountingConversationMapper()
+    job = await draft(llm, ids["novels"][0], chapter_id, 4, mapper)
+    state = chapter_state(ids["novels"][0], chapter_id)
+    return {"status": job.status, "attempts": job.attempts, "batched_writes": mapper.batches,
+            "conversations_per_scene": sorted(set(state.values())),
+            "ok": job.status == "done" and job.attempts == 2 and len(mapper.batches) == 1
+                  and all(n == 1 for n in state.values())}
+
+
+async def run_checks(ids: dict, chapters: list, levels: list, delay: float) -> dict:
+    from core.service.JobService import start_job_runner, stop_job_runner
+    from core.utils import AppConfig
+
+    AppConfig.JOB_POLL_SECONDS = 0.05
+    AppConfig.JOB_RETRY_BASE_SECONDS = 0.05
+    start_job_runner(concurrency=1)
+    try:
+        result = await timing(ids, chapters, levels, delay)
+        result["skipped"] = await skipped(ids, chapters[0])
+        result["failure"] = await failure(ids, chapters[len(levels)], delay)
+        return result
+    finally:
+        await stop_job_runner()
+
+
+def run(scenes: int, levels: list, delay: float) -> dict:
+    from benchmark.DataGenerator import DataScale, generate
+
+    ids = generate(DataScale(novels=1, chapters=len(levels) + 1, scenes=scenes, turns=0, characters=3))
+    chapters = sorted(ids["chapters"])
+    return asyncio.run(run_checks(ids, chapters, levels, delay))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="批量起草章节的耗时和写入检查")
+    parser.add_argument("--scenes", type=int, default=8, help="每个章节的情景数")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8], help="并发数")
+    parser.add_argument("--delay", type=float, default=0.2, help="假模型每次调用的耗时（秒）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-draft-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "draft.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "ERROR")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        result = run(args.scenes, args.levels, args.delay)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(0 if all(item.get("ok", True) for item in result.values()) else 1)
@@ -0,0 +1,156 @@
+"""
+角色更新的写入量对比：按差异写入 / 删除后重新插入全部子表数据（原来的做法）
+
+角色带有大量对话示例（默认 500 条），分别测试以下修改：
+只改名字、修改一条对话示例、追加一条、删除一条、全部对话示例都改变（差异写入的最坏情况）。
+每种修改统计单次更新的耗时、SQL 数量，以及连续更新后 WAL 文件增长的字节数（即写入数据库文件的数据量）。
+
+同时检查乐观锁：两个客户端读取同一版本后先后提交，第一个成功，第二个返回 409 且数据没有被覆盖。
+
+运行方式（在 app 目录下）: python -m benchmark.CharacterUpdateBenchmark --speaks 500 --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import summarize
+
+
+def replace_all(character_id: int, patch):
+    """
+    原来的 update_character：删除角色的全部子表数据后重新插入
+    """
+    from pony.orm import commit, db_session
+
+    from core.entity.po.CharacterEntity import CharacterEntity
+    from core.mapper.CharacterMapper import CHARACTER_FIELDS, CHILD_TABLES
+
+    with db_session:
+        character = CharacterEntity[character_id]
+        for field in CHARACTER_FIELDS:
+            if getattr(patch, field) is not None:
+                setattr(character, field, getattr(patch, field))
+        for entity, attr, fields in CHILD_TABLES:
+            if getattr(patch, attr) is None:
+                continue
+            entity.select(lambda data: data.character.character_id == character_id).delete()
+            for dto in getattr(patch, attr):
+                entity(character=character, **{field: getattr(dto, field) for field in fields})
+        commit()
+
+
+def wal_bytes(db_path: str) -> int:
+    wal = Path(db_path + "-wal")
+    return wal.stat().st_size if wal.exists() else 0
+
+
+def checkpoint(db_path: str):
+    """
+    把 WAL 中的数据写回数据库文件并清空 WAL，之后 WAL 的大小即新写入的数据量
+    """
+    with sqlite3.connect(db_path) as connection:
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def edits(speaks: int) -> dict:
+    """
+    每种修改返回一个函数，参数为第几次修改，返回基于当前数据修改后的 PatchCharacterDto
+    """
+    from core.entity.dto.CharacterDto import PatchCharacterDto, SpeakingDto
+
+    def speak(i: int, text: str = "对话") -> SpeakingDto:
+        return SpeakingDto(role="user", content=f"{text}{i}" * 5, reply=f"回复{i}" * 5)
+
+    base = [speak(i) for i in range(speaks)]
+    return {
+        "rename": lambda n: PatchCharacterDto(name=f"角色{n}", speak=base),
+        "edit_one_speak": lambda n: PatchCharacterDto(speak=base[:10] + [speak(10, f"修改{n}")] + base[11:]),
+        "append_speak": lambda n: PatchCharacterDto(speak=base + [speak(speaks + n % 2)]),
+        "delete_speak": lambda n: PatchCharacterDto(speak=base[:-1] if n % 2 == 0 else base),
+        "rewrite_all_speaks": lambda n: PatchCharacterDto(speak=[speak(i, f"第{n}版") for i in range(speaks)]),
+    }
+
+
+def measure(update, make_patch, repeat: int, db_path: str) -> dict:
+    from core.mapper.config.QueryMonitor import track_queries
+
+    checkpoint(db_path)
+    samples, queries = [], []
+    for n in range(repeat):
+        patch = make_patch(n)
+        with track_queries() as stats:
+            start = time.perf_counter()
+            update(patch)
+            samples.append(time.perf_counter() - start)
+        queries.append(stats.count)
+    return {"latency": summarize(samples), "queries_per_update": round(sum(queries) / repeat, 1),
+            "wal_bytes_per_update": wal_bytes(db_path) // repeat}
+
+
+def create_character(speaks: int) -> int:
+    from core.entity.dto.CharacterDto import CreateCharacterDto, DistinctiveDto, SpeakingDto, TraitDto
+    from core.mapper.CharacterMapper import CharacterMapper
+
+    return CharacterMapper().create_character(CreateCharacterDto(
+        name="压测角色", description="描述", background_story="背景",
+        trait=[TraitDto(label=f"性格{i}", description="描述") for i in range(20)],
+        speak=[SpeakingDto(role="user", content=f"对话{i}" * 5, reply=f"回复{i}" * 5) for i in range(speaks)],
+        distinctive=[DistinctiveDto(name=f"特征{i}", content="内容") for i in range(20)]))
+
+
+async def version_conflict(character_id: int) -> dict:
+    from benchmark.BenchmarkRunner import asgi_client
+    from benchmark.FakeLLM import FakeChatModel
+
+    async with asgi_client(FakeChatModel("")) as client:
+        version = (await client.get(f"/api/character/{character_id}")).json()["data"]["version"]
+        first = await client.patch(f"/api/character/{character_id}", json={"name": "客户端A", "version": version})
+        second = await client.patch(f"/api/character/{character_id}", json={"name": "客户端B", "version": version})
+        current = (await client.get(f"/api/character/{character_id}")).json()["data"]
+    return {
+        "first_status": first.status_code,
+        "second_status": second.status_code,
+        "ok": first.status_code == 200 and second.status_code == 409
+              and current["name"] == "客户端A" and current["version"] == version + 1,
+    }
+
+
+def run(speaks: int, repeat: int, db_path: str) -> dict:
+    from core.mapper.CharacterMapper import CharacterMapper
+    from core.mapper.config.CreateDatabase import generate_table_mapping
+
+    generate_table_mapping()
+    mapper = CharacterMapper()
+    result = {"speaks": speaks, "repeat": repeat, "edits": {}}
+    for name, make_patch in edits(speaks).items():
+        diff_id, replace_id = create_character(speaks), create_character(speaks)
+        result["edits"][name] = {
+            "diff": measure(lambda patch: mapper.update_character(diff_id, patch), make_patch, repeat, db_path),
+            "replace_all": measure(lambda patch: replace_all(replace_id, patch), make_patch, repeat, db_path),
+        }
+        # 两种方式更新后的数据应一致
+        diff_dto, replace_dto = mapper.select_character_by_id(diff_id), mapper.select_character_by_id(replace_id)
+        result["edits"][name]["same_result"] = [(s.role, s.content, s.reply) for s in diff_dto.speak] == \
+                                               [(s.role, s.content, s.reply) for s in replace_dto.speak]
+    result["version_conflict"] = asyncio.run(version_conflict(create_character(speaks)))
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="角色更新按差异写入与整体重写的对比")
+    parser.add_argument("--speaks", type=int, default=500, help="角色的对话示例条数")
+    parser.add_argument("--repeat", type=int, default=20, help="每种修改连续更新的次数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-character-") as workdir:
+        path = str(Path(workdir) / "character.sqlite")
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", path)
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "WARNING")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        print(json.dumps(run(args.speaks, args.repeat, path), ensure_ascii=False, indent=2))
@@ -0,0 +1,130 @@
+"""
+生成指定规模的合成小说数据，写入 QUICKNOVEL_DB_PATH 指定的 SQLite 文件
+
+运行方式（在 app 目录下）:
+QUICKNOVEL_DB_PATH=/tmp/bench.sqlite python -m benchmark.DataGenerator --chapters 10 --scenes 5 --turns 20
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from pydantic import BaseModel
+from pony.orm import db_session, commit
+
+from core.utils.LogConfig import get_logger
+
+logging = get_logger(__name__)
+
+_WORDS = ["夜色", "清风", "灯火", "长街", "旧梦", "细雨", "钟声", "山河", "故人", "归途", "少年", "星河"]
+
+
+class DataScale(BaseModel):
+    novels: int = 1
+    # 每本小说的章节数
+    chapters: int = 10
+    # 每个章节的情景数
+    scenes: int = 5
+    # 每个情景的对话轮数，一轮包含一条 user 和一条 assistant 消息
+    turns: int = 20
+    # 角色总数，每本小说关联全部角色
+    characters: int = 5
+    # 每个角色的性格特征、说话方式、自定义字段数量
+    character_details: int = 5
+    worlds: int = 2
+    world_details: int = 10
+    # 每条对话的字数
+    content_length: int = 200
+    seed: int = 42
+
+
+def _text(rng: random.Random, length: int) -> str:
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        size += len(word)
+    return "".join(words)[:length]
+
+
+def generate(scale: DataScale) -> dict:
+    """
+    按规模生成数据，返回各实体的 id，供压测用例选择参数
+    """
+    from core.entity.po.CharacterEntity import CharacterEntity, Trait, Speak, Distinctive
+    from core.entity.po.CharacterNovelEntity import CharacterNovelEntity
+    from core.entity.po.ConversationEntity import ConversationEntity
+    from core.entity.po.NovelEntity import NovelEntity, ChapterEntity, SceneEntity
+    from core.entity.po.WorldEntity import WorldEntity, WorldDetailEntity
+    from core.mapper.config.Counters import rebuild_counters
+    from core.mapper.config.CreateDatabase import generate_table_mapping
+
+    generate_table_mapping()
+
+    rng = random.Random(scale.seed)
+    now = datetime.now()
+    ids = {"novels": [], "chapters": [], "scenes": [], "characters": [], "worlds": []}
+
+    with db_session:
+        worlds = []
+        for w in range(scale.worlds):
+            world = WorldEntity(world_name=f"世界{w}", world_desc=_text(rng, 100), create_time=now)
+            for d in range(scale.world_details):
+                WorldDetailEntity(world_detail_name=f"设定{d}", world_detail_desc=_text(rng, 100), world=world)
+            worlds.append(world)
+
+        characters = []
+        for c in range(scale.characters):
+            character = CharacterEntity(name=f"角色{c}", description=_text(rng, 50),
+                                        background_story=_text(rng, 300))
+            for i in range(scale.character_details):
+                Trait(label=f"性格{i}", description=_text(rng, 30), character=character)
+                Speak(role="user", content=_text(rng, 30), reply=_text(rng, 30), character=character)
+                Distinctive(name=f"特征{i}", content=_text(rng, 30), character=character)
+            characters.append(character)
+        commit()
+
+        ids["worlds"] = [world.world_id for world in worlds]
+        ids["characters"] = [character.character_id for character in characters]
+
+    for n in range(scale.novels):
+        with db_session:
+            novel = NovelEntity(novel_name=f"小说{n}", novel_desc=_text(rng, 100), create_time=now)
+            novel.world.add([WorldEntity[world_id] for world_id in ids["worlds"]])
+            for character_id in ids["characters"]:
+                CharacterNovelEntity(novel=novel, character=character_id)
+
+            for ch in range(scale.chapters):
+                chapter = ChapterEntity(chapter_number=ch + 1, chapter_title=f"第{ch + 1}章",
+                                        chapter_desc=_text(rng, 100), create_time=now, novel=novel)
+                for sc in range(scale.scenes):
+                    scene = SceneEntity(scene_name=f"情景{ch + 1}-{sc + 1}", scene_desc=_text(rng, 100),
+                                        create_time=now, chapter=chapter)
+                    for t in range(scale.turns):
+                        turn_time = now + timedelta(seconds=t)
+                        ConversationEntity(role="user", content=_text(rng, scale.content_length),
+                                           create_time=turn_time, scene=scene)
+                        ConversationEntity(role="assistant", content=_text(rng, scale.content_length),
+                                           create_time=turn_time, scene=scene)
+                # 每个章节提交一次，避免单个事务过大
+                commit()
+                ids["chapters"].append(chapter.chapter_id)
+                ids["scenes"].extend(scene.scene_id for scene in chapter.scene)
+            ids["novels"].append(novel.novel_id)
+
+        logging.info("生成小说 %s 完成", n)
+
+    with db_session:
+        # 直接创建实体没有经过 mapper，重新计算汇总字段
+        rebuild_counters()
+
+    return ids
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="生成合成小说数据")
+    for field, info in DataScale.model_fields.items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=int, default=info.default)
+    args = parser.parse_args()
+    result = generate(DataScale(**vars(args)))
+    print({key: len(value) for key, value in result.items()})
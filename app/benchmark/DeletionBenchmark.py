@@ -0,0 +1,264 @@
+"""
+后台分批删除与单个事务删除的对比
+
+1. 并发影响：删除一本大小说的同时，后台线程持续读取另一本小说的汇总信息并写入对话，
+   分别统计后台分批删除（每批 DELETE_BATCH_SIZE 行）和在一个事务中删除全部数据时读写请求的耗时，
+   以及删除本身的总耗时。SQLite 同一时间只有一个写事务，单个大事务期间的写请求需要等待事务结束
+2. 进度：后台删除期间轮询 /api/deletion/{job_id}，进度只增不减，完成时为 1；删除请求返回后小说立即不可见
+3. 汇总字段：删除一个章节、一个情景、一条对话后，小说的汇总字段与 rebuild_counters 重新计算的结果一致
+4. 头像：删除角色或更换头像后没有其他角色引用的头像及缩略图被删除，共用的头像和刚保存的头像保留，超过保留时间的无引用头像被清理
+
+运行方式（在 app 目录下）: python -m benchmark.DeletionBenchmark --chapters 20 --scenes 10 --turns 50
+在 PostgreSQL 上运行时需要一个空数据库，例如:
+QUICKNOVEL_DB_PROVIDER=postgres QUICKNOVEL_PG_DATABASE=quicknovel_check python -m benchmark.DeletionBenchmark
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import asgi_client, summarize
+
+
+class Traffic:
+    """
+    后台线程持续读取一本小说的汇总信息并向其中写入对话，记录每次请求的开始时间和耗时
+    """
+
+    def __init__(self, novel_id: int, scene_id: int):
+        self.novel_id = novel_id
+        self.scene_id = scene_id
+        self.reads, self.writes = [], []
+        self._stopped = threading.Event()
+        self._threads = [threading.Thread(target=self._read_loop), threading.Thread(target=self._write_loop)]
+
+    def _read_loop(self):
+        from core.mapper.NovelMapper import NovelMapper
+
+        mapper = NovelMapper()
+        while not self._stopped.is_set():
+            start = time.perf_counter()
+            mapper.get_novel_summary(self.novel_id)
+            self.reads.append((start, time.perf_counter() - start))
+            time.sleep(0.005)
+
+    def _write_loop(self):
+        from core.entity.dto.ConversationDto import CreateConversationDto
+        from core.mapper.ConversationMapper import ConversationMapper
+
+        mapper = ConversationMapper()
+        while not self._stopped.is_set():
+            start = time.perf_counter()
+            mapper.create_conversation(CreateConversationDto(
+                role="user", content="继续写下去", create_time=datetime.now(), scene=self.scene_id))
+            self.writes.append((start, time.perf_counter() - start))
+            time.sleep(0.005)
+
+    def __enter__(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+
+    def result(self, since: float, until: float) -> dict:
+        """
+        只统计删除期间开始的请求
+        """
+
+        def during(samples):
+            return [duration for start, duration in samples if since <= start <= until]
+
+        return {"reads": summarize(during(self.reads)), "writes": summarize(during(self.writes))}
+
+
+def delete_in_one_transaction(novel_id: int):
+    """
+    对照组：不限制每批的行数，在一个事务中执行全部删除步骤
+    """
+    from pony.orm import db_session
+
+    from core.mapper.DeletionMapper import NOVEL_JOB, STEPS, DeletionBatch
+
+    with db_session:
+        for step in STEPS[NOVEL_JOB]:
+            step(novel_id, 10 ** 9, DeletionBatch())
+
+
+async def background_deletion(novel_id: int) -> dict:
+    """
+    通过接口删除小说，由后台线程分批执行，期间轮询进度
+    """
+    from benchmark.FakeLLM import FakeChatModel
+    from core.service.DeletionService import start_deletion_worker, stop_deletion_worker
+
+    start_deletion_worker()
+    try:
+        async with asgi_client(FakeChatModel("")) as client:
+            start = time.perf_counter()
+            job = (await client.delete(f"/api/novel/{novel_id}")).json()["data"]
+            request_seconds = time.perf_counter() - start
+            hidden = (await client.get(f"/api/novel/{novel_id}/summary")).status_code == 404
+            progress = []
+            while job["status"] not in ("done", "failed"):
+                await asyncio.sleep(0.05)
+                job = (await client.get(f"/api/deletion/{job['job_id']}")).json()["data"]
+                progress.append(job["progress"])
+            seconds = time.perf_counter() - start
+    finally:
+        stop_deletion_worker()
+    return {
+        "started_at": start,
+        "seconds": round(seconds, 3),
+        "request_ms": round(request_seconds * 1000, 2),
+        "status": job["status"],
+        "rows": job["deleted"],
+        "estimated_rows": job["total"],
+        "progress_samples": len(progress),
+        "progress_monotonic": progress == sorted(progress) and progress[-1] == 1.0,
+        "hidden_after_request": hidden,
+    }
+
+
+def compare(ids: dict, chapters: int) -> dict:
+    background_novel, blocking_novel, traffic_novel = ids["novels"][:3]
+    traffic_scene = ids["scenes"][-1]
+    result = {}
+
+    with Traffic(traffic_novel, traffic_scene) as traffic:
+        time.sleep(0.2)
+        background = asyncio.run(background_deletion(background_novel))
+    start = background.pop("started_at")
+    background["traffic"] = traffic.result(start, start + background["seconds"])
+    result["background"] = background
+
+    with Traffic(traffic_novel, traffic_scene) as traffic:
+        time.sleep(0.2)
+        start = time.perf_counter()
+        delete_in_one_transaction(blocking_novel)
+        seconds = time.perf_counter() - start
+    result["single_transaction"] = {"seconds": round(seconds, 3), "traffic": traffic.result(start, start + seconds)}
+    return result
+
+
+def novel_counters(novel_id: int) -> tuple:
+    from pony.orm import db_session
+
+    from core.entity.po.NovelEntity import NovelEntity
+
+    with db_session:
+        novel = NovelEntity[novel_id]
+        return novel.chapter_count, novel.scene_count, novel.conversation_count, novel.total_characters
+
+
+def counters(ids: dict, chapters: int, scenes: int) -> dict:
+    """
+    在第三本小说中删除一个章节、另一个章节中的一个情景和一条对话，对比汇总字段与重新计算的结果
+    """
+    from pony.orm import db_session, select
+
+    from core.entity.po.ConversationEntity import ConversationEntity
+    from core.mapper.DeletionMapper import CHAPTER_JOB, SCENE_JOB, DeletionMapper
+    from core.mapper.ConversationMapper import ConversationMapper
+    from core.mapper.config.Counters import rebuild_counters
+    from core.service.DeletionService import DeletionService
+
+    novel_id = ids["novels"][2]
+    chapter_ids = ids["chapters"][2 * chapters:3 * chapters]
+    scene_id = ids["scenes"][(2 * chapters + 1) * scenes]
+    with db_session:
+        conversation_id = select(c.conversation_id for c in ConversationEntity
+                                 if c.scene.scene_id == ids["scenes"][-2]).first()
+
+    service = DeletionService(DeletionMapper())
+    before = novel_counters(novel_id)
+    service.request_deletion(CHAPTER_JOB, chapter_ids[0])
+    service.request_deletion(SCENE_JOB, scene_id)
+    while service.run_next_job("benchmark"):
+        pass
+    ConversationMapper().delete_conversation(conversation_id)
+
+    after = novel_counters(novel_id)
+    with db_session:
+        rebuild_counters()
+    rebuilt = novel_counters(novel_id)
+    return {"before": before, "after": after, "rebuilt": rebuilt, "consistent": after == rebuilt}
+
+
+def avatars() -> dict:
+    """
+    角色 A、B 共用头像 shared.png，角色 C 使用 own.png，orphan.png 没有角色引用且已超过保留时间；
+    角色 D、E 分别把头像从 recent.png（刚保存，可能有其他上传请求正要使用）、replaced.png 换成 shared.png，
+    replaced.png 立即删除，recent.png 在保留时间内不删除
+    """
+    from core.entity.dto.CharacterDto import CreateCharacterDto
+    from core.mapper.CharacterMapper import CharacterMapper
+    from core.mapper.DeletionMapper import CHARACTER_JOB, DeletionMapper
+    from core.service.DeletionService import DeletionService
+    from core.utils import AppConfig
+    from core.utils.ImagePipeline import avatar_dir, variant_dir
+
+    directory = avatar_dir()
+    variant_dir(directory).mkdir(parents=True, exist_ok=True)
+    names = ("shared", "own", "orphan", "replaced", "recent")
+    for name in names:
+        (directory / f"{name}.png").write_bytes(b"png")
+        (variant_dir(directory) / f"{name}_thumb.webp").write_bytes(b"webp")
+    old = time.time() - AppConfig.ORPHAN_AVATAR_GRACE_SECONDS - 60
+    for name in names[:-1]:
+        os.utime(directory / f"{name}.png", (old, old))
+
+    mapper = CharacterMapper()
+    created = {}
+    for name, avatar in (("A", "shared.png"), ("B", "shared.png"), ("C", "own.png"), ("D", "recent.png"),
+                         ("E", "replaced.png")):
+        created[name] = mapper.create_character(CreateCharacterDto(name=name, description="描述"))
+        mapper.update_avatar(created[name], avatar)
+    for name in ("D", "E"):
+        mapper.update_avatar(created[name], "shared.png")
+
+    service = DeletionService(DeletionMapper())
+    service.request_deletion(CHARACTER_JOB, created["A"])
+    service.request_deletion(CHARACTER_JOB, created["C"])
+    while service.run_next_job("benchmark"):
+        pass
+    remaining = sorted(path.name for path in directory.rglob("*") if path.is_file())
+    return {"remaining_files": remaining,
+            "ok": remaining == ["recent.png", "recent_thumb.webp", "shared.png", "shared_thumb.webp"]}
+
+
+def run(scale, chapters: int, scenes: int) -> dict:
+    from benchmark.DataGenerator import generate
+
+    ids = generate(scale)
+    result = {"scale": scale.model_dump(), **compare(ids, chapters)}
+    result["counters"] = counters(ids, chapters, scenes)
+    result["avatars"] = avatars()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="后台分批删除与单个事务删除的对比")
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--scenes", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-deletion-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "deletion.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "WARNING")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        # 设置数据库路径之后才能导入 core 下的模块
+        from benchmark.DataGenerator import DataScale
+
+        data_scale = DataScale(novels=3, chapters=args.chapters, scenes=args.scenes, turns=args.turns)
+        print(json.dumps(run(data_scale, args.chapters, args.scenes), ensure_ascii=False, indent=2))
@@ -0,0 +1,33 @@
+import asyncio
+from typing import AsyncIterator, List
+
+from langchain_core.messages import AIMessageChunk, BaseMessage
+
+
+class FakeChatModel:
+    """
+    压测用的假模型，按固定的延迟流式返回固定内容，并记录收到的消息
+    """
+
+    def __init__(self, reply: str = "夜色渐深，灯火在长街尽头摇曳。", chunk_size: int = 4,
+                 first_token_delay: float = 0.0, chunk_delay: float = 0.0):
+        self.reply = reply
+        self.chunk_size = chunk_size
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.calls: List[List[BaseMessage]] = []
+
+    async def astream(self, messages: List[BaseMessage], *args, **kwargs) -> AsyncIterator[AIMessageChunk]:
+        self.calls.append(list(messages))
+        if self.first_token_delay:
+            await asyncio.sleep(self.first_token_delay)
+        for i in range(0, len(self.reply), self.chunk_size):
+            if i and self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            yield AIMessageChunk(content=self.reply[i:i + self.chunk_size])
+
+    async def ainvoke(self, messages: List[BaseMessage], *args, **kwargs) -> AIMessageChunk:
+        self.calls.append(list(messages))
+        if self.first_token_delay:
+            await asyncio.sleep(self.first_token_delay)
+        return AIMessageChunk(content=self.reply)
@@ -0,0 +1,239 @@
+"""
+检查后台模型任务（core/service/JobService.py）的执行、进度、重试和并发限制，模型使用假模型
+
+1. 接口：POST /api/job/ 创建总结章节的任务后立即返回，轮询 GET /api/job/{job_id} 直到完成，进度单调递增，
+   每次模型调用都记录了用量；不支持的任务类型返回 400
+2. 重试：前两次执行失败的任务按指数退避重试后完成
+3. 失败：一直失败的任务执行 JOB_MAX_ATTEMPTS 次后标记为失败；抛出 JobAbortError 的任务不重试
+4. 并发：同时创建多个任务，同时执行的任务数不超过执行协程数
+5. 租约：领取任务的进程崩溃（租约过期）后，任务由其他进程接手完成
+6. 停止：服务停止时正在执行的任务放回队列且不计入失败次数，重新启动后继续执行
+
+任意一项检查不满足时以非零状态码退出。运行方式（在 app 目录下）: python -m benchmark.JobRunnerCheck
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import asgi_client, build_provider_service
+
+PROBE = "probe"
+
+
+class Probe:
+    """
+    测试用的任务类型，参数 sleep 为执行时间，前 fail_until 次执行失败，abort 为真时直接放弃
+    """
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.starts = {}
+
+    def __call__(self):
+        from core.service.JobService import JobAbortError
+
+        async def handler(context):
+            self.starts.setdefault(context.job_id, []).append(time.perf_counter())
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            try:
+                await asyncio.sleep(context.params.get("sleep", 0))
+                if context.params.get("abort"):
+                    raise JobAbortError("参数错误")
+                if context.attempt <= context.params.get("fail_until", 0):
+                    raise RuntimeError(f"第{context.attempt}次执行失败")
+                return {"attempt": context.attempt}
+            finally:
+                self.running -= 1
+
+        return handler
+
+
+async def wait_job(job_id: int, timeout: float = 10):
+    from core.mapper.LlmJobMapper import LlmJobMapper
+
+    mapper = LlmJobMapper()
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        job = mapper.get_job(job_id)
+        if job.status in ("done", "failed"):
+            return job
+        await asyncio.sleep(0.01)
+    return mapper.get_job(job_id)
+
+
+def create(kind: str, params: dict, novel_id: int = None) -> int:
+    from core.entity.dto.LlmJobDto import CreateLlmJobDto
+    from core.mapper.LlmJobMapper import LlmJobMapper
+    from core.service.JobService import JobService
+
+    return JobService(LlmJobMapper()).create_job(CreateLlmJobDto(kind=kind, params=params, novel_id=novel_id)).data.job_id
+
+
+async def http(ids: dict, delay: float) -> dict:
+    from benchmark.FakeLLM import FakeChatModel
+    from core.mapper.TokenUsageMapper import TokenUsageMapper
+    from core.mapper.NovelMapper import NovelMapper
+    from core.service.ChapterSummaryJob import CHAPTER_SUMMARY, ChapterSummaryJob
+    from core.service.JobService import register_job_handler
+
+    novel_id, chapter_id = ids["novels"][0], min(ids["chapters"])
+    fake = FakeChatModel(reply="主角在长街尽头与故人重逢。", first_token_delay=delay)
+    turns_before = TokenUsageMapper().get_novel_usage(novel_id).total.turns
+
+    async with asgi_client(fake) as client:
+        # 导入接口时注册的是使用真实模型的实现，替换为假模型
+        register_job_handler(CHAPTER_SUMMARY, lambda: ChapterSummaryJob(NovelMapper(), build_provider_service(fake)))
+        await client.get(f"/api/job/novel/{novel_id}")
+        start = time.perf_counter()
+        created = await client.post("/api/job/", json={"kind": CHAPTER_SUMMARY, "novel_id": novel_id,
+                                                       "params": {"chapter_id": chapter_id}})
+        create_ms = (time.perf_counter() - start) * 1000
+        job_id = created.json()["data"]["job_id"]
+        progress, job = [], None
+        while time.perf_counter() - start < 10:
+            job = (await client.get(f"/api/job/{job_id}")).json()["data"]
+            progress.append(job["progress"])
+            if job["status"] in ("done", "failed"):
+                break
+            await asyncio.sleep(0.01)
+        listed = (await client.get(f"/api/job/novel/{novel_id}")).json()["data"]
+        unknown = await client.post("/api/job/", json={"kind": "missing", "params": {}})
+
+    turns = TokenUsageMapper().get_novel_usage(novel_id).total.turns - turns_before
+    scenes = len(job["result"]["scenes"]) if job["result"] else 0
+    return {
+        "create_ms": round(create_ms, 2),
+        "total_ms": round((time.perf_counter() - start) * 1000, 2),
+        "status": job["status"],
+        "progress": sorted(set(progress)),
+        "scenes": scenes,
+        "llm_calls": len(fake.calls),
+        "usage_turns": turns,
+        "unknown_kind": unknown.status_code,
+        "ok": job["status"] == "done" and progress == sorted(progress) and any(0 < p < 1 for p in progress)
+              and scenes > 0 and len(fake.calls) == scenes + 1 and turns == scenes + 1
+              and created.json()["data"]["status"] == "pending" and create_ms < delay * 1000
+              and any(j["job_id"] == job_id for j in listed) and unknown.status_code == 400,
+    }
+
+
+async def retry(probe: Probe, base: float) -> dict:
+    job_id = create(PROBE, {"fail_until": 2})
+    job = await wait_job(job_id)
+    starts = probe.starts[job_id]
+    gaps = [round(b - a, 3) for a, b in zip(starts, starts[1:])]
+    return {
+        "status": job.status, "attempts": job.attempts, "gaps_s": gaps, "last_error": job.error,
+        "ok": job.status == "done" and job.attempts == 3 and job.result == {"attempt": 3}
+              and gaps[0] >= base and gaps[1] >= base * 2,
+    }
+
+
+async def failure(max_attempts: int) -> dict:
+    exhausted = await wait_job(create(PROBE, {"fail_until": 100}))
+    aborted = await wait_job(create(PROBE, {"abort": True}))
+    return {
+        "exhausted": [exhausted.status, exhausted.attempts, exhausted.error],
+        "aborted": [aborted.status, aborted.attempts, aborted.error],
+        "ok": exhausted.status == "failed" and exhausted.attempts == max_attempts
+              and aborted.status == "failed" and aborted.attempts == 1,
+    }
+
+
+async def concurrency(probe: Probe, workers: int, jobs: int, hold: float) -> dict:
+    probe.max_running = 0
+    start = time.perf_counter()
+    job_ids = [create(PROBE, {"sleep": hold}) for _ in range(jobs)]
+    results = [await wait_job(job_id) for job_id in job_ids]
+    wall = time.perf_counter() - start
+    return {
+        "jobs": jobs, "workers": workers, "max_running": probe.max_running, "wall_s": round(wall, 3),
+        "sequential_s": round(jobs * hold, 3),
+        "ok": all(r.status == "done" for r in results) and probe.max_running == workers
+              and wall < jobs * hold * 0.75,
+    }
+
+
+async def lease() -> dict:
+    from core.mapper.LlmJobMapper import LlmJobMapper
+
+    mapper = LlmJobMapper()
+    job_id = create(PROBE, {})
+    # 另一个进程领取任务后崩溃：租约立即过期
+    claimed = mapper.claim_next_job("crashed:1", -1)
+    job = await wait_job(job_id)
+    return {"claimed_by_crashed": claimed is not None and claimed.job_id == job_id, "status": job.status,
+            "attempts": job.attempts,
+            "ok": claimed is not None and job.status == "done" and job.attempts == 2}
+
+
+async def shutdown(probe: Probe, workers: int) -> dict:
+    from core.mapper.LlmJobMapper import LlmJobMapper
+    from core.service.JobService import start_job_runner, stop_job_runner
+
+    mapper = LlmJobMapper()
+    job_id = create(PROBE, {"sleep": 0.3})
+    while job_id not in probe.starts:
+        await asyncio.sleep(0.01)
+    await stop_job_runner()
+    stopped = mapper.get_job(job_id)
+    start_job_runner(concurrency=workers)
+    job = await wait_job(job_id)
+    return {
+        "after_stop": [stopped.status, stopped.attempts], "after_restart": [job.status, job.attempts],
+        "ok": stopped.status == "pending" and stopped.attempts == 0 and job.status == "done" and job.attempts == 1,
+    }
+
+
+async def check(ids: dict, workers: int, delay: float) -> dict:
+    from core.service.JobService import register_job_handler, start_job_runner, stop_job_runner
+    from core.utils import AppConfig
+
+    AppConfig.JOB_POLL_SECONDS = 0.05
+    AppConfig.JOB_RETRY_BASE_SECONDS = 0.1
+    AppConfig.JOB_MAX_ATTEMPTS = 3
+    probe = Probe()
+    register_job_handler(PROBE, probe)
+    start_job_runner(concurrency=workers)
+    try:
+        return {
+            "http": await http(ids, delay),
+            "retry": await retry(probe, AppConfig.JOB_RETRY_BASE_SECONDS),
+            "failure": await failure(AppConfig.JOB_MAX_ATTEMPTS),
+            "concurrency": await concurrency(probe, workers, workers * 3, 0.1),
+            "lease": await lease(),
+            "shutdown": await shutdown(probe, workers),
+        }
+    finally:
+        await stop_job_runner()
+
+
+def run(workers: int, delay: float) -> dict:
+    from benchmark.DataGenerator import DataScale, generate as generate_data
+
+    ids = generate_data(DataScale(novels=1, chapters=2, scenes=3, turns=2, characters=2))
+    return asyncio.run(check(ids, workers, delay))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="使用假模型检查后台模型任务的执行、重试和并发限制")
+    parser.add_argument("--workers", type=int, default=2, help="执行协程数")
+    parser.add_argument("--delay", type=float, default=0.05, help="假模型每次调用的耗时（秒）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-jobs-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "jobs.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "ERROR")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        result = run(args.workers, args.delay)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(0 if all(item.get("ok", True) for item in result.values()) else 1)
@@ -0,0 +1,84 @@
+"""
+对比旧的同步 DEBUG 日志与队列日志在一次对话请求中的日志开销
+
+运行方式（在 app 目录下）: python -m benchmark.LogBenchmark --messages 2000 --length 500
+"""
+import argparse
+import logging
+import os
+import time
+
+from langchain_core.messages import HumanMessage, AIMessage
+
+from core.utils.LogConfig import init_log, shutdown_log, log_payload, LOG_FORMAT, get_logger
+
+logger = get_logger("benchmark.log")
+
+
+def build_messages(count: int, length: int):
+    text = "夜色" * (length // 2)
+    return [HumanMessage(content=text) if i % 2 == 0 else AIMessage(content=text) for i in range(count)]
+
+
+def legacy_request(messages, prompt: str):
+    # 旧实现：在 INFO 级别直接格式化完整的消息列表
+    logger.info(f"添加历史小说消息:{messages}")
+    logger.info(f"用户消息:{prompt}")
+
+
+def current_request(messages, prompt: str):
+    # 新实现：只记录数量，完整内容按需截断、采样并延迟格式化
+    logger.info("构建 prompt 完成，历史小说消息 %d 条", len(messages))
+    log_payload(logger, "历史小说消息", messages)
+    log_payload(logger, "用户消息", prompt)
+
+
+def measure(func, messages, prompt: str, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(messages, prompt)
+    return (time.perf_counter() - start) / rounds
+
+
+def run(message_count: int, length: int, rounds: int) -> dict:
+    messages = build_messages(message_count, length)
+    prompt = "继续"
+    root = logging.getLogger()
+
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        # 旧配置：basicConfig(DEBUG) + 同步写出
+        shutdown_log()
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.DEBUG)
+        legacy = measure(legacy_request, messages, prompt, rounds)
+        root.removeHandler(handler)
+
+        # 新配置：INFO 级别 + 队列日志
+        init_log(level="INFO", module_levels="", stream=devnull)
+        current = measure(current_request, messages, prompt, rounds)
+        shutdown_log()
+
+        # 开启 DEBUG 且不采样时，调用线程只把原始记录放入队列，格式化在后台线程完成
+        init_log(level="DEBUG", module_levels="", stream=devnull)
+        debug = measure(current_request, messages, prompt, rounds)
+        shutdown_log()
+
+    return {
+        "messages": message_count,
+        "message_length": length,
+        "legacy_ms_per_request": round(legacy * 1000, 4),
+        "current_ms_per_request": round(current * 1000, 4),
+        "speedup": round(legacy / current, 1) if current else None,
+        "debug_ms_per_request": round(debug * 1000, 4),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="日志开销对比")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--length", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    print(run(args.messages, args.length, args.rounds))
@@ -0,0 +1,175 @@
+"""
+角色记忆整理（core/service/MemoryConsolidationJob.py）对 prompt 大小的影响，模型使用假模型
+
+1. 整理前：prompt 包含全部历史，记录 token 数量
+2. 整理：MemoryService.on_turn 判断新增轮数达到 MEMORY_CONSOLIDATION_TURNS 后创建后台任务，
+   任务为每个角色保存记忆、状态和已整理到的对话 id；同一批对话只创建一次任务
+3. 整理后：prompt 只包含角色记忆、最近 MEMORY_RECENT_TURNS 轮已整理的对话和还没整理的对话，对比 token 数量
+4. 继续对话：新增轮数未达到阈值时不创建任务，相邻两轮的 prompt 前者是后者的前缀；达到阈值后再次整理，
+   prompt 回到整理后的大小
+
+检查的是发送整部小说历史时（AppConfig.PROMPT_SCOPE 为 novel）记忆的效果，以情景为中心的 prompt 见 SceneContextBenchmark。
+任意一项检查不满足时以非零状态码退出。运行方式（在 app 目录下）: python -m benchmark.MemoryBenchmark
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import build_provider_service
+
+MEMORY_REPLY = "记忆：在长街尽头与故人重逢，得知旧案另有隐情，答应三日后在钟楼再见。\n状态：夜色中独自归途，心事重重。"
+
+
+def memory_service():
+    from core.mapper.CharacterMapper import CharacterMapper
+    from core.mapper.CharacterNovelMapper import CharacterNovelMapper
+    from core.mapper.LlmJobMapper import LlmJobMapper
+    from core.mapper.NovelMapper import NovelMapper
+    from core.service.JobService import JobService
+    from core.service.MemoryService import MemoryService
+
+    return MemoryService(CharacterNovelMapper(CharacterMapper(), NovelMapper()), JobService(LlmJobMapper()))
+
+
+async def prompt(novel_id: int, scene_id: int) -> dict:
+    """
+    发起一轮对话（假模型），返回发送给模型的 prompt
+    """
+    from benchmark.FakeLLM import FakeChatModel
+    from core.utils.TokenCounter import count_messages_tokens
+
+    fake = FakeChatModel(chunk_size=1000)
+    async for _ in build_provider_service(fake).generate_llm_response("继续", novel_id, scene_id):
+        pass
+    messages = [m.content for m in fake.calls[0]]
+    return {"messages": messages, "tokens": count_messages_tokens(messages)}
+
+
+def add_turn(novel_id: int, scene_id: int, service):
+    from datetime import datetime
+
+    from core.entity.dto.ConversationDto import CreateConversationDto
+    from core.mapper.ConversationMapper import ConversationMapper
+
+    mapper = ConversationMapper()
+    for role, content in (("user", "他推开门，走进雨里。"), ("assistant", "雨声渐密，灯火在长街尽头摇曳。")):
+        mapper.create_conversation(CreateConversationDto(role=role, content=content, create_time=datetime.now(),
+                                                         scene=scene_id, novel=novel_id))
+    service.on_turn(novel_id)
+
+
+async def wait_jobs(novel_id: int) -> list:
+    from core.mapper.LlmJobMapper import LlmJobMapper
+
+    mapper = LlmJobMapper()
+    for _ in range(1000):
+        jobs = mapper.get_jobs_by_novel_id(novel_id)
+        if all(job.status in ("done", "failed") for job in jobs):
+            return jobs
+        await asyncio.sleep(0.01)
+    return mapper.get_jobs_by_novel_id(novel_id)
+
+
+async def check(ids: dict, turns: int) -> dict:
+    from benchmark.FakeLLM import FakeChatModel
+    from core.mapper.CharacterMapper import CharacterMapper
+    from core.mapper.CharacterNovelMapper import CharacterNovelMapper
+    from core.mapper.NovelMapper import NovelMapper
+    from core.service.JobService import register_job_handler, start_job_runner, stop_job_runner
+    from core.service.MemoryConsolidationJob import MEMORY_CONSOLIDATION, MemoryConsolidationJob
+    from core.utils import AppConfig
+
+    AppConfig.JOB_POLL_SECONDS = 0.05
+    AppConfig.MEMORY_CONSOLIDATION_TURNS = turns
+    AppConfig.PROMPT_SCOPE = "novel"
+    novel_id, scene_id = ids["novels"][0], max(ids["scenes"])
+    character_novel_mapper = CharacterNovelMapper(CharacterMapper(), NovelMapper())
+    fake = FakeChatModel(reply=MEMORY_REPLY)
+    register_job_handler(MEMORY_CONSOLIDATION, lambda: MemoryConsolidationJob(
+        NovelMapper(), character_novel_mapper, build_provider_service(fake)))
+    service = memory_service()
+    start_job_runner(concurrency=1)
+    try:
+        before = await prompt(novel_id, scene_id)
+
+        # 已有的对话超过阈值，第一次调用即创建任务，再次调用不重复创建
+        service.on_turn(novel_id)
+        service.on_turn(novel_id)
+        jobs = await wait_jobs(novel_id)
+        memories = character_novel_mapper.get_character_memories(novel_id)
+        after = await prompt(novel_id, scene_id)
+        consolidation = {
+            "jobs": [job.status for job in jobs],
+            "llm_calls": len(fake.calls),
+            "memory_until": sorted({m.memory_until for m in memories}),
+            "status": memories[0].status if memories else None,
+            "ok": [job.status for job in jobs] == ["done"] and len(fake.calls) == len(memories)
+                  and all(m.memory and m.status and m.memory_until > 0 for m in memories),
+        }
+
+        # 新增轮数未达到阈值：不创建任务，prompt 只在末尾追加
+        growing, prefix_ok = [], True
+        previous = after
+        for _ in range(turns - 1):
+            add_turn(novel_id, scene_id, service)
+            current = await prompt(novel_id, scene_id)
+            prefix_ok = prefix_ok and current["messages"][:len(previous["messages"])] == previous["messages"]
+            growing.append(current["tokens"])
+            previous = current
+        pending = len(await wait_jobs(novel_id))
+        # 达到阈值后再次整理
+        add_turn(novel_id, scene_id, service)
+        jobs = await wait_jobs(novel_id)
+        again = await prompt(novel_id, scene_id)
+    finally:
+        await stop_job_runner()
+
+    return {
+        "full_history": {"tokens": before["tokens"], "messages": len(before["messages"])},
+        "consolidation": consolidation,
+        "with_memory": {
+            "tokens": after["tokens"], "messages": len(after["messages"]),
+            "reduction": round(1 - after["tokens"] / before["tokens"], 4),
+            "ok": after["tokens"] * 5 < before["tokens"],
+        },
+        "continue": {
+            "tokens_before_next_consolidation": growing[-1] if growing else None,
+            "jobs_before_threshold": pending,
+            "jobs_after_threshold": [job.status for job in jobs],
+            "prefix_stable": prefix_ok,
+            "tokens_after_second_consolidation": again["tokens"],
+            "ok": pending == 1 and [job.status for job in jobs] == ["done", "done"] and prefix_ok
+                  and again["tokens"] < growing[-1],
+        },
+    }
+
+
+def run(chapters: int, scenes: int, turns: int, threshold: int) -> dict:
+    from benchmark.DataGenerator import DataScale, generate
+
+    ids = generate(DataScale(novels=1, chapters=chapters, scenes=scenes, turns=turns, characters=3,
+                             content_length=100))
+    return asyncio.run(check(ids, threshold))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="角色记忆整理前后 prompt 的 token 数量")
+    parser.add_argument("--chapters", type=int, default=5)
+    parser.add_argument("--scenes", type=int, default=4, help="每个章节的情景数")
+    parser.add_argument("--turns", type=int, default=10, help="每个情景的对话轮数")
+    parser.add_argument("--threshold", type=int, default=20, help="新增多少轮对话后整理记忆")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-memory-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "memory.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "ERROR")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        result = run(args.chapters, args.scenes, args.turns, args.threshold)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(0 if all(item.get("ok", True) for item in result.values()) else 1)
@@ -0,0 +1,298 @@
+"""
+小说详情缓存（core/mapper/config/NovelCache.py）与每次完整读取的对比
+
+对每个规模（10k / 100k 轮对话，一轮为 user 和 assistant 两条）统计：
+1. 读取耗时：不使用缓存时每次完整读取 / 缓存命中（只查询一次汇总字段）
+2. 写入后读取：通过 mapper 创建对话后立即读取，缓存由写入直接修改，仍然命中；对比写入后清空缓存、重新读取的耗时
+3. 正确性：依次创建对话、批量创建对话、创建情景和章节（自动编号）、删除对话后，缓存中的小说详情序列化后
+   与完整读取的结果逐字节相同，期间的读取全部命中缓存；写入前已经返回的小说详情序列化后不变
+4. 内存：tracemalloc 测得的小说详情内存占用与 NovelCache 的估算值之比
+
+另外检查 dto 读取模式下修改缓存的结果同样与完整读取相同，超过内存上限时淘汰最久没有访问的小说，
+删除数据的通知（CacheInvalidation）使缓存失效，以及其他进程删除角色（没有本进程的通知）后缓存不再命中。任意一项检查不满足时以非零状态码退出。
+
+运行方式（在 app 目录下）: python -m benchmark.NovelCacheBenchmark
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import summarize
+
+# 规模名称 -> 章节数、每章情景数、每个情景的对话轮数
+SCALES = {
+    "10k": dict(chapters=20, scenes=10, turns=50),
+    "100k": dict(chapters=50, scenes=20, turns=100),
+}
+
+
+def timed(func, repeat: int, setup=None) -> dict:
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def body(novel) -> bytes:
+    from core.entity.ResponseEntity import success
+    from core.utils.JsonResponse import dumps
+
+    return dumps(success(data=novel))
+
+
+def fresh_body(novel_id: int) -> bytes:
+    """
+    不使用缓存完整读取的结果
+    """
+    from core.mapper.NovelMapper import NovelMapper
+    from core.utils import AppConfig
+
+    limit, AppConfig.NOVEL_CACHE_MAX_MB = AppConfig.NOVEL_CACHE_MAX_MB, 0
+    try:
+        return body(NovelMapper().get_novel_by_id(novel_id))
+    finally:
+        AppConfig.NOVEL_CACHE_MAX_MB = limit
+
+
+def write_all_kinds(ids: dict, novel_id: int) -> int:
+    """
+    经过 mapper 写入各种数据，返回写入的次数
+    """
+    from core.entity.dto.ChapterDto import CreateChapterDto
+    from core.entity.dto.ConversationDto import CreateConversationDto
+    from core.entity.dto.SceneDto import CreateSceneDto
+    from core.mapper.ChapterMapper import ChapterMapper
+    from core.mapper.ConversationMapper import ConversationMapper
+    from core.mapper.NovelMapper import NovelMapper
+    from core.mapper.SceneMapper import SceneMapper
+
+    conversation_mapper = ConversationMapper()
+    scene_id, now = ids["scenes"][0], datetime.now()
+    first = conversation_mapper.create_conversation(CreateConversationDto(
+        role="user", content="他推开门，走进雨里。", create_time=now, scene=scene_id))
+    conversation_mapper.create_conversations([CreateConversationDto(
+        role="assistant", content="雨声渐密。", create_time=now, scene=scene_id, parent=first,
+        sender_character=ids["characters"][0])] * 3)
+    chapter_id = ChapterMapper().create_chapter(CreateChapterDto(
+        chapter_title="新章节", chapter_number=None, create_time=now, novel=novel_id))
+    ChapterMapper().create_chapters([CreateChapterDto(
+        chapter_title="插入的章节", chapter_number=1, create_time=now, novel=novel_id)] * 2)
+    new_scene = SceneMapper().create_scene(CreateSceneDto(scene_name="新情景", create_time=now, chapter=chapter_id))
+    SceneMapper().create_scenes([CreateSceneDto(scene_name="批量情景", create_time=now, chapter=chapter_id)] * 2)
+    conversation_mapper.create_conversation(CreateConversationDto(
+        role="user", content="新情景中的第一句话", create_time=now, scene=new_scene))
+    # 删除被回复的对话，回复它的对话 parent 被置空
+    conversation_mapper.delete_conversation(first)
+    # 写入之间的读取应当全部命中
+    NovelMapper().get_novel_by_id(novel_id)
+    return 8
+
+
+def tree_bytes(novel_id: int) -> int:
+    from core.mapper.NovelMapper import NovelMapper
+    from core.mapper.config.NovelCache import clear_novel_cache
+
+    clear_novel_cache()
+    gc.collect()
+    tracemalloc.start()
+    novel = NovelMapper().get_novel_by_id(novel_id)
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del novel
+    return retained
+
+
+def measure(ids: dict, repeat: int, writes: int) -> dict:
+    from core.entity.dto.ConversationDto import CreateConversationDto
+    from core.mapper.ConversationMapper import ConversationMapper
+    from core.mapper.NovelMapper import NovelMapper
+    from core.mapper.config.NovelCache import NOVEL_CACHE_LOOKUPS, cached_bytes, clear_novel_cache, estimate_bytes
+    from core.utils import AppConfig
+
+    novel_id, scene_id = ids["novels"][0], ids["scenes"][-1]
+    mapper, conversation_mapper = NovelMapper(), ConversationMapper()
+    limit = AppConfig.NOVEL_CACHE_MAX_MB
+
+    AppConfig.NOVEL_CACHE_MAX_MB = 0
+    rebuild = timed(lambda: mapper.get_novel_by_id(novel_id), repeat)
+    AppConfig.NOVEL_CACHE_MAX_MB = limit
+
+    clear_novel_cache()
+    cached = mapper.get_novel_by_id(novel_id)
+    hit = timed(lambda: mapper.get_novel_by_id(novel_id), repeat)
+
+    def write():
+        conversation_mapper.create_conversation(CreateConversationDto(
+            role="user", content="继续写下去", create_time=datetime.now(), scene=scene_id))
+
+    # 写入后清空缓存再读取，即写入时整体失效的做法
+    after_invalidate = timed(lambda: mapper.get_novel_by_id(novel_id), writes,
+                             setup=lambda: (write(), clear_novel_cache()))
+    mapper.get_novel_by_id(novel_id)
+    hits_before = NOVEL_CACHE_LOOKUPS.snapshot().get(("hit",), 0)
+    after_patch = timed(lambda: mapper.get_novel_by_id(novel_id), writes, setup=write)
+    patched_hits = NOVEL_CACHE_LOOKUPS.snapshot().get(("hit",), 0) - hits_before
+
+    held = mapper.get_novel_by_id(novel_id)
+    held_body = body(held)
+    hits_before = NOVEL_CACHE_LOOKUPS.snapshot().get(("hit",), 0)
+    kinds = write_all_kinds(ids, novel_id)
+    cached = mapper.get_novel_by_id(novel_id)
+    all_kinds_hit = NOVEL_CACHE_LOOKUPS.snapshot().get(("hit",), 0) - hits_before == 2
+    same_body = body(cached) == fresh_body(novel_id)
+    held_unchanged = body(held) == held_body
+    estimated, retained = estimate_bytes(cached, AppConfig.READ_MODE), tree_bytes(novel_id)
+
+    return {
+        "conversations": cached.conversation_count,
+        "full_rebuild": rebuild,
+        "cache_hit": hit,
+        "read_after_write_invalidated": after_invalidate,
+        "read_after_write_patched": after_patch,
+        "speedup": round(rebuild["median_ms"] / hit["median_ms"], 1),
+        "patched_hits": f"{patched_hits}/{writes}",
+        "all_kinds": {"writes": kinds, "hit": all_kinds_hit, "same_body": same_body,
+                      "held_unchanged": held_unchanged},
+        "memory": {"retained_mb": round(retained / 2 ** 20, 2), "estimated_mb": round(estimated / 2 ** 20, 2),
+                   "estimate_ratio": round(estimated / retained, 2), "cached_mb": round(cached_bytes() / 2 ** 20, 2)},
+        "ok": patched_hits == writes and all_kinds_hit and same_body and held_unchanged
+              and hit["median_ms"] * 10 < rebuild["median_ms"]
+              and 0.5 < estimated / retained < 2,
+    }
+
+
+def check_dto_mode() -> dict:
+    """
+    dto 读取模式下修改缓存的结果与完整读取相同，写入前返回的小说详情不变
+    """
+    from benchmark.DataGenerator import DataScale, generate
+    from core.mapper.NovelMapper import NovelMapper
+    from core.mapper.config.NovelCache import NOVEL_CACHE_LOOKUPS, clear_novel_cache
+    from core.utils import AppConfig
+
+    mode, AppConfig.READ_MODE = AppConfig.READ_MODE, "dto"
+    try:
+        ids = generate(DataScale(novels=1, chapters=3, scenes=3, turns=5, characters=2, content_length=50))
+        novel_id = ids["novels"][0]
+        clear_novel_cache()
+        before = NovelMapper().get_novel_by_id(novel_id)
+        before_body = body(before)
+        hits_before = NOVEL_CACHE_LOOKUPS.snapshot().get(("hit",), 0)
+        write_all_kinds(ids, novel_id)
+        cached = NovelMapper().get_novel_by_id(novel_id)
+        patched = NOVEL_CACHE_LOOKUPS.snapshot().get(("hit",), 0) - hits_before == 2
+        same_body = body(cached) == fresh_body(novel_id)
+        unchanged = body(before) == before_body
+        return {"patched": patched, "same_body": same_body, "held_unchanged": unchanged,
+                "ok": patched and same_body and unchanged}
+    finally:
+        AppConfig.READ_MODE = mode
+
+
+def check_lru_and_invalidation() -> dict:
+    """
+    内存上限只能容纳一部小说时淘汰最久没有访问的小说；删除通知使缓存失效；
+    其他进程删除角色、置空对话的角色后，小说的 revision 使缓存失效
+    """
+    from pony.orm import db_session, select
+
+    from benchmark.DataGenerator import DataScale, generate
+    from core.entity.dto.ConversationDto import CreateConversationDto
+    from core.entity.po.NovelEntity import SceneEntity
+    from core.mapper.ConversationMapper import ConversationMapper
+    from core.mapper.DeletionMapper import CHARACTER_JOB, DeletionMapper
+    from core.mapper.NovelMapper import NovelMapper
+    from core.mapper.config.NovelCache import cached_bytes, clear_novel_cache, max_bytes
+    from core.utils import AppConfig
+    from core.utils.CacheInvalidation import invalidate_caches
+
+    ids = generate(DataScale(novels=3, chapters=2, scenes=3, turns=20, characters=2, content_length=200))
+    mapper = NovelMapper()
+    limit = AppConfig.NOVEL_CACHE_MAX_MB
+    clear_novel_cache()
+    first = mapper.get_novel_by_id(ids["novels"][0])
+    size = cached_bytes()
+    AppConfig.NOVEL_CACHE_MAX_MB = size * 1.5 / 2 ** 20
+    try:
+        second = mapper.get_novel_by_id(ids["novels"][1])
+        evicted = mapper.get_novel_by_id(ids["novels"][0]) is not first
+        # 访问过第一部小说后，最久没有访问的是第二部
+        third = mapper.get_novel_by_id(ids["novels"][2])
+        kept = mapper.get_novel_by_id(ids["novels"][2]) is third and mapper.get_novel_by_id(ids["novels"][1]) \
+            is not second
+        bounded = cached_bytes() <= max_bytes()
+    finally:
+        AppConfig.NOVEL_CACHE_MAX_MB = limit
+
+    with db_session:
+        scene_id = select(s.scene_id for s in SceneEntity if s.chapter.novel.novel_id == ids["novels"][1]).first()
+    novel = mapper.get_novel_by_id(ids["novels"][1])
+    invalidate_caches("scene", scene_id)
+    scene_invalidated = mapper.get_novel_by_id(ids["novels"][1]) is not novel
+
+    # 直接通过 DeletionMapper 执行删除任务，不调用 invalidate_caches，相当于由其他进程删除
+    character_id = ids["characters"][0]
+    ConversationMapper().create_conversation(CreateConversationDto(
+        role="assistant", content="角色的回复", create_time=datetime.now(), scene=scene_id,
+        sender_character=character_id))
+    novel = mapper.get_novel_by_id(ids["novels"][1])
+    deletion, owner = DeletionMapper(), "other-worker"
+    deletion.create_job(CHARACTER_JOB, character_id)
+    job_id = deletion.claim_next_job(owner, 60)
+    while not deletion.delete_batch(job_id, owner, AppConfig.DELETE_BATCH_SIZE, 60).done:
+        pass
+    fresh = mapper.get_novel_by_id(ids["novels"][1])
+    senders = {conversation.sender_character for chapter in fresh.chapter for scene in chapter.scene
+               for conversation in scene.conversation}
+    character_invalidated = fresh is not novel and character_id not in senders
+    return {
+        "evicted_oldest": evicted, "kept_recent": kept, "bounded": bounded,
+        "scene_invalidated": scene_invalidated, "character_invalidated": character_invalidated,
+        "ok": evicted and kept and bounded and scene_invalidated and character_invalidated,
+    }
+
+
+def run(scales: list, content_length: int, repeat: int, writes: int) -> dict:
+    from benchmark.DataGenerator import DataScale, generate
+
+    result = {}
+    for name in scales:
+        start = time.perf_counter()
+        ids = generate(DataScale(novels=1, characters=3, content_length=content_length, **SCALES[name]))
+        print(f"生成 {name} 数据耗时 {time.perf_counter() - start:.1f} 秒", file=sys.stderr)
+        # 规模越大完整读取越慢，减少次数
+        result[name] = measure(ids, repeat if name == "10k" else max(3, repeat // 4), writes)
+    result["dto_mode"] = check_dto_mode()
+    result["lru_and_invalidation"] = check_lru_and_invalidation()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="小说详情缓存与完整读取的对比")
+    parser.add_argument("--scales", default="10k,100k", help=f"逗号分隔，可选 {', '.join(SCALES)}")
+    parser.add_argument("--content-length", type=int, default=50, help="每条对话的字数")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--writes", type=int, default=20, help="写入后读取的次数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-novel-cache-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "novel_cache.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "ERROR")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        result = run(args.scales.split(","), args.content_length, args.repeat, args.writes)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(0 if all(item.get("ok", True) for item in result.values()) else 1)
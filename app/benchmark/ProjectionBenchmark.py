@@ -0,0 +1,124 @@
+"""
+投影读取模式与 DTO 读取模式的内存和耗时
+
+对小说详情（NovelMapper.get_novel_by_id）和角色列表（CharacterMapper.get_all_characters）分别统计两种模式下：
+1. 读取耗时、序列化为响应体的耗时、拼接历史消息（ProviderService.generate_scene_messages）的耗时
+2. 读取结果常驻的内存和读取过程中的内存峰值（tracemalloc），小说详情另外折算为每 10 万条对话的内存
+3. 两种模式序列化后的响应体完全相同
+
+运行方式（在 app 目录下）: python -m benchmark.ProjectionBenchmark --chapters 20 --scenes 50 --turns 50
+（默认规模为 20 x 50 个情景，每个情景 50 轮即 100 条对话，共 10 万条对话）
+"""
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import build_provider_service, summarize
+
+MODES = ("dto", "projection")
+
+
+def latency(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)["median_ms"]
+
+
+def memory(func) -> dict:
+    """
+    返回值常驻的内存和调用过程中的内存峰值
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return {"retained_mb": round(retained / 2 ** 20, 2), "peak_mb": round(peak / 2 ** 20, 2)}
+
+
+def measure(load, build_prompt, conversations: int, repeat: int) -> dict:
+    from core.entity.ResponseEntity import success
+    from core.utils import AppConfig
+    from core.utils.JsonResponse import dumps
+
+    result, bodies = {}, {}
+    for mode in MODES:
+        AppConfig.READ_MODE = mode
+        data = load()
+        bodies[mode] = dumps(success(data=data))
+        stats = {
+            "load_ms": latency(load, repeat),
+            "serialize_ms": latency(lambda: dumps(success(data=data)), repeat),
+            **memory(load),
+        }
+        if build_prompt is not None:
+            stats["prompt_ms"] = latency(build_prompt, repeat)
+        if conversations:
+            stats["retained_mb_per_100k_conversations"] = round(stats["retained_mb"] * 100000 / conversations, 2)
+        result[mode] = stats
+        del data
+    result["same_body"] = bodies["dto"] == bodies["projection"]
+    result["bytes"] = len(bodies["projection"])
+    return result
+
+
+def run(scale, repeat: int) -> dict:
+    from benchmark.DataGenerator import generate
+    from benchmark.FakeLLM import FakeChatModel
+    from core.mapper.CharacterMapper import CharacterMapper
+    from core.mapper.NovelMapper import NovelMapper
+    from core.utils import AppConfig
+
+    # 对比的是两种模式的读取过程，不使用小说详情缓存（见 NovelCacheBenchmark）
+    AppConfig.NOVEL_CACHE_MAX_MB = 0
+    ids = generate(scale)
+    novel_id = ids["novels"][0]
+    conversations = scale.chapters * scale.scenes * scale.turns * 2
+    provider_service = build_provider_service(FakeChatModel(""))
+    novel_mapper, character_mapper = NovelMapper(), CharacterMapper()
+
+    default_mode = AppConfig.READ_MODE
+    try:
+        return {
+            "scale": scale.model_dump(),
+            "conversations": conversations,
+            "novel": measure(lambda: novel_mapper.get_novel_by_id(novel_id),
+                             lambda: provider_service.generate_scene_messages(novel_id), conversations, repeat),
+            "characters": measure(character_mapper.get_all_characters, None, 0, repeat),
+        }
+    finally:
+        AppConfig.READ_MODE = default_mode
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="投影读取模式与 DTO 读取模式的内存和耗时")
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--scenes", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--characters", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-projection-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "projection.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "WARNING")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        # 设置数据库路径之后才能导入 core 下的模块
+        from benchmark.DataGenerator import DataScale
+
+        data_scale = DataScale(chapters=args.chapters, scenes=args.scenes, turns=args.turns,
+                               characters=args.characters)
+        print(json.dumps(run(data_scale, args.repeat), ensure_ascii=False, indent=2))
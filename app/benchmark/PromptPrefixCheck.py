@@ -0,0 +1,177 @@
+"""
+检查对话 prompt 的前缀稳定性，布局见 core/service/PromptLayout.py
+
+服务商的前缀缓存只对逐字节相同的开头部分生效，检查以下几项，任意一项不满足时以非零状态码退出：
+1. 在最新的情景中连续对话（假模型），每轮发给模型的消息按 OpenAI 接口的格式序列化后，是下一轮消息的前缀
+2. 以打乱的顺序关联角色，角色消息仍按角色 id 排列
+3. projection 和 dto 两种读取模式生成的 prompt 逐字节相同
+4. 模型返回缓存命中的 token 数量（input_token_details.cache_read）时记录到用量中，并按缓存价格估算费用
+
+另外输出在较早的情景中对话时与上一轮共同前缀的比例，这种情况下新的对话插入在历史中间，之后的部分无法命中缓存。
+
+运行方式（在 app 目录下）: python -m benchmark.PromptPrefixCheck
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import asgi_client, build_provider_service
+
+# LangChain 消息类型 -> OpenAI 接口的角色
+_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+class CacheReportingModel:
+    """
+    返回缓存命中用量的假模型，与 DeepSeek 等 OpenAI 兼容接口经 langchain-openai 转换后的用量相同
+    """
+
+    def __init__(self, input_tokens: int, cache_read: int, output_tokens: int):
+        self.usage = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                      "total_tokens": input_tokens + output_tokens,
+                      "input_token_details": {"cache_read": cache_read}}
+
+    async def astream(self, messages, *args, **kwargs):
+        from langchain_core.messages import AIMessageChunk
+
+        yield AIMessageChunk(content="好的。")
+        yield AIMessageChunk(content="", usage_metadata=self.usage)
+
+
+def wire(messages) -> list:
+    """
+    每条消息按请求体中的格式序列化为字节
+    """
+    return [json.dumps({"role": _ROLES[m.type], "content": m.content}, ensure_ascii=False).encode()
+            for m in messages]
+
+
+def common_prefix(previous: list, current: list) -> int:
+    """
+    两轮消息逐字节相同的开头部分的字节数
+    """
+    size = 0
+    for a, b in zip(previous, current):
+        if a != b:
+            break
+        size += len(a)
+    return size
+
+
+async def conversation_turns(novel_id: int, scene_id: int, character_id: int, rounds: int) -> list:
+    from benchmark.FakeLLM import FakeChatModel
+
+    fake_llm = FakeChatModel("夜色渐深，灯火在长街尽头摇曳。", chunk_size=1000)
+    async with asgi_client(fake_llm) as client:
+        for i in range(rounds):
+            response = await client.post("/api/conversation/", json={
+                "role": "user", "content": f"第{i + 1}轮：继续写下去", "scene": scene_id, "novel": novel_id,
+                "receiver_character": character_id})
+            assert response.status_code == 200 and "event: end" in response.text, response.text[-200:]
+    return [wire(messages) for messages in fake_llm.calls]
+
+
+def prefix_stability(ids: dict, rounds: int) -> dict:
+    novel_id, character_id = ids["novels"][0], ids["characters"][0]
+    # 历史中的情景按 id 排列，id 最大的情景是最新的情景
+    turns = asyncio.run(conversation_turns(novel_id, max(ids["scenes"]), character_id, rounds))
+    latest = [turns[i] == turns[i + 1][:len(turns[i])] for i in range(len(turns) - 1)]
+
+    earlier = asyncio.run(conversation_turns(novel_id, min(ids["scenes"]), character_id, 2))
+    return {
+        "rounds": len(turns),
+        "messages": [len(messages) for messages in turns],
+        "ok": len(turns) == rounds and all(latest),
+        "earlier_scene_prefix_ratio": round(common_prefix(*earlier) / sum(len(m) for m in earlier[1]), 4),
+    }
+
+
+def character_order(ids: dict) -> dict:
+    from pony.orm import db_session, commit
+
+    from core.entity.dto.NovelDto import CreateCharacter2NovelDto
+    from core.entity.po.NovelEntity import NovelEntity
+    from core.mapper.CharacterMapper import CharacterMapper
+    from core.mapper.CharacterNovelMapper import CharacterNovelMapper
+    from core.mapper.NovelMapper import NovelMapper
+
+    with db_session:
+        novel = NovelEntity(novel_name="关联顺序", novel_desc="", create_time=datetime.now())
+        commit()
+        novel_id = novel.novel_id
+    mapper = CharacterNovelMapper(character_mapper=CharacterMapper(), novel_mapper=NovelMapper())
+    shuffled = ids["characters"][1::2] + ids["characters"][0::2]
+    for character_id in reversed(shuffled):
+        mapper.connect_character_2_novel(CreateCharacter2NovelDto(novel_id=novel_id, character_id=character_id))
+
+    queried = [c.id for c in mapper.get_connect_characters_by_novel_id(novel_id)]
+    # 角色消息的第一行是角色名称
+    character_ids = {f"角色名称: {c.name}": c.id for c in CharacterMapper().get_all_characters()}
+    messages = build_provider_service(None).generate_character_messages(novel_id)
+    prompted = [character_ids[m.content.split("\n", 1)[0]] for m in messages]
+    return {"queried": queried, "prompted": prompted, "ok": prompted == sorted(ids["characters"])}
+
+
+def read_modes(ids: dict) -> dict:
+    from core.utils import AppConfig
+
+    novel_id = ids["novels"][0]
+    service = build_provider_service(None)
+    default_mode = AppConfig.READ_MODE
+    prompts = {}
+    try:
+        for mode in ("projection", "dto"):
+            AppConfig.READ_MODE = mode
+            prompts[mode] = wire(service.generate_character_messages(novel_id)
+                                 + service.generate_scene_messages(novel_id))
+    finally:
+        AppConfig.READ_MODE = default_mode
+    return {"messages": len(prompts["dto"]), "ok": prompts["projection"] == prompts["dto"]}
+
+
+async def cached_usage(ids: dict) -> dict:
+    from core.mapper.TokenUsageMapper import TokenUsageMapper
+    from core.service.TokenUsageService import TokenUsageService, estimate_cost
+
+    # 前面的检查只在 id 最小和最大的情景中对话过
+    scene_id = sorted(ids["scenes"])[1]
+    service = build_provider_service(CacheReportingModel(input_tokens=10000, cache_read=9000, output_tokens=100))
+    async for _ in service.generate_llm_response("继续", ids["novels"][0], scene_id):
+        pass
+    usage = TokenUsageService(TokenUsageMapper()).get_scene_usage(scene_id).data
+    return {"cached_tokens": usage.cached_tokens, "cost": usage.cost,
+            "cost_without_cache": estimate_cost(usage.prompt_tokens, usage.completion_tokens),
+            "ok": usage.cached_tokens == 9000 and usage.cost == estimate_cost(10000, 100, 9000)}
+
+
+def run(rounds: int) -> dict:
+    from benchmark.DataGenerator import DataScale, generate
+
+    ids = generate(DataScale(novels=1, chapters=3, scenes=2, turns=2, characters=5, character_details=2))
+    return {
+        "prefix": prefix_stability(ids, rounds),
+        "characters": character_order(ids),
+        "read_modes": read_modes(ids),
+        "cached_usage": asyncio.run(cached_usage(ids)),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="检查对话 prompt 的前缀稳定性")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-prompt-prefix-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "prefix.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "WARNING")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        result = run(args.rounds)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(0 if all(item["ok"] for item in result.values()) else 1)
@@ -0,0 +1,129 @@
+"""
+固定每个 mapper 方法执行的 SQL 数量，防止 Pony 查询中隐藏的 N+1 问题悄悄出现
+
+在固定规模的合成数据上逐个执行 mapper 方法，并与 EXPECTED_QUERIES 对比，数量不一致时以非零状态码退出。
+修改了 mapper 的查询方式后，确认新的数量合理再更新 EXPECTED_QUERIES。
+
+运行方式（在 app 目录下）: python -m benchmark.QueryBudgetCheck
+在 PostgreSQL 上检查时需要一个空数据库（可以用临时容器），例如:
+QUICKNOVEL_DB_PROVIDER=postgres QUICKNOVEL_PG_DATABASE=quicknovel_check python -m benchmark.QueryBudgetCheck
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 固定的数据规模，数量与规模相关的方法（N+1）会在这里暴露出来
+CHECK_SCALE = dict(novels=1, chapters=3, scenes=2, turns=2, characters=3, character_details=2,
+                   worlds=1, world_details=3)
+
+# mapper 方法 -> 期望执行的 SQL 数量
+EXPECTED_QUERIES = {
+    "NovelMapper.get_all_novels": 1,
+    # 汇总字段 + 小说、章节、情景、对话各一次
+    "NovelMapper.get_novel_by_id": 5,
+    # 缓存命中时只查询汇总字段
+    "NovelMapper.get_novel_by_id.cached": 1,
+    "NovelMapper.get_novel_summary": 1,
+    "ConversationMapper.get_conversation_by_scene_id": 1,
+    "CharacterMapper.get_all_characters": 4,
+    "CharacterMapper.select_character_by_id": 4,
+    # 每个关联角色单独查询一次（1 + 3 个角色 x 4）
+    "CharacterNovelMapper.get_connect_characters_by_novel_id": 13,
+    # 只查询指定的角色（1 + 1 个角色 x 4）
+    "CharacterNovelMapper.get_connect_characters_by_novel_id.filtered": 5,
+    # 父情景链 + 父章节链 + 同章节情景 + 对话 + 其他情景的最后一条对话
+    "SceneMapper.get_scene_context": 5,
+    "CharacterNovelMapper.get_character_memories": 1,
+    "WorldMapper.get_all_worlds": 1,
+    "WorldMapper.get_world_by_id": 2,
+    # 合计 + 按情景分组 + 按角色分组
+    "TokenUsageMapper.get_novel_usage": 3,
+    "TokenUsageMapper.get_scene_usage": 1,
+    "TokenUsageMapper.get_character_usage": 1,
+    "LlmJobMapper.get_jobs_by_novel_id": 1,
+    "LlmJobMapper.get_job": 1,
+    "NovelMapper.create_novel": 1,
+    # 写入后更新上级的汇总字段，每一级一条 UPDATE
+    "ChapterMapper.create_chapter": 2,
+    # 先查询最大章节编号
+    "ChapterMapper.create_chapter_auto_number": 3,
+    "SceneMapper.create_scene": 3,
+    "ConversationMapper.create_conversation": 4,
+    # 每个性格特征、说话方式、自定义字段各插入一次
+    "CharacterMapper.create_character": 16,
+    # 子表只写入有变化的数据（压测数据中修改 2 条、新增 3 条），再更新版本号并读取新版本号
+    "CharacterMapper.update_character": 22,
+    "CharacterMapper.update_avatar": 6,
+    # 检查角色存在 + 统计需要处理的行数 + 查询未完成的任务 + 插入任务
+    "DeletionMapper.create_job": 5,
+    # 读取任务 + 前两个步骤没有数据 + 删除一批性格特征 + 更新任务进度
+    "DeletionMapper.delete_batch": 5,
+    # 减少三级汇总字段，回复该对话的对话由 Pony 置空 parent
+    "ConversationMapper.delete_conversation": 6,
+    "CharacterNovelMapper.connect_character_2_novel": 1,
+    "CharacterNovelMapper.disconnect_character_from_novel": 1,
+    "WorldMapper.create_world": 1,
+    "WorldDetailMapper.create_world_detail": 1,
+    # 查询后删除
+    "WorldDetailMapper.delete_world_detail": 2,
+    # 批量 5 条：引用的上级各查询一次 + 每条插入一次 + 每个上级更新一次汇总字段
+    "ChapterMapper.create_chapters": 8,
+    "SceneMapper.create_scenes": 8,
+    # 批量 5 条（同一情景）：查询情景一次 + 每条插入一次 + 情景、章节、小说各更新一次
+    "ConversationMapper.create_conversations": 9,
+    "WorldDetailMapper.create_world_details": 6,
+    "CharacterMapper.create_traits": 7,
+    "TokenUsageMapper.record_usage": 1,
+    "CharacterNovelMapper.reserve_memory_consolidation": 1,
+    "CharacterNovelMapper.save_character_memory": 1,
+    "LlmJobMapper.create_job": 1,
+    # 查询最早的可执行任务 + 条件更新 + 读取任务参数
+    "LlmJobMapper.claim_next_job": 3,
+    "LlmJobMapper.update_progress": 1,
+    "LlmJobMapper.complete_job": 1,
+    # 条件更新 + 读取更新后的状态
+    "LlmJobMapper.fail_job": 2,
+}
+
+
+def collect() -> dict:
+    from benchmark.BenchmarkRunner import mapper_cases
+    from benchmark.DataGenerator import DataScale, generate
+    from core.mapper.config.QueryMonitor import track_queries
+
+    ids = generate(DataScale(**CHECK_SCALE))
+
+    counts = {}
+    for case in mapper_cases(ids):
+        args = case.setup() if case.setup else ()
+        with track_queries() as stats:
+            case.func(*args)
+        counts[case.name] = stats
+    return counts
+
+
+def check() -> bool:
+    passed = True
+    for name, stats in collect().items():
+        expected = EXPECTED_QUERIES.get(name)
+        if expected is None:
+            print(f"{name}: {stats.count} 条 SQL（未设置期望值）")
+            passed = False
+        elif stats.count != expected:
+            print(f"{name}: 期望 {expected} 条 SQL，实际 {stats.count} 条  <-- 不一致")
+            for sql, seconds, session in stats.statements:
+                print(f"    [会话 {session}] {seconds * 1000:.3f} ms {' '.join(sql.split())[:200]}")
+            passed = False
+        else:
+            print(f"{name}: {stats.count} 条 SQL")
+    return passed
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory(prefix="quicknovel-query-check-") as workdir:
+        os.environ["QUICKNOVEL_DB_PATH"] = str(Path(workdir) / "check.sqlite")
+        os.chdir(workdir)
+        ok = check()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,98 @@
+"""
+检查每个 mapper 方法执行的 SQL 是否都使用了索引
+
+在合成数据上逐个执行 mapper 方法，对其中的查询、更新和删除语句执行 EXPLAIN QUERY PLAN，
+出现全表扫描（SCAN 且没有使用索引）或为排序创建临时 B 树时以非零状态码退出。
+FULL_SCAN_ALLOWED 中的方法本身就需要读取整张表，不做检查。
+
+运行方式（在 app 目录下）: python -m benchmark.QueryPlanCheck
+"""
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+# 读取全部数据的方法，全表扫描是预期行为
+FULL_SCAN_ALLOWED = {
+    "NovelMapper.get_all_novels",
+    "CharacterMapper.get_all_characters",
+    "WorldMapper.get_all_worlds",
+}
+
+# SCAN 后面没有 USING INDEX / USING COVERING INDEX 时为全表扫描，SCAN CONSTANT ROW 是没有 FROM 的 SELECT，不读取表
+FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(?!.*USING (COVERING )?INDEX)")
+# 递归查询的公用表表达式，SCAN 的是每层只有几行的中间结果，不是表
+CTE = re.compile(r"^\s*WITH\s+(?:RECURSIVE\s+)?(\w+)", re.IGNORECASE)
+
+
+def explain(connection: sqlite3.Connection, sql: str) -> List[str]:
+    # 执行计划与参数值无关，全部绑定为 NULL
+    rows = connection.execute("EXPLAIN QUERY PLAN " + sql, [None] * sql.count("?")).fetchall()
+    return [row[3] for row in rows]
+
+
+def collect_plans(database_path: str) -> Dict[str, List[tuple]]:
+    """
+    返回 mapper 方法 -> [(sql, 执行计划)]
+    """
+    from benchmark.QueryBudgetCheck import collect
+
+    plans = {}
+    with sqlite3.connect(database_path) as connection:
+        for name, stats in collect().items():
+            seen = set()
+            plans[name] = []
+            for sql, _, _ in stats.statements:
+                if sql in seen or not sql.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE")):
+                    continue
+                seen.add(sql)
+                plans[name].append((sql, explain(connection, sql)))
+    return plans
+
+
+def check(database_path: str) -> bool:
+    from core.mapper.config.Migrations import LATEST_VERSION, current_version
+
+    passed = True
+    plans = collect_plans(database_path)
+
+    version = current_version()
+    if version != LATEST_VERSION:
+        print(f"数据库版本为 {version}，期望为 {LATEST_VERSION}  <-- 不一致")
+        passed = False
+
+    for name, statements in plans.items():
+        problems = []
+        for sql, plan in statements:
+            cte = CTE.match(sql)
+            for step in plan:
+                if cte and step == f"SCAN {cte.group(1)}":
+                    continue
+                if name not in FULL_SCAN_ALLOWED and FULL_SCAN.match(step):
+                    problems.append((sql, step))
+                elif "USE TEMP B-TREE" in step:
+                    problems.append((sql, step))
+
+        if problems:
+            passed = False
+            print(f"{name}: 存在未使用索引的查询  <-- 不通过")
+            for sql, step in problems:
+                print(f"    {step}: {' '.join(sql.split())[:200]}")
+        else:
+            indexes = sorted({step for _, plan in statements for step in plan})
+            print(f"{name}: {len(statements)} 条语句")
+            for step in indexes:
+                print(f"    {step}")
+    return passed
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory(prefix="quicknovel-plan-check-") as workdir:
+        database_path = str(Path(workdir) / "check.sqlite")
+        os.environ["QUICKNOVEL_DB_PATH"] = database_path
+        os.chdir(workdir)
+        ok = check(database_path)
+    sys.exit(0 if ok else 1)
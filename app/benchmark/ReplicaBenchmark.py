@@ -0,0 +1,218 @@
+"""
+只读副本的读写分离测试，使用主库的 SQLite 快照作为副本
+
+1. 路由：副本足够新时读方法访问副本；写入后携带 Cookie 或带回写入时间请求头的客户端读到自己的写入
+   （读己之写），两者都没有的客户端读到副本上的旧数据；副本落后超过上限后改为访问主库；重新同步后恢复访问副本；
+   后台任务在副本同步之前执行时读取主库，能找到刚写入的章节
+2. 性能：持续写入对话的同时并发读取整本小说，对比读取主库和读取副本的耗时
+
+运行方式（在 app 目录下）: python -m benchmark.ReplicaBenchmark --chapters 10 --scenes 5 --turns 20 --seconds 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import asgi_client, summarize
+
+
+def snapshot(primary: str, replica: str):
+    """
+    先写入心跳，再把主库复制为副本。先复制到临时文件并切换为非 WAL 模式，
+    再整体复制到副本文件，副本始终不是 WAL 模式，只读连接无需写入共享内存文件
+    """
+    from core.mapper.config.ReadReplica import write_heartbeat
+
+    write_heartbeat()
+    temp = replica + ".tmp"
+    with sqlite3.connect(primary) as source, sqlite3.connect(temp) as target:
+        source.backup(target)
+        target.execute("PRAGMA journal_mode = DELETE")
+    with sqlite3.connect(temp) as source, sqlite3.connect(replica, timeout=30) as target:
+        source.backup(target)
+    os.remove(temp)
+
+
+def reads_by_target() -> dict:
+    from core.mapper.config.ReadReplica import REPLICA_READS
+
+    return {"/".join(key): value for key, value in REPLICA_READS.snapshot().items()}
+
+
+async def scene_count(client, novel_id: int, headers: dict = None) -> int:
+    response = await client.get(f"/api/novel/{novel_id}", headers=headers)
+    return sum(len(chapter["scene"]) for chapter in response.json()["data"]["chapter"])
+
+
+async def routing(ids: dict, primary: str, replica: str) -> dict:
+    from benchmark.FakeLLM import FakeChatModel
+    from core.utils import AppConfig
+    from core.utils.ReadConsistencyMiddleware import WRITE_HEADER
+
+    novel_id, chapter_id = ids["novels"][0], ids["chapters"][0]
+    snapshot(primary, replica)
+    result = {}
+
+    async with asgi_client(FakeChatModel("")) as writer, asgi_client(FakeChatModel("")) as other:
+        result["before"] = await scene_count(writer, novel_id)
+        result["fresh_read"] = reads_by_target()
+
+        response = await writer.post("/api/scene/", json={"scene_name": "副本测试", "chapter": chapter_id})
+        result["write_cookie"] = "quicknovel_write_at" in response.headers.get("set-cookie", "")
+        # 写入的客户端读到自己的写入，其他客户端读到副本上的数据
+        result["writer_sees_write"] = await scene_count(writer, novel_id) == result["before"] + 1
+        result["other_sees_replica"] = await scene_count(other, novel_id) == result["before"]
+        # 不携带 Cookie、只带回写入时间请求头的客户端（与接口不同源的前端）同样读到自己的写入
+        headers = {WRITE_HEADER: response.headers.get(WRITE_HEADER, "")}
+        result["header_sees_write"] = await scene_count(other, novel_id, headers) == result["before"] + 1
+
+        # 副本不再同步，超过落后上限后改为访问主库
+        await asyncio.sleep(AppConfig.REPLICA_MAX_LAG_SECONDS + 0.6)
+        result["lagging_replica_bypassed"] = await scene_count(other, novel_id) == result["before"] + 1
+
+        # 重新同步后两个客户端都访问副本
+        snapshot(primary, replica)
+        await asyncio.sleep(0.6)
+        counts = {await scene_count(writer, novel_id), await scene_count(other, novel_id)}
+        result["after_sync_consistent"] = counts == {result["before"] + 1}
+    result["reads"] = reads_by_target()
+    return result
+
+
+async def job_reads(ids: dict, primary: str, replica: str) -> dict:
+    """
+    写入新的章节、情景和对话后立即创建总结章节的任务，副本还没有同步这些数据时执行任务
+    """
+    import math
+
+    from benchmark.BenchmarkRunner import build_provider_service
+    from benchmark.FakeLLM import FakeChatModel
+    from core.entity.dto.ChapterDto import CreateChapterDto
+    from core.entity.dto.ConversationDto import CreateConversationDto
+    from core.entity.dto.LlmJobDto import CreateLlmJobDto
+    from core.entity.dto.SceneDto import CreateSceneDto
+    from core.mapper.ChapterMapper import ChapterMapper
+    from core.mapper.ConversationMapper import ConversationMapper
+    from core.mapper.LlmJobMapper import LlmJobMapper
+    from core.mapper.NovelMapper import NovelMapper
+    from core.mapper.SceneMapper import SceneMapper
+    from core.mapper.config.NovelCache import clear_novel_cache
+    from core.mapper.config.ReadReplica import require_position
+    from core.service.ChapterSummaryJob import CHAPTER_SUMMARY, ChapterSummaryJob
+    from core.service.JobService import JobService, register_job_handler
+
+    novel_id, now = ids["novels"][0], datetime.now()
+    snapshot(primary, replica)
+    chapter_id = ChapterMapper().create_chapter(CreateChapterDto(
+        chapter_title="副本之后的章节", chapter_number=None, create_time=now, novel=novel_id))
+    scene_id = SceneMapper().create_scene(CreateSceneDto(scene_name="新情景", create_time=now, chapter=chapter_id))
+    ConversationMapper().create_conversation(CreateConversationDto(
+        role="user", content="雨夜，他回到了旧宅。", create_time=now, scene=scene_id))
+    # 对照：接口之外的普通读取访问副本，读不到新章节
+    clear_novel_cache()
+    replica_has_chapter = any(c.chapter_id == chapter_id for c in NovelMapper().get_novel_by_id(novel_id).chapter)
+
+    fake = FakeChatModel(reply="他在旧宅中找到了一封信。")
+    register_job_handler(CHAPTER_SUMMARY, lambda: ChapterSummaryJob(NovelMapper(), build_provider_service(fake)))
+    service = JobService(LlmJobMapper())
+    job_id = service.create_job(CreateLlmJobDto(kind=CHAPTER_SUMMARY, novel_id=novel_id,
+                                                params={"chapter_id": chapter_id})).data.job_id
+    await service.run_next_job("replica-benchmark")
+    with require_position(math.inf):
+        job = LlmJobMapper().get_job(job_id)
+    scenes = len(job.result["scenes"]) if job.result else 0
+    return {"replica_has_chapter": replica_has_chapter, "status": job.status, "error": job.error, "scenes": scenes,
+            "ok": not replica_has_chapter and job.status == "done" and scenes == 1}
+
+
+async def contention(ids: dict, seconds: float, readers: int) -> dict:
+    """
+    后台线程持续向第二本小说写入对话，同时并发读取第一本小说，读取的数据量不随写入变化
+    """
+    from benchmark.FakeLLM import FakeChatModel
+    from core.entity.dto.ConversationDto import CreateConversationDto
+    from core.mapper.ConversationMapper import ConversationMapper
+
+    novel_id, scene_id = ids["novels"][0], ids["scenes"][-1]
+    stopped = threading.Event()
+    writes = 0
+
+    def write_loop():
+        nonlocal writes
+        mapper = ConversationMapper()
+        while not stopped.is_set():
+            mapper.create_conversation(CreateConversationDto(
+                role="user", content="继续写下去" * 20, create_time=datetime.now(), scene=scene_id))
+            writes += 1
+
+    samples = []
+
+    async def read_loop(client, deadline):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get(f"/api/novel/{novel_id}")
+            assert response.status_code == 200, response.text
+            samples.append(time.perf_counter() - start)
+
+    writer = threading.Thread(target=write_loop)
+    writer.start()
+    try:
+        async with asgi_client(FakeChatModel("")) as client:
+            deadline = time.perf_counter() + seconds
+            await asyncio.gather(*(read_loop(client, deadline) for _ in range(readers)))
+    finally:
+        stopped.set()
+        writer.join()
+    return {"reads": summarize(samples), "reads_per_second": round(len(samples) / seconds, 1),
+            "writes_per_second": round(writes / seconds, 1)}
+
+
+def run(scale, primary: str, replica: str, seconds: float, readers: int) -> dict:
+    from benchmark.DataGenerator import generate
+    from core.utils import AppConfig
+
+    ids = generate(scale)
+    result = {"scale": scale.model_dump(), "routing": asyncio.run(routing(ids, primary, replica))}
+    result["job_reads"] = asyncio.run(job_reads(ids, primary, replica))
+
+    # 性能对比时副本不再同步，放宽落后上限，只比较读取的数据库不同带来的差异
+    max_lag = AppConfig.REPLICA_MAX_LAG_SECONDS
+    snapshot(primary, replica)
+    AppConfig.REPLICA_MAX_LAG_SECONDS = 3600
+    result["replica"] = asyncio.run(contention(ids, seconds, readers))
+    AppConfig.REPLICA_MAX_LAG_SECONDS = -1
+    result["primary"] = asyncio.run(contention(ids, seconds, readers))
+    AppConfig.REPLICA_MAX_LAG_SECONDS = max_lag
+    result["reads"] = reads_by_target()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="只读副本的读写分离测试")
+    parser.add_argument("--chapters", type=int, default=10)
+    parser.add_argument("--scenes", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=5, help="性能对比每轮的秒数")
+    parser.add_argument("--readers", type=int, default=4, help="并发读取的请求数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-replica-") as workdir:
+        primary_path, replica_path = str(Path(workdir) / "primary.sqlite"), str(Path(workdir) / "replica.sqlite")
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", primary_path)
+        os.environ["QUICKNOVEL_REPLICA"] = replica_path
+        os.environ.setdefault("QUICKNOVEL_REPLICA_MAX_LAG_SECONDS", "2")
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "WARNING")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        # 设置数据库路径之后才能导入 core 下的模块
+        from benchmark.DataGenerator import DataScale
+
+        scale = DataScale(novels=2, chapters=args.chapters, scenes=args.scenes, turns=args.turns)
+        print(json.dumps(run(scale, primary_path, replica_path, args.seconds, args.readers),
+                         ensure_ascii=False, indent=2))
@@ -0,0 +1,157 @@
+"""
+以情景为中心构建 prompt（AppConfig.PROMPT_SCOPE 为 scene）与发送整部小说历史（novel）的对比，模型使用假模型
+
+每个规模生成一部小说，章节依次以上一章为父章节，最后一章的最后一个情景以前一个情景为父情景，
+前一个情景又以上一章的最后一个情景为父情景；这两个情景中的回复由两个角色说出，本轮对话指定第三个角色，
+小说关联的其他角色不参与对话。检查以下几项，任意一项不满足时以非零状态码退出：
+1. token：scene 的 prompt 明显小于 novel，且不随章节数增长
+2. 角色：scene 的 prompt 只包含参与对话的三个角色，novel 包含全部关联角色
+3. 前缀：在同一情景中连续对话，scene 模式下每轮的消息是下一轮的前缀
+
+另外输出两种方式从发起请求到收到第一块回复的耗时（假模型没有延迟，即查询和构建 prompt 的耗时），取多次的中位数。
+
+运行方式（在 app 目录下）: python -m benchmark.SceneContextBenchmark
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import build_provider_service
+
+SCALES = {
+    "small": dict(chapters=5, scenes=4, turns=10),
+    "large": dict(chapters=30, scenes=5, turns=10),
+}
+
+
+def link_scenes(ids: dict) -> dict:
+    """
+    设置父章节、父情景和说话的角色，返回本轮对话的小说、情景和角色
+    """
+    from pony.orm import db_session
+
+    from core.entity.po.NovelEntity import ChapterEntity
+
+    with db_session:
+        chapters = [ChapterEntity[chapter_id] for chapter_id in ids["chapters"]]
+        for parent, chapter in zip(chapters, chapters[1:]):
+            chapter.parent = parent
+        previous = max(chapters[-2].scene, key=lambda scene: scene.scene_id)
+        scenes = sorted(chapters[-1].scene, key=lambda scene: scene.scene_id)
+        parent, scene = scenes[-2], scenes[-1]
+        parent.parent = previous
+        scene.parent = parent
+        speakers = ids["characters"][:2]
+        for target, character_id in ((scene, speakers[0]), (parent, speakers[1])):
+            for conversation in target.conversation:
+                if conversation.role == "assistant":
+                    conversation.sender_character = character_id
+        return {"novel_id": chapters[-1].novel.novel_id, "scene_id": scene.scene_id,
+                "character_id": ids["characters"][2], "involved": ids["characters"][:3]}
+
+
+async def prompt(provider, fake, target: dict) -> dict:
+    """
+    发起一轮对话（假模型），返回发送给模型的消息和收到第一块回复的耗时
+    """
+    from core.utils.TokenCounter import count_messages_tokens
+
+    start = time.perf_counter()
+    stream = provider.generate_llm_response("继续", target["novel_id"], target["scene_id"], target["character_id"])
+    await stream.__anext__()
+    elapsed = time.perf_counter() - start
+    await stream.aclose()
+    messages = [m.content for m in fake.calls[-1]]
+    return {"messages": messages, "tokens": count_messages_tokens(messages), "ms": elapsed * 1000,
+            "characters": sum(message.startswith("角色名称") for message in messages)}
+
+
+async def compare(target: dict, repeat: int) -> dict:
+    from benchmark.FakeLLM import FakeChatModel
+    from core.utils import AppConfig
+
+    fake = FakeChatModel(chunk_size=1000)
+    provider = build_provider_service(fake)
+    result = {}
+    for scope in ("novel", "scene"):
+        AppConfig.PROMPT_SCOPE = scope
+        runs = [await prompt(provider, fake, target) for _ in range(repeat)]
+        result[scope] = {"tokens": runs[-1]["tokens"], "messages": len(runs[-1]["messages"]),
+                         "characters": runs[-1]["characters"],
+                         "first_chunk_ms": round(statistics.median(run["ms"] for run in runs), 3)}
+    return result
+
+
+async def prefix_stable(target: dict, turns: int) -> bool:
+    """
+    scene 模式下在同一情景中连续对话，上一轮的消息是下一轮的前缀
+    """
+    from datetime import datetime
+
+    from benchmark.FakeLLM import FakeChatModel
+    from core.entity.dto.ConversationDto import CreateConversationDto
+    from core.mapper.ConversationMapper import ConversationMapper
+    from core.utils import AppConfig
+
+    AppConfig.PROMPT_SCOPE = "scene"
+    fake = FakeChatModel(chunk_size=1000)
+    provider = build_provider_service(fake)
+    mapper = ConversationMapper()
+    previous = await prompt(provider, fake, target)
+    stable = True
+    for _ in range(turns):
+        for role, content, sender in (("user", "他推开门，走进雨里。", None),
+                                      ("assistant", "雨声渐密，灯火在长街尽头摇曳。", target["character_id"])):
+            mapper.create_conversation(CreateConversationDto(
+                role=role, content=content, create_time=datetime.now(), scene=target["scene_id"],
+                novel=target["novel_id"], sender_character=sender))
+        current = await prompt(provider, fake, target)
+        stable = stable and current["messages"][:len(previous["messages"])] == previous["messages"]
+        previous = current
+    return stable
+
+
+def run(characters: int, repeat: int, turns: int) -> dict:
+    from benchmark.DataGenerator import DataScale, generate
+
+    result = {}
+    for name, scale in SCALES.items():
+        ids = generate(DataScale(novels=1, characters=characters, content_length=100, **scale))
+        target = link_scenes(ids)
+        modes = asyncio.run(compare(target, repeat))
+        novel, scene = modes["novel"], modes["scene"]
+        result[name] = {
+            **modes,
+            "reduction": round(1 - scene["tokens"] / novel["tokens"], 4),
+            "ok": scene["tokens"] * 3 < novel["tokens"] and scene["characters"] == len(target["involved"])
+                  and novel["characters"] == characters,
+        }
+    # 父情景、父章节和同章节情景的数量与规模无关，scene 模式的 prompt 不随章节数增长
+    small, large = result["small"]["scene"]["tokens"], result["large"]["scene"]["tokens"]
+    result["scale_independent"] = {"small": small, "large": large, "ok": large < small * 1.5}
+    result["prefix"] = {"turns": turns, "ok": asyncio.run(prefix_stable(target, turns))}
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="以情景为中心的 prompt 与整部小说的 prompt 的对比")
+    parser.add_argument("--characters", type=int, default=8, help="小说关联的角色数，其中 3 个参与对话")
+    parser.add_argument("--repeat", type=int, default=5, help="每种方式发起的对话次数，耗时取中位数")
+    parser.add_argument("--turns", type=int, default=3, help="检查前缀时连续对话的轮数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-scene-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "scene.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "ERROR")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        result = run(args.characters, args.repeat, args.turns)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(0 if all(item.get("ok", True) for item in result.values()) else 1)
@@ -0,0 +1,248 @@
+"""
+模拟多个客户端同时发起生成，检查限流和公平调度（core/service/GenerationScheduler.py）
+
+1. 公平：一个客户端一次发起大量生成，其他客户端随后各发起一次，对比按客户端加权轮询和全部请求先到先得时
+   其他客户端等待名额的时间
+2. 权重：两个权重为 3:1 的客户端同时排满队列，前若干个名额的分配比例
+3. 令牌桶（模拟时钟）：突发数量用完后被拒绝，Retry-After 与补充令牌的时间一致；同一小说的多个客户端共用小说的令牌
+4. 排队上限：同一客户端排队的生成达到上限后被拒绝，其他客户端不受影响；同时通过 admit、还没有进入 slot 的请求同样计入，
+   预留的位置进入 slot 后转为排队，到期后释放
+5. 取消：排队中和刚分到名额时被取消的请求不占用名额
+6. 接口：通过对话接口（假模型）超出限制时返回 429 和 Retry-After，被拒绝的请求不写入对话，其他客户端不受影响
+7. 开销：没有竞争时 admit 加 slot 的耗时
+
+任意一项检查不满足时以非零状态码退出。运行方式（在 app 目录下）: python -m benchmark.SchedulerSimulation
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import asgi_client, summarize
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def scheduler(concurrency=1, client_rate=0, client_burst=1, novel_rate=0, novel_burst=1, queue_limit=0,
+              weights=None, clock=time.monotonic):
+    from core.service.GenerationScheduler import GenerationScheduler
+
+    return GenerationScheduler(concurrency, client_rate, client_burst, novel_rate, novel_burst, queue_limit,
+                               weights, clock)
+
+
+async def generate(s, client: str, hold: float, waits: list, order: list = None):
+    start = time.perf_counter()
+    async with s.slot(client):
+        waits.append(time.perf_counter() - start)
+        if order is not None:
+            order.append(client)
+        await asyncio.sleep(hold)
+
+
+async def fairness(greedy: int, others: int, hold: float) -> dict:
+    """
+    greedy 个请求同时到达后，others 个客户端各发起一次生成。fifo 模式下全部请求使用同一个客户端标识，即只有一个队列
+    """
+    result = {}
+    for mode in ("fair", "fifo"):
+        s = scheduler(concurrency=2)
+        greedy_waits, other_waits = [], []
+        tasks = [asyncio.create_task(generate(s, "greedy" if mode == "fair" else "all", hold, greedy_waits))
+                 for _ in range(greedy)]
+        await asyncio.sleep(hold / 2)
+        tasks += [asyncio.create_task(generate(s, f"user{i}" if mode == "fair" else "all", hold, other_waits))
+                  for i in range(others)]
+        await asyncio.gather(*tasks)
+        result[mode] = {"others_wait": summarize(other_waits), "greedy_wait": summarize(greedy_waits)}
+    result["ok"] = result["fair"]["others_wait"]["p95_ms"] * 3 < result["fifo"]["others_wait"]["p95_ms"]
+    return result
+
+
+async def weights(rounds: int) -> dict:
+    s = scheduler(concurrency=1, weights={"heavy": 3, "light": 1})
+    order = []
+    # 先占住唯一的名额，两个客户端的请求全部进入队列
+    blocker = asyncio.create_task(generate(s, "blocker", 0.01, []))
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(generate(s, client, 0, [], order))
+             for client in ("heavy", "light") for _ in range(rounds)]
+    await asyncio.gather(blocker, *tasks)
+    first = order[:rounds]
+    heavy = first.count("heavy")
+    return {"first": rounds, "heavy": heavy, "light": rounds - heavy,
+            "ok": abs(heavy - rounds * 3 / 4) <= 1}
+
+
+def token_buckets() -> dict:
+    from core.utils.CustomizeException import RateLimitError
+
+    clock = FakeClock()
+    # 每个客户端每分钟 60 次（每秒补充 1 个令牌），突发 5 次；每部小说突发 8 次
+    s = scheduler(client_rate=60, client_burst=5, novel_rate=60, novel_burst=8, clock=clock)
+
+    def attempt(client, novel_id=1):
+        try:
+            s.admit(client, novel_id)
+            return "ok"
+        except RateLimitError as e:
+            return f"{e.data['reason']}:{e.headers['Retry-After']}"
+
+    burst = [attempt("a") for _ in range(7)]
+    clock.now += 1
+    refilled = attempt("a")
+    # 小说 1 的令牌已消耗 6 个、补充 1 个，另一个客户端只能再发起 3 次
+    shared = [attempt("b") for _ in range(4)]
+    other_novel = attempt("b", 2)
+    return {
+        "burst": burst, "after_1s": refilled, "shared_novel": shared, "other_novel": other_novel,
+        "ok": burst == ["ok"] * 5 + ["client_rate:1"] * 2 and refilled == "ok"
+              and shared == ["ok"] * 3 + ["novel_rate:1"] and other_novel == "ok",
+    }
+
+
+async def queue_limit() -> dict:
+    from core.utils.CustomizeException import RateLimitError
+
+    s = scheduler(concurrency=1, queue_limit=2)
+    results = {}
+    async with s.slot("a"):
+        queued = [asyncio.create_task(generate(s, "a", 0, [])) for _ in range(2)]
+        await asyncio.sleep(0)
+        for client in ("a", "b"):
+            try:
+                s.admit(client)
+                results[client] = "ok"
+            except RateLimitError as e:
+                results[client] = e.data["reason"]
+    await asyncio.gather(*queued)
+
+    # 同一客户端的多个请求同时通过 admit，都还没有进入 slot
+    clock = FakeClock()
+    s = scheduler(concurrency=1, queue_limit=2, clock=clock)
+
+    def attempt(client):
+        try:
+            s.admit(client)
+            return "ok"
+        except RateLimitError as e:
+            return e.data["reason"]
+
+    concurrent = [attempt("c") for _ in range(3)]
+    async with s.slot("c"):
+        # 一个预留位置已取用，另一个仍在等待进入 slot
+        after_slot = attempt("c")
+        full = attempt("c")
+    clock.now += 61
+    expired = attempt("c")
+    return {**results, "concurrent_admits": concurrent, "after_slot": after_slot, "expired": expired,
+            "ok": results == {"a": "client_queue", "b": "ok"} and concurrent == ["ok", "ok", "client_queue"]
+                  and after_slot == "ok" and full == "client_queue" and expired == "ok"}
+
+
+async def cancellation() -> dict:
+    s = scheduler(concurrency=1)
+    async with s.slot("a"):
+        queued = [asyncio.create_task(generate(s, client, 0.01, [])) for client in ("b", "c", "d")]
+        await asyncio.sleep(0.01)
+        # 排队中取消
+        queued[0].cancel()
+        await asyncio.sleep(0)
+    # 退出时名额已交给 c，c 在开始执行前被取消，名额再交给 d
+    queued[1].cancel()
+    results = await asyncio.gather(*queued, return_exceptions=True)
+    cancelled = sum(isinstance(r, asyncio.CancelledError) for r in results)
+    after = [asyncio.create_task(generate(s, "e", 0, [])) for _ in range(3)]
+    await asyncio.wait_for(asyncio.gather(*after), timeout=1)
+    return {"cancelled": cancelled, "queued": s.queued(), "active": s._active,
+            "ok": s.queued() == 0 and s._active == 0}
+
+
+async def http(ids: dict) -> dict:
+    from pony.orm import db_session, count
+
+    from benchmark.FakeLLM import FakeChatModel
+    from core.entity.po.ConversationEntity import ConversationEntity
+
+    novel_id, scene_id = ids["novels"][0], ids["scenes"][0]
+
+    def conversations():
+        with db_session:
+            return count(c for c in ConversationEntity if c.scene.scene_id == scene_id)
+
+    s = scheduler(concurrency=2, client_rate=6, client_burst=3, novel_rate=60, novel_burst=10)
+    body = {"role": "user", "content": "继续", "scene": scene_id, "novel": novel_id}
+    before = conversations()
+    async with asgi_client(FakeChatModel(chunk_size=1000), s) as client:
+        responses = await asyncio.gather(*[client.post("/api/conversation/", json=body,
+                                                       headers={"X-Client-Id": "tab"}) for _ in range(5)])
+        other = await client.post("/api/conversation/", json=body, headers={"X-Client-Id": "other"})
+        metrics = (await client.get("/metrics")).text
+    statuses = sorted(r.status_code for r in responses)
+    rejected = [r for r in responses if r.status_code == 429]
+    written = conversations() - before
+    return {
+        "statuses": statuses,
+        "retry_after": [r.headers.get("retry-after") for r in rejected],
+        "reason": [r.json()["data"]["reason"] for r in rejected],
+        "other_client": other.status_code,
+        # 每次成功的生成写入用户消息和回复两条
+        "written": written,
+        "ok": statuses == [200] * 3 + [429] * 2 and all(r.headers.get("retry-after") == "10" for r in rejected)
+              and other.status_code == 200 and written == 8
+              and 'quicknovel_generation_rejected_total{reason="client_rate"}' in metrics,
+    }
+
+
+async def overhead(repeat: int) -> dict:
+    s = scheduler(concurrency=8, client_rate=1e9, client_burst=10 ** 9, novel_rate=1e9, novel_burst=10 ** 9)
+    start = time.perf_counter()
+    for i in range(repeat):
+        s.admit(f"client{i % 100}", i % 10)
+        async with s.slot(f"client{i % 100}"):
+            pass
+    return {"per_generation_us": round((time.perf_counter() - start) / repeat * 1e6, 2)}
+
+
+def run(greedy: int, others: int, hold: float) -> dict:
+    from benchmark.DataGenerator import DataScale, generate as generate_data
+
+    ids = generate_data(DataScale(novels=1, chapters=1, scenes=1, turns=1, characters=1))
+    return {
+        "fairness": asyncio.run(fairness(greedy, others, hold)),
+        "weights": asyncio.run(weights(20)),
+        "token_buckets": token_buckets(),
+        "queue_limit": asyncio.run(queue_limit()),
+        "cancellation": asyncio.run(cancellation()),
+        "http": asyncio.run(http(ids)),
+        "overhead": asyncio.run(overhead(10000)),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="模拟多个客户端检查生成的限流和公平调度")
+    parser.add_argument("--greedy", type=int, default=40, help="一次发起大量生成的客户端的请求数")
+    parser.add_argument("--others", type=int, default=5, help="其他客户端数，每个客户端发起一次生成")
+    parser.add_argument("--hold", type=float, default=0.02, help="每次生成占用名额的时间（秒）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-scheduler-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "scheduler.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "ERROR")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        result = run(args.greedy, args.others, args.hold)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(0 if all(item.get("ok", True) for item in result.values()) else 1)
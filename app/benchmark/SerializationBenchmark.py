@@ -0,0 +1,189 @@
+"""
+接口响应的序列化耗时和传输字节数
+
+1. 逐接口对比：用同一组接口函数构造只使用 FastAPI 默认路由（按 response_model 校验后序列化）的对照应用，
+   与当前应用（DtoRoute 直接序列化 DTO）分别请求，统计耗时和响应体字节数，以及 gzip / brotli 压缩后的字节数，
+   并检查两者的响应内容完全相同
+2. 序列化方式：对最大的响应（整本小说）单独统计 FastAPI 默认序列化、jsonable_encoder（没有返回值注解的接口）、
+   pydantic 和 orjson 的耗时
+3. 压缩级别：整本小说的 JSON 在不同 gzip 级别（以及 brotli 质量，安装了 brotli 时）下的耗时和压缩后的字节数
+
+运行方式（在 app 目录下）: python -m benchmark.SerializationBenchmark --chapters 20 --scenes 10 --turns 50
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import summarize
+
+# 对比的接口，{} 中为 ids 的键
+ENDPOINTS = [
+    "/api/novel/{novels}",
+    "/api/novel/",
+    "/api/conversation/{scenes}",
+    "/api/character/",
+    "/api/world/{worlds}",
+]
+
+
+def baseline_app():
+    """
+    使用与当前应用相同的接口函数、返回值注解和中间件，但路由为 FastAPI 默认的 APIRoute
+    """
+    from fastapi import APIRouter, FastAPI
+
+    import Start
+    from core.utils.JsonResponse import DtoRoute
+
+    app = FastAPI()
+    # 中间件相同，只有路由不同
+    app.user_middleware = list(Start.app.user_middleware)
+    for router in vars(Start).values():
+        if not isinstance(router, APIRouter):
+            continue
+        for route in router.routes:
+            if isinstance(route, DtoRoute) and "GET" in route.methods:
+                app.add_api_route(route.path, route.endpoint.__wrapped__, methods=["GET"],
+                                  response_model=route.response_model)
+    return app
+
+
+async def measure(client, url: str, repeat: int, encoding: str = "identity") -> dict:
+    samples, body = [], b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await client.get(url, headers={"accept-encoding": encoding})
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text[:200]
+        body = response.content
+    # httpx 自动解压，压缩后的字节数从响应头读取
+    return {"latency": summarize(samples), "bytes": int(response.headers.get("content-length", len(body))),
+            "body": body}
+
+
+async def compare_endpoints(ids: dict, repeat: int) -> dict:
+    import httpx
+
+    import Start
+    from core.utils.CompressionMiddleware import BROTLI_AVAILABLE
+
+    result = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=baseline_app()), base_url="http://baseline",
+                                 timeout=120) as baseline, \
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=Start.app), base_url="http://current",
+                              timeout=120) as current:
+        for endpoint in ENDPOINTS:
+            url = endpoint.format(**{key: values[0] for key, values in ids.items()})
+            default = await measure(baseline, url, repeat)
+            dto = await measure(current, url, repeat)
+            compressed = {"gzip": await measure(current, url, repeat, "gzip")}
+            if BROTLI_AVAILABLE:
+                compressed["br"] = await measure(current, url, repeat, "br")
+            result[endpoint] = {
+                "bytes": dto["bytes"],
+                "same_body": default.pop("body") == dto.pop("body"),
+                "default_median_ms": default["latency"]["median_ms"],
+                "dto_median_ms": dto["latency"]["median_ms"],
+                **{f"{name}_bytes": value["bytes"] for name, value in compressed.items()},
+                **{f"{name}_median_ms": value["latency"]["median_ms"] for name, value in compressed.items()},
+            }
+    return result
+
+
+def timed(func, repeat: int) -> dict:
+    func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = func()
+        samples.append(time.perf_counter() - start)
+    return {"median_ms": summarize(samples)["median_ms"], "bytes": len(output)}
+
+
+def serializers(novel_id: int, repeat: int) -> dict:
+    """
+    整本小说的响应只序列化、不经过 HTTP 的耗时
+    """
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+
+    from core.entity.ResponseEntity import ResponseModel, success
+    from core.entity.dto.NovelDto import ResponseAllNovelDto
+    from core.mapper.NovelMapper import NovelMapper
+    from core.utils import JsonResponse
+
+    response = success(data=NovelMapper().get_novel_by_id(novel_id))
+    field = create_model_field(name="response", type_=ResponseModel[ResponseAllNovelDto], mode="serialization")
+    loop = asyncio.new_event_loop()
+    result = {
+        "fastapi_response_model": timed(lambda: loop.run_until_complete(serialize_response(
+            field=field, response_content=response, dump_json=True)), repeat),
+        "jsonable_encoder": timed(lambda: json.dumps(jsonable_encoder(response), ensure_ascii=False).encode(),
+                                  max(1, repeat // 4)),
+        "pydantic_to_json": timed(lambda: response.__pydantic_serializer__.to_json(response), repeat),
+    }
+    if JsonResponse.ORJSON_AVAILABLE:
+        result["orjson"] = timed(lambda: JsonResponse.dumps(response), repeat)
+    loop.close()
+    return result
+
+
+def compression_levels(novel_id: int, repeat: int) -> dict:
+    from core.entity.ResponseEntity import success
+    from core.mapper.NovelMapper import NovelMapper
+    from core.utils.CompressionMiddleware import BROTLI_AVAILABLE
+    from core.utils.JsonResponse import dumps
+
+    body = dumps(success(data=NovelMapper().get_novel_by_id(novel_id)))
+    result = {"raw_bytes": len(body)}
+    for level in (1, 3, 5, 9):
+        result[f"gzip_{level}"] = timed(lambda: gzip.compress(body, compresslevel=level, mtime=0), repeat)
+    if BROTLI_AVAILABLE:
+        import brotli
+
+        for quality in (1, 4, 8):
+            result[f"br_{quality}"] = timed(lambda: brotli.compress(body, quality=quality), repeat)
+    return result
+
+
+def run(scale, repeat: int) -> dict:
+    from benchmark.DataGenerator import generate
+    from core.utils.CompressionMiddleware import BROTLI_AVAILABLE
+    from core.utils.JsonResponse import ORJSON_AVAILABLE
+
+    ids = generate(scale)
+    novel_id = ids["novels"][0]
+    return {
+        "scale": scale.model_dump(),
+        "orjson": ORJSON_AVAILABLE,
+        "brotli": BROTLI_AVAILABLE,
+        "endpoints": asyncio.run(compare_endpoints(ids, repeat)),
+        "serializers": serializers(novel_id, repeat),
+        "compression": compression_levels(novel_id, repeat),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="接口响应的序列化耗时和传输字节数")
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--scenes", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-serialization-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "serialization.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "WARNING")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        # 设置数据库路径之后才能导入 core 下的模块
+        from benchmark.DataGenerator import DataScale
+
+        data_scale = DataScale(chapters=args.chapters, scenes=args.scenes, turns=args.turns)
+        print(json.dumps(run(data_scale, args.repeat), ensure_ascii=False, indent=2))
@@ -0,0 +1,107 @@
+"""
+统计 API 进程的启动耗时
+
+1. 使用 python -X importtime 统计导入 Start 模块时耗时最多的模块
+2. 启动 uvicorn 子进程，测量从进程启动到第一次返回 200 的时间（冷启动，分别测试空库和已建表的数据库）
+
+运行方式（在 app 目录下）: python -m benchmark.StartupProfile --rounds 3
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+
+def _env(workdir: str) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(APP_DIR)
+    env["QUICKNOVEL_DB_PATH"] = str(Path(workdir) / "startup.sqlite")
+    env.setdefault("QUICKNOVEL_LOG_LEVEL", "WARNING")
+    return env
+
+
+def import_profile(workdir: str, top: int) -> list:
+    """
+    返回导入 Start 时累计耗时最多的模块
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import Start"],
+                            cwd=workdir, env=_env(workdir), capture_output=True, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # 格式为 "import time: 自身耗时 | 累计耗时 | 模块名"，单位为微秒
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    modules.sort(key=lambda m: m["cumulative_ms"], reverse=True)
+    return modules[:top]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cold_start(workdir: str, path: str, timeout: float = 30) -> float:
+    """
+    启动 uvicorn，返回从进程启动到 path 第一次返回 200 的秒数
+    """
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "Start:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=workdir, env=_env(workdir), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"{timeout} 秒内没有返回 200")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run(rounds: int, path: str, top: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="quicknovel-startup-") as workdir:
+        Path(workdir, "uploads").mkdir()
+        modules = import_profile(workdir, top)
+
+        # 第一次启动需要建表，之后的启动走结构指纹一致的快速路径
+        first = cold_start(workdir, path)
+        warm_schema = [cold_start(workdir, path) for _ in range(rounds)]
+
+    return {
+        "path": path,
+        "first_start_seconds": round(first, 3),
+        "cold_start_median_seconds": round(statistics.median(warm_schema), 3),
+        "cold_start_samples": [round(sample, 3) for sample in warm_schema],
+        "slowest_imports": modules,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="启动耗时统计")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--path", default="/api/novel/", help="用于判断启动完成的接口")
+    parser.add_argument("--top", type=int, default=15, help="输出耗时最多的模块数量")
+    args = parser.parse_args()
+    print(json.dumps(run(args.rounds, args.path, args.top), ensure_ascii=False, indent=2))
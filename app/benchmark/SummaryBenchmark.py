@@ -0,0 +1,157 @@
+"""
+对比汇总字段和实时统计的耗时
+
+1. 小说列表：直接读取汇总字段 / 用 SQL 实时聚合 / 加载每本小说的完整数据后统计（前端原来的做法）
+2. 小说详情头部：读取汇总字段 / 加载完整数据后统计
+3. 写入开销：创建对话时同时更新汇总字段 / 只插入对话
+4. 正确性：经过 mapper 写入后，汇总字段与重新计算的结果一致
+
+运行方式（在 app 目录下）: python -m benchmark.SummaryBenchmark --novels 20 --chapters 5 --scenes 5 --turns 20
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import summarize
+
+# 实时聚合的 SQL，与汇总字段含义相同
+AGGREGATE_SQL = """
+    SELECT n.novel_id, n.novel_name,
+           (SELECT COUNT(*) FROM ChapterEntity c WHERE c.novel = n.novel_id),
+           (SELECT COUNT(*) FROM SceneEntity s JOIN ChapterEntity c ON s.chapter = c.chapter_id
+            WHERE c.novel = n.novel_id),
+           COUNT(conv.conversation_id),
+           COALESCE(SUM(LENGTH(conv.content)), 0),
+           MAX(conv.create_time)
+    FROM NovelEntity n
+    LEFT JOIN ChapterEntity c ON c.novel = n.novel_id
+    LEFT JOIN SceneEntity s ON s.chapter = c.chapter_id
+    LEFT JOIN ConversationEntity conv ON conv.scene = s.scene_id
+    GROUP BY n.novel_id
+"""
+
+
+def timed(func, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def tree_summary(novel) -> dict:
+    """
+    根据完整的小说数据统计，等同于前端拿到整棵树之后的计算
+    """
+    scenes = [scene for chapter in novel.chapter for scene in chapter.scene]
+    conversations = [conv for scene in scenes for conv in scene.conversation]
+    return {
+        "chapter_count": len(novel.chapter),
+        "scene_count": len(scenes),
+        "conversation_count": len(conversations),
+        "total_characters": sum(len(conv.content) for conv in conversations),
+    }
+
+
+def run(scale, repeat: int, writes: int) -> dict:
+    from pony.orm import db_session
+
+    from benchmark.DataGenerator import generate
+    from core.entity.dto.ChapterDto import CreateChapterDto
+    from core.entity.dto.ConversationDto import CreateConversationDto
+    from core.entity.dto.SceneDto import CreateSceneDto
+    from core.entity.po.ConversationEntity import ConversationEntity
+    from core.mapper.ChapterMapper import ChapterMapper
+    from core.mapper.ConversationMapper import ConversationMapper
+    from core.mapper.NovelMapper import NovelMapper
+    from core.mapper.SceneMapper import SceneMapper
+    from core.mapper.config.Counters import rebuild_counters
+    from core.mapper.config.DatabaseConfig import db
+    from core.utils import AppConfig
+
+    # 统计的是加载完整数据的耗时，不使用小说详情缓存（见 NovelCacheBenchmark）
+    AppConfig.NOVEL_CACHE_MAX_MB = 0
+    ids = generate(scale)
+    novel_mapper = NovelMapper()
+    conversation_mapper = ConversationMapper()
+    novel_id = ids["novels"][0]
+    scene_id = ids["scenes"][0]
+
+    @db_session
+    def aggregate_list():
+        return db.select(AGGREGATE_SQL.strip())
+
+    def tree_list():
+        return [tree_summary(novel_mapper.get_novel_by_id(novel.novel_id)) for novel in novel_mapper.get_all_novels()]
+
+    reads = {
+        "list_counters": timed(novel_mapper.get_all_novels, repeat),
+        "list_sql_aggregate": timed(aggregate_list, repeat),
+        "list_full_trees": timed(tree_list, max(1, repeat // 5)),
+        "header_counters": timed(lambda: novel_mapper.get_novel_summary(novel_id), repeat),
+        "header_full_tree": timed(lambda: tree_summary(novel_mapper.get_novel_by_id(novel_id)), repeat),
+    }
+
+    @db_session
+    def insert_only():
+        ConversationEntity(role="user", content="继续写下去", create_time=datetime.now(), scene=scene_id)
+
+    write_costs = {
+        "create_conversation_with_counters": timed(lambda: conversation_mapper.create_conversation(
+            CreateConversationDto(role="user", content="继续写下去", create_time=datetime.now(), scene=scene_id)),
+            writes),
+        "insert_conversation_only": timed(insert_only, writes),
+    }
+
+    # insert_only 绕过了 mapper，先修正汇总字段
+    with db_session:
+        rebuild_counters()
+
+    # 通过 mapper 写入新的章节、情景、对话后，汇总字段应与重新计算的结果一致
+    chapter_id = ChapterMapper().create_chapter(CreateChapterDto(
+        chapter_title="新章节", chapter_number=None, create_time=datetime.now(), novel=novel_id))
+    new_scene_id = SceneMapper().create_scene(CreateSceneDto(
+        scene_name="新情景", create_time=datetime.now(), chapter=chapter_id))
+    for content in ("新的对话", "再来一句"):
+        conversation_mapper.create_conversation(CreateConversationDto(
+            role="user", content=content, create_time=datetime.now(), scene=new_scene_id))
+    maintained = novel_mapper.get_novel_summary(novel_id)
+    with db_session:
+        rebuild_counters()
+    rebuilt = novel_mapper.get_novel_summary(novel_id)
+    computed = tree_summary(novel_mapper.get_novel_by_id(novel_id))
+
+    return {
+        "scale": scale.model_dump(),
+        "reads": reads,
+        "writes": write_costs,
+        "consistent": maintained == rebuilt and all(getattr(maintained, key) == value
+                                                    for key, value in computed.items()),
+        "summary": maintained.model_dump(mode="json"),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="汇总字段与实时统计的对比")
+    parser.add_argument("--novels", type=int, default=20)
+    parser.add_argument("--chapters", type=int, default=5)
+    parser.add_argument("--scenes", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--writes", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-summary-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "summary.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "WARNING")
+        os.chdir(workdir)
+        # 设置数据库路径之后才能导入 core 下的模块
+        from benchmark.DataGenerator import DataScale
+
+        scale = DataScale(novels=args.novels, chapters=args.chapters, scenes=args.scenes, turns=args.turns)
+        print(json.dumps(run(scale, args.repeat, args.writes), ensure_ascii=False, indent=2))
@@ -0,0 +1,165 @@
+"""
+模型用量统计的正确性和开销
+
+1. 通过对话接口在两个情景中、以不同的接收角色发起若干轮对话（假模型），检查 /api/usage 的汇总结果：
+   轮数正确，prompt 各部分之和等于 prompt token 数，按情景、按角色分组的合计等于小说的合计
+2. 假模型返回用量（usage_metadata）时记录模型的用量而不是本地统计
+3. 开销：拼接 prompt 并统计各部分 token 数量的耗时，与只拼接 prompt 的耗时对比；以及写入一条用量记录的耗时
+
+运行方式（在 app 目录下）: python -m benchmark.TokenUsageBenchmark --chapters 10 --scenes 5 --turns 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import asgi_client, build_provider_service, summarize
+
+
+class UsageReportingModel:
+    """
+    在最后一块数据中返回用量的假模型，与设置了 stream_usage 的 ChatOpenAI 相同
+    """
+
+    def __init__(self, reply: str, input_tokens: int, output_tokens: int):
+        self.reply = reply
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+    async def astream(self, messages, *args, **kwargs):
+        from langchain_core.messages import AIMessageChunk
+
+        yield AIMessageChunk(content=self.reply)
+        yield AIMessageChunk(content="", usage_metadata={"input_tokens": self.input_tokens,
+                                                         "output_tokens": self.output_tokens,
+                                                         "total_tokens": self.input_tokens + self.output_tokens})
+
+
+async def chat(client, novel_id: int, scene_id: int, character_id: int):
+    response = await client.post("/api/conversation/", json={
+        "role": "user", "content": "继续写下去", "scene": scene_id, "novel": novel_id,
+        "receiver_character": character_id})
+    assert response.status_code == 200 and "event: end" in response.text, response.text[-200:]
+
+
+async def accounting(ids: dict, rounds: int) -> dict:
+    """
+    在两个情景中轮流与两个角色对话，共 rounds 轮
+    """
+    from benchmark.FakeLLM import FakeChatModel
+
+    novel_id = ids["novels"][0]
+    scenes, characters = ids["scenes"][:2], ids["characters"][:2]
+    async with asgi_client(FakeChatModel("夜色渐深，灯火在长街尽头摇曳。", chunk_size=1000)) as client:
+        for i in range(rounds):
+            await chat(client, novel_id, scenes[i % 2], characters[(i // 2) % 2])
+        usage = (await client.get(f"/api/usage/novel/{novel_id}")).json()["data"]
+        scene_usage = (await client.get(f"/api/usage/scene/{scenes[0]}")).json()["data"]
+        character_usage = (await client.get(f"/api/usage/character/{characters[0]}")).json()["data"]
+
+    total = usage["total"]
+
+    def column_sum(rows, key):
+        return sum(row[key] for row in rows)
+
+    return {
+        "total": total,
+        "scene": scene_usage,
+        "character": character_usage,
+        "turns_ok": total["turns"] == rounds,
+        "sections_ok": total["system_tokens"] + total["character_tokens"] + total["history_tokens"]
+                       == total["prompt_tokens"],
+        "scenes_ok": all(column_sum(usage["scenes"], key) == total[key]
+                         for key in ("turns", "prompt_tokens", "completion_tokens")),
+        "characters_ok": all(column_sum(usage["characters"], key) == total[key]
+                             for key in ("turns", "prompt_tokens", "completion_tokens")),
+    }
+
+
+async def provider_usage(ids: dict) -> dict:
+    """
+    模型返回用量时以模型的用量为准
+    """
+    from core.mapper.TokenUsageMapper import TokenUsageMapper
+
+    scene_id = ids["scenes"][2]
+    service = build_provider_service(UsageReportingModel("好的。", input_tokens=12345, output_tokens=67))
+    async for _ in service.generate_llm_response("继续", ids["novels"][0], scene_id):
+        pass
+    usage = TokenUsageMapper().get_scene_usage(scene_id)
+    return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens,
+            "ok": (usage.prompt_tokens, usage.completion_tokens) == (12345, 67)}
+
+
+def overhead(ids: dict, repeat: int) -> dict:
+    from benchmark.FakeLLM import FakeChatModel
+    from core.entity.dto.TokenUsageDto import CreateTokenUsageDto
+    from core.mapper.TokenUsageMapper import TokenUsageMapper
+    from core.utils.TokenCounter import count_messages_tokens, get_tokenizer
+
+    novel_id = ids["novels"][0]
+    service = build_provider_service(FakeChatModel(""))
+
+    def timed(func):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+        return summarize(samples)["median_ms"]
+
+    def build():
+        return service.generate_scene_messages(novel_id), service.generate_character_messages(novel_id)
+
+    def build_and_count():
+        history, characters = build()
+        return count_messages_tokens(m.content for m in history), count_messages_tokens(m.content for m in characters)
+
+    mapper = TokenUsageMapper()
+    usage = CreateTokenUsageDto(novel_id=novel_id, model="fake", prompt_tokens=1, create_time=datetime.now())
+    history, characters = build()
+    return {
+        "tokenizer": get_tokenizer().name,
+        "history_messages": len(history),
+        "history_tokens": count_messages_tokens(m.content for m in history),
+        "build_prompt_ms": timed(build),
+        "build_and_count_ms": timed(build_and_count),
+        "record_usage_ms": timed(lambda: mapper.record_usage(usage)),
+    }
+
+
+def run(scale, rounds: int, repeat: int) -> dict:
+    from benchmark.DataGenerator import generate
+
+    ids = generate(scale)
+    return {
+        "scale": scale.model_dump(),
+        "accounting": asyncio.run(accounting(ids, rounds)),
+        "provider_usage": asyncio.run(provider_usage(ids)),
+        "overhead": overhead(ids, repeat),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="模型用量统计的正确性和开销")
+    parser.add_argument("--chapters", type=int, default=10)
+    parser.add_argument("--scenes", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-token-usage-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "usage.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "WARNING")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        # 设置数据库路径之后才能导入 core 下的模块
+        from benchmark.DataGenerator import DataScale
+
+        data_scale = DataScale(chapters=args.chapters, scenes=args.scenes, turns=args.turns)
+        print(json.dumps(run(data_scale, args.rounds, args.repeat), ensure_ascii=False, indent=2))
@@ -0,0 +1,85 @@
+"""
+测试并发上传大头像时对流式对话延迟的影响
+
+先单独测量多次流式对话的耗时，再在持续并发上传大文件的同时测量一次，对比两者的中位数和 p95。
+
+运行方式（在 app 目录下）: python -m benchmark.UploadBenchmark --uploads 8 --size-mb 4 --chats 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from benchmark.BenchmarkRunner import PNG_BYTES, asgi_client, summarize
+
+
+async def chat_once(client, scene_id: int, novel_id: int) -> float:
+    start = time.perf_counter()
+    async with client.stream("POST", "/api/conversation/", json={
+            "role": "user", "content": "继续", "scene": scene_id, "novel": novel_id}) as response:
+        async for _ in response.aiter_bytes():
+            pass
+    return time.perf_counter() - start
+
+
+async def measure_chats(client, ids, count: int) -> list:
+    return [await chat_once(client, ids["scenes"][0], ids["novels"][0]) for _ in range(count)]
+
+
+async def upload_loop(client, character_id: int, payload: bytes, stop: asyncio.Event, results: list):
+    while not stop.is_set():
+        response = await client.post(f"/api/character/{character_id}/avatar",
+                                     files={"avatar": ("avatar.png", payload, "image/png")})
+        results.append(response.status_code)
+
+
+async def run(uploads: int, size_mb: int, chats: int) -> dict:
+    from benchmark.DataGenerator import DataScale, generate
+    from benchmark.FakeLLM import FakeChatModel
+
+    # 每个上传任务使用不同的角色，模拟多个用户同时上传
+    ids = generate(DataScale(chapters=2, scenes=2, turns=5, characters=max(5, uploads)))
+    # 大小合法的 PNG：合法的文件头加上填充数据
+    payload = PNG_BYTES + b"\0" * (size_mb * 1024 * 1024 - len(PNG_BYTES))
+
+    async with asgi_client(FakeChatModel(chunk_size=4, first_token_delay=0.02)) as client:
+        baseline = await measure_chats(client, ids, chats)
+
+        stop = asyncio.Event()
+        statuses = []
+        workers = [asyncio.create_task(upload_loop(client, ids["characters"][i], payload, stop, statuses))
+                   for i in range(uploads)]
+        # 等待上传开始
+        await asyncio.sleep(0.2)
+        under_load = await measure_chats(client, ids, chats)
+        stop.set()
+        await asyncio.gather(*workers)
+
+    return {
+        "uploads": uploads,
+        "upload_size_mb": size_mb,
+        "completed_uploads": len(statuses),
+        "upload_statuses": sorted(set(statuses)),
+        "chat_alone": summarize(baseline),
+        "chat_during_uploads": summarize(under_load),
+        "median_ratio": round(statistics.median(under_load) / statistics.median(baseline), 2),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="并发上传对对话延迟的影响")
+    parser.add_argument("--uploads", type=int, default=8, help="并发上传的数量")
+    parser.add_argument("--size-mb", type=int, default=4, help="每个上传文件的大小")
+    parser.add_argument("--chats", type=int, default=20, help="每种情况下的对话次数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-upload-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "upload.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "WARNING")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        print(json.dumps(asyncio.run(run(args.uploads, args.size_mb, args.chats)), ensure_ascii=False, indent=2))
@@ -0,0 +1,204 @@
+"""
+多进程部署的压测
+
+分别以 1、2、4 个工作进程启动服务（uvicorn --workers），由多个压测进程并发请求只读接口，
+统计每秒请求数和相对单进程的扩展倍数；同时并发创建情景，检查写入没有出现数据库锁错误、
+汇总字段与写入次数一致，以及 /metrics 汇总了全部进程的请求数。
+
+读请求的扩展倍数受 CPU 核数限制，压测进程本身也占用 CPU，结果中记录了 cpu_count。
+
+运行方式（在 app 目录下）: python -m benchmark.WorkerScaling --workers 1 2 4 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from benchmark.BenchmarkRunner import summarize
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+REQUEST_COUNT = re.compile(r'^quicknovel_request_duration_seconds_count\{.*\} (\S+)$', re.MULTILINE)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, port: int, workdir: Path) -> subprocess.Popen:
+    env = dict(os.environ, QUICKNOVEL_METRICS_DIR=str(workdir / f"metrics-{workers}"))
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "Start:app", "--app-dir", str(APP_DIR), "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL)
+
+
+def wait_ready(base_url: str, timeout: float = 60):
+    import httpx
+
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            if httpx.get(base_url + "/", timeout=1).status_code == 200:
+                # 等其他工作进程也完成启动
+                time.sleep(2)
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{timeout} 秒内服务没有启动")
+
+
+async def _client_loop(base_url: str, paths: List[str], duration: float, concurrency: int,
+                       write: dict = None) -> dict:
+    import httpx
+
+    latencies, errors = [], 0
+    writes, write_errors = 0, 0
+    deadline = time.perf_counter() + duration
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60,
+                                 limits=httpx.Limits(max_connections=concurrency + 1)) as client:
+        async def reader(offset: int):
+            nonlocal errors
+            i = offset
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = await client.get(paths[i % len(paths)])
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+                i += 1
+
+        async def writer():
+            nonlocal writes, write_errors
+            while time.perf_counter() < deadline:
+                response = await client.post("/api/scene/", json={"scene_name": "压测情景", "chapter": write["chapter"]})
+                if response.status_code == 200:
+                    writes += 1
+                else:
+                    write_errors += 1
+                await asyncio.sleep(write["interval"])
+
+        tasks = [reader(i) for i in range(concurrency)]
+        if write:
+            tasks.append(writer())
+        await asyncio.gather(*tasks)
+    return {"latencies": latencies, "errors": errors, "writes": writes, "write_errors": write_errors}
+
+
+def client_process(base_url: str, paths: List[str], duration: float, concurrency: int, write: dict = None) -> dict:
+    return asyncio.run(_client_loop(base_url, paths, duration, concurrency, write))
+
+
+def load(base_url: str, paths: List[str], duration: float, clients: int, concurrency: int,
+         write: dict = None) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(clients) as pool:
+        results = pool.starmap(client_process, [(base_url, paths, duration, concurrency, write)] * clients)
+    latencies = [value for result in results for value in result["latencies"]]
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / duration, 1),
+        "errors": sum(result["errors"] for result in results),
+        "writes": sum(result["writes"] for result in results),
+        "write_errors": sum(result["write_errors"] for result in results),
+        "latency": summarize(latencies) if latencies else {},
+    }
+
+
+def metrics_request_count(base_url: str) -> float:
+    import httpx
+
+    return sum(float(value) for value in REQUEST_COUNT.findall(httpx.get(base_url + "/metrics").text))
+
+
+def run_workers(workers: int, workdir: Path, ids: dict, args) -> dict:
+    import httpx
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    novel_id, chapter_id = ids["novels"][0], ids["chapters"][0]
+    paths = [f"/api/novel/{novel_id}/summary", "/api/novel/"] + \
+            [f"/api/conversation/{scene_id}" for scene_id in ids["scenes"][:5]]
+
+    server = start_server(workers, port, workdir)
+    try:
+        wait_ready(base_url)
+        before = httpx.get(f"{base_url}/api/novel/{novel_id}/summary").json()["data"]["scene_count"]
+        # 预热
+        warmup = load(base_url, paths, 1, args.clients, args.concurrency)
+
+        reads = load(base_url, paths, args.duration, args.clients, args.concurrency)
+        mixed = load(base_url, paths, args.duration, args.clients, args.concurrency,
+                     write={"chapter": chapter_id, "interval": args.write_interval})
+        after = httpx.get(f"{base_url}/api/novel/{novel_id}/summary").json()["data"]["scene_count"]
+
+        # 等各进程写入最新的指标快照
+        time.sleep(float(os.environ["QUICKNOVEL_METRICS_EXPORT_SECONDS"]) * 2)
+        metrics_requests = metrics_request_count(base_url)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    sent = warmup["requests"] + reads["requests"] + mixed["requests"] + mixed["writes"] + mixed["write_errors"]
+    return {
+        "workers": workers,
+        "reads": reads,
+        "mixed": mixed,
+        "scene_count_consistent": after - before == mixed["writes"],
+        # /metrics 的请求数应不少于压测发出的请求数，否则只统计了部分进程
+        "metrics_cover_all_workers": metrics_requests >= sent,
+        "metrics_requests": metrics_requests,
+        "requests_sent": sent,
+    }
+
+
+def run(args) -> dict:
+    from benchmark.DataGenerator import DataScale, generate
+
+    workdir = Path.cwd()
+    ids = generate(DataScale(chapters=args.chapters, scenes=args.scenes, turns=args.turns))
+
+    results: List[Dict] = []
+    for workers in args.workers:
+        results.append(run_workers(workers, workdir, ids, args))
+
+    baseline = results[0]["reads"]["rps"] or 1
+    for result in results:
+        result["read_speedup"] = round(result["reads"]["rps"] / baseline, 2)
+    return {"cpu_count": os.cpu_count(), "clients": args.clients, "concurrency": args.concurrency,
+            "duration": args.duration, "results": results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="多进程部署的读写压测")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="依次测试的工作进程数")
+    parser.add_argument("--duration", type=float, default=10, help="每轮压测的秒数")
+    parser.add_argument("--clients", type=int, default=4, help="压测进程数")
+    parser.add_argument("--concurrency", type=int, default=8, help="每个压测进程的并发请求数")
+    parser.add_argument("--write-interval", type=float, default=0.02, help="每个压测进程两次写入之间的间隔（秒）")
+    parser.add_argument("--chapters", type=int, default=10)
+    parser.add_argument("--scenes", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="quicknovel-workers-") as workdir:
+        os.environ.setdefault("QUICKNOVEL_DB_PATH", str(Path(workdir) / "workers.sqlite"))
+        os.environ.setdefault("QUICKNOVEL_LOG_LEVEL", "WARNING")
+        os.environ.setdefault("QUICKNOVEL_PRELOAD_LLM", "false")
+        os.environ.setdefault("QUICKNOVEL_METRICS_EXPORT_SECONDS", "1")
+        os.chdir(workdir)
+        Path("uploads").mkdir()
+        print(json.dumps(run(args), ensure_ascii=False, indent=2))
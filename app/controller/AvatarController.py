@@ -0,0 +1,32 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, Query
+
+from core.service.AvatarService import AvatarService
+
+avatar_router = APIRouter(prefix="/api/avatar", tags=["Avatar"])
+
+
+def get_avatar_service():
+    return AvatarService()
+
+
+@avatar_router.get("/{variant}/{avatar}")
+def get_avatar(
+        variant: str,
+        avatar: str,
+        image_format: Optional[str] = Query(None, alias="format"),
+        accept: str = Header(""),
+        if_none_match: Optional[str] = Header(None),
+        avatar_service: AvatarService = Depends(get_avatar_service)):
+    """
+    获取头像，variant 为 original、thumb、small 或 medium
+    :param variant: 尺寸
+    :param avatar: 角色的头像文件名
+    :param image_format: 缩略图格式，webp 或 jpeg，不指定时根据 Accept 头选择
+    :param accept: 请求头 Accept
+    :param if_none_match: 请求头 If-None-Match
+    :param avatar_service: service
+    :return: 头像文件
+    """
+    return avatar_service.get_avatar(avatar, variant, accept, if_none_match, image_format)
@@ -1,10 +1,19 @@
+from typing import List
+
 from fastapi import APIRouter, Depends
 
+from controller.DeletionController import get_deletion_service
+from core.entity.ResponseEntity import ResponseModel
+from core.entity.dto.BatchDto import BatchResultDto
 from core.entity.dto.ChapterDto import CreateChapterDto
+from core.entity.dto.DeletionDto import ResponseDeletionJobDto
 from core.mapper.ChapterMapper import ChapterMapper
+from core.mapper.DeletionMapper import CHAPTER_JOB
 from core.service.ChapterService import ChapterService
+from core.service.DeletionService import DeletionService
+from core.utils.JsonResponse import DtoRoute
 
-chapter_router = APIRouter(prefix="/api/chapter", tags=["chapter"])
+chapter_router = APIRouter(prefix="/api/chapter", tags=["chapter"], route_class=DtoRoute)
 
 
 def get_chapter_service():
@@ -15,3 +24,19 @@ def get_chapter_service():
 def create_chapter(chapter: CreateChapterDto,
                    chapter_service: ChapterService = Depends(get_chapter_service)):
     return chapter_service.create_chapter(chapter)
+
+
+@chapter_router.post("/batch")
+def create_chapters(chapters: List[CreateChapterDto],
+                    chapter_service: ChapterService = Depends(get_chapter_service)) -> ResponseModel[BatchResultDto]:
+    return chapter_service.create_chapters(chapters)
+
+
+
+@chapter_router.delete("/{chapter_id}")
+def delete_chapter(chapter_id: int,
+                   deletion_service: DeletionService = Depends(get_deletion_service)) -> ResponseModel[ResponseDeletionJobDto]:
+    """
+    删除章节及其全部情景和对话，在后台分批执行，返回删除任务，通过 /api/deletion/{job_id} 查询进度
+    """
+    return deletion_service.request_deletion(CHAPTER_JOB, chapter_id)
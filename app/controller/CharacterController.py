@@ -2,13 +2,20 @@ from typing import List
 
 from fastapi import APIRouter, Depends, UploadFile, File
 
+from controller.DeletionController import get_deletion_service
 from core.entity.ResponseEntity import ResponseModel
-from core.entity.dto.CharacterDto import ResponseCharacterDto, CreateCharacterDto, UpdateCharacterDto
+from core.entity.dto.BatchDto import BatchResultDto
+from core.entity.dto.CharacterDto import ResponseCharacterDto, CreateCharacterDto, UpdateCharacterDto, CreateTraitDto, \
+    PatchCharacterDto, UpdateCharacterResultDto
+from core.entity.dto.DeletionDto import ResponseDeletionJobDto
 from core.mapper.CharacterMapper import CharacterMapper
+from core.mapper.DeletionMapper import CHARACTER_JOB
 from core.service.CharacterService import CharacterService
+from core.service.DeletionService import DeletionService
+from core.utils.JsonResponse import DtoRoute
 
 
-character_router = APIRouter(prefix="/api/character", tags=["Character"])
+character_router = APIRouter(prefix="/api/character", tags=["Character"], route_class=DtoRoute)
 
 
 def get_character_service():
@@ -55,14 +62,28 @@ def get_all_characters(
 @character_router.delete("/{character_id}")
 def delete_character(
         character_id: int,
-        character_service: CharacterService = Depends(get_character_service)) -> ResponseModel:
+        deletion_service: DeletionService = Depends(get_deletion_service)) -> ResponseModel[ResponseDeletionJobDto]:
     """
-    删除角色
+    删除角色及其性格特征、说话方式、自定义字段和与小说的关联，对话中对该角色的引用置空。
+    在后台分批执行，没有其他角色引用的头像文件随后删除
     :param character_id: 角色id
+    :param deletion_service: service
+    :return: resp，data 中为删除任务，通过 /api/deletion/{job_id} 查询进度
+    """
+    return deletion_service.request_deletion(CHARACTER_JOB, character_id)
+
+
+@character_router.post("/trait/batch")
+def create_traits(
+        traits: List[CreateTraitDto],
+        character_service: CharacterService = Depends(get_character_service)) -> ResponseModel[BatchResultDto]:
+    """
+    批量添加性格特征，全部写入或全部不写入
+    :param traits: 性格特征列表，每条包含所属角色id
     :param character_service: service
-    :return: resp
+    :return: resp，data 中为每条数据的结果
     """
-    return character_service.delete_character(character_id)
+    return character_service.create_traits(traits)
 
 
 @character_router.post("/{character_id}/avatar")
@@ -82,7 +103,7 @@ async def update_avatar(character_id: int,
 @character_router.post("/{character_id}")
 def update_character(
         character: UpdateCharacterDto,
-        character_service: CharacterService = Depends(get_character_service)) -> ResponseModel[ResponseCharacterDto]:
+        character_service: CharacterService = Depends(get_character_service)) -> ResponseModel[UpdateCharacterResultDto]:
     """
     更新角色信息，但不包含头像
     :param character: 角色信息
@@ -90,3 +111,18 @@ def update_character(
     :return: resp
     """
     return character_service.update_character(character)
+
+
+@character_router.patch("/{character_id}")
+def patch_character(
+        character_id: int,
+        patch: PatchCharacterDto,
+        character_service: CharacterService = Depends(get_character_service)) -> ResponseModel[UpdateCharacterResultDto]:
+    """
+    部分更新角色信息，只修改传入的字段；子表传入完整列表，只写入有变化的数据
+    :param character_id: 角色id
+    :param patch: 需要修改的字段，version 为读取到的版本号，与当前版本不一致时返回 409
+    :param character_service: service
+    :return: resp，data 中为新的版本号和子表的写入条数
+    """
+    return character_service.patch_character(character_id, patch)
@@ -1,17 +1,25 @@
+from typing import List
+
 from fastapi import APIRouter, Depends, Request
 
-from core.entity.dto.ConversationDto import CreateConversationDto
+from controller.JobController import get_memory_service
+from core.entity.ResponseEntity import ResponseModel
+from core.entity.dto.ConversationDto import CreateConversationDto, ResponseConversationDto
 from core.mapper.CharacterMapper import CharacterMapper
 from core.mapper.CharacterNovelMapper import CharacterNovelMapper
 from core.mapper.ConversationMapper import ConversationMapper
 from core.mapper.NovelMapper import NovelMapper
+from core.mapper.SceneMapper import SceneMapper
+from core.mapper.TokenUsageMapper import TokenUsageMapper
 from core.service.ConversationService import ConversationService
+from core.service.GenerationScheduler import get_generation_scheduler
 from core.service.ProviderService import ProviderService
+from core.utils.JsonResponse import DtoRoute
 from core.utils.LogConfig import get_logger
 
 logging = get_logger(__name__)
 
-conversation_router = APIRouter(prefix="/api/conversation", tags=["Conversation"])
+conversation_router = APIRouter(prefix="/api/conversation", tags=["Conversation"], route_class=DtoRoute)
 
 
 def get_conversation_service():
@@ -22,7 +30,9 @@ def get_conversation_service():
             novel_mapper=NovelMapper(),
         ),
         model="deepseek-chat",
-        streaming=True))
+        streaming=True,
+        usage_mapper=TokenUsageMapper(),
+        scene_mapper=SceneMapper()), get_generation_scheduler(), get_memory_service())
 
 
 @conversation_router.post("/")
@@ -42,8 +52,9 @@ def create_conversation(
 
 @conversation_router.get("/{scene_id}")
 def get_conversation_by_scene_id(
-        scene_id: str,
-        conversation_service: ConversationService = Depends(get_conversation_service)):
+        scene_id: int,
+        conversation_service: ConversationService = Depends(get_conversation_service)) \
+        -> ResponseModel[List[ResponseConversationDto]]:
     """
     根据scene id 获取对应的对话内容
     :param scene_id: 情景id
@@ -51,3 +62,16 @@ def get_conversation_by_scene_id(
     :return: 对话列表
     """
     return conversation_service.get_conversation_by_scene_id(scene_id)
+
+
+@conversation_router.delete("/{conversation_id}")
+def delete_conversation(
+        conversation_id: int,
+        conversation_service: ConversationService = Depends(get_conversation_service)):
+    """
+    删除单条对话
+    :param conversation_id: 对话id
+    :param conversation_service: 对话的服务
+    :return: resp
+    """
+    return conversation_service.delete_conversation(conversation_id)
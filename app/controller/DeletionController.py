@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends
+
+from core.entity.ResponseEntity import ResponseModel
+from core.entity.dto.DeletionDto import ResponseDeletionJobDto
+from core.mapper.DeletionMapper import DeletionMapper
+from core.service.DeletionService import DeletionService
+from core.utils.JsonResponse import DtoRoute
+
+deletion_router = APIRouter(prefix="/api/deletion", tags=["deletion"], route_class=DtoRoute)
+
+
+def get_deletion_service():
+    return DeletionService(DeletionMapper())
+
+
+@deletion_router.get("/{job_id}")
+def get_deletion_job(job_id: int,
+                     deletion_service: DeletionService = Depends(get_deletion_service)) -> ResponseModel[ResponseDeletionJobDto]:
+    """
+    查询后台删除任务的进度
+    """
+    return deletion_service.get_job(job_id)
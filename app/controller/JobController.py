@@ -0,0 +1,77 @@
+from typing import List
+
+from fastapi import APIRouter, Depends
+
+from core.entity.ResponseEntity import ResponseModel
+from core.entity.dto.LlmJobDto import CreateLlmJobDto, ResponseLlmJobDto
+from core.mapper.CharacterMapper import CharacterMapper
+from core.mapper.CharacterNovelMapper import CharacterNovelMapper
+from core.mapper.ConversationMapper import ConversationMapper
+from core.mapper.LlmJobMapper import LlmJobMapper
+from core.mapper.NovelMapper import NovelMapper
+from core.mapper.TokenUsageMapper import TokenUsageMapper
+from core.service.ChapterDraftJob import CHAPTER_DRAFT, ChapterDraftJob
+from core.service.ChapterSummaryJob import CHAPTER_SUMMARY, ChapterSummaryJob
+from core.service.JobService import JobService, register_job_handler
+from core.service.MemoryConsolidationJob import MEMORY_CONSOLIDATION, MemoryConsolidationJob
+from core.service.MemoryService import MemoryService
+from core.service.ProviderService import ProviderService
+from core.utils.JsonResponse import DtoRoute
+
+job_router = APIRouter(prefix="/api/job", tags=["job"], route_class=DtoRoute)
+
+
+def get_job_service():
+    return JobService(LlmJobMapper())
+
+
+def get_memory_service():
+    return MemoryService(CharacterNovelMapper(character_mapper=CharacterMapper(), novel_mapper=NovelMapper()),
+                         get_job_service())
+
+
+def get_job_provider_service():
+    # 后台任务不需要流式输出
+    return ProviderService(
+        novel_mapper=NovelMapper(),
+        character_novel_mapper=CharacterNovelMapper(
+            character_mapper=CharacterMapper(),
+            novel_mapper=NovelMapper(),
+        ),
+        model="deepseek-chat",
+        streaming=False,
+        usage_mapper=TokenUsageMapper())
+
+
+register_job_handler(CHAPTER_SUMMARY, lambda: ChapterSummaryJob(NovelMapper(), get_job_provider_service()))
+register_job_handler(CHAPTER_DRAFT, lambda: ChapterDraftJob(NovelMapper(), ConversationMapper(),
+                                                            get_job_provider_service()))
+register_job_handler(MEMORY_CONSOLIDATION, lambda: MemoryConsolidationJob(
+    NovelMapper(), CharacterNovelMapper(character_mapper=CharacterMapper(), novel_mapper=NovelMapper()),
+    get_job_provider_service()))
+
+
+@job_router.post("/")
+def create_job(job: CreateLlmJobDto,
+               job_service: JobService = Depends(get_job_service)) -> ResponseModel[ResponseLlmJobDto]:
+    """
+    创建后台模型任务，立即返回任务，通过 GET /api/job/{job_id} 查询进度和结果
+    """
+    return job_service.create_job(job)
+
+
+@job_router.get("/{job_id}")
+def get_job(job_id: int, job_service: JobService = Depends(get_job_service)) -> ResponseModel[ResponseLlmJobDto]:
+    """
+    查询后台任务的进度和结果
+    """
+    return job_service.get_job(job_id)
+
+
+@job_router.get("/novel/{novel_id}")
+def get_jobs_by_novel_id(novel_id: int, job_service: JobService = Depends(get_job_service)) \
+        -> ResponseModel[List[ResponseLlmJobDto]]:
+    """
+    查询小说的全部后台任务
+    """
+    return job_service.get_jobs_by_novel_id(novel_id)
@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from starlette.responses import PlainTextResponse
+
+from core.utils.Metrics import REGISTRY
+
+metrics_router = APIRouter(tags=["metrics"])
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    以 Prometheus 文本格式输出运行指标
+    :return: 指标文本
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
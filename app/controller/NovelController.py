@@ -2,16 +2,26 @@ from typing import List
 
 from fastapi import APIRouter, Depends
 
+from controller.DeletionController import get_deletion_service
+from controller.JobController import get_memory_service
 from core.entity.ResponseEntity import ResponseModel
-from core.entity.dto.NovelDto import CreateNovelDto, ResponseAllNovelDto, ResponseNovelDto
+from core.entity.dto.DeletionDto import ResponseDeletionJobDto
+from core.entity.dto.NovelDto import CreateNovelDto, ResponseAllNovelDto, ResponseCharacterMemoryDto, ResponseNovelDto
+from core.mapper.CharacterMapper import CharacterMapper
+from core.mapper.CharacterNovelMapper import CharacterNovelMapper
+from core.mapper.DeletionMapper import NOVEL_JOB
 from core.mapper.NovelMapper import NovelMapper
+from core.service.DeletionService import DeletionService
+from core.service.MemoryService import MemoryService
 from core.service.NovelService import NovelService
+from core.utils.JsonResponse import DtoRoute
 
-novel_router = APIRouter(prefix="/api/novel", tags=["novel"])
+novel_router = APIRouter(prefix="/api/novel", tags=["novel"], route_class=DtoRoute)
 
 
 def get_novel_service():
-    return NovelService(NovelMapper())
+    return NovelService(NovelMapper(),
+                        CharacterNovelMapper(character_mapper=CharacterMapper(), novel_mapper=NovelMapper()))
 
 
 @novel_router.post("/")
@@ -20,12 +30,48 @@ def create_novel(novel: CreateNovelDto,
     return novel_service.create_novel(novel)
 
 
+@novel_router.get("/{novel_id}/summary")
+def get_novel_summary(novel_id: int,
+                      novel_service: NovelService = Depends(get_novel_service)) -> ResponseModel[ResponseNovelDto]:
+    """
+    获取小说的基本信息和汇总数据（章节、情景、对话数量，总字数，最后活动时间），不包含章节内容
+    """
+    return novel_service.get_novel_summary(novel_id)
+
+
+@novel_router.get("/{novel_id}/memory")
+def get_character_memories(novel_id: int, memory_service: MemoryService = Depends(get_memory_service)) \
+        -> ResponseModel[List[ResponseCharacterMemoryDto]]:
+    """
+    小说中各角色整理后的记忆和当前状态
+    """
+    return memory_service.get_character_memories(novel_id)
+
+
 @novel_router.get("/{novel_id}")
 def get_novel_by_id(novel_id: int,
                     novel_service: NovelService = Depends(get_novel_service)) -> ResponseModel[ResponseAllNovelDto]:
     return novel_service.get_novel_by_id(novel_id)
 
 
+@novel_router.delete("/{novel_id}")
+def delete_novel(novel_id: int,
+                 deletion_service: DeletionService = Depends(get_deletion_service)) -> ResponseModel[ResponseDeletionJobDto]:
+    """
+    删除小说及其全部章节、情景和对话，在后台分批执行，返回删除任务，通过 /api/deletion/{job_id} 查询进度
+    """
+    return deletion_service.request_deletion(NOVEL_JOB, novel_id)
+
+
+@novel_router.delete("/{novel_id}/character/{character_id}")
+def disconnect_character(novel_id: int, character_id: int,
+                         novel_service: NovelService = Depends(get_novel_service)) -> ResponseModel:
+    """
+    取消角色与小说的关联，同时删除角色在这部小说中的记忆；已有的对话和角色本身保留
+    """
+    return novel_service.disconnect_character(novel_id, character_id)
+
+
 @novel_router.get("/")
 def get_all_novels(novel_service: NovelService = Depends(get_novel_service)) -> ResponseModel[List[ResponseNovelDto]]:
     return novel_service.get_all_novels()
@@ -1,13 +1,22 @@
+from typing import List
+
 from fastapi import APIRouter, Depends
 
+from controller.DeletionController import get_deletion_service
+from core.entity.ResponseEntity import ResponseModel
+from core.entity.dto.BatchDto import BatchResultDto
+from core.entity.dto.DeletionDto import ResponseDeletionJobDto
 from core.entity.dto.SceneDto import CreateSceneDto
+from core.mapper.DeletionMapper import SCENE_JOB
 from core.mapper.SceneMapper import SceneMapper
+from core.service.DeletionService import DeletionService
 from core.service.SceneService import SceneService
+from core.utils.JsonResponse import DtoRoute
 from core.utils.LogConfig import get_logger
 
 logging = get_logger(__name__)
 
-scene_router = APIRouter(prefix="/api/scene", tags=["scene"])
+scene_router = APIRouter(prefix="/api/scene", tags=["scene"], route_class=DtoRoute)
 
 def get_scene_service():
     return SceneService(SceneMapper())
@@ -18,3 +27,21 @@ def create_scene(
         scene: CreateSceneDto,
         scene_service: SceneService = Depends(get_scene_service)):
     return scene_service.create_scene(scene)
+
+
+@scene_router.post("/batch")
+def create_scenes(
+        scenes: List[CreateSceneDto],
+        scene_service: SceneService = Depends(get_scene_service)) -> ResponseModel[BatchResultDto]:
+    return scene_service.create_scenes(scenes)
+
+
+
+@scene_router.delete("/{scene_id}")
+def delete_scene(
+        scene_id: int,
+        deletion_service: DeletionService = Depends(get_deletion_service)) -> ResponseModel[ResponseDeletionJobDto]:
+    """
+    删除情景及其全部对话，在后台分批执行，返回删除任务，通过 /api/deletion/{job_id} 查询进度
+    """
+    return deletion_service.request_deletion(SCENE_JOB, scene_id)
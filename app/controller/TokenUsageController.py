@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends
+
+from core.entity.ResponseEntity import ResponseModel
+from core.entity.dto.TokenUsageDto import ResponseTokenUsageDto, ResponseNovelTokenUsageDto
+from core.mapper.TokenUsageMapper import TokenUsageMapper
+from core.service.TokenUsageService import TokenUsageService
+from core.utils.JsonResponse import DtoRoute
+
+usage_router = APIRouter(prefix="/api/usage", tags=["usage"], route_class=DtoRoute)
+
+
+def get_usage_service():
+    return TokenUsageService(TokenUsageMapper())
+
+
+@usage_router.get("/novel/{novel_id}")
+def get_novel_usage(novel_id: int,
+                    usage_service: TokenUsageService = Depends(get_usage_service)) \
+        -> ResponseModel[ResponseNovelTokenUsageDto]:
+    """
+    小说的模型用量和估算费用，以及按情景、角色分组的用量
+    """
+    return usage_service.get_novel_usage(novel_id)
+
+
+@usage_router.get("/scene/{scene_id}")
+def get_scene_usage(scene_id: int,
+                    usage_service: TokenUsageService = Depends(get_usage_service)) -> ResponseModel[ResponseTokenUsageDto]:
+    """
+    情景的模型用量和估算费用
+    """
+    return usage_service.get_scene_usage(scene_id)
+
+
+@usage_router.get("/character/{character_id}")
+def get_character_usage(character_id: int,
+                        usage_service: TokenUsageService = Depends(get_usage_service)) \
+        -> ResponseModel[ResponseTokenUsageDto]:
+    """
+    角色的模型用量和估算费用
+    """
+    return usage_service.get_character_usage(character_id)
@@ -2,16 +2,23 @@ from typing import List
 
 from fastapi import APIRouter, Depends
 
+from controller.DeletionController import get_deletion_service
 from core.entity.ResponseEntity import ResponseModel
-from core.entity.dto.WorldDto import ResponseWorldDto, CreateWorldDto, ResponseAllWorldDetailDto
+from core.entity.dto.BatchDto import BatchResultDto
+from core.entity.dto.DeletionDto import ResponseDeletionJobDto
+from core.entity.dto.WorldDto import ResponseWorldDto, CreateWorldDto, ResponseAllWorldDetailDto, CreateWorldDetailDto
+from core.mapper.DeletionMapper import WORLD_JOB
+from core.mapper.WorldDetailMapper import WorldDetailMapper
 from core.mapper.WorldMapper import WorldMapper
+from core.service.DeletionService import DeletionService
 from core.service.WorldService import WorldService
+from core.utils.JsonResponse import DtoRoute
 
-world_router = APIRouter(prefix="/api/world", tags=["world"])
+world_router = APIRouter(prefix="/api/world", tags=["world"], route_class=DtoRoute)
 
 
 def get_world_service():
-    return WorldService(WorldMapper())
+    return WorldService(WorldMapper(), WorldDetailMapper())
 
 
 @world_router.get("/")
@@ -30,4 +37,31 @@ def create_world(
 def get_world_by_id(
         world_id: int,
         world_service: WorldService = Depends(get_world_service)) -> ResponseModel[ResponseAllWorldDetailDto]:
-    return world_service.get_world_by_id(world_id)
\ No newline at end of file
+    return world_service.get_world_by_id(world_id)
+
+
+@world_router.delete("/{world_id}")
+def delete_world(
+        world_id: int,
+        deletion_service: DeletionService = Depends(get_deletion_service)) -> ResponseModel[ResponseDeletionJobDto]:
+    """
+    删除世界观及其详细世界观，在后台分批执行，返回删除任务，通过 /api/deletion/{job_id} 查询进度
+    """
+    return deletion_service.request_deletion(WORLD_JOB, world_id)
+
+
+@world_router.post("/detail/batch")
+def create_world_details(
+        world_details: List[CreateWorldDetailDto],
+        world_service: WorldService = Depends(get_world_service)) -> ResponseModel[BatchResultDto]:
+    return world_service.create_world_details(world_details)
+
+
+@world_router.delete("/detail/{world_detail_id}")
+def delete_world_detail(
+        world_detail_id: int,
+        world_service: WorldService = Depends(get_world_service)) -> ResponseModel:
+    """
+    删除单条详细世界观
+    """
+    return world_service.delete_world_detail(world_detail_id)
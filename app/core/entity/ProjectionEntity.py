@@ -0,0 +1,112 @@
+"""
+投影读取模式返回的行对象
+
+小说详情和角色列表按 DTO 读取时，先由 Pony 创建实体对象，再逐行创建 pydantic 对象，同一份数据在内存中有两套对象。
+投影模式（AppConfig.READ_MODE 为 projection）下 mapper 只查询需要的字段，直接组装为这里的行对象：
+1. 使用 __slots__ 的 dataclass，没有 __dict__，每行的内存占用远小于 pydantic 对象，创建时也不做校验
+2. 字段名和字段顺序与对应的 DTO 相同，接口序列化（orjson 直接支持 dataclass）和拼接 prompt 的代码不需要区分两种模式，
+   两种模式序列化后的 JSON 完全相同
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+
+# 对应 ResponseConversationDto
+@dataclass(slots=True)
+class ConversationRow:
+    role: str
+    sender_character: Optional[int]
+    receiver_character: Optional[int]
+    content: str
+    create_time: datetime
+    parent: Optional[int]
+    scene: int
+    novel: Optional[int]
+    conversation_id: int
+
+
+# 对应 ResponseSceneDto
+@dataclass(slots=True)
+class SceneRow:
+    scene_id: int
+    scene_name: str
+    scene_desc: Optional[str]
+    create_time: datetime
+    parent: Optional[int]
+    chapter: Optional[int]
+    conversation_count: int
+    total_characters: int
+    last_activity: Optional[datetime]
+    conversation: List[ConversationRow] = field(default_factory=list)
+
+
+# 对应 ResponseAllChapterDto
+@dataclass(slots=True)
+class ChapterRow:
+    chapter_id: int
+    chapter_number: int
+    chapter_title: Optional[str]
+    chapter_desc: Optional[str]
+    create_time: datetime
+    parent: Optional[int]
+    novel: int
+    scene_count: int
+    conversation_count: int
+    total_characters: int
+    last_activity: Optional[datetime]
+    scene: List[SceneRow] = field(default_factory=list)
+
+
+# 对应 ResponseAllNovelDto
+@dataclass(slots=True)
+class NovelRow:
+    novel_id: int
+    novel_name: str
+    novel_desc: str
+    create_time: datetime
+    chapter_count: int
+    scene_count: int
+    conversation_count: int
+    total_characters: int
+    last_activity: Optional[datetime]
+    chapter: List[ChapterRow] = field(default_factory=list)
+
+
+# 对应 TraitDto
+@dataclass(slots=True)
+class TraitRow:
+    id: int
+    label: str
+    description: str
+
+
+# 对应 SpeakingDto
+@dataclass(slots=True)
+class SpeakRow:
+    id: int
+    role: str
+    content: str
+    reply: str
+
+
+# 对应 DistinctiveDto
+@dataclass(slots=True)
+class DistinctiveRow:
+    id: int
+    name: str
+    content: str
+
+
+# 对应 ResponseCharacterDto
+@dataclass(slots=True)
+class CharacterRow:
+    id: int
+    avatar: str
+    name: str
+    description: str
+    background_story: str
+    trait: List[TraitRow] = field(default_factory=list)
+    speak: List[SpeakRow] = field(default_factory=list)
+    distinctive: List[DistinctiveRow] = field(default_factory=list)
+    version: Optional[int] = None
@@ -0,0 +1,33 @@
+from typing import Optional, List, Dict
+
+from pydantic import BaseModel
+
+
+# 批量创建中单条数据的结果，index 为该条数据在请求数组中的下标
+class BatchItemResultDto(BaseModel):
+    index: int
+    success: bool
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+# 批量创建的结果，全部写入或全部不写入
+class BatchResultDto(BaseModel):
+    created: int = 0
+    failed: int = 0
+    items: List[BatchItemResultDto]
+
+
+def batch_created(ids: List[int]) -> BatchResultDto:
+    return BatchResultDto(
+        created=len(ids),
+        items=[BatchItemResultDto(index=index, success=True, id=entity_id) for index, entity_id in enumerate(ids)])
+
+
+def batch_rejected(total: int, errors: Dict[int, str]) -> BatchResultDto:
+    """
+    存在无效数据时整批不写入，没有错误的数据 success 也为 False、error 为空
+    """
+    return BatchResultDto(
+        failed=len(errors),
+        items=[BatchItemResultDto(index=index, success=False, error=errors.get(index)) for index in range(total)])
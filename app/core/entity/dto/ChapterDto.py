@@ -24,6 +24,12 @@ class ResponseChapterDto(BaseModel):
     parent: Optional[int]
     novel: int
 
+    # 汇总信息
+    scene_count: int = 0
+    conversation_count: int = 0
+    total_characters: int = 0
+    last_activity: Optional[datetime] = None
+
 
 class ResponseAllChapterDto(ResponseChapterDto):
     scene: Optional[List[ResponseSceneDto]]
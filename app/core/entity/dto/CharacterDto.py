@@ -1,20 +1,29 @@
 from typing import Optional, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
 
+# 子表数据的 id 在创建时忽略；更新时传入读取到的 id 表示修改该条数据，不传时按内容与已有数据匹配
 class TraitDto(BaseModel):
+    id: Optional[int] = None
     label: str
     description: str
 
 
+# 批量创建性格特征，character 为所属角色的id
+class CreateTraitDto(TraitDto):
+    character: int
+
+
 class SpeakingDto(BaseModel):
+    id: Optional[int] = None
     role: str
     content: str
     reply: str
 
 
 class DistinctiveDto(BaseModel):
+    id: Optional[int] = None
     name: str
     content: str
 
@@ -43,6 +52,9 @@ class CharacterDto(BaseModel):
     speak: Optional[List[SpeakingDto]] = None
     distinctive: Optional[List[DistinctiveDto]] = None
 
+    # 乐观锁版本号，更新时传入读取到的版本号，与当前版本不一致时返回 409；不传则不检查
+    version: Optional[int] = None
+
 
 # 返回角色信息
 class ResponseCharacterDto(CharacterDto):
@@ -52,3 +64,35 @@ class ResponseCharacterDto(CharacterDto):
 # 更新角色信息
 class UpdateCharacterDto(CharacterDto):
     pass
+
+
+# 部分更新角色信息，没有传入的字段不修改，传入 null 表示清空；子表传入完整列表，只写入有变化的数据，传入 null 时不修改
+class PatchCharacterDto(BaseModel):
+    avatar: Optional[str] = None
+    name: Optional[str] = None
+    description: Optional[str] = None
+    background_story: Optional[str] = None
+
+    trait: Optional[List[TraitDto]] = None
+    speak: Optional[List[SpeakingDto]] = None
+    distinctive: Optional[List[DistinctiveDto]] = None
+
+    version: Optional[int] = None
+
+    # 名称不能清空，不传时不修改，传入 null 时校验失败（默认值不经过校验）
+    @field_validator("name")
+    @classmethod
+    def name_not_null(cls, name: Optional[str]) -> str:
+        if name is None:
+            raise ValueError("角色名称不能为空")
+        return name
+
+
+# 更新角色的结果
+class UpdateCharacterResultDto(BaseModel):
+    id: int
+    version: int
+    # 子表插入、修改、删除的条数
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
@@ -0,0 +1,21 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+# 后台删除任务的进度
+class ResponseDeletionJobDto(BaseModel):
+    job_id: int
+    entity: str
+    entity_id: int
+    status: str
+    total: int
+    deleted: int
+    # 0 ~ 1
+    progress: float
+    error: Optional[str] = None
+    # 已失败的次数
+    attempts: int = 0
+    create_time: datetime
+    update_time: datetime
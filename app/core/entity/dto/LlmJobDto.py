@@ -0,0 +1,38 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+
+class CreateLlmJobDto(BaseModel):
+    # 任务类型，见 JobService.register_job_handler
+    kind: str
+    params: Dict[str, Any] = {}
+    novel_id: Optional[int] = None
+
+
+# 后台模型任务的进度和结果
+class ResponseLlmJobDto(BaseModel):
+    job_id: int
+    kind: str
+    novel_id: Optional[int] = None
+    status: str
+    # 0 ~ 1
+    progress: float
+    message: Optional[str] = None
+    params: Dict[str, Any]
+    result: Optional[Dict[str, Any]] = None
+    attempts: int
+    error: Optional[str] = None
+    create_time: datetime
+    update_time: datetime
+
+
+# 领取到的任务
+class ClaimedLlmJobDto(BaseModel):
+    job_id: int
+    kind: str
+    params: Dict[str, Any]
+    novel_id: Optional[int] = None
+    # 本次是第几次执行，从 1 开始
+    attempt: int
@@ -17,12 +17,29 @@ class CreateCharacter2NovelDto(BaseModel):
     character_id: int
 
 
+# 角色在小说中的记忆
+class ResponseCharacterMemoryDto(BaseModel):
+    character_id: int
+    name: str
+    memory: str = ""
+    status: str = ""
+    # 记忆已整理到的对话 id
+    memory_until: int = 0
+
+
 class ResponseNovelDto(BaseModel):
     novel_id: int
     novel_name: str
     novel_desc: str
     create_time: datetime
 
+    # 汇总信息
+    chapter_count: int = 0
+    scene_count: int = 0
+    conversation_count: int = 0
+    total_characters: int = 0
+    last_activity: Optional[datetime] = None
+
 
 class ResponseAllNovelDto(ResponseNovelDto):
     chapter: Optional[List[ResponseAllChapterDto]]
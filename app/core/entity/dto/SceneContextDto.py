@@ -0,0 +1,33 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from core.entity.dto.ChapterDto import ResponseChapterDto
+from core.entity.dto.SceneDto import ResponseSceneDto
+
+
+# 同章节其他情景的摘要，拼接 prompt 时代替完整的对话
+class SceneDigestDto(BaseModel):
+    scene_id: int
+    scene_name: str
+    scene_desc: Optional[str] = ''
+    conversation_count: int = 0
+    # 最后一条对话的开头部分
+    last_content: Optional[str] = None
+
+
+# 以情景为中心拼接 prompt 需要的数据，见 SceneMapper.get_scene_context
+class ResponseSceneContextDto(BaseModel):
+    novel_id: int
+    novel_name: str
+    novel_desc: str
+    chapter: ResponseChapterDto
+    # 父章节链，从最上层的章节开始
+    ancestor_chapters: List[ResponseChapterDto] = []
+    # 父情景链，从最上层的情景开始，只包含最近几轮对话
+    ancestors: List[ResponseSceneDto] = []
+    # 当前情景，包含全部对话
+    scene: ResponseSceneDto
+    siblings: List[SceneDigestDto] = []
+    # 当前情景和父情景的对话中出现的角色
+    character_ids: List[int] = []
@@ -22,4 +22,9 @@ class ResponseSceneDto(BaseModel):
     parent: Optional[int]
     chapter: Optional[int]
 
+    # 汇总信息
+    conversation_count: int = 0
+    total_characters: int = 0
+    last_activity: Optional[datetime] = None
+
     conversation: Optional[List[ResponseConversationDto]] = []
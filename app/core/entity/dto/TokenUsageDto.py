@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+# 一轮对话的模型用量，字段含义见 TokenUsageEntity
+class CreateTokenUsageDto(BaseModel):
+    novel_id: Optional[int] = None
+    scene_id: Optional[int] = None
+    character_id: Optional[int] = None
+    model: str
+    system_tokens: int = 0
+    character_tokens: int = 0
+    history_tokens: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    provider_usage: bool = False
+    cached_tokens: int = 0
+    latency_ms: float = 0
+    first_token_ms: Optional[float] = None
+    create_time: datetime
+
+
+# 汇总的模型用量，id 为分组的情景或角色 id，汇总全部时为空
+class ResponseTokenUsageDto(BaseModel):
+    id: Optional[int] = None
+    turns: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # prompt 中命中服务商前缀缓存的 token 数量
+    cached_tokens: int = 0
+    # prompt 各部分的 token 数量
+    system_tokens: int = 0
+    character_tokens: int = 0
+    history_tokens: int = 0
+    avg_latency_ms: float = 0
+    # 按 LLM_PROMPT_PRICE、LLM_CACHED_PROMPT_PRICE、LLM_COMPLETION_PRICE 估算的费用
+    cost: float = 0
+
+
+# 小说的模型用量，以及按情景、角色分组的用量
+class ResponseNovelTokenUsageDto(BaseModel):
+    novel_id: int
+    total: ResponseTokenUsageDto
+    scenes: List[ResponseTokenUsageDto]
+    characters: List[ResponseTokenUsageDto]
@@ -10,6 +10,8 @@ class CharacterEntity(db.Entity):
     name = Required(str)
     description = Optional(str)
     background_story = Optional(str)
+    # 乐观锁版本号，每次修改角色或其子表数据时加一，见 CharacterMapper
+    version = Required(int, default=1)
     trait = Set('Trait')
     speak = Set('Speak')
     distinctive = Set('Distinctive')
@@ -8,8 +8,13 @@ from core.mapper.config.DatabaseConfig import db
 # 小说和角色的多对多中间表
 class CharacterNovelEntity(db.Entity):
     character_novel_id = PrimaryKey(int, auto=True)
+    # 角色在这部小说中的记忆和当前状态，由后台任务根据对话整理，见 MemoryConsolidationJob
     memory = Optional(str)
     status = Optional(str)
+    # 记忆已整理到的对话 id，之后的对话还没有整理进 memory
+    memory_until = Required(int, default=0)
+    # 上次安排整理时小说的对话数量，之后新增的对话达到 MEMORY_CONSOLIDATION_TURNS 轮时再次整理
+    memory_turns = Required(int, default=0)
 
     # 关联表信息，外键
     novel = Required(NovelEntity)
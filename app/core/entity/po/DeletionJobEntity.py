@@ -0,0 +1,28 @@
+from datetime import datetime
+
+from pony.orm import PrimaryKey, Required, Optional
+
+from core.mapper.config.DatabaseConfig import db
+
+
+# 后台删除任务，删除小说、章节、情景、角色、世界观时创建，由 DeletionWorker 分批执行
+class DeletionJobEntity(db.Entity):
+    job_id = PrimaryKey(int, auto=True)
+    # 删除的实体类型，见 DeletionMapper.DELETABLE
+    entity = Required(str)
+    entity_id = Required(int)
+    # pending / running / done / failed
+    status = Required(str)
+    # 需要删除的数据行数（创建任务时的估计值）和已删除的行数
+    total = Required(int, default=0)
+    deleted = Required(int, default=0)
+    # 失败的次数和最近一次失败的原因，失败次数达到 DELETE_MAX_ATTEMPTS 后不再重试
+    attempts = Required(int, default=0)
+    error = Optional(str, nullable=True)
+    # 执行任务的进程和租约到期时间（秒级时间戳），进程退出后租约到期，任务由其他进程接手
+    owner = Optional(str, nullable=True)
+    lease_until = Required(float, default=0)
+    # 失败后等待重试，在该时间（秒级时间戳）之前不会被领取
+    run_after = Required(float, default=0)
+    create_time = Required(datetime)
+    update_time = Required(datetime)
@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from pony.orm import PrimaryKey, Required, Optional
+
+from core.mapper.config.DatabaseConfig import db
+
+
+# 后台模型任务（总结章节等耗时较长的调用），由 JobRunner 执行，任务类型见 JobService.register_job_handler
+class LlmJobEntity(db.Entity):
+    job_id = PrimaryKey(int, auto=True)
+    kind = Required(str)
+    # 任务参数和执行结果，JSON 文本
+    params = Required(str)
+    result = Optional(str, nullable=True)
+    # 任务所属的小说，用于按小说查询任务
+    novel_id = Optional(int)
+    # pending / running / done / failed
+    status = Required(str)
+    # 执行进度 0 ~ 1 和当前步骤的说明，由任务的执行函数更新
+    progress = Required(float, default=0)
+    message = Optional(str, nullable=True)
+    # 失败的次数和最近一次失败的原因，失败次数达到 JOB_MAX_ATTEMPTS 后不再重试
+    attempts = Required(int, default=0)
+    error = Optional(str, nullable=True)
+    # 失败后等待重试，在该时间（秒级时间戳）之前不会被领取
+    run_after = Required(float, default=0)
+    # 执行任务的进程和租约到期时间（秒级时间戳），进程退出后租约到期，任务由其他进程接手
+    owner = Optional(str, nullable=True)
+    lease_until = Required(float, default=0)
+    create_time = Required(datetime)
+    update_time = Required(datetime)
@@ -22,6 +22,15 @@ class NovelEntity(db.Entity):
     # 多对一关联小说角色表
     character = Set('CharacterNovelEntity')
 
+    # 汇总字段，写入章节、情景、对话时更新，见 core.mapper.config.Counters
+    chapter_count = Required(int, default=0)
+    scene_count = Required(int, default=0)
+    conversation_count = Required(int, default=0)
+    total_characters = Required(int, default=0)
+    last_activity = Optional(datetime)
+    # 不改变汇总字段的修改（例如删除角色时置空对话的角色）使其加一，小说详情缓存据此判断是否过期，见 NovelCache
+    revision = Required(int, default=0)
+
 
 # 小说章节信息
 class ChapterEntity(db.Entity):
@@ -47,6 +56,12 @@ class ChapterEntity(db.Entity):
     # 反向引用
     scene = Set('SceneEntity')
 
+    # 汇总字段
+    scene_count = Required(int, default=0)
+    conversation_count = Required(int, default=0)
+    total_characters = Required(int, default=0)
+    last_activity = Optional(datetime)
+
 
 # 情景信息
 class SceneEntity(db.Entity):
@@ -66,3 +81,8 @@ class SceneEntity(db.Entity):
 
     # 反向引用
     conversation = Set('ConversationEntity')
+
+    # 汇总字段
+    conversation_count = Required(int, default=0)
+    total_characters = Required(int, default=0)
+    last_activity = Optional(datetime)
@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from pony.orm import PrimaryKey, Required, Optional
+
+from core.mapper.config.DatabaseConfig import db
+
+
+# 每轮对话调用模型的用量，只保存 id 不建立关联，删除小说、情景、角色后用量记录仍保留，用于统计费用
+class TokenUsageEntity(db.Entity):
+    usage_id = PrimaryKey(int, auto=True)
+    novel_id = Optional(int)
+    scene_id = Optional(int)
+    # 本轮回复的角色（对话的接收者，没有时为发送者）
+    character_id = Optional(int)
+    model = Required(str)
+    # prompt 各部分的 token 数量，由本地分词器统计
+    system_tokens = Required(int, default=0)
+    character_tokens = Required(int, default=0)
+    history_tokens = Required(int, default=0)
+    # 输入和输出的 token 数量，provider_usage 为真时是模型返回的用量，否则为本地分词器的统计
+    prompt_tokens = Required(int, default=0)
+    completion_tokens = Required(int, default=0)
+    provider_usage = Required(bool, default=False)
+    # prompt 中命中服务商前缀缓存的 token 数量，只有模型返回用量时才有
+    cached_tokens = Required(int, default=0)
+    # 从发送请求到输出结束、到首个 token 的耗时（毫秒）
+    latency_ms = Required(float, default=0)
+    first_token_ms = Optional(float)
+    create_time = Required(datetime)
@@ -1,13 +1,19 @@
 from abc import ABC
 from datetime import datetime
+from typing import List
 
-from pony.orm import commit, db_session
+from pony.orm import commit, db_session, select
 
+from core.entity.dto.BatchDto import BatchResultDto, batch_created, batch_rejected
 from core.entity.dto.ChapterDto import CreateChapterDto
-from core.entity.po.NovelEntity import ChapterEntity
+from core.entity.po.NovelEntity import ChapterEntity, NovelEntity
+from core.mapper.config.BatchValidation import existing_ids, add_error, group_by_parent
+from core.mapper.config.Counters import on_chapter_created
 from core.mapper.config.CreateDatabase import generate_table_mapping
+from core.mapper.config.NovelCache import patch_chapters_created
 from core.utils.CustomizeException import DatabaseError
 from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
 
 logging = get_logger(__name__)
 
@@ -17,27 +23,92 @@ class ChapterMapperInterface(ABC):
     def create_chapter(self, chapter: CreateChapterDto) -> int:
         raise NotImplementedError()
 
+    def create_chapters(self, chapters: List[CreateChapterDto]) -> BatchResultDto:
+        raise NotImplementedError()
+
 
 class ChapterMapper(ChapterMapperInterface):
 
+    @traced()
     @db_session
     def create_chapter(self, chapter: CreateChapterDto) -> int:
         try:
+            chapter_number = chapter.chapter_number
+            if chapter_number is None:
+                # 未指定编号时排在小说的最后一章之后
+                chapter_number = (select(c.chapter_number for c in ChapterEntity
+                                         if c.novel.novel_id == chapter.novel).max() or 0) + 1
+
             c = ChapterEntity(
-                chapter_number=chapter.chapter_number,
+                chapter_number=chapter_number,
                 chapter_title=chapter.chapter_title,
                 chapter_desc=chapter.chapter_desc,
                 create_time=chapter.create_time,
                 parent=chapter.parent,
                 novel=chapter.novel,
+                last_activity=chapter.create_time,
             )
+            on_chapter_created(chapter.novel, chapter.create_time)
 
             commit()
+            patch_chapters_created([(c.chapter_id, chapter_number, chapter)])
             return c.chapter_id
         except Exception as e:
             logging.error(f"创建章节{chapter.chapter_title}失败, {e}")
             raise DatabaseError(message=f"创建章节{chapter.chapter_title}失败, {e}")
 
+    @traced()
+    @db_session
+    def create_chapters(self, chapters: List[CreateChapterDto]) -> BatchResultDto:
+        """
+        在同一个事务中批量创建章节，存在无效数据时整批不写入
+        """
+        novels = existing_ids(NovelEntity, (chapter.novel for chapter in chapters))
+        parents = existing_ids(ChapterEntity, (chapter.parent for chapter in chapters))
+        errors = {}
+        for index, chapter in enumerate(chapters):
+            if chapter.novel not in novels:
+                add_error(errors, index, f"小说{chapter.novel}不存在")
+            if chapter.parent is not None and chapter.parent not in parents:
+                add_error(errors, index, f"父章节{chapter.parent}不存在")
+        if errors:
+            return batch_rejected(len(chapters), errors)
+
+        try:
+            # 未指定编号的章节依次排在所属小说的最后一章之后，各小说的最大编号一次查出
+            auto_novels = list({chapter.novel for chapter in chapters if chapter.chapter_number is None})
+            next_numbers = {novel_id: 1 for novel_id in auto_novels}
+            if auto_novels:
+                for novel_id, number in select((c.novel.novel_id, max(c.chapter_number)) for c in ChapterEntity
+                                               if c.novel.novel_id in auto_novels):
+                    next_numbers[novel_id] = (number or 0) + 1
+
+            entities = []
+            for chapter in chapters:
+                chapter_number = chapter.chapter_number
+                if chapter_number is None:
+                    chapter_number = next_numbers[chapter.novel]
+                    next_numbers[chapter.novel] += 1
+                entities.append(ChapterEntity(
+                    chapter_number=chapter_number,
+                    chapter_title=chapter.chapter_title,
+                    chapter_desc=chapter.chapter_desc,
+                    create_time=chapter.create_time,
+                    parent=chapter.parent,
+                    novel=chapter.novel,
+                    last_activity=chapter.create_time,
+                ))
+            # 汇总字段按小说合并更新
+            for novel_id, (count, activity) in group_by_parent(chapters, lambda c: c.novel).items():
+                on_chapter_created(novel_id, activity, count)
+
+            commit()
+            patch_chapters_created((c.chapter_id, c.chapter_number, chapter) for c, chapter in zip(entities, chapters))
+            return batch_created([c.chapter_id for c in entities])
+        except Exception as e:
+            logging.error(f"批量创建章节失败, {e}")
+            raise DatabaseError(message=f"批量创建章节失败, {e}")
+
 
 if __name__ == '__main__':
     generate_table_mapping()
@@ -1,16 +1,38 @@
-import os
 from abc import ABC
+from typing import Union
 
 from pony.orm import db_session, commit
 
+from core.entity.ProjectionEntity import CharacterRow, DistinctiveRow, SpeakRow, TraitRow
+from core.entity.dto.BatchDto import BatchResultDto, batch_created, batch_rejected
 from core.entity.dto.CharacterDto import *
 from core.entity.po.CharacterEntity import *
+from core.mapper.config.BatchValidation import existing_ids
+from core.mapper.config.ChildDiff import diff_children
 from core.mapper.config.CreateDatabase import generate_table_mapping
-from core.utils.CustomizeException import NotFoundError, DatabaseError, FileError
-from core.utils.LogConfig import get_logger
+from core.mapper.config.DatabaseConfig import db
+from core.mapper.config.Dialect import quote
+from core.mapper.config.ReadReplica import replica_read
+from core.utils import AppConfig
+from core.utils.CustomizeException import NotFoundError, DatabaseError, VersionConflictError
+from core.utils.ImagePipeline import remove_unreferenced_avatar
+from core.utils.LogConfig import get_logger, log_payload
+from core.utils.Tracer import traced
 
 logging = get_logger(__name__)
 
+CHARACTER, TRAIT, SPEAK, DISTINCTIVE = (quote(name) for name in ("CharacterEntity", "Trait", "Speak", "Distinctive"))
+
+# 角色的基本信息字段
+CHARACTER_FIELDS = ("avatar", "name", "description", "background_story")
+
+# 子表实体、对应的角色属性和参与比较的字段
+CHILD_TABLES = (
+    (Trait, "trait", ("label", "description")),
+    (Speak, "speak", ("role", "content", "reply")),
+    (Distinctive, "distinctive", ("name", "content")),
+)
+
 
 class CharacterMapperInterface(ABC):
 
@@ -20,21 +42,22 @@ class CharacterMapperInterface(ABC):
     def update_avatar(self, character_id: int, avatar: str) -> bool:
         raise NotImplementedError()
 
-    def get_all_characters(self) -> List[ResponseCharacterDto]:
+    def get_all_characters(self) -> List[Union[ResponseCharacterDto, CharacterRow]]:
         raise NotImplementedError()
 
-    def delete_character_by_id(self, character_id: int) -> bool:
+    def select_character_by_id(self, character_id: int) -> ResponseCharacterDto:
         raise NotImplementedError()
 
-    def select_character_by_id(self, character_id: int) -> ResponseCharacterDto:
+    def update_character(self, character_id: int, character: PatchCharacterDto) -> UpdateCharacterResultDto:
         raise NotImplementedError()
 
-    def update_character(self, character: UpdateCharacterDto) -> bool:
+    def create_traits(self, traits: List[CreateTraitDto]) -> BatchResultDto:
         raise NotImplementedError()
 
 
 class CharacterMapper(CharacterMapperInterface):
 
+    @traced()
     @db_session
     def create_character(self, character: CreateCharacterDto) -> int:
         # 创建角色实体
@@ -79,79 +102,101 @@ class CharacterMapper(CharacterMapperInterface):
         commit()
 
         # 记录日志
-        logging.info(f"创建角色成功，id为:{c.character_id}，角色信息为:{c}")
+        logging.info("创建角色成功，id为:%s，角色名称为:%s", c.character_id, c.name)
+        log_payload(logging, "角色信息", character)
         return c.character_id
 
+    @traced()
     @db_session
     def update_avatar(self, character_id, avatar) -> bool:
         character = self._select_character_by_id(character_id)
-        if character.avatar and os.path.exists(avatar):
-            # 删除旧头像
-            try:
-                os.remove(avatar)
-            except Exception as e:
-                logging.error(f"删除文件失败，{e}")
-                raise FileError(str(e))
-
+        old_avatar = character.avatar
         character.avatar = avatar
+        if old_avatar != avatar:
+            self._bump_version(character_id)
+        commit()
+
+        # 头像按内容保存，可能被多个角色共用，没有其他角色引用时才删除旧头像及其缩略图，最近保存的留给定期清理
+        if old_avatar and old_avatar != avatar and not CharacterEntity.exists(avatar=old_avatar) \
+                and remove_unreferenced_avatar(old_avatar):
+            logging.info("已删除旧头像 %s", old_avatar)
+
         logging.info(f"更新头像完成，角色id为{character_id}")
         return True
 
+    @traced()
     @db_session
-    def update_character(self, update_character: CharacterDto):
-        character_id = update_character.id
-        # 查询角色并预加载关联数据
+    def update_character(self, character_id: int, patch: PatchCharacterDto) -> UpdateCharacterResultDto:
+        """
+        更新角色，只修改 patch 中传入的基本信息字段（完整更新传入全部字段），传入 None 表示清空；
+        子表为 None 时不修改，否则与已有数据比较后只插入、修改、删除变化的数据。
+        patch.version 不为空时检查版本号，不一致时抛出 VersionConflictError，整个更新回滚
+        """
         character = self._select_character_by_id(character_id)
-
-        # 更新角色基本信息
-        character.avatar = update_character.avatar
-        character.name = update_character.name
-        character.description = update_character.description
-        character.background_story = update_character.background_story
-
-        # 更新 Trait（性格特征）
-        if update_character.trait is not None or update_character.trait == []:
-            # 删除现有的 trait
-            Trait.select(lambda data: data.character.character_id == character_id).delete()
-            # 添加新的 trait
-            for trait_dto in update_character.trait:
-                Trait(
-                    label=trait_dto.label,
-                    description=trait_dto.description,
-                    character=character
-                )
-
-        # 更新 Speak（说话方式）
-        if update_character.speak is not None or update_character.speak == []:
-            # 删除现有的 speaks
-            Speak.select(lambda data: data.character.character_id == character_id).delete()
-            # 添加新的 speaks
-            for speaking_dto in update_character.speak:
-                Speak(
-                    role=speaking_dto.role,
-                    content=speaking_dto.content,
-                    reply=speaking_dto.reply,
-                    character=character
-                )
-
-        # 更新 Distinctive（自定义字段）
-        if update_character.distinctive is not None or update_character.distinctive == []:
-            # 删除现有的 distinctive
-            Distinctive.select(lambda data: data.character.character_id == character_id).delete()
-            # 添加新的 distinctive
-            for distinctive_dto in update_character.distinctive:
-                Distinctive(
-                    name=distinctive_dto.name,
-                    content=distinctive_dto.content,
-                    character=character
-                )
+        result = UpdateCharacterResultDto(id=character_id, version=0)
+
+        changed = False
+        for field, value in patch.model_dump(include=set(CHARACTER_FIELDS), exclude_unset=True).items():
+            # 可选字段在数据库中以空字符串表示没有值
+            value = '' if value is None else value
+            if value != getattr(character, field):
+                setattr(character, field, value)
+                changed = True
+
+        for entity, attr, fields in CHILD_TABLES:
+            incoming = getattr(patch, attr)
+            if incoming is None:
+                continue
+            stored = sorted(getattr(character, attr), key=lambda e: e.id)
+            diff = diff_children(stored, incoming, fields)
+            for removed in diff.deletes:
+                removed.delete()
+            for updated, dto in diff.updates:
+                updated.set(**{field: getattr(dto, field) for field in fields})
+            for dto in diff.inserts:
+                entity(character=character, **{field: getattr(dto, field) for field in fields})
+            result.inserted += len(diff.inserts)
+            result.updated += len(diff.updates)
+            result.deleted += len(diff.deletes)
+            changed = changed or diff.changed
+
+        if changed:
+            self._bump_version(character_id, patch.version)
+            result.version = patch.version + 1 if patch.version is not None else self._current_version(character_id)
+        else:
+            result.version = self._current_version(character_id)
+            if patch.version is not None and patch.version != result.version:
+                raise VersionConflictError(character_id, patch.version, result.version)
 
         commit()
-        return True
+        logging.info("更新角色成功，id为:%s，版本为:%s，子表插入%d条、修改%d条、删除%d条",
+                     character_id, result.version, result.inserted, result.updated, result.deleted)
+        return result
 
+    @staticmethod
+    def _current_version(character_id: int) -> int:
+        return db.select(f"SELECT version FROM {CHARACTER} WHERE character_id = $character_id")[0]
 
+    def _bump_version(self, character_id: int, expected: int = None):
+        """
+        版本号加一，需要在 db_session 中调用。
+        传入 expected 时用条件更新比较版本号，并发修改同一个角色时只有一个请求能更新成功
+        """
+        if expected is None:
+            db.execute(f"UPDATE {CHARACTER} SET version = version + 1 WHERE character_id = $character_id")
+            return
+        cursor = db.execute(f"UPDATE {CHARACTER} SET version = version + 1 "
+                            f"WHERE character_id = $character_id AND version = $expected")
+        if cursor.rowcount == 0:
+            raise VersionConflictError(character_id, expected, self._current_version(character_id))
+
+    @traced()
+    @replica_read
     @db_session
-    def get_all_characters(self) -> List[ResponseCharacterDto]:
+    def get_all_characters(self) -> List[Union[ResponseCharacterDto, CharacterRow]]:
+        if AppConfig.READ_MODE == "projection":
+            return self._get_character_rows()
+
         # 查询所有 CharacterEntity 记录
         characters = CharacterEntity.select(lambda data: data).prefetch(
             CharacterEntity.trait,
@@ -160,56 +205,79 @@ class CharacterMapper(CharacterMapperInterface):
         )[:]
 
         logging.info("获取所有角色成功")
+        return [self._to_response_dto(character) for character in characters]
 
-        # 转换为 ResponseCharacterDto 列表
-        result = []
-        for character in characters:
-            # 转换 trait
-            traits = [
-                TraitDto(label=t.label, description=t.description)
-                for t in character.trait
-            ] if character.trait else []
-
-            # 转换 speak
-            speakings = [
-                SpeakingDto(role=s.role, content=s.content, reply=s.reply)
-                for s in character.speak
-            ] if character.speak else []
-
-            # 转换 distinctive
-            distinctive = [
-                DistinctiveDto(name=d.name, content=d.content)
-                for d in character.distinctive
-            ] if character.distinctive else []
-
-            # 创建 ResponseCharacterDto 实例
-            character_dto = ResponseCharacterDto(
-                id=character.character_id,
-                avatar=character.avatar or '',
-                name=character.name,
-                description=character.description or '',
-                background_story=character.background_story or '',
-                trait=traits,
-                speak=speakings,
-                distinctive=distinctive
-            )
-            result.append(character_dto)
+    @staticmethod
+    def _get_character_rows() -> List[CharacterRow]:
+        """
+        投影模式，角色和三个子表各查询一次需要的字段，子表数据按 id 排序，与 _to_response_dto 的顺序相同
+        """
+        characters = {
+            character_id: CharacterRow(character_id, avatar or '', name, description or '', background_story or '',
+                                       version=version)
+            for character_id, avatar, name, description, background_story, version in db.execute(
+                f"SELECT character_id, avatar, name, description, background_story, version "
+                f"FROM {CHARACTER} ORDER BY character_id")
+        }
+        for row_id, label, description, character_id in db.execute(
+                f"SELECT id, label, description, character FROM {TRAIT} ORDER BY id"):
+            characters[character_id].trait.append(TraitRow(row_id, label, description))
+        for row_id, role, content, reply, character_id in db.execute(
+                f"SELECT id, role, content, reply, character FROM {SPEAK} ORDER BY id"):
+            characters[character_id].speak.append(SpeakRow(row_id, role, content, reply))
+        for row_id, name, content, character_id in db.execute(
+                f"SELECT id, name, content, character FROM {DISTINCTIVE} ORDER BY id"):
+            characters[character_id].distinctive.append(DistinctiveRow(row_id, name, content))
 
-        return result
+        logging.info("获取所有角色成功")
+        return list(characters.values())
 
+    @staticmethod
+    def _to_response_dto(character: CharacterEntity) -> ResponseCharacterDto:
+        """
+        子表数据按 id 排序，即按创建顺序返回，拼接的提示词不随查询顺序变化
+        """
+        return ResponseCharacterDto(
+            id=character.character_id,
+            avatar=character.avatar or '',
+            name=character.name,
+            description=character.description or '',
+            background_story=character.background_story or '',
+            trait=[TraitDto(id=t.id, label=t.label, description=t.description)
+                   for t in sorted(character.trait, key=lambda e: e.id)],
+            speak=[SpeakingDto(id=s.id, role=s.role, content=s.content, reply=s.reply)
+                   for s in sorted(character.speak, key=lambda e: e.id)],
+            distinctive=[DistinctiveDto(id=d.id, name=d.name, content=d.content)
+                         for d in sorted(character.distinctive, key=lambda e: e.id)],
+            version=character.version,
+        )
 
+    @traced()
     @db_session
-    def delete_character_by_id(self, character_id: int) -> bool:
-        character = CharacterEntity.get(character_id=character_id)
-
-        if not character:
-            logging.warning(f"角色id: {character_id} 不存在")
-            raise NotFoundError(entity_id=character_id)
+    def create_traits(self, traits: List[CreateTraitDto]) -> BatchResultDto:
+        """
+        在同一个事务中为角色批量添加性格特征，存在无效数据时整批不写入
+        """
+        characters = existing_ids(CharacterEntity, (trait.character for trait in traits))
+        errors = {index: f"角色{trait.character}不存在"
+                  for index, trait in enumerate(traits) if trait.character not in characters}
+        if errors:
+            return batch_rejected(len(traits), errors)
 
-        character.delete()
-        logging.info(f"删除角色id为{character_id}成功")
-        return True
+        try:
+            entities = [Trait(label=trait.label, description=trait.description, character=trait.character)
+                        for trait in traits]
+            for character_id in {trait.character for trait in traits}:
+                self._bump_version(character_id)
+
+            commit()
+            logging.info("批量添加性格特征成功，数量为:%s", len(entities))
+            return batch_created([trait.id for trait in entities])
+        except Exception as e:
+            logging.error(f"批量添加性格特征失败，{e}")
+            raise DatabaseError(message=f"批量添加性格特征失败，{e}")
 
+    @traced()
     @db_session
     def _select_character_by_id(self, character_id: int) -> CharacterEntity:
         # 查询角色并预加载关联数据
@@ -224,6 +292,7 @@ class CharacterMapper(CharacterMapperInterface):
             raise NotFoundError(character_id)
         return character
 
+    @traced()
     @db_session
     def select_character_by_id(self, character_id: int) -> ResponseCharacterDto:
         """
@@ -233,26 +302,7 @@ class CharacterMapper(CharacterMapperInterface):
             # 查询角色并预加载关联数据
             character = self._select_character_by_id(character_id)
 
-            # 转换为 ResponseCharacterDto
-            return ResponseCharacterDto(
-                id=character.character_id,
-                avatar=character.avatar or '',
-                name=character.name,
-                description=character.description or '',
-                background_story=character.background_story or '',
-                trait=[
-                    TraitDto(label=t.label, description=t.description)
-                    for t in character.trait
-                ],
-                speak=[
-                    SpeakingDto(role=s.role, content=s.content, reply=s.reply)
-                    for s in character.speak
-                ],
-                distinctive=[
-                    DistinctiveDto(name=d.name, content=d.content)
-                    for d in character.distinctive
-                ]
-            )
+            return self._to_response_dto(character)
 
         except Exception as e:
             logging.error(f"查询角色 ID {character_id} 失败: {str(e)}")
@@ -1,26 +1,46 @@
 from abc import ABC
-from typing import List
+from typing import List, Optional
 
 from pony.orm import commit, db_session
 
 from core.entity.dto.CharacterDto import ResponseCharacterDto
-from core.entity.dto.NovelDto import CreateCharacter2NovelDto
+from core.entity.dto.NovelDto import CreateCharacter2NovelDto, ResponseCharacterMemoryDto
 from core.entity.po.CharacterNovelEntity import CharacterNovelEntity
 from core.mapper.CharacterMapper import CharacterMapperInterface, CharacterMapper
 from core.mapper.NovelMapper import NovelMapperInterface, NovelMapper
 from core.mapper.config.CreateDatabase import generate_table_mapping
-from core.utils.CustomizeException import DatabaseError
+from core.mapper.config.DatabaseConfig import db
+from core.mapper.config.Dialect import quote
+from core.utils.CustomizeException import DatabaseError, NotFoundError
 from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
 
 logging = get_logger(__name__)
 
+CHARACTER, CHARACTER_NOVEL, NOVEL = (quote(name) for name in ("CharacterEntity", "CharacterNovelEntity", "NovelEntity"))
+# character 在 PostgreSQL 中是保留字
+CHARACTER_COLUMN = quote("character")
+
 
 class CharacterNovelMapperInterface(ABC):
 
     def connect_character_2_novel(self, character_novel: CreateCharacter2NovelDto):
         raise NotImplementedError()
 
-    def get_connect_characters_by_novel_id(self, novel_id: int):
+    def disconnect_character_from_novel(self, novel_id: int, character_id: int) -> int:
+        raise NotImplementedError()
+
+    def get_connect_characters_by_novel_id(self, novel_id: int, character_ids: Optional[List[int]] = None):
+        raise NotImplementedError()
+
+    def get_character_memories(self, novel_id: int) -> List[ResponseCharacterMemoryDto]:
+        raise NotImplementedError()
+
+    def reserve_memory_consolidation(self, novel_id: int, conversations: int) -> bool:
+        raise NotImplementedError()
+
+    def save_character_memory(self, novel_id: int, character_id: int, memory: str, status: str,
+                              memory_until: int) -> bool:
         raise NotImplementedError()
 
 
@@ -32,6 +52,7 @@ class CharacterNovelMapper(CharacterNovelMapperInterface):
         self.character_mapper = character_mapper
         self.novel_mapper = novel_mapper
 
+    @traced()
     @db_session
     def connect_character_2_novel(self, character_novel: CreateCharacter2NovelDto):
         try:
@@ -47,10 +68,36 @@ class CharacterNovelMapper(CharacterNovelMapperInterface):
                 f"角色 ID {character_novel.character_id}，连接小说 ID {character_novel.novel_id} 失败，{str(e)}")
             raise DatabaseError(str(e))
 
+    @traced()
     @db_session
-    def get_connect_characters_by_novel_id(self, novel_id: int) -> List[ResponseCharacterDto]:
+    def disconnect_character_from_novel(self, novel_id: int, character_id: int) -> int:
+        """
+        取消角色与小说的关联，角色在这部小说中的记忆一起删除；小说中已有的对话保留，角色本身不删除
+
+        :return: 删除的关联数量
+        """
+        cursor = db.execute(f"DELETE FROM {CHARACTER_NOVEL} WHERE novel = $novel_id "
+                            f"AND {CHARACTER_COLUMN} = $character_id")
+        commit()
+        if cursor.rowcount == 0:
+            logging.warning(f"角色 ID {character_id} 没有关联到小说 ID {novel_id}")
+            raise NotFoundError(character_id)
+        logging.info(f"已取消角色 ID {character_id} 与小说 ID {novel_id} 的关联")
+        return cursor.rowcount
+
+    @traced()
+    @db_session
+    def get_connect_characters_by_novel_id(self, novel_id: int,
+                                           character_ids: Optional[List[int]] = None) -> List[ResponseCharacterDto]:
+        """
+        :param character_ids: 不为空时只返回其中关联到小说的角色
+        """
         try:
-            cn = CharacterNovelEntity.select(lambda data: data.novel.novel_id == novel_id)[:]
+            if character_ids is None:
+                cn = CharacterNovelEntity.select(lambda data: data.novel.novel_id == novel_id)[:]
+            else:
+                cn = CharacterNovelEntity.select(lambda data: data.novel.novel_id == novel_id
+                                                 and data.character.character_id in character_ids)[:]
 
             result: List[ResponseCharacterDto] = []
             for c in cn:
@@ -60,6 +107,52 @@ class CharacterNovelMapper(CharacterNovelMapperInterface):
             logging.error(f"获取小说连接的角色失败，{str(e)}")
             raise DatabaseError(str(e))
 
+    @traced()
+    @db_session
+    def get_character_memories(self, novel_id: int) -> List[ResponseCharacterMemoryDto]:
+        """
+        小说关联的全部角色的记忆，按角色 id 排序
+        """
+        rows = db.select(f"SELECT c.character_id, c.name, cn.memory, cn.status, cn.memory_until "
+                         f"FROM {CHARACTER_NOVEL} cn JOIN {CHARACTER} c ON c.character_id = cn.{CHARACTER_COLUMN} "
+                         f"WHERE cn.novel = $novel_id")
+        # 每部小说的角色很少，在内存中排序，避免按角色 id 排序时建立临时 B 树
+        return [ResponseCharacterMemoryDto(character_id=character_id, name=name, memory=memory or "",
+                                           status=status or "", memory_until=memory_until)
+                for character_id, name, memory, status, memory_until in sorted(rows)]
+
+    @traced()
+    @db_session
+    def reserve_memory_consolidation(self, novel_id: int, conversations: int) -> bool:
+        """
+        距离上次安排整理新增了 conversations 条对话时，把小说当前的对话数量记为本次安排的位置。
+        条件更新只有一个请求能成功，同一批对话只会安排一次整理；删除对话后数量变小时重新对齐
+
+        :return: 是否需要整理
+        """
+        count = f"(SELECT conversation_count FROM {NOVEL} WHERE novel_id = $novel_id)"
+        cursor = db.execute(f"UPDATE {CHARACTER_NOVEL} SET memory_turns = {count} "
+                            f"WHERE novel = $novel_id AND (memory_turns <= {count} - $conversations "
+                            f"OR memory_turns > {count})")
+        commit()
+        return cursor.rowcount > 0
+
+    @traced()
+    @db_session
+    def save_character_memory(self, novel_id: int, character_id: int, memory: str, status: str,
+                              memory_until: int) -> bool:
+        """
+        保存整理后的记忆，已保存了更新的记忆时（重试的任务晚于后来的任务完成）不覆盖
+
+        :return: 是否保存
+        """
+        cursor = db.execute(f"UPDATE {CHARACTER_NOVEL} SET memory = $memory, status = $status, "
+                            f"memory_until = $memory_until WHERE novel = $novel_id "
+                            f"AND {CHARACTER_COLUMN} = $character_id AND memory_until <= $memory_until")
+        commit()
+        return cursor.rowcount > 0
+
+    @traced()
     @db_session
     def create_character_prompt(self, character: ResponseCharacterDto):
         """
@@ -4,11 +4,18 @@ from typing import List
 
 from pony.orm import commit, db_session
 
+from core.entity.dto.BatchDto import BatchResultDto, batch_created, batch_rejected
 from core.entity.dto.ConversationDto import CreateConversationDto, ResponseConversationDto
 from core.entity.po.ConversationEntity import ConversationEntity
+from core.entity.po.NovelEntity import SceneEntity
+from core.mapper.config.BatchValidation import existing_ids, add_error, group_by_parent
+from core.mapper.config.Counters import on_conversation_created, on_conversations_deleted
 from core.mapper.config.CreateDatabase import generate_table_mapping
-from core.utils.CustomizeException import DatabaseError
+from core.mapper.config.NovelCache import patch_conversation_deleted, patch_conversations_created
+from core.mapper.config.ReadReplica import replica_read
+from core.utils.CustomizeException import DatabaseError, NotFoundError
 from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
 
 logging = get_logger(__name__)
 
@@ -18,12 +25,19 @@ class ConversationMapperInterface(ABC):
     def create_conversation(self, conversation: CreateConversationDto) -> int:
         raise NotImplementedError()
 
-    def get_conversation_by_scene_id(self, scene_id: str) -> List[ResponseConversationDto]:
+    def create_conversations(self, conversations: List[CreateConversationDto]) -> BatchResultDto:
+        raise NotImplementedError()
+
+    def get_conversation_by_scene_id(self, scene_id: int) -> List[ResponseConversationDto]:
+        raise NotImplementedError()
+
+    def delete_conversation(self, conversation_id: int) -> bool:
         raise NotImplementedError()
 
 
 class ConversationMapper(ConversationMapperInterface):
 
+    @traced()
     @db_session
     def create_conversation(self, conversation: CreateConversationDto) -> int:
         try:
@@ -35,30 +49,94 @@ class ConversationMapper(ConversationMapperInterface):
                 create_time=conversation.create_time,
                 parent=conversation.parent,
                 scene=conversation.scene)
+            on_conversation_created(conversation.scene, len(conversation.content), conversation.create_time)
 
             # 提交事务
             commit()
+            patch_conversations_created([(c.conversation_id, conversation)])
             return c.conversation_id
         except Exception as e:
             logging.error(f"创建对话失败，{str(e)}")
             raise DatabaseError(str(e))
 
+    @traced()
+    @db_session
+    def create_conversations(self, conversations: List[CreateConversationDto]) -> BatchResultDto:
+        """
+        在同一个事务中批量创建对话，存在无效数据时整批不写入
+        """
+        scenes = existing_ids(SceneEntity, (conversation.scene for conversation in conversations))
+        parents = existing_ids(ConversationEntity, (conversation.parent for conversation in conversations))
+        errors = {}
+        for index, conversation in enumerate(conversations):
+            if conversation.scene not in scenes:
+                add_error(errors, index, f"情景{conversation.scene}不存在")
+            if conversation.parent is not None and conversation.parent not in parents:
+                add_error(errors, index, f"父对话{conversation.parent}不存在")
+        if errors:
+            return batch_rejected(len(conversations), errors)
+
+        try:
+            entities = [ConversationEntity(
+                role=conversation.role,
+                sender_character=conversation.sender_character,
+                receiver_character=conversation.receiver_character,
+                content=conversation.content,
+                create_time=conversation.create_time,
+                parent=conversation.parent,
+                scene=conversation.scene) for conversation in conversations]
+            # 汇总字段按情景合并更新
+            characters = {}
+            for conversation in conversations:
+                characters[conversation.scene] = characters.get(conversation.scene, 0) + len(conversation.content)
+            for scene_id, (count, activity) in group_by_parent(conversations, lambda c: c.scene).items():
+                on_conversation_created(scene_id, characters[scene_id], activity, count)
+
+            commit()
+            patch_conversations_created(zip((c.conversation_id for c in entities), conversations))
+            return batch_created([c.conversation_id for c in entities])
+        except Exception as e:
+            logging.error(f"批量创建对话失败，{e}")
+            raise DatabaseError(message=f"批量创建对话失败，{e}")
+
+    @traced()
+    @db_session
+    def delete_conversation(self, conversation_id: int) -> bool:
+        """
+        删除单条对话，数据量小，直接删除不创建后台任务。回复该对话的对话保留，parent 由外键置空
+        """
+        conversation = ConversationEntity.get(conversation_id=conversation_id)
+        if not conversation:
+            logging.warning(f"对话 ID {conversation_id} 不存在")
+            raise NotFoundError(conversation_id)
+
+        scene_id, characters = conversation.scene.scene_id, len(conversation.content)
+        on_conversations_deleted(scene_id, 1, characters)
+        conversation.delete()
+        commit()
+        patch_conversation_deleted(conversation_id, scene_id, characters)
+        logging.info(f"删除对话id为{conversation_id}成功")
+        return True
+
+    @traced()
+    @replica_read
     @db_session
-    def get_conversation_by_scene_id(self, scene_id: str) -> List[ResponseConversationDto]:
+    def get_conversation_by_scene_id(self, scene_id: int) -> List[ResponseConversationDto]:
         try:
-            conversations = ConversationEntity.select(lambda data: data.scene.scene_id == scene_id)[:]
+            conversations = ConversationEntity.select(lambda data: data.scene.scene_id == scene_id) \
+                .order_by(lambda data: (data.create_time, data.conversation_id))[:]
 
             result: List[ResponseConversationDto] = []
             for conversation in conversations:
                 result.append(ResponseConversationDto(
                     conversation_id=conversation.conversation_id,
                     role=conversation.role,
-                    sender_character=conversation.sender_character,
-                    receiver_character=conversation.receiver_character,
+                    sender_character=conversation.sender_character.character_id if conversation.sender_character else None,
+                    receiver_character=conversation.receiver_character.character_id if conversation.receiver_character else None,
                     content=conversation.content,
                     create_time=conversation.create_time,
-                    parent=conversation.parent,
-                    scene=conversation.scene))
+                    parent=conversation.parent.conversation_id if conversation.parent else None,
+                    scene=conversation.scene.scene_id))
             return result
         except Exception as e:
             logging.error(f"获取情景 ID 为{scene_id}的对话失败，{str(e)}")
@@ -0,0 +1,406 @@
+"""
+后台分批删除
+
+删除小说、章节、情景、角色、世界观时只创建删除任务，由 DeletionWorker 在后台分批执行，每批在一个事务中最多处理
+DELETE_BATCH_SIZE 行，删除大量数据时不会长时间占用写锁，其他请求可以在两批之间读写。
+
+每种实体的删除按顺序分为若干步骤，先删除最下层的数据，最后删除实体本身。步骤不保存执行位置，每批从第一个步骤开始，
+执行第一个还有数据可删的步骤，因此任务中断后重新执行是安全的，删除过程中新写入的下级数据也会被删除。
+
+删除章节、情景、对话时同步减少上级的汇总字段。删除小说时不更新汇总字段，小说在创建删除任务后就不再出现在列表和详情中。
+"""
+from abc import ABC
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from pony.orm import db_session, commit, rollback, TransactionIntegrityError
+
+from core.entity.dto.DeletionDto import ResponseDeletionJobDto
+from core.entity.po.CharacterEntity import CharacterEntity
+from core.entity.po.DeletionJobEntity import DeletionJobEntity
+from core.entity.po.NovelEntity import NovelEntity, ChapterEntity, SceneEntity
+from core.entity.po.WorldEntity import WorldEntity
+from core.mapper.config.Counters import (CHAPTER, CONVERSATION, NOVEL, SCENE, on_chapter_deleted,
+                                         on_conversations_deleted, on_novels_changed, on_scenes_deleted)
+from core.mapper.config.DatabaseConfig import db
+from core.mapper.config.Dialect import datetime_param, quote
+from core.utils.CustomizeException import NotFoundError
+from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
+
+logging = get_logger(__name__)
+
+JOB = quote("DeletionJobEntity")
+CHARACTER, CHARACTER_NOVEL = quote("CharacterEntity"), quote("CharacterNovelEntity")
+WORLD, WORLD_DETAIL = quote("WorldEntity"), quote("WorldDetailEntity")
+TRAIT, SPEAK, DISTINCTIVE = quote("Trait"), quote("Speak"), quote("Distinctive")
+
+# 任务状态
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+# 可以在后台删除的实体
+NOVEL_JOB, CHAPTER_JOB, SCENE_JOB, CHARACTER_JOB, WORLD_JOB = "novel", "chapter", "scene", "character", "world"
+
+# 任务可以被（重新）领取：等待执行且已到重试时间，或执行任务的进程的租约已过期
+_CLAIMABLE = f"((status = '{PENDING}' AND run_after <= $now) OR (status = '{RUNNING}' AND lease_until < $now))"
+
+
+class DeletionBatch:
+    """
+    一批删除的结果
+    """
+
+    def __init__(self):
+        # 本批处理的行数
+        self.deleted = 0
+        # 全部数据已删除，任务完成
+        self.done = False
+        # 任务已不属于当前进程（租约过期后被其他进程领取），需要停止执行
+        self.lost = False
+        # 已删除且没有其他角色引用的头像，提交后删除文件
+        self.avatars: List[str] = []
+
+
+def _id_list(ids) -> str:
+    return ", ".join(str(int(i)) for i in ids)
+
+
+def _delete_ids(table: str, key: str, ids) -> int:
+    if not ids:
+        return 0
+    return db.execute(f"DELETE FROM {table} WHERE {key} IN ({_id_list(ids)})").rowcount
+
+
+def _delete_children(table: str, key: str, column: str, parent_id: int, limit: int) -> int:
+    """
+    删除子表中属于 parent_id 的至多 limit 行
+    """
+    return db.execute(f"DELETE FROM {table} WHERE {key} IN "
+                      f"(SELECT {key} FROM {table} WHERE {column} = $parent_id LIMIT $limit)").rowcount
+
+
+def _delete_conversations(rows: List[Tuple[int, int, int]]) -> int:
+    """
+    删除对话并减少所在情景、章节、小说的汇总字段
+
+    :param rows: (对话id, 情景id, 内容字数)
+    """
+    by_scene: Dict[int, List[int]] = defaultdict(lambda: [0, 0])
+    for _, scene_id, characters in rows:
+        by_scene[scene_id][0] += 1
+        by_scene[scene_id][1] += characters or 0
+    for scene_id, (count, characters) in by_scene.items():
+        on_conversations_deleted(scene_id, count, characters)
+    return _delete_ids(CONVERSATION, "conversation_id", [row[0] for row in rows])
+
+
+# 每个步骤的参数为实体id、本批最多处理的行数和本批的结果，返回处理的行数，返回 0 表示该步骤已没有数据
+
+def _novel_conversations(novel_id: int, limit: int, batch: DeletionBatch) -> int:
+    return db.execute(f"DELETE FROM {CONVERSATION} WHERE conversation_id IN ("
+                      f"SELECT c.conversation_id FROM {CONVERSATION} c JOIN {SCENE} s ON c.scene = s.scene_id "
+                      f"JOIN {CHAPTER} ch ON s.chapter = ch.chapter_id WHERE ch.novel = $novel_id LIMIT $limit)").rowcount
+
+
+def _novel_scenes(novel_id: int, limit: int, batch: DeletionBatch) -> int:
+    return db.execute(f"DELETE FROM {SCENE} WHERE scene_id IN ("
+                      f"SELECT s.scene_id FROM {SCENE} s JOIN {CHAPTER} ch ON s.chapter = ch.chapter_id "
+                      f"WHERE ch.novel = $novel_id LIMIT $limit)").rowcount
+
+
+def _novel_chapters(novel_id: int, limit: int, batch: DeletionBatch) -> int:
+    return _delete_children(CHAPTER, "chapter_id", "novel", novel_id, limit)
+
+
+def _novel_characters(novel_id: int, limit: int, batch: DeletionBatch) -> int:
+    return _delete_children(CHARACTER_NOVEL, "character_novel_id", "novel", novel_id, limit)
+
+
+def _novel(novel_id: int, limit: int, batch: DeletionBatch) -> int:
+    # 与世界观的关联由外键级联删除
+    return db.execute(f"DELETE FROM {NOVEL} WHERE novel_id = $novel_id").rowcount
+
+
+def _chapter_conversations(chapter_id: int, limit: int, batch: DeletionBatch) -> int:
+    rows = db.select(f"SELECT c.conversation_id, c.scene, LENGTH(c.content) FROM {CONVERSATION} c "
+                     f"JOIN {SCENE} s ON c.scene = s.scene_id WHERE s.chapter = $chapter_id LIMIT $limit")
+    return _delete_conversations(rows)
+
+
+def _chapter_scenes(chapter_id: int, limit: int, batch: DeletionBatch) -> int:
+    rows = db.select(f"SELECT scene_id, conversation_count, total_characters FROM {SCENE} "
+                     f"WHERE chapter = $chapter_id LIMIT $limit")
+    if rows:
+        on_scenes_deleted(chapter_id, len(rows), sum(row[1] for row in rows), sum(row[2] for row in rows))
+    return _delete_ids(SCENE, "scene_id", [row[0] for row in rows])
+
+
+def _chapter(chapter_id: int, limit: int, batch: DeletionBatch) -> int:
+    rows = db.select(f"SELECT novel, scene_count, conversation_count, total_characters FROM {CHAPTER} "
+                     f"WHERE chapter_id = $chapter_id")
+    if not rows:
+        return 0
+    on_chapter_deleted(*rows[0])
+    return _delete_ids(CHAPTER, "chapter_id", [chapter_id])
+
+
+def _scene_conversations(scene_id: int, limit: int, batch: DeletionBatch) -> int:
+    rows = db.select(f"SELECT conversation_id, scene, LENGTH(content) FROM {CONVERSATION} "
+                     f"WHERE scene = $scene_id LIMIT $limit")
+    return _delete_conversations(rows)
+
+
+def _scene(scene_id: int, limit: int, batch: DeletionBatch) -> int:
+    rows = db.select(f"SELECT chapter, conversation_count, total_characters FROM {SCENE} WHERE scene_id = $scene_id")
+    if not rows:
+        return 0
+    chapter_id, conversations, characters = rows[0]
+    on_scenes_deleted(chapter_id, 1, conversations, characters)
+    return _delete_ids(SCENE, "scene_id", [scene_id])
+
+
+def _character_references(column: str) -> Callable[[int, int, DeletionBatch], int]:
+    """
+    对话中的发送者、接收者引用置空，对话本身保留。汇总字段不变，同时增加所属小说的 revision
+    """
+
+    def step(character_id: int, limit: int, batch: DeletionBatch) -> int:
+        rows = db.select(f"SELECT c.conversation_id, ch.novel FROM {CONVERSATION} c "
+                         f"LEFT JOIN {SCENE} s ON c.scene = s.scene_id LEFT JOIN {CHAPTER} ch ON s.chapter = ch.chapter_id "
+                         f"WHERE c.{column} = $character_id LIMIT $limit")
+        if not rows:
+            return 0
+        on_novels_changed({novel_id for _, novel_id in rows if novel_id is not None})
+        return db.execute(f"UPDATE {CONVERSATION} SET {column} = NULL "
+                          f"WHERE conversation_id IN ({_id_list(row[0] for row in rows)})").rowcount
+
+    return step
+
+
+def _character_children(table: str, key: str) -> Callable[[int, int, DeletionBatch], int]:
+    def step(character_id: int, limit: int, batch: DeletionBatch) -> int:
+        return _delete_children(table, key, "character", character_id, limit)
+
+    return step
+
+
+def _character(character_id: int, limit: int, batch: DeletionBatch) -> int:
+    rows = db.select(f"SELECT avatar FROM {CHARACTER} WHERE character_id = $character_id")
+    if not rows:
+        return 0
+    deleted = _delete_ids(CHARACTER, "character_id", [character_id])
+    # 头像按内容保存，可能被多个角色共用，没有其他角色引用时才删除文件
+    avatar = rows[0]
+    if avatar and not db.select(f"SELECT 1 FROM {CHARACTER} WHERE avatar = $avatar LIMIT 1"):
+        batch.avatars.append(avatar)
+    return deleted
+
+
+def _world_details(world_id: int, limit: int, batch: DeletionBatch) -> int:
+    return _delete_children(WORLD_DETAIL, "id", "world", world_id, limit)
+
+
+def _world(world_id: int, limit: int, batch: DeletionBatch) -> int:
+    # 与小说的关联由外键级联删除
+    return db.execute(f"DELETE FROM {WORLD} WHERE world_id = $world_id").rowcount
+
+
+# 各实体的删除步骤，按执行顺序排列
+STEPS: Dict[str, Tuple[Callable[[int, int, DeletionBatch], int], ...]] = {
+    NOVEL_JOB: (_novel_conversations, _novel_scenes, _novel_chapters, _novel_characters, _novel),
+    CHAPTER_JOB: (_chapter_conversations, _chapter_scenes, _chapter),
+    SCENE_JOB: (_scene_conversations, _scene),
+    CHARACTER_JOB: (_character_references("sender_character"), _character_references("receiver_character"),
+                    _character_children(TRAIT, "id"), _character_children(SPEAK, "id"),
+                    _character_children(DISTINCTIVE, "id"),
+                    _character_children(CHARACTER_NOVEL, "character_novel_id"), _character),
+    WORLD_JOB: (_world_details, _world),
+}
+
+
+class DeletionMapperInterface(ABC):
+
+    def create_job(self, entity: str, entity_id: int) -> ResponseDeletionJobDto:
+        raise NotImplementedError()
+
+    def get_job(self, job_id: int) -> ResponseDeletionJobDto:
+        raise NotImplementedError()
+
+    def claim_next_job(self, owner: str, lease: float) -> Optional[int]:
+        raise NotImplementedError()
+
+    def delete_batch(self, job_id: int, owner: str, limit: int, lease: float) -> DeletionBatch:
+        raise NotImplementedError()
+
+    def release_job(self, job_id: int, owner: str):
+        raise NotImplementedError()
+
+    def fail_job(self, job_id: int, owner: str, error: str, max_attempts: int, retry_at: float) -> bool:
+        raise NotImplementedError()
+
+    def referenced_avatars(self) -> Set[str]:
+        raise NotImplementedError()
+
+
+class DeletionMapper(DeletionMapperInterface):
+
+    @traced()
+    @db_session
+    def create_job(self, entity: str, entity_id: int) -> ResponseDeletionJobDto:
+        """
+        创建删除任务，实体已有未完成的任务时返回该任务，失败的任务重新开始执行。
+        同一实体未完成的任务由唯一索引保证只有一个，并发创建时写入失败的请求返回已创建的任务
+        """
+        total = self._estimate_rows(entity, entity_id)
+        job = self._active_job(entity, entity_id)
+        now = datetime.now()
+        if job is None:
+            try:
+                job = DeletionJobEntity(entity=entity, entity_id=entity_id, status=PENDING, total=total,
+                                        create_time=now, update_time=now)
+                commit()
+            except TransactionIntegrityError:
+                rollback()
+                logging.info("%s id为%s 的删除任务已由其他请求创建", entity, entity_id)
+                return self._to_dto(self._active_job(entity, entity_id))
+            logging.info("创建删除任务成功，id为:%s，删除%s id为%s，预计%d行", job.job_id, entity, entity_id, total)
+        elif job.status == FAILED:
+            job.set(status=PENDING, attempts=0, error=None, run_after=0, total=job.deleted + total, update_time=now)
+            commit()
+            logging.info("删除任务 %s 重新开始执行", job.job_id)
+        return self._to_dto(job)
+
+    @staticmethod
+    def _active_job(entity: str, entity_id: int) -> Optional[DeletionJobEntity]:
+        return DeletionJobEntity.select(
+            lambda j: j.entity == entity and j.entity_id == entity_id and j.status != DONE).first()
+
+    @staticmethod
+    def _estimate_rows(entity: str, entity_id: int) -> int:
+        """
+        需要处理的行数，实体不存在时抛出 NotFoundError
+        """
+        if entity == NOVEL_JOB:
+            novel = NovelEntity.get(novel_id=entity_id)
+            if novel:
+                return novel.chapter_count + novel.scene_count + novel.conversation_count + 1
+        elif entity == CHAPTER_JOB:
+            chapter = ChapterEntity.get(chapter_id=entity_id)
+            if chapter:
+                return chapter.scene_count + chapter.conversation_count + 1
+        elif entity == SCENE_JOB:
+            scene = SceneEntity.get(scene_id=entity_id)
+            if scene:
+                return scene.conversation_count + 1
+        elif entity == CHARACTER_JOB:
+            if CharacterEntity.exists(character_id=entity_id):
+                counts = ", ".join(f"(SELECT COUNT(*) FROM {table} WHERE {column} = $entity_id)" for table, column in (
+                    (CONVERSATION, "sender_character"), (CONVERSATION, "receiver_character"), (TRAIT, "character"),
+                    (SPEAK, "character"), (DISTINCTIVE, "character"), (CHARACTER_NOVEL, "character")))
+                return sum(db.select(f"SELECT {counts}")[0]) + 1
+        elif entity == WORLD_JOB:
+            if WorldEntity.exists(world_id=entity_id):
+                return db.select(f"SELECT COUNT(*) FROM {WORLD_DETAIL} WHERE world = $entity_id")[0] + 1
+        else:
+            raise ValueError(f"不支持删除的实体类型: {entity}")
+        logging.warning(f"{entity} id: {entity_id} 不存在")
+        raise NotFoundError(entity_id)
+
+    @traced()
+    @db_session
+    def get_job(self, job_id: int) -> ResponseDeletionJobDto:
+        job = DeletionJobEntity.get(job_id=job_id)
+        if not job:
+            logging.warning(f"删除任务 ID {job_id} 不存在")
+            raise NotFoundError(job_id)
+        return self._to_dto(job)
+
+    @db_session
+    def claim_next_job(self, owner: str, lease: float) -> Optional[int]:
+        """
+        领取最早创建的可执行任务，多个进程同时领取时用条件更新保证只有一个进程领取成功
+
+        :return: 任务id，没有可执行的任务时返回 None
+        """
+        now = datetime.now().timestamp()
+        rows = db.select(f"SELECT job_id FROM {JOB} WHERE {_CLAIMABLE} ORDER BY job_id LIMIT 1")
+        if not rows:
+            return None
+        job_id, lease_until, update_time = rows[0], now + lease, datetime_param(datetime.now())
+        cursor = db.execute(f"UPDATE {JOB} SET status = '{RUNNING}', owner = $owner, lease_until = $lease_until, "
+                            f"update_time = $update_time WHERE job_id = $job_id AND {_CLAIMABLE}")
+        commit()
+        return job_id if cursor.rowcount else None
+
+    @db_session
+    def delete_batch(self, job_id: int, owner: str, limit: int, lease: float) -> DeletionBatch:
+        """
+        执行一批删除并更新任务进度，删除和进度在同一个事务中提交，同时延长租约
+        """
+        batch = DeletionBatch()
+        rows = db.select(f"SELECT entity, entity_id FROM {JOB} "
+                         f"WHERE job_id = $job_id AND status = '{RUNNING}' AND owner = $owner")
+        if not rows:
+            batch.lost = True
+            return batch
+
+        entity, entity_id = rows[0]
+        for step in STEPS[entity]:
+            batch.deleted = step(entity_id, limit, batch)
+            if batch.deleted:
+                break
+        else:
+            batch.done = True
+
+        deleted, status = batch.deleted, DONE if batch.done else RUNNING
+        lease_until, update_time = datetime.now().timestamp() + lease, datetime_param(datetime.now())
+        db.execute(f"UPDATE {JOB} SET deleted = deleted + $deleted, status = $status, lease_until = $lease_until, "
+                   f"update_time = $update_time WHERE job_id = $job_id")
+        commit()
+        return batch
+
+    @db_session
+    def release_job(self, job_id: int, owner: str):
+        """
+        进程退出前把正在执行的任务放回队列，由其他进程继续执行
+        """
+        update_time = datetime_param(datetime.now())
+        db.execute(f"UPDATE {JOB} SET status = '{PENDING}', owner = NULL, lease_until = 0, "
+                   f"update_time = $update_time WHERE job_id = $job_id AND status = '{RUNNING}' AND owner = $owner")
+        commit()
+
+    @db_session
+    def fail_job(self, job_id: int, owner: str, error: str, max_attempts: int, retry_at: float) -> bool:
+        """
+        记录一次失败，未达到最大次数时放回队列，retry_at 之后重试
+
+        :return: 任务是否已标记为失败，不再重试
+        """
+        update_time = datetime_param(datetime.now())
+        db.execute(f"UPDATE {JOB} SET attempts = attempts + 1, error = $error, owner = NULL, lease_until = 0, "
+                   f"run_after = $retry_at, status = CASE WHEN attempts + 1 >= $max_attempts THEN '{FAILED}' ELSE '{PENDING}' END, "
+                   f"update_time = $update_time WHERE job_id = $job_id AND status = '{RUNNING}' AND owner = $owner")
+        commit()
+        return db.select(f"SELECT status FROM {JOB} WHERE job_id = $job_id")[0] == FAILED
+
+    @db_session
+    def referenced_avatars(self) -> Set[str]:
+        return set(db.select(f"SELECT DISTINCT avatar FROM {CHARACTER} WHERE avatar IS NOT NULL"))
+
+    @staticmethod
+    def _to_dto(job: DeletionJobEntity) -> ResponseDeletionJobDto:
+        progress = 1.0 if job.status == DONE else min(job.deleted / job.total, 1.0) if job.total else 0.0
+        return ResponseDeletionJobDto(
+            job_id=job.job_id,
+            entity=job.entity,
+            entity_id=job.entity_id,
+            status=job.status,
+            total=job.total,
+            deleted=job.deleted,
+            progress=round(progress, 4),
+            error=job.error,
+            attempts=job.attempts,
+            create_time=job.create_time,
+            update_time=job.update_time,
+        )
@@ -0,0 +1,185 @@
+"""
+后台模型任务的持久化
+
+任务保存在 LlmJobEntity 中，与后台删除任务相同，通过数据库中的租约在进程之间分配：领取时用条件更新保证只有一个进程
+领取成功，执行期间定期延长租约，进程退出或崩溃后租约到期，任务由其他进程重新领取。
+失败的任务按退避时间放回队列，run_after 之前不会被领取。
+"""
+import json
+from abc import ABC
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pony.orm import db_session, commit
+
+from core.entity.dto.LlmJobDto import ClaimedLlmJobDto, CreateLlmJobDto, ResponseLlmJobDto
+from core.entity.po.LlmJobEntity import LlmJobEntity
+from core.mapper.config.DatabaseConfig import db
+from core.mapper.config.Dialect import datetime_param, quote
+from core.mapper.config.ReadReplica import replica_read
+from core.utils.CustomizeException import DatabaseError, NotFoundError
+from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
+
+logging = get_logger(__name__)
+
+JOB = quote("LlmJobEntity")
+
+# 任务状态
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+class LlmJobMapperInterface(ABC):
+
+    def create_job(self, job: CreateLlmJobDto) -> ResponseLlmJobDto:
+        raise NotImplementedError()
+
+    def get_job(self, job_id: int) -> ResponseLlmJobDto:
+        raise NotImplementedError()
+
+    def get_jobs_by_novel_id(self, novel_id: int) -> List[ResponseLlmJobDto]:
+        raise NotImplementedError()
+
+    def claim_next_job(self, owner: str, lease: float) -> Optional[ClaimedLlmJobDto]:
+        raise NotImplementedError()
+
+    def update_progress(self, job_id: int, owner: str, progress: float, message: Optional[str], lease: float) -> bool:
+        raise NotImplementedError()
+
+    def complete_job(self, job_id: int, owner: str, result: Dict[str, Any]) -> bool:
+        raise NotImplementedError()
+
+    def fail_job(self, job_id: int, owner: str, error: str, max_attempts: int, retry_at: float) -> bool:
+        raise NotImplementedError()
+
+    def release_job(self, job_id: int, owner: str):
+        raise NotImplementedError()
+
+
+class LlmJobMapper(LlmJobMapperInterface):
+
+    @traced()
+    @db_session
+    def create_job(self, job: CreateLlmJobDto) -> ResponseLlmJobDto:
+        try:
+            now = datetime.now()
+            j = LlmJobEntity(kind=job.kind, params=json.dumps(job.params, ensure_ascii=False), novel_id=job.novel_id,
+                             status=PENDING, create_time=now, update_time=now)
+            commit()
+            # 直接用写入的值生成结果，访问实体上未赋值的字段会重新查询一次
+            created = ResponseLlmJobDto(job_id=j.job_id, kind=job.kind, novel_id=job.novel_id, status=PENDING,
+                                        progress=0, params=job.params, attempts=0, create_time=now, update_time=now)
+        except Exception as e:
+            logging.error(f"创建后台任务失败，{str(e)}")
+            raise DatabaseError(str(e))
+        logging.info("创建后台任务成功，id为:%s，类型为%s", created.job_id, created.kind)
+        return created
+
+    @traced()
+    @replica_read
+    @db_session
+    def get_job(self, job_id: int) -> ResponseLlmJobDto:
+        job = LlmJobEntity.get(job_id=job_id)
+        if not job:
+            logging.warning(f"后台任务 ID {job_id} 不存在")
+            raise NotFoundError(job_id)
+        return self._to_dto(job)
+
+    @traced()
+    @replica_read
+    @db_session
+    def get_jobs_by_novel_id(self, novel_id: int) -> List[ResponseLlmJobDto]:
+        jobs = LlmJobEntity.select(lambda j: j.novel_id == novel_id).order_by(LlmJobEntity.job_id)
+        return [self._to_dto(job) for job in jobs]
+
+    @db_session
+    def claim_next_job(self, owner: str, lease: float) -> Optional[ClaimedLlmJobDto]:
+        """
+        领取最早创建的可执行任务：等待执行且已到重试时间，或执行任务的进程的租约已过期
+
+        :return: 领取到的任务，没有可执行的任务时返回 None
+        """
+        now = datetime.now().timestamp()
+        for condition in (f"status = '{PENDING}' AND run_after <= $now", f"status = '{RUNNING}' AND lease_until < $now"):
+            rows = db.select(f"SELECT job_id FROM {JOB} WHERE {condition} ORDER BY job_id LIMIT 1")
+            if rows:
+                break
+        else:
+            return None
+
+        job_id, lease_until, update_time = rows[0], now + lease, datetime_param(datetime.now())
+        cursor = db.execute(f"UPDATE {JOB} SET status = '{RUNNING}', owner = $owner, lease_until = $lease_until, "
+                            f"attempts = attempts + 1, update_time = $update_time "
+                            f"WHERE job_id = $job_id AND {condition}")
+        if not cursor.rowcount:
+            return None
+        kind, params, novel_id, attempts = db.select(
+            f"SELECT kind, params, novel_id, attempts FROM {JOB} WHERE job_id = $job_id")[0]
+        commit()
+        return ClaimedLlmJobDto(job_id=job_id, kind=kind, params=json.loads(params), novel_id=novel_id,
+                                attempt=attempts)
+
+    @db_session
+    def update_progress(self, job_id: int, owner: str, progress: float, message: Optional[str], lease: float) -> bool:
+        """
+        更新进度并延长租约，progress 为空时只延长租约
+
+        :return: 任务是否仍由 owner 执行，为假时任务已被其他进程接手
+        """
+        lease_until, update_time = datetime.now().timestamp() + lease, datetime_param(datetime.now())
+        progress_set = "" if progress is None else "progress = $progress, message = $message, "
+        cursor = db.execute(f"UPDATE {JOB} SET {progress_set}lease_until = $lease_until, update_time = $update_time "
+                            f"WHERE job_id = $job_id AND status = '{RUNNING}' AND owner = $owner")
+        commit()
+        return cursor.rowcount > 0
+
+    @db_session
+    def complete_job(self, job_id: int, owner: str, result: Dict[str, Any]) -> bool:
+        result_json, update_time = json.dumps(result, ensure_ascii=False), datetime_param(datetime.now())
+        cursor = db.execute(f"UPDATE {JOB} SET status = '{DONE}', progress = 1, result = $result_json, error = NULL, "
+                            f"owner = NULL, lease_until = 0, update_time = $update_time "
+                            f"WHERE job_id = $job_id AND status = '{RUNNING}' AND owner = $owner")
+        commit()
+        return cursor.rowcount > 0
+
+    @db_session
+    def fail_job(self, job_id: int, owner: str, error: str, max_attempts: int, retry_at: float) -> bool:
+        """
+        记录一次失败，未达到最大次数时放回队列，retry_at 之后重试
+
+        :return: 任务是否已标记为失败，不再重试
+        """
+        update_time = datetime_param(datetime.now())
+        db.execute(f"UPDATE {JOB} SET error = $error, owner = NULL, lease_until = 0, run_after = $retry_at, "
+                   f"status = CASE WHEN attempts >= $max_attempts THEN '{FAILED}' ELSE '{PENDING}' END, "
+                   f"update_time = $update_time WHERE job_id = $job_id AND status = '{RUNNING}' AND owner = $owner")
+        commit()
+        return db.select(f"SELECT status FROM {JOB} WHERE job_id = $job_id")[0] == FAILED
+
+    @db_session
+    def release_job(self, job_id: int, owner: str):
+        """
+        进程退出前把正在执行的任务放回队列，本次执行不计入失败次数
+        """
+        update_time = datetime_param(datetime.now())
+        db.execute(f"UPDATE {JOB} SET status = '{PENDING}', owner = NULL, lease_until = 0, "
+                   f"attempts = attempts - 1, update_time = $update_time "
+                   f"WHERE job_id = $job_id AND status = '{RUNNING}' AND owner = $owner")
+        commit()
+
+    @staticmethod
+    def _to_dto(job: LlmJobEntity) -> ResponseLlmJobDto:
+        return ResponseLlmJobDto(
+            job_id=job.job_id,
+            kind=job.kind,
+            novel_id=job.novel_id,
+            status=job.status,
+            progress=round(job.progress, 4),
+            message=job.message,
+            params=json.loads(job.params),
+            result=json.loads(job.result) if job.result else None,
+            attempts=job.attempts,
+            error=job.error,
+            create_time=job.create_time,
+            update_time=job.update_time,
+        )
@@ -1,21 +1,35 @@
 from abc import ABC
 from datetime import datetime
-from typing import List
+from operator import itemgetter
+from typing import List, Union
 
-from pony.orm import db_session, commit
+from pony.orm import db_session, commit, raw_sql
 
+from core.entity.ProjectionEntity import ChapterRow, ConversationRow, NovelRow, SceneRow
 from core.entity.dto.ChapterDto import ResponseAllChapterDto
 from core.entity.dto.ConversationDto import ResponseConversationDto
 from core.entity.dto.NovelDto import CreateNovelDto, ResponseNovelDto, ResponseAllNovelDto, CreateCharacter2NovelDto
 from core.entity.dto.SceneDto import ResponseSceneDto
 from core.entity.po.CharacterNovelEntity import CharacterNovelEntity
 from core.entity.po.NovelEntity import NovelEntity, ChapterEntity, SceneEntity
+from core.mapper.DeletionMapper import DONE, JOB, NOVEL_JOB
+from core.mapper.config.Counters import CHAPTER, CONVERSATION, NOVEL, SCENE
 from core.mapper.config.CreateDatabase import generate_table_mapping
+from core.mapper.config.DatabaseConfig import db
+from core.mapper.config.Dialect import to_datetime
+from core.mapper.config.NovelCache import cache_enabled, cache_novel, discard_novel, get_cached_novel
+from core.mapper.config.ReadReplica import replica_read
+from core.utils import AppConfig
 from core.utils.CustomizeException import DatabaseError, NotFoundError
 from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
 
 logging = get_logger(__name__)
 
+# 已创建删除任务的小说不再返回，后台删除完成前小说的部分数据可能已删除。查询中小说的别名需要为 n
+_NOT_DELETING = (f"NOT EXISTS (SELECT 1 FROM {JOB} j WHERE j.entity = '{NOVEL_JOB}' "
+                 f"AND j.entity_id = n.novel_id AND j.status <> '{DONE}')")
+
 
 class NovelMapperInterface(ABC):
 
@@ -25,12 +39,16 @@ class NovelMapperInterface(ABC):
     def get_all_novels(self) -> List[ResponseNovelDto]:
         raise NotImplementedError()
 
-    def get_novel_by_id(self, novel_id: int) -> ResponseAllNovelDto:
+    def get_novel_by_id(self, novel_id: int) -> Union[ResponseAllNovelDto, NovelRow]:
+        raise NotImplementedError()
+
+    def get_novel_summary(self, novel_id: int) -> ResponseNovelDto:
         raise NotImplementedError()
 
 
 class NovelMapper(NovelMapperInterface):
 
+    @traced()
     @db_session
     def create_novel(self, novel: CreateNovelDto) -> int:
         try:
@@ -38,6 +56,7 @@ class NovelMapper(NovelMapperInterface):
                 novel_name=novel.novel_name,
                 novel_desc=novel.novel_desc,
                 create_time=novel.create_time,
+                last_activity=novel.create_time,
             )
 
             commit()
@@ -46,32 +65,110 @@ class NovelMapper(NovelMapperInterface):
             raise DatabaseError(str(e))
         return n.novel_id
 
+    @traced()
+    @replica_read
     @db_session
     def get_all_novels(self) -> List[ResponseNovelDto]:
         try:
-            novels = NovelEntity.select(lambda data: data)[:]
+            novels = NovelEntity.select(lambda n: raw_sql(_NOT_DELETING))[:]
             logging.info("获取所有角色成功")
 
             result: List[ResponseNovelDto] = []
 
             for novel in novels:
                 # 转换信息
-                novel_dto = ResponseNovelDto(
-                    novel_id=novel.novel_id,
-                    novel_name=novel.novel_name,
-                    novel_desc=novel.novel_desc,
-                    create_time=novel.create_time,
-                )
-                result.append(novel_dto)
+                result.append(self._to_novel_dto(novel))
 
             return result
         except Exception as e:
             logging.error(f"获取全部小说信息失败, {str(e)}")
             raise DatabaseError(str(e))
 
+    @traced()
+    @replica_read
     @db_session
-    def get_novel_by_id(self, novel_id: int) -> ResponseAllNovelDto:
-        novel = NovelEntity.select(lambda data: data.novel_id == novel_id).prefetch(
+    def get_novel_by_id(self, novel_id: int) -> Union[ResponseAllNovelDto, NovelRow]:
+        """
+        开启缓存时先查询小说的汇总字段，与缓存一致时直接返回缓存（见 NovelCache），返回的对象不能修改
+        """
+        mode = AppConfig.READ_MODE
+        if not cache_enabled():
+            return self._get_novel_tree(novel_id, mode)
+
+        summary = db.execute(f"SELECT chapter_count, scene_count, conversation_count, total_characters, last_activity, "
+                             f"revision FROM {NOVEL} n WHERE n.novel_id = $novel_id AND {_NOT_DELETING}").fetchone()
+        if not summary:
+            discard_novel(novel_id)
+            logging.warning(f"小说 ID {novel_id} 不存在")
+            raise NotFoundError(novel_id)
+        chapters, scenes, conversations, characters, activity, revision = summary
+        novel = get_cached_novel(novel_id, mode, (chapters, scenes, conversations, characters, to_datetime(activity)),
+                                 revision)
+        if novel is None:
+            # 使用查询树之前读到的 revision，查询期间的修改会使下次读取重新查询
+            novel = self._get_novel_tree(novel_id, mode)
+            cache_novel(novel_id, mode, novel, revision)
+        return novel
+
+    def _get_novel_tree(self, novel_id: int, mode: str) -> Union[ResponseAllNovelDto, NovelRow]:
+        if mode == "projection":
+            return self._get_novel_rows(novel_id)
+        return self._get_novel_dtos(novel_id)
+
+    def _get_novel_rows(self, novel_id: int) -> NovelRow:
+        """
+        投影模式，按小说、章节、情景、对话各查询一次需要的字段，组装为行对象，不创建 Pony 实体和 pydantic 对象
+        """
+        novel = db.execute(f"SELECT novel_id, novel_name, novel_desc, create_time, chapter_count, scene_count, "
+                           f"conversation_count, total_characters, last_activity "
+                           f"FROM {NOVEL} n WHERE n.novel_id = $novel_id AND {_NOT_DELETING}").fetchone()
+        if not novel:
+            logging.warning(f"小说 ID {novel_id} 不存在")
+            raise NotFoundError(novel_id)
+
+        try:
+            n_id, name, desc, create_time, chapter_count, scene_count, conversation_count, characters, activity = novel
+            result = NovelRow(n_id, name, desc, to_datetime(create_time), chapter_count, scene_count,
+                              conversation_count, characters, to_datetime(activity))
+
+            chapters = {}
+            for c_id, number, title, c_desc, c_time, parent, c_novel, c_scenes, c_conversations, c_characters, \
+                    c_activity in db.execute(
+                        f"SELECT chapter_id, chapter_number, chapter_title, chapter_desc, create_time, parent, novel, "
+                        f"scene_count, conversation_count, total_characters, last_activity FROM {CHAPTER} "
+                        f"WHERE novel = $novel_id ORDER BY chapter_number, chapter_id"):
+                chapter = ChapterRow(c_id, number, title, c_desc, to_datetime(c_time), parent, c_novel, c_scenes,
+                                     c_conversations, c_characters, to_datetime(c_activity))
+                chapters[c_id] = chapter
+                result.chapter.append(chapter)
+
+            # 情景和对话在 Python 中按 id 排序，避免数据库为联表查询的 ORDER BY 建立临时 B 树
+            scenes = {}
+            for s_id, s_name, s_desc, s_time, parent, s_chapter, s_conversations, s_characters, \
+                    s_activity in sorted(db.execute(
+                        f"SELECT s.scene_id, s.scene_name, s.scene_desc, s.create_time, s.parent, s.chapter, "
+                        f"s.conversation_count, s.total_characters, s.last_activity "
+                        f"FROM {SCENE} s JOIN {CHAPTER} c ON s.chapter = c.chapter_id "
+                        f"WHERE c.novel = $novel_id"), key=itemgetter(0)):
+                scene = SceneRow(s_id, s_name, s_desc, to_datetime(s_time), parent, s_chapter, s_conversations,
+                                 s_characters, to_datetime(s_activity))
+                scenes[s_id] = scene
+                chapters[s_chapter].scene.append(scene)
+
+            for conversation_id, role, sender, receiver, content, cv_time, parent, cv_scene in sorted(db.execute(
+                    f"SELECT cv.conversation_id, cv.role, cv.sender_character, cv.receiver_character, cv.content, "
+                    f"cv.create_time, cv.parent, cv.scene FROM {CONVERSATION} cv "
+                    f"JOIN {SCENE} s ON cv.scene = s.scene_id JOIN {CHAPTER} c ON s.chapter = c.chapter_id "
+                    f"WHERE c.novel = $novel_id"), key=itemgetter(0)):
+                scenes[cv_scene].conversation.append(ConversationRow(
+                    role, sender, receiver, content, to_datetime(cv_time), parent, cv_scene, None, conversation_id))
+            return result
+        except Exception as e:
+            logging.error(f"获取小说 ID {novel_id}失败，{str(e)}")
+            raise DatabaseError(str(e))
+
+    def _get_novel_dtos(self, novel_id: int) -> ResponseAllNovelDto:
+        novel = NovelEntity.select(lambda n: n.novel_id == novel_id and raw_sql(_NOT_DELETING)).prefetch(
             NovelEntity.chapter,
             ChapterEntity.scene,
             SceneEntity.conversation
@@ -84,8 +181,8 @@ class NovelMapper(NovelMapperInterface):
         try:
             # 在这里对获取到的集合进行排序，这是最通用和显式的方式
             # 即使你在实体中定义了 order_by，你也可以在这里覆盖它
-            sorted_chapters = sorted(novel.chapter, key=lambda ch: ch.chapter_number,
-                                     reverse=False)  # 假设按 chapter_number 升序
+            sorted_chapters = sorted(novel.chapter, key=lambda ch: (ch.chapter_number, ch.chapter_id),
+                                     reverse=False)  # 按 chapter_number 升序，章节号相同时按创建顺序
 
             chapters_dto = []
             for chapter in sorted_chapters:
@@ -100,11 +197,11 @@ class NovelMapper(NovelMapperInterface):
                         ResponseConversationDto(
                             conversation_id=conv.conversation_id,
                             role=conv.role,
-                            sender_character=conv.sender_character,
-                            receiver_character=conv.receiver_character,
+                            sender_character=conv.sender_character.character_id if conv.sender_character else None,
+                            receiver_character=conv.receiver_character.character_id if conv.receiver_character else None,
                             content=conv.content,
                             create_time=conv.create_time,
-                            parent=conv.parent,
+                            parent=conv.parent.conversation_id if conv.parent else None,
                             scene=conv.scene.scene_id
                         ) for conv in sorted_conversations
                     ]
@@ -116,6 +213,9 @@ class NovelMapper(NovelMapperInterface):
                             create_time=scene.create_time,
                             parent=scene.parent,
                             chapter=scene.chapter.chapter_id,
+                            conversation_count=scene.conversation_count,
+                            total_characters=scene.total_characters,
+                            last_activity=scene.last_activity,
                             conversation=conversations_dto
                         )
                     )
@@ -128,21 +228,48 @@ class NovelMapper(NovelMapperInterface):
                         create_time=chapter.create_time,
                         parent=chapter.parent,
                         novel=chapter.novel.novel_id,
+                        scene_count=chapter.scene_count,
+                        conversation_count=chapter.conversation_count,
+                        total_characters=chapter.total_characters,
+                        last_activity=chapter.last_activity,
                         scene=scenes_dto
                     )
                 )
 
             return ResponseAllNovelDto(
-                novel_id=novel.novel_id,
-                novel_name=novel.novel_name,
-                novel_desc=novel.novel_desc,
-                create_time=novel.create_time,
+                **self._to_novel_dto(novel).model_dump(),
                 chapter=chapters_dto
             )
         except Exception as e:
             logging.error(f"获取小说 ID {novel_id}失败，{str(e)}")
             raise DatabaseError(str(e))
 
+    @traced()
+    @db_session
+    def get_novel_summary(self, novel_id: int) -> ResponseNovelDto:
+        novel = NovelEntity.select(lambda n: n.novel_id == novel_id and raw_sql(_NOT_DELETING)).first()
+        if not novel:
+            logging.warning(f"小说 ID {novel_id} 不存在")
+            raise NotFoundError(novel_id)
+        return self._to_novel_dto(novel)
+
+    @staticmethod
+    def _to_novel_dto(novel: NovelEntity) -> ResponseNovelDto:
+        """
+        小说基本信息和汇总字段，不需要加载章节
+        """
+        return ResponseNovelDto(
+            novel_id=novel.novel_id,
+            novel_name=novel.novel_name,
+            novel_desc=novel.novel_desc,
+            create_time=novel.create_time,
+            chapter_count=novel.chapter_count,
+            scene_count=novel.scene_count,
+            conversation_count=novel.conversation_count,
+            total_characters=novel.total_characters,
+            last_activity=novel.last_activity,
+        )
+
     def generate_scene_prompts(self, novel_id: int) -> List[str]:
         """
         将 ResponseAllNovelDto 对象转换为按情景划分的 prompt 列表。
@@ -1,13 +1,25 @@
 from abc import ABC
 from datetime import datetime
+from operator import itemgetter
+from typing import List, Optional
 
 from pony.orm import commit, db_session
 
-from core.entity.dto.SceneDto import CreateSceneDto
-from core.entity.po.NovelEntity import SceneEntity
+from core.entity.dto.BatchDto import BatchResultDto, batch_created, batch_rejected
+from core.entity.dto.ChapterDto import ResponseChapterDto
+from core.entity.dto.ConversationDto import ResponseConversationDto
+from core.entity.dto.SceneContextDto import ResponseSceneContextDto, SceneDigestDto
+from core.entity.dto.SceneDto import CreateSceneDto, ResponseSceneDto
+from core.entity.po.NovelEntity import SceneEntity, ChapterEntity
+from core.mapper.config.BatchValidation import existing_ids, add_error, group_by_parent
+from core.mapper.config.Counters import CHAPTER, CONVERSATION, NOVEL, SCENE, on_scene_created
 from core.mapper.config.CreateDatabase import generate_table_mapping
-from core.utils.CustomizeException import DatabaseError
+from core.mapper.config.DatabaseConfig import db
+from core.mapper.config.Dialect import to_datetime
+from core.mapper.config.NovelCache import patch_scenes_created
+from core.utils.CustomizeException import DatabaseError, NotFoundError
 from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
 
 logging = get_logger(__name__)
 
@@ -17,9 +29,21 @@ class SceneMapperInterface(ABC):
     def create_scene(self, scene: CreateSceneDto) -> int:
         raise NotImplementedError()
 
+    def create_scenes(self, scenes: List[CreateSceneDto]) -> BatchResultDto:
+        raise NotImplementedError()
+
+    def get_scene_context(self, scene_id: int, depth: int, ancestor_conversations: int,
+                          digest_chars: int) -> Optional[ResponseSceneContextDto]:
+        raise NotImplementedError()
+
+
+def _id_list(ids) -> str:
+    return ", ".join(str(int(i)) for i in ids)
+
 
 class SceneMapper(SceneMapperInterface):
 
+    @traced()
     @db_session
     def create_scene(self, scene: CreateSceneDto) -> int:
         try:
@@ -29,14 +53,142 @@ class SceneMapper(SceneMapperInterface):
                 create_time=scene.create_time,
                 parent=scene.parent,
                 chapter=scene.chapter,
+                last_activity=scene.create_time,
             )
+            on_scene_created(scene.chapter, scene.create_time)
 
             commit()
+            patch_scenes_created([(s.scene_id, scene)])
             return s.scene_id
         except Exception as e:
             logging.error(f"创建情景{scene.scene_name}失败，{e}")
             raise DatabaseError(message=f"创建情景{scene.scene_name}失败，{e}")
 
+    @traced()
+    @db_session
+    def create_scenes(self, scenes: List[CreateSceneDto]) -> BatchResultDto:
+        """
+        在同一个事务中批量创建情景，存在无效数据时整批不写入
+        """
+        chapters = existing_ids(ChapterEntity, (scene.chapter for scene in scenes))
+        parents = existing_ids(SceneEntity, (scene.parent for scene in scenes))
+        errors = {}
+        for index, scene in enumerate(scenes):
+            if scene.chapter is not None and scene.chapter not in chapters:
+                add_error(errors, index, f"章节{scene.chapter}不存在")
+            if scene.parent is not None and scene.parent not in parents:
+                add_error(errors, index, f"父情景{scene.parent}不存在")
+        if errors:
+            return batch_rejected(len(scenes), errors)
+
+        try:
+            entities = [SceneEntity(
+                scene_name=scene.scene_name,
+                scene_desc=scene.scene_desc,
+                create_time=scene.create_time,
+                parent=scene.parent,
+                chapter=scene.chapter,
+                last_activity=scene.create_time,
+            ) for scene in scenes]
+            # 汇总字段按章节合并更新
+            for chapter_id, (count, activity) in group_by_parent(scenes, lambda s: s.chapter).items():
+                on_scene_created(chapter_id, activity, count)
+
+            commit()
+            patch_scenes_created(zip((s.scene_id for s in entities), scenes))
+            return batch_created([s.scene_id for s in entities])
+        except Exception as e:
+            logging.error(f"批量创建情景失败，{e}")
+            raise DatabaseError(message=f"批量创建情景失败，{e}")
+
+    @traced()
+    @db_session
+    def get_scene_context(self, scene_id: int, depth: int, ancestor_conversations: int,
+                          digest_chars: int) -> Optional[ResponseSceneContextDto]:
+        """
+        以情景为中心拼接 prompt 需要的数据：当前情景的全部对话、最多 depth 层父情景的最近 ancestor_conversations 条对话、
+        最多 depth 层父章节、同章节其他情景的摘要（最后一条对话的前 digest_chars 个字）。
+        父情景和父章节用递归查询一次取出，不加载整部小说
+
+        :return: 情景不属于任何章节时返回 None
+        """
+        # db.select 会给不以 SELECT 开头的语句补上 SELECT，递归查询用 db.execute
+        scenes = db.execute(
+            f"WITH RECURSIVE chain(scene_id, depth) AS ("
+            f"SELECT scene_id, 0 FROM {SCENE} WHERE scene_id = $scene_id "
+            f"UNION ALL SELECT s.parent, chain.depth + 1 FROM {SCENE} s "
+            f"JOIN chain ON s.scene_id = chain.scene_id WHERE s.parent IS NOT NULL AND chain.depth < $depth) "
+            f"SELECT s.scene_id, s.scene_name, s.scene_desc, s.create_time, s.parent, s.chapter, "
+            f"s.conversation_count, s.total_characters, s.last_activity, chain.depth "
+            f"FROM chain JOIN {SCENE} s ON s.scene_id = chain.scene_id").fetchall()
+        if not scenes:
+            logging.warning(f"情景 ID {scene_id} 不存在")
+            raise NotFoundError(scene_id)
+
+        try:
+            # 按层级从上到下排列，当前情景在最后
+            chain = [ResponseSceneDto(scene_id=s_id, scene_name=name, scene_desc=desc, create_time=to_datetime(s_time),
+                                      parent=parent, chapter=chapter, conversation_count=conversations,
+                                      total_characters=characters, last_activity=to_datetime(activity))
+                     for s_id, name, desc, s_time, parent, chapter, conversations, characters, activity, _
+                     in sorted(scenes, key=itemgetter(9), reverse=True)]
+            scene = chain[-1]
+            chapter_id = scene.chapter
+            if chapter_id is None:
+                return None
+
+            chapters = sorted(db.execute(
+                f"WITH RECURSIVE chain(chapter_id, depth) AS ("
+                f"SELECT chapter_id, 0 FROM {CHAPTER} WHERE chapter_id = $chapter_id "
+                f"UNION ALL SELECT c.parent, chain.depth + 1 FROM {CHAPTER} c "
+                f"JOIN chain ON c.chapter_id = chain.chapter_id WHERE c.parent IS NOT NULL AND chain.depth < $depth) "
+                f"SELECT c.chapter_id, c.chapter_number, c.chapter_title, c.chapter_desc, c.create_time, c.parent, "
+                f"c.novel, c.scene_count, c.conversation_count, c.total_characters, c.last_activity, n.novel_name, "
+                f"n.novel_desc, chain.depth FROM chain JOIN {CHAPTER} c ON c.chapter_id = chain.chapter_id "
+                f"JOIN {NOVEL} n ON n.novel_id = c.novel").fetchall(), key=itemgetter(13), reverse=True)
+            chapter_chain = [ResponseChapterDto(
+                chapter_id=c_id, chapter_number=number, chapter_title=title, chapter_desc=desc,
+                create_time=to_datetime(c_time), parent=parent, novel=novel, scene_count=scene_count,
+                conversation_count=conversations, total_characters=characters, last_activity=to_datetime(activity))
+                for c_id, number, title, desc, c_time, parent, novel, scene_count, conversations, characters, activity,
+                _, _, _ in chapters]
+            novel_name, novel_desc = chapters[-1][11], chapters[-1][12]
+
+            # 当前情景和父情景的对话，在 Python 中按 id 排序，避免建立临时 B 树
+            by_scene = {s.scene_id: s for s in chain}
+            for conversation_id, role, sender, receiver, content, cv_time, parent, cv_scene in sorted(db.select(
+                    f"SELECT conversation_id, role, sender_character, receiver_character, content, create_time, "
+                    f"parent, scene FROM {CONVERSATION} WHERE scene IN ({_id_list(by_scene)})"), key=itemgetter(0)):
+                by_scene[cv_scene].conversation.append(ResponseConversationDto(
+                    conversation_id=conversation_id, role=role, sender_character=sender, receiver_character=receiver,
+                    content=content, create_time=to_datetime(cv_time), parent=parent, scene=cv_scene))
+            character_ids = sorted({character for s in chain for conv in s.conversation
+                                    for character in (conv.sender_character, conv.receiver_character)
+                                    if character is not None})
+            for ancestor in chain[:-1]:
+                keep = ancestor.conversation[-ancestor_conversations:] if ancestor_conversations > 0 else []
+                ancestor.conversation = keep
+
+            siblings = [SceneDigestDto(scene_id=s_id, scene_name=name, scene_desc=desc, conversation_count=count)
+                        for s_id, name, desc, count in sorted(db.select(
+                            f"SELECT scene_id, scene_name, scene_desc, conversation_count FROM {SCENE} "
+                            f"WHERE chapter = $chapter_id")) if s_id not in by_scene]
+            active = {s.scene_id: s for s in siblings if s.conversation_count}
+            if active:
+                for s_id, content in db.select(
+                        f"SELECT scene, SUBSTR(content, 1, $digest_chars) FROM {CONVERSATION} "
+                        f"WHERE conversation_id IN (SELECT MAX(conversation_id) FROM {CONVERSATION} "
+                        f"WHERE scene IN ({_id_list(active)}) GROUP BY scene)"):
+                    active[s_id].last_content = content
+
+            return ResponseSceneContextDto(
+                novel_id=chapter_chain[-1].novel, novel_name=novel_name, novel_desc=novel_desc or "",
+                chapter=chapter_chain[-1], ancestor_chapters=chapter_chain[:-1], ancestors=chain[:-1], scene=scene,
+                siblings=siblings, character_ids=character_ids)
+        except Exception as e:
+            logging.error(f"获取情景 ID 为{scene_id}的上下文失败，{e}")
+            raise DatabaseError(message=f"获取情景 ID 为{scene_id}的上下文失败，{e}")
+
 
 if __name__ == '__main__':
     generate_table_mapping()
@@ -0,0 +1,104 @@
+"""
+模型用量的记录和汇总
+
+每轮对话写入一行 TokenUsageEntity，查询时按小说、情景、角色汇总，汇总字段见 ResponseTokenUsageDto
+"""
+from abc import ABC
+from typing import List
+
+from pony.orm import db_session, commit
+
+from core.entity.dto.TokenUsageDto import CreateTokenUsageDto, ResponseTokenUsageDto, ResponseNovelTokenUsageDto
+from core.entity.po.TokenUsageEntity import TokenUsageEntity
+from core.mapper.config.DatabaseConfig import db
+from core.mapper.config.Dialect import quote
+from core.mapper.config.ReadReplica import replica_read
+from core.utils.CustomizeException import DatabaseError
+from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
+
+logging = get_logger(__name__)
+
+USAGE = quote("TokenUsageEntity")
+
+# 汇总字段，顺序与 _to_dto 的参数一致
+_SUMS = ("COUNT(*), COALESCE(SUM(prompt_tokens), 0), COALESCE(SUM(completion_tokens), 0), "
+         "COALESCE(SUM(cached_tokens), 0), "
+         "COALESCE(SUM(system_tokens), 0), COALESCE(SUM(character_tokens), 0), COALESCE(SUM(history_tokens), 0), "
+         "COALESCE(AVG(latency_ms), 0)")
+
+
+class TokenUsageMapperInterface(ABC):
+
+    def record_usage(self, usage: CreateTokenUsageDto) -> int:
+        raise NotImplementedError()
+
+    def get_novel_usage(self, novel_id: int) -> ResponseNovelTokenUsageDto:
+        raise NotImplementedError()
+
+    def get_scene_usage(self, scene_id: int) -> ResponseTokenUsageDto:
+        raise NotImplementedError()
+
+    def get_character_usage(self, character_id: int) -> ResponseTokenUsageDto:
+        raise NotImplementedError()
+
+
+class TokenUsageMapper(TokenUsageMapperInterface):
+
+    @traced()
+    @db_session
+    def record_usage(self, usage: CreateTokenUsageDto) -> int:
+        try:
+            u = TokenUsageEntity(**usage.model_dump())
+            commit()
+        except Exception as e:
+            logging.error(f"记录模型用量失败，{str(e)}")
+            raise DatabaseError(str(e))
+        return u.usage_id
+
+    @traced()
+    @replica_read
+    @db_session
+    def get_novel_usage(self, novel_id: int) -> ResponseNovelTokenUsageDto:
+        total = db.select(f"SELECT {_SUMS} FROM {USAGE} WHERE novel_id = $novel_id")[0]
+        scenes = db.select(f"SELECT scene_id, {_SUMS} FROM {USAGE} "
+                           f"WHERE novel_id = $novel_id AND scene_id IS NOT NULL GROUP BY scene_id")
+        characters = db.select(f"SELECT character_id, {_SUMS} FROM {USAGE} "
+                               f"WHERE novel_id = $novel_id AND character_id IS NOT NULL GROUP BY character_id")
+        return ResponseNovelTokenUsageDto(
+            novel_id=novel_id,
+            total=self._to_dto(None, *total),
+            scenes=self._to_dtos(scenes),
+            characters=self._to_dtos(characters),
+        )
+
+    @traced()
+    @replica_read
+    @db_session
+    def get_scene_usage(self, scene_id: int) -> ResponseTokenUsageDto:
+        return self._to_dto(scene_id, *db.select(f"SELECT {_SUMS} FROM {USAGE} WHERE scene_id = $scene_id")[0])
+
+    @traced()
+    @replica_read
+    @db_session
+    def get_character_usage(self, character_id: int) -> ResponseTokenUsageDto:
+        return self._to_dto(character_id, *db.select(
+            f"SELECT {_SUMS} FROM {USAGE} WHERE character_id = $character_id")[0])
+
+    def _to_dtos(self, rows) -> List[ResponseTokenUsageDto]:
+        return [self._to_dto(*row) for row in rows]
+
+    @staticmethod
+    def _to_dto(key, turns, prompt_tokens, completion_tokens, cached_tokens, system_tokens, character_tokens, history_tokens,
+                avg_latency_ms) -> ResponseTokenUsageDto:
+        return ResponseTokenUsageDto(
+            id=key,
+            turns=turns,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            system_tokens=system_tokens,
+            character_tokens=character_tokens,
+            history_tokens=history_tokens,
+            avg_latency_ms=round(avg_latency_ms, 3),
+        )
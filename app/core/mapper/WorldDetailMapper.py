@@ -1,12 +1,16 @@
 from abc import ABC
+from typing import List
 
 from pony.orm import commit, db_session
 
+from core.entity.dto.BatchDto import BatchResultDto, batch_created, batch_rejected
 from core.entity.dto.WorldDto import CreateWorldDetailDto
-from core.entity.po.WorldEntity import WorldDetailEntity
+from core.entity.po.WorldEntity import WorldDetailEntity, WorldEntity
+from core.mapper.config.BatchValidation import existing_ids
 from core.mapper.config.CreateDatabase import generate_table_mapping
-from core.utils.CustomizeException import DatabaseError
+from core.utils.CustomizeException import DatabaseError, NotFoundError
 from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
 
 logging = get_logger(__name__)
 
@@ -16,9 +20,16 @@ class WorldDetailMapperInterface(ABC):
     def create_world_detail(self, world_detail: CreateWorldDetailDto):
         raise NotImplementedError()
 
+    def create_world_details(self, world_details: List[CreateWorldDetailDto]) -> BatchResultDto:
+        raise NotImplementedError()
+
+    def delete_world_detail(self, world_detail_id: int) -> bool:
+        raise NotImplementedError()
+
 
 class WorldDetailMapper(WorldDetailMapperInterface):
 
+    @traced()
     @db_session
     def create_world_detail(self, world_detail: CreateWorldDetailDto):
         try:
@@ -33,6 +44,46 @@ class WorldDetailMapper(WorldDetailMapperInterface):
             logging.error(f"创建详细世界观失败，{str(e)}")
             raise DatabaseError(f"创建详细世界观失败，{str(e)}")
 
+    @traced()
+    @db_session
+    def create_world_details(self, world_details: List[CreateWorldDetailDto]) -> BatchResultDto:
+        """
+        在同一个事务中批量创建详细世界观，存在无效数据时整批不写入
+        """
+        worlds = existing_ids(WorldEntity, (detail.world for detail in world_details))
+        errors = {index: f"世界观{detail.world}不存在"
+                  for index, detail in enumerate(world_details) if detail.world not in worlds}
+        if errors:
+            return batch_rejected(len(world_details), errors)
+
+        try:
+            entities = [WorldDetailEntity(
+                world_detail_name=detail.world_detail_name,
+                world_detail_desc=detail.world_detail_desc,
+                world=detail.world) for detail in world_details]
+
+            commit()
+            return batch_created([detail.id for detail in entities])
+        except Exception as e:
+            logging.error(f"批量创建详细世界观失败，{str(e)}")
+            raise DatabaseError(f"批量创建详细世界观失败，{str(e)}")
+
+    @traced()
+    @db_session
+    def delete_world_detail(self, world_detail_id: int) -> bool:
+        """
+        删除单条详细世界观，没有下级数据，直接删除不创建后台任务
+        """
+        world_detail = WorldDetailEntity.get(id=world_detail_id)
+        if not world_detail:
+            logging.warning(f"详细世界观 ID {world_detail_id} 不存在")
+            raise NotFoundError(world_detail_id)
+
+        world_detail.delete()
+        commit()
+        logging.info(f"删除详细世界观id为{world_detail_id}成功")
+        return True
+
 
 if __name__ == '__main__':
     generate_table_mapping()
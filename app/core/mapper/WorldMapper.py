@@ -6,8 +6,10 @@ from pony.orm import commit, db_session
 from core.entity.dto.WorldDto import CreateWorldDto, ResponseWorldDto, ResponseAllWorldDetailDto, ResponseWorldDetailDto
 from core.entity.po.WorldEntity import WorldEntity
 from core.mapper.config.CreateDatabase import generate_table_mapping
+from core.mapper.config.ReadReplica import replica_read
 from core.utils.CustomizeException import DatabaseError, NotFoundError
 from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
 
 logging = get_logger(__name__)
 
@@ -26,6 +28,7 @@ class WorldMapperInterface(ABC):
 
 class WorldMapper(WorldMapperInterface):
 
+    @traced()
     @db_session
     def create_world(self, world: CreateWorldDto) -> int:
         try:
@@ -40,6 +43,7 @@ class WorldMapper(WorldMapperInterface):
             logging.error(f"创建世界观失败, {str(e)}")
             raise DatabaseError(f"创建世界观失败, {str(e)}")
 
+    @traced()
     @db_session
     def get_all_worlds(self) -> List[ResponseWorldDto]:
         try:
@@ -59,6 +63,8 @@ class WorldMapper(WorldMapperInterface):
             logging.error(f"获取全部世界观失败, {str(e)}")
             raise DatabaseError(f"获取全部世界观失败, {str(e)}")
 
+    @traced()
+    @replica_read
     @db_session
     def get_world_by_id(self, world_id: int) -> ResponseAllWorldDetailDto:
         world = WorldEntity.select(lambda data: data.world_id == world_id).prefetch(
@@ -75,7 +81,8 @@ class WorldMapper(WorldMapperInterface):
                     id=detail.id,
                     world_detail_name=detail.world_detail_name,
                     world_detail_desc=detail.world_detail_desc,
-                    world=detail.world.world_id)for detail in world.world_detail
+                    world=detail.world.world_id)
+                for detail in sorted(world.world_detail, key=lambda d: d.id)
             ]
 
             return ResponseAllWorldDetailDto(
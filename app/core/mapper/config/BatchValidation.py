@@ -0,0 +1,41 @@
+"""
+批量创建时校验引用的数据是否存在
+
+批量接口先收集整批数据引用的上级 id，每种实体只查询一次，再逐条检查，
+避免逐条查询；存在无效数据时整批不写入，按下标返回每条数据的错误。
+写入后汇总字段按上级合并更新，每个上级只执行一次更新。
+"""
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from pony.orm import select
+
+
+def existing_ids(entity, ids: Iterable[Optional[int]]) -> Set[int]:
+    """
+    ids 中实际存在的主键，忽略 None，需要在 db_session 中调用
+    """
+    ids = list({entity_id for entity_id in ids if entity_id is not None})
+    if not ids:
+        return set()
+    pk = entity._pk_attrs_[0].name
+    return set(select(getattr(e, pk) for e in entity if getattr(e, pk) in ids)[:])
+
+
+def group_by_parent(items: list, parent: Callable) -> Dict[int, Tuple[int, datetime]]:
+    """
+    按上级 id 统计新增数量和最晚的创建时间，用于合并更新汇总字段
+    """
+    groups = {}
+    for item in items:
+        key = parent(item)
+        count, activity = groups.get(key, (0, item.create_time))
+        groups[key] = (count + 1, activity if activity >= item.create_time else item.create_time)
+    return groups
+
+
+def add_error(errors: Dict[int, str], index: int, message: str):
+    """
+    一条数据有多个错误时合并为一条信息
+    """
+    errors[index] = f"{errors[index]}；{message}" if index in errors else message
@@ -0,0 +1,62 @@
+"""
+子表数据的差异比较
+
+更新角色时客户端传入性格特征、说话方式、自定义字段的完整列表，与数据库中已有的数据比较后只写入变化的部分：
+1. 传入了 id 且属于该角色的数据，内容有变化时修改
+2. 没有 id（或 id 不属于该角色）的数据，与剩余的已有数据内容完全相同时保持不变
+3. 仍未匹配的已有数据与传入数据按顺序两两配对改为修改，多出的已有数据删除，多出的传入数据插入
+
+只修改名字时不会写入任何子表数据，在列表中追加、删除、修改一条时也只写入一条。
+"""
+from collections import defaultdict
+from typing import List, Tuple
+
+from pydantic import BaseModel
+
+
+class ChildDiff:
+
+    def __init__(self, inserts: List[BaseModel], updates: List[Tuple[object, BaseModel]], deletes: List[object]):
+        self.inserts = inserts
+        self.updates = updates
+        self.deletes = deletes
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.inserts or self.updates or self.deletes)
+
+
+def values(item, fields: Tuple[str, ...]) -> tuple:
+    return tuple(getattr(item, field) for field in fields)
+
+
+def diff_children(stored: list, incoming: List[BaseModel], fields: Tuple[str, ...]) -> ChildDiff:
+    """
+    :param stored: 已有的子表实体，按 id 排序
+    :param incoming: 传入的完整列表
+    :param fields: 参与比较和写入的字段
+    """
+    remaining = {entity.id: entity for entity in stored}
+    updates = []
+    unmatched = []
+    for dto in incoming:
+        entity = remaining.pop(dto.id, None) if dto.id is not None else None
+        if entity is None:
+            unmatched.append(dto)
+        elif values(entity, fields) != values(dto, fields):
+            updates.append((entity, dto))
+
+    same_values = defaultdict(list)
+    for entity in remaining.values():
+        same_values[values(entity, fields)].append(entity)
+    added = []
+    for dto in unmatched:
+        same = same_values.get(values(dto, fields))
+        if same:
+            del remaining[same.pop(0).id]
+        else:
+            added.append(dto)
+
+    removed = list(remaining.values())
+    updates.extend(zip(removed, added))
+    return ChildDiff(inserts=added[len(removed):], updates=updates, deletes=removed[len(added):])
@@ -0,0 +1,134 @@
+"""
+小说、章节、情景上的汇总字段
+
+NovelEntity、ChapterEntity、SceneEntity 上保存了下级数量、对话总字数和最后活动时间，列表和详情头部直接读取，
+不需要加载整棵树再统计。mapper 在写入时于同一个 db_session 中调用这里的方法更新汇总字段，与写入一起提交。
+使用 SQL 自增而不是修改实体属性，避免并发写入时触发 Pony 的乐观锁检查。
+SQL 需要同时支持 SQLite 和 PostgreSQL，因数据库而异的部分见 Dialect。
+"""
+from datetime import datetime
+
+from core.mapper.config.DatabaseConfig import db
+from core.mapper.config.Dialect import datetime_param, greatest, quote
+
+NOVEL, CHAPTER, SCENE, CONVERSATION = (quote(name) for name in (
+    "NovelEntity", "ChapterEntity", "SceneEntity", "ConversationEntity"))
+
+# 只在新时间更晚时更新最后活动时间
+_LAST_ACTIVITY = f"last_activity = {greatest('COALESCE(last_activity, $activity)', '$activity')}"
+
+# 情景所属章节和小说
+_CHAPTER_OF_SCENE = f"(SELECT chapter FROM {SCENE} WHERE scene_id = $scene_id)"
+_NOVEL_OF_SCENE = (f"(SELECT c.novel FROM {CHAPTER} c JOIN {SCENE} s ON s.chapter = c.chapter_id "
+                   f"WHERE s.scene_id = $scene_id)")
+
+
+def on_conversation_created(scene_id: int, characters: int, activity: datetime, count: int = 1):
+    """
+    新增对话后更新情景、章节、小说的对话数量、总字数和最后活动时间，批量创建时 count 为同一情景下新增的数量
+    """
+    activity = datetime_param(activity)
+    updates = f"conversation_count = conversation_count + $count, total_characters = total_characters + $characters, " \
+              f"{_LAST_ACTIVITY}"
+    db.execute(f"UPDATE {SCENE} SET {updates} WHERE scene_id = $scene_id")
+    db.execute(f"UPDATE {CHAPTER} SET {updates} WHERE chapter_id = {_CHAPTER_OF_SCENE}")
+    db.execute(f"UPDATE {NOVEL} SET {updates} WHERE novel_id = {_NOVEL_OF_SCENE}")
+
+
+def on_scene_created(chapter_id: int, activity: datetime, count: int = 1):
+    """
+    新增情景后更新章节和小说的情景数量和最后活动时间，批量创建时 count 为同一章节下新增的数量
+    """
+    if chapter_id is None:
+        return
+    activity = datetime_param(activity)
+    updates = f"scene_count = scene_count + $count, {_LAST_ACTIVITY}"
+    db.execute(f"UPDATE {CHAPTER} SET {updates} WHERE chapter_id = $chapter_id")
+    db.execute(f"UPDATE {NOVEL} SET {updates} "
+               f"WHERE novel_id = (SELECT novel FROM {CHAPTER} WHERE chapter_id = $chapter_id)")
+
+
+def on_chapter_created(novel_id: int, activity: datetime, count: int = 1):
+    """
+    新增章节后更新小说的章节数量和最后活动时间，批量创建时 count 为同一小说下新增的数量
+    """
+    activity = datetime_param(activity)
+    db.execute(f"UPDATE {NOVEL} SET chapter_count = chapter_count + $count, {_LAST_ACTIVITY} "
+               f"WHERE novel_id = $novel_id")
+
+
+def on_conversations_deleted(scene_id: int, count: int, characters: int):
+    """
+    删除对话后减少情景、章节、小说的对话数量和总字数，最后活动时间不变
+    """
+    updates = "conversation_count = conversation_count - $count, total_characters = total_characters - $characters"
+    db.execute(f"UPDATE {SCENE} SET {updates} WHERE scene_id = $scene_id")
+    db.execute(f"UPDATE {CHAPTER} SET {updates} WHERE chapter_id = {_CHAPTER_OF_SCENE}")
+    db.execute(f"UPDATE {NOVEL} SET {updates} WHERE novel_id = {_NOVEL_OF_SCENE}")
+
+
+def on_scenes_deleted(chapter_id: int, scenes: int, conversations: int, characters: int):
+    """
+    删除同一章节下的情景后减少章节和小说的情景数量，以及这些情景中剩余对话的数量和字数（通常已先删除对话，为 0）
+    """
+    if chapter_id is None:
+        return
+    updates = "scene_count = scene_count - $scenes, conversation_count = conversation_count - $conversations, " \
+              "total_characters = total_characters - $characters"
+    db.execute(f"UPDATE {CHAPTER} SET {updates} WHERE chapter_id = $chapter_id")
+    db.execute(f"UPDATE {NOVEL} SET {updates} "
+               f"WHERE novel_id = (SELECT novel FROM {CHAPTER} WHERE chapter_id = $chapter_id)")
+
+
+def on_chapter_deleted(novel_id: int, scenes: int, conversations: int, characters: int):
+    """
+    删除章节后减少小说的章节数量，以及章节中剩余情景、对话的数量和字数
+    """
+    db.execute(f"UPDATE {NOVEL} SET chapter_count = chapter_count - 1, scene_count = scene_count - $scenes, "
+               f"conversation_count = conversation_count - $conversations, "
+               f"total_characters = total_characters - $characters WHERE novel_id = $novel_id")
+
+
+def on_novels_changed(novel_ids):
+    """
+    修改了小说中的数据但汇总字段不变时（例如置空对话的角色）增加小说的 revision，使各进程的小说详情缓存过期
+    """
+    ids = ", ".join(str(int(novel_id)) for novel_id in novel_ids)
+    if ids:
+        db.execute(f"UPDATE {NOVEL} SET revision = revision + 1 WHERE novel_id IN ({ids})")
+
+
+def rebuild_counters():
+    """
+    根据现有数据重新计算全部汇总字段，用于迁移时回填和修复数据，需要在 db_session 中调用
+    """
+    db.execute(f"""
+        UPDATE {SCENE} SET
+            conversation_count = (SELECT COUNT(*) FROM {CONVERSATION} c WHERE c.scene = {SCENE}.scene_id),
+            total_characters = (SELECT COALESCE(SUM(LENGTH(c.content)), 0) FROM {CONVERSATION} c
+                                WHERE c.scene = {SCENE}.scene_id),
+            last_activity = {greatest("create_time", f"COALESCE((SELECT MAX(c.create_time) FROM {CONVERSATION} c "
+                                                     f"WHERE c.scene = {SCENE}.scene_id), create_time)")}
+    """)
+    db.execute(f"""
+        UPDATE {CHAPTER} SET
+            scene_count = (SELECT COUNT(*) FROM {SCENE} s WHERE s.chapter = {CHAPTER}.chapter_id),
+            conversation_count = (SELECT COALESCE(SUM(s.conversation_count), 0) FROM {SCENE} s
+                                  WHERE s.chapter = {CHAPTER}.chapter_id),
+            total_characters = (SELECT COALESCE(SUM(s.total_characters), 0) FROM {SCENE} s
+                                WHERE s.chapter = {CHAPTER}.chapter_id),
+            last_activity = {greatest("create_time", f"COALESCE((SELECT MAX(s.last_activity) FROM {SCENE} s "
+                                                     f"WHERE s.chapter = {CHAPTER}.chapter_id), create_time)")}
+    """)
+    db.execute(f"""
+        UPDATE {NOVEL} SET
+            chapter_count = (SELECT COUNT(*) FROM {CHAPTER} c WHERE c.novel = {NOVEL}.novel_id),
+            scene_count = (SELECT COALESCE(SUM(c.scene_count), 0) FROM {CHAPTER} c
+                           WHERE c.novel = {NOVEL}.novel_id),
+            conversation_count = (SELECT COALESCE(SUM(c.conversation_count), 0) FROM {CHAPTER} c
+                                  WHERE c.novel = {NOVEL}.novel_id),
+            total_characters = (SELECT COALESCE(SUM(c.total_characters), 0) FROM {CHAPTER} c
+                                WHERE c.novel = {NOVEL}.novel_id),
+            last_activity = {greatest("create_time", f"COALESCE((SELECT MAX(c.last_activity) FROM {CHAPTER} c "
+                                                     f"WHERE c.novel = {NOVEL}.novel_id), create_time)")}
+    """)
@@ -1,8 +1,26 @@
+import hashlib
+import tempfile
+from pathlib import Path
+
+from pony.orm import db_session
+
 from core.entity.po.CharacterEntity import *
 from core.entity.po.ConversationEntity import *
 from core.entity.po.NovelEntity import *
 from core.entity.po.WorldEntity import *
 from core.entity.po.CharacterNovelEntity import *
+from core.entity.po.DeletionJobEntity import *
+from core.entity.po.TokenUsageEntity import *
+from core.entity.po.LlmJobEntity import *
+from core.mapper.config.Migrations import apply_migrations
+from core.utils import AppConfig
+from core.utils.LogConfig import get_logger
+from core.utils.ProcessLock import process_lock
+
+logging = get_logger(__name__)
+
+# 记录数据库结构信息的表，不属于任何实体
+SCHEMA_TABLE = "quicknovel_schema"
 
 
 def create_table():
@@ -10,9 +28,66 @@ def create_table():
     db.create_tables()
 
 
+def schema_fingerprint() -> str:
+    """
+    根据全部实体的定义计算结构指纹，实体或字段有变化时指纹随之改变
+    """
+    parts = []
+    for name in sorted(db.entities):
+        entity = db.entities[name]
+        for attr in entity._attrs_:
+            py_type = getattr(attr.py_type, "__name__", str(attr.py_type))
+            parts.append(f"{name}.{attr.name}:{type(attr).__name__}:{py_type}:{attr.is_required}:{attr.is_unique}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+@db_session
+def _get_schema_value(key: str):
+    db.execute(f"CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    rows = db.select(f"SELECT value FROM {SCHEMA_TABLE} WHERE name = $key")
+    return rows[0] if rows else None
+
+
+@db_session
+def _set_schema_value(key: str, value: str):
+    db.execute(f"INSERT INTO {SCHEMA_TABLE} (name, value) VALUES ($key, $value) "
+               f"ON CONFLICT (name) DO UPDATE SET value = excluded.value")
+
+
+def migration_lock_path() -> str:
+    """
+    建表和迁移使用的锁文件。SQLite 放在数据库文件旁边（相对路径已由 Pony 转换为绝对路径），
+    PostgreSQL 没有本地文件，放在临时目录，只协调同一台机器上的工作进程
+    """
+    if db.provider_name == "sqlite":
+        return db.provider.pool.filename + ".migrate.lock"
+    return str(Path(tempfile.gettempdir()) / f"quicknovel-{AppConfig.PG_DATABASE}.migrate.lock")
+
+
 def generate_table_mapping():
-    db.generate_mapping(create_tables=True)
+    """
+    生成实体映射并执行尚未执行的迁移。结构指纹与数据库中记录的一致时跳过建表和表结构检查，加快启动速度
+
+    多个工作进程同时启动时，只有拿到锁的进程建表和迁移，其他进程等待后读取到新的指纹，直接生成映射
+    """
+    if db.schema is not None:
+        # 已经生成过映射
+        return
+
+    fingerprint = schema_fingerprint()
+    with process_lock(migration_lock_path()):
+        if _get_schema_value("fingerprint") == fingerprint:
+            db.generate_mapping(create_tables=False, check_tables=False)
+            version = apply_migrations()
+            logging.info("数据库结构未变化，跳过建表，数据库版本为 %d", version)
+            return
 
+        # 只创建缺失的表，已有的表可能缺少新增的字段，需要先执行迁移再检查表结构
+        db.generate_mapping(create_tables=True, check_tables=False)
+        version = apply_migrations()
+        db.check_tables()
+        _set_schema_value("fingerprint", fingerprint)
+        logging.info("数据库结构已更新，指纹为 %s，数据库版本为 %d", fingerprint[:12], version)
 
 if __name__ == '__main__':
-    create_table()
\ No newline at end of file
+    create_table()
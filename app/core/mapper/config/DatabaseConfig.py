@@ -1,4 +1,52 @@
+"""
+数据库连接配置，按 AppConfig.DATABASE_PROVIDER 选择 SQLite 或 PostgreSQL，mapper 不感知具体的数据库
+
+多个工作进程共用同一个 SQLite 文件时的写入协调：
+1. Pony 在写入前执行 BEGIN IMMEDIATE，先拿到数据库的写锁再写入，同一时刻只有一个进程的一个事务在写，
+   进程内由 Pony 的事务锁排队，进程之间由 SQLite 的写锁排队，等待时间由 busy timeout 控制
+2. 使用 WAL 日志模式，写入期间其他进程仍可以读取已提交的数据，读请求不会被写入阻塞
+3. 只读的 db_session 运行在自动提交模式下，不持有锁，不存在读锁升级为写锁时的死锁
+
+PostgreSQL 支持多个事务同时写入，不需要上述协调。
+"""
 from pony.orm import *
 
+from core.mapper.config.QueryMonitor import install_query_monitor
+from core.mapper.config.ReadReplica import install_read_replica
+from core.utils import AppConfig
+
+SUPPORTED_PROVIDERS = ("sqlite", "postgres")
+
+
+def create_database() -> Database:
+    provider = AppConfig.DATABASE_PROVIDER
+    if provider == "sqlite":
+        # timeout 为等待写锁的秒数
+        return Database('sqlite', AppConfig.DATABASE_PATH, create_db=True, timeout=AppConfig.DATABASE_BUSY_TIMEOUT)
+    if provider == "postgres":
+        return Database('postgres', host=AppConfig.PG_HOST, port=AppConfig.PG_PORT, user=AppConfig.PG_USER,
+                        password=AppConfig.PG_PASSWORD, database=AppConfig.PG_DATABASE,
+                        connect_timeout=AppConfig.PG_CONNECT_TIMEOUT, application_name="quicknovel",
+                        options=f"-c statement_timeout={AppConfig.PG_STATEMENT_TIMEOUT_MS}")
+    raise ValueError(f"不支持的数据库类型 {provider}，可选值为 {', '.join(SUPPORTED_PROVIDERS)}")
+
+
 # 定义数据库对象
-db = Database('sqlite', 'database.sqlite', create_db=True)
+db = create_database()
+
+
+@db.on_connect(provider='sqlite')
+def _configure_connection(database, connection):
+    cursor = connection.cursor()
+    # WAL 模式记录在数据库文件中，对已是 WAL 模式的数据库执行不会有额外开销
+    cursor.execute("PRAGMA journal_mode = WAL")
+    # WAL 模式下 NORMAL 不会损坏数据库，只有断电时可能丢失最后提交的事务
+    cursor.execute("PRAGMA synchronous = NORMAL")
+
+
+# 统计每个请求执行的 SQL 数量和耗时
+install_query_monitor(db)
+
+# 配置了只读副本时，部分读方法从副本读取
+if AppConfig.REPLICA:
+    install_read_replica(db, AppConfig.REPLICA)
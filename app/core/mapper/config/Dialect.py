@@ -0,0 +1,55 @@
+"""
+原生 SQL 中因数据库而异的部分
+
+mapper 中的 Pony 查询由 Pony 翻译成对应数据库的 SQL，汇总字段和迁移中的原生 SQL 需要同时支持 SQLite 和 PostgreSQL：
+1. 表名由 Pony 按实体名创建，PostgreSQL 上 Pony 会先把名称转为小写（SQLite 保持原样），原生 SQL 中的表名和索引名
+   统一用 quote 按数据库的规则转换后加引号
+2. 取两个值中较大值的函数，SQLite 为多参数的 MAX，PostgreSQL 为 GREATEST
+3. 时间类型和时间参数，SQLite 以文本保存时间，参数需要与 Pony 保存的格式一致才能按字符串比较，查询结果需要转换为 datetime
+"""
+from datetime import datetime
+from typing import Optional
+
+from pony.utils import datetime2timestamp
+
+from core.mapper.config.DatabaseConfig import db
+
+
+def is_sqlite() -> bool:
+    return db.provider_name == "sqlite"
+
+
+def quote(name: str) -> str:
+    return f'"{db.provider.normalize_name(name)}"'
+
+
+def greatest(*expressions: str) -> str:
+    """
+    多个非空值中的较大值
+    """
+    return f"{'MAX' if is_sqlite() else 'GREATEST'}({', '.join(expressions)})"
+
+
+def datetime_type() -> str:
+    return "DATETIME" if is_sqlite() else "TIMESTAMP"
+
+
+def datetime_param(value: datetime):
+    return datetime2timestamp(value) if is_sqlite() else value
+
+
+def to_datetime(value) -> Optional[datetime]:
+    """
+    原生 SQL 查询结果中的时间，SQLite 返回 Pony 保存的文本，PostgreSQL 返回 datetime
+    """
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def column_names(table: str) -> list:
+    """
+    表中已有的字段名，通过查询结果的字段描述获取，不依赖 PRAGMA 或 information_schema
+    """
+    cursor = db.execute(f"SELECT * FROM {quote(table)} WHERE 1 = 0")
+    return [column[0] for column in cursor.description]
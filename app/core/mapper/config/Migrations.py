@@ -0,0 +1,193 @@
+"""
+数据库结构迁移
+
+Pony 的 generate_mapping(create_tables=True) 只会创建缺失的表，不会修改已有的表，也不会创建组合索引。
+结构变更按编号写在 MIGRATIONS 中，启动时依次执行尚未执行的迁移，已执行的版本记录在 MIGRATION_TABLE 中。
+
+新数据库的表由 Pony 按最新的实体定义创建，旧数据库则缺少后来新增的字段，
+因此每个迁移都必须是幂等的：索引使用 IF NOT EXISTS，新增字段使用 add_column。
+迁移中的 SQL 需要同时支持 SQLite 和 PostgreSQL，因数据库而异的部分见 Dialect。
+"""
+from datetime import datetime
+from typing import Callable, List
+
+from pony.orm import db_session
+
+from core.mapper.config.Counters import rebuild_counters
+from core.mapper.config.DatabaseConfig import db
+from core.mapper.config.Dialect import column_names, datetime_type, quote
+from core.mapper.config.ReadReplica import HEARTBEAT_TABLE
+from core.utils.LogConfig import get_logger
+
+logging = get_logger(__name__)
+
+# 记录已执行迁移的表
+MIGRATION_TABLE = "quicknovel_migration"
+
+
+class Migration:
+
+    def __init__(self, version: int, description: str, apply: Callable[[], None]):
+        self.version = version
+        self.description = description
+        self.apply = apply
+
+
+def create_index(name: str, table: str, *columns: str, unique: bool = False, where: str = None):
+    """
+    :param where: 部分索引的条件，只索引满足条件的行，SQLite 和 PostgreSQL 都支持
+    """
+    column_list = ", ".join(quote(column) for column in columns)
+    db.execute(f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {quote(name)} ON {quote(table)} ({column_list})'
+               + (f" WHERE {where}" if where else ""))
+
+
+def add_column(table: str, column: str, definition: str):
+    """
+    字段不存在时新增字段，definition 为字段类型和默认值，例如 "INTEGER NOT NULL DEFAULT 0"
+    """
+    if column not in column_names(table):
+        db.execute(f"ALTER TABLE {quote(table)} ADD COLUMN {quote(column)} {definition}")
+
+
+def _foreign_key_indexes():
+    # 外键索引，Pony 建表时会自动创建同名索引，这里显式声明，保证旧数据库上也存在
+    create_index("idx_chapterentity__novel", "ChapterEntity", "novel")
+    create_index("idx_sceneentity__chapter", "SceneEntity", "chapter")
+    create_index("idx_conversationentity__scene", "ConversationEntity", "scene")
+    create_index("idx_characternovelentity__novel", "CharacterNovelEntity", "novel")
+    create_index("idx_characternovelentity__character", "CharacterNovelEntity", "character")
+    create_index("idx_worlddetailentity__world", "WorldDetailEntity", "world")
+
+    # 组合索引，覆盖按外键过滤后再排序或取最大值的查询
+    # 新章节的编号：max(chapter_number) where novel = ?
+    create_index("idx_chapterentity__novel_chapter_number", "ChapterEntity", "novel", "chapter_number")
+    # 情景的对话记录按时间排序
+    create_index("idx_conversationentity__scene_create_time", "ConversationEntity", "scene", "create_time")
+    # 小说关联的角色只需要读取角色 id
+    create_index("idx_characternovelentity__novel_character", "CharacterNovelEntity", "novel", "character")
+
+
+def _summary_columns():
+    # 小说、章节、情景的汇总字段，添加后根据现有数据回填
+    for table, columns in (("NovelEntity", ("chapter_count", "scene_count", "conversation_count", "total_characters")),
+                           ("ChapterEntity", ("scene_count", "conversation_count", "total_characters")),
+                           ("SceneEntity", ("conversation_count", "total_characters"))):
+        for column in columns:
+            add_column(table, column, "INTEGER NOT NULL DEFAULT 0")
+        add_column(table, "last_activity", datetime_type())
+    rebuild_counters()
+
+
+def _replica_heartbeat():
+    # 主库定期写入心跳时间，复制到副本后用于计算副本落后的时间
+    db.execute(f"CREATE TABLE IF NOT EXISTS {HEARTBEAT_TABLE} (id INTEGER PRIMARY KEY, beat_at DOUBLE PRECISION NOT NULL)")
+
+
+def _character_version():
+    # 角色的乐观锁版本号
+    add_column("CharacterEntity", "version", "INTEGER NOT NULL DEFAULT 1")
+
+
+def _deletion_job_indexes():
+    # 小说列表和详情排除正在删除的小说：exists(entity = ? and entity_id = ?)
+    create_index("idx_deletionjobentity__entity_entity_id", "DeletionJobEntity", "entity", "entity_id")
+    # 后台删除进程领取任务
+    create_index("idx_deletionjobentity__status", "DeletionJobEntity", "status")
+
+
+def _token_usage_indexes():
+    # 按小说汇总用量，并按情景、角色分组
+    create_index("idx_tokenusageentity__novel_id_scene_id", "TokenUsageEntity", "novel_id", "scene_id")
+    create_index("idx_tokenusageentity__novel_id_character_id", "TokenUsageEntity", "novel_id", "character_id")
+    # 单个情景、角色的用量
+    create_index("idx_tokenusageentity__scene_id", "TokenUsageEntity", "scene_id")
+    create_index("idx_tokenusageentity__character_id", "TokenUsageEntity", "character_id")
+
+
+def _cached_tokens():
+    # 命中服务商前缀缓存的 prompt token 数量
+    add_column("TokenUsageEntity", "cached_tokens", "INTEGER NOT NULL DEFAULT 0")
+
+
+def _llm_job_indexes():
+    # 后台任务进程按状态领取任务
+    create_index("idx_llmjobentity__status", "LlmJobEntity", "status")
+    # 按小说查询任务
+    create_index("idx_llmjobentity__novel_id", "LlmJobEntity", "novel_id")
+
+
+def _character_memory():
+    # 角色记忆整理的进度
+    add_column("CharacterNovelEntity", "memory_until", "INTEGER NOT NULL DEFAULT 0")
+    add_column("CharacterNovelEntity", "memory_turns", "INTEGER NOT NULL DEFAULT 0")
+
+
+def _deletion_job_retry():
+    add_column("DeletionJobEntity", "run_after", "DOUBLE PRECISION NOT NULL DEFAULT 0")
+    # 同一实体只能有一个未完成的删除任务，并发的删除请求中只有一个能创建任务。
+    # 之前并发创建的重复任务只保留最早的一个，其余任务删除的是同一个实体，直接标记为完成
+    job = quote("DeletionJobEntity")
+    db.execute(f"UPDATE {job} SET status = 'done' WHERE status <> 'done' AND job_id NOT IN ("
+               f"SELECT MIN(job_id) FROM {job} WHERE status <> 'done' GROUP BY entity, entity_id)")
+    create_index("idx_deletionjobentity__entity_entity_id_active", "DeletionJobEntity", "entity", "entity_id",
+                 unique=True, where="status <> 'done'")
+
+
+def _novel_revision():
+    add_column("NovelEntity", "revision", "INTEGER NOT NULL DEFAULT 0")
+
+
+# 按版本号排列，只能在末尾追加，已发布的迁移不能修改
+MIGRATIONS: List[Migration] = [
+    Migration(1, "外键索引和组合索引", _foreign_key_indexes),
+    Migration(2, "小说、章节、情景的汇总字段", _summary_columns),
+    Migration(3, "只读副本的心跳表", _replica_heartbeat),
+    Migration(4, "角色的乐观锁版本号", _character_version),
+    Migration(5, "后台删除任务的索引", _deletion_job_indexes),
+    Migration(6, "模型用量的索引", _token_usage_indexes),
+    Migration(7, "模型用量的缓存命中 token 数量", _cached_tokens),
+    Migration(8, "后台模型任务的索引", _llm_job_indexes),
+    Migration(9, "角色记忆整理的进度", _character_memory),
+    Migration(10, "删除任务的重试时间和未完成任务的唯一索引", _deletion_job_retry),
+    Migration(11, "小说的修改版本号", _novel_revision),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+@db_session
+def current_version() -> int:
+    db.execute(f"CREATE TABLE IF NOT EXISTS {MIGRATION_TABLE} ("
+               f"version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TEXT NOT NULL)")
+    return db.select(f"SELECT COALESCE(MAX(version), 0) FROM {MIGRATION_TABLE}")[0]
+
+
+def pending_migrations(version: int) -> List[Migration]:
+    return [migration for migration in MIGRATIONS if migration.version > version]
+
+
+def apply_migrations() -> int:
+    """
+    依次执行尚未执行的迁移，每个迁移单独一个事务
+
+    :return: 执行后的版本号
+    """
+    versions = [migration.version for migration in MIGRATIONS]
+    if versions != list(range(1, len(MIGRATIONS) + 1)):
+        raise ValueError(f"迁移版本号必须从 1 开始连续编号，当前为 {versions}")
+
+    version = current_version()
+    if version > LATEST_VERSION:
+        logging.warning("数据库版本 %d 高于程序支持的版本 %d，可能使用了旧版本的程序", version, LATEST_VERSION)
+        return version
+
+    for migration in pending_migrations(version):
+        with db_session:
+            migration.apply()
+            version, description, applied_at = migration.version, migration.description, datetime.now().isoformat()
+            db.execute(f"INSERT INTO {MIGRATION_TABLE} (version, description, applied_at) "
+                       f"VALUES ($version, $description, $applied_at)")
+        logging.info("执行数据库迁移 %d: %s", migration.version, migration.description)
+        version = migration.version
+    return version
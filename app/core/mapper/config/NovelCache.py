@@ -0,0 +1,401 @@
+"""
+小说详情的进程内缓存
+
+小说详情页轮询 GET /api/novel/{id}，每次都重新查询并组装整棵章节、情景、对话树。NovelMapper.get_novel_by_id
+把组装好的结果（NovelRow 或 ResponseAllNovelDto，与 READ_MODE 一致）按小说缓存：
+1. 写入对话、情景、章节的 mapper 提交后调用这里的 patch_* 函数，把新数据按顺序插入缓存中的树，并像 Counters 一样更新
+   各级的汇总字段，不重建整棵树。重复调用同一条数据不会重复插入。已经返回的树可能正在被其他请求遍历，因此修改时
+   复制从小说到被修改节点的路径（节点和它的子列表），在锁内替换缓存中的引用，已经返回的树不会改变
+2. 每次读取先查询一次小说的汇总字段和 revision，与缓存中的一致才返回缓存，否则重新查询。其他进程的写入、后台删除
+   都会改变汇总字段；不改变汇总字段的修改（删除角色时置空对话的角色）增加 revision，因此多进程部署时每个进程的缓存
+   都能发现其他进程的修改；插入与查询交错时缓存的汇总字段与数据库不一致，同样会重新查询
+3. 内存占用按对话字数和行数估算，总量超过 NOVEL_CACHE_MAX_MB 时淘汰最久没有访问的小说
+4. 删除数据通过 CacheInvalidation 通知：删除小说、章节、情景时立即释放所属小说的缓存（即使没有通知，
+   下次读取时汇总字段也已变化）
+
+返回的对象由多个请求共享，调用方不能修改。对比见 benchmark/NovelCacheBenchmark.py
+"""
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from dataclasses import is_dataclass, replace
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set, Tuple, Union
+
+from core.entity.ProjectionEntity import ChapterRow, ConversationRow, NovelRow, SceneRow
+from core.entity.dto.ChapterDto import CreateChapterDto, ResponseAllChapterDto
+from core.entity.dto.ConversationDto import CreateConversationDto, ResponseConversationDto
+from core.entity.dto.NovelDto import ResponseAllNovelDto
+from core.entity.dto.SceneDto import CreateSceneDto, ResponseSceneDto
+from core.utils import AppConfig
+from core.utils.CacheInvalidation import register_cache_invalidator
+from core.utils.LogConfig import get_logger
+from core.utils.Metrics import Counter, Gauge
+
+logging = get_logger(__name__)
+
+NOVEL_CACHE_LOOKUPS = Counter("quicknovel_novel_cache_lookups_total",
+                              "小说详情缓存的读取结果（hit 命中，miss 未缓存，stale 汇总字段已变化）", ["result"])
+NOVEL_CACHE_PATCHES = Counter("quicknovel_novel_cache_patches_total", "写入后直接修改缓存的次数", ["entity"])
+NOVEL_CACHE_EVICTIONS = Counter("quicknovel_novel_cache_evictions_total", "超过内存上限时淘汰的小说数量")
+NOVEL_CACHE_BYTES = Gauge("quicknovel_novel_cache_bytes", "小说详情缓存估算的内存占用（字节）")
+
+# 每条对话、情景、章节除文本以外的内存占用（字节），两种读取模式分别用 tracemalloc 测得，见 NovelCacheBenchmark
+ROW_BYTES = {"projection": 350, "dto": 1250}
+
+NovelTree = Union[NovelRow, ResponseAllNovelDto]
+# 章节数、情景数、对话数、总字数、最后活动时间
+Summary = Tuple[int, int, int, int, Optional[datetime]]
+
+
+def summary_of(novel) -> Summary:
+    return (novel.chapter_count, novel.scene_count, novel.conversation_count, novel.total_characters,
+            novel.last_activity)
+
+
+def estimate_bytes(novel, mode: str) -> int:
+    """
+    按汇总字段估算一部小说的内存占用，文本按每字 2 字节计算
+    """
+    rows = novel.chapter_count + novel.scene_count + novel.conversation_count
+    return novel.total_characters * 2 + rows * ROW_BYTES.get(mode, ROW_BYTES["dto"])
+
+
+class _Entry:
+    __slots__ = ("mode", "novel", "revision", "chapters", "scenes", "size")
+
+    def __init__(self, mode: str, novel: NovelTree, revision: int):
+        self.mode = mode
+        self.novel = novel
+        self.revision = revision
+        self.chapters = {chapter.chapter_id: chapter for chapter in novel.chapter}
+        self.scenes = {scene.scene_id: scene for chapter in novel.chapter for scene in chapter.scene}
+        self.size = estimate_bytes(novel, mode)
+
+    @property
+    def rows(self) -> bool:
+        return isinstance(self.novel, NovelRow)
+
+
+_lock = threading.RLock()
+# 小说 id -> 缓存，按访问顺序排列，最久没有访问的在最前
+_entries: "OrderedDict[int, _Entry]" = OrderedDict()
+# 章节、情景 id -> 所属小说 id，写入时按上级找到缓存
+_chapter_novels: Dict[int, int] = {}
+_scene_novels: Dict[int, int] = {}
+_size = 0
+
+
+def max_bytes() -> int:
+    return int(AppConfig.NOVEL_CACHE_MAX_MB * 1024 * 1024)
+
+
+def cache_enabled() -> bool:
+    return max_bytes() > 0
+
+
+def cached_bytes() -> int:
+    return _size
+
+
+def get_cached_novel(novel_id: int, mode: str, summary: Summary, revision: int) -> Optional[NovelTree]:
+    """
+    汇总字段与 summary、revision 都一致时返回缓存，否则返回空，不一致的缓存同时清理
+    """
+    with _lock:
+        entry = _entries.get(novel_id)
+        if entry is None:
+            NOVEL_CACHE_LOOKUPS.inc(result="miss")
+            return None
+        if entry.mode != mode or entry.revision != revision or summary_of(entry.novel) != summary:
+            NOVEL_CACHE_LOOKUPS.inc(result="stale")
+            _discard(novel_id)
+            return None
+        _entries.move_to_end(novel_id)
+        NOVEL_CACHE_LOOKUPS.inc(result="hit")
+        return entry.novel
+
+
+def cache_novel(novel_id: int, mode: str, novel: NovelTree, revision: int):
+    """
+    缓存查询得到的小说详情，revision 为查询前读到的值。单部小说超过内存上限时不缓存
+    """
+    global _size
+    entry = _Entry(mode, novel, revision)
+    if entry.size > max_bytes():
+        discard_novel(novel_id)
+        return
+    with _lock:
+        _discard(novel_id)
+        _entries[novel_id] = entry
+        _chapter_novels.update((chapter_id, novel_id) for chapter_id in entry.chapters)
+        _scene_novels.update((scene_id, novel_id) for scene_id in entry.scenes)
+        _size += entry.size
+        _evict()
+
+
+def discard_novel(novel_id: Optional[int]):
+    with _lock:
+        _discard(novel_id)
+
+
+def clear_novel_cache():
+    global _size
+    with _lock:
+        _entries.clear()
+        _chapter_novels.clear()
+        _scene_novels.clear()
+        _size = 0
+        NOVEL_CACHE_BYTES.set(0)
+
+
+def _discard(novel_id: Optional[int]):
+    global _size
+    entry = _entries.pop(novel_id, None)
+    if entry is None:
+        return
+    for chapter_id in entry.chapters:
+        _chapter_novels.pop(chapter_id, None)
+    for scene_id in entry.scenes:
+        _scene_novels.pop(scene_id, None)
+    _size -= entry.size
+    NOVEL_CACHE_BYTES.set(_size)
+
+
+def _evict():
+    limit = max_bytes()
+    while _size > limit and _entries:
+        _discard(next(iter(_entries)))
+        NOVEL_CACHE_EVICTIONS.inc()
+    NOVEL_CACHE_BYTES.set(_size)
+
+
+def _resize(entry: _Entry):
+    global _size
+    size = estimate_bytes(entry.novel, entry.mode)
+    _size += size - entry.size
+    entry.size = size
+
+
+def _add(node, activity: Optional[datetime], chapters: int = 0, scenes: int = 0, conversations: int = 0,
+         characters: int = 0):
+    """
+    与 Counters 相同地更新汇总字段，最后活动时间只在更晚时更新
+    """
+    if chapters:
+        node.chapter_count += chapters
+    if scenes:
+        node.scene_count += scenes
+    node.conversation_count += conversations
+    node.total_characters += characters
+    if activity is not None and (node.last_activity is None or activity > node.last_activity):
+        node.last_activity = activity
+
+
+def _position(items: list, item_id: int, key) -> Tuple[int, bool]:
+    """
+    有序列表中 id 的位置和是否已存在
+    """
+    index = bisect_left(items, item_id, key=key)
+    return index, index < len(items) and key(items[index]) == item_id
+
+
+def _copy(node, **changes):
+    """
+    浅复制行对象或 DTO
+    """
+    if is_dataclass(node):
+        return replace(node, **changes)
+    return node.model_copy(update=changes)
+
+
+class _Copies:
+    """
+    一次修改中复制出的节点。节点第一次被修改时连同它的上级一起复制，复制出的节点还没有返回给任何请求，
+    同一次修改中可以直接修改
+    """
+
+    def __init__(self):
+        self.copied: Set[int] = set()
+
+    def novel(self, entry: _Entry):
+        if id(entry.novel) not in self.copied:
+            entry.novel = _copy(entry.novel, chapter=list(entry.novel.chapter))
+            self.copied.add(id(entry.novel))
+        return entry.novel
+
+    def chapter(self, entry: _Entry, chapter_id: int):
+        chapter = entry.chapters[chapter_id]
+        if id(chapter) not in self.copied:
+            chapters = self.novel(entry).chapter
+            index = bisect_left(chapters, (chapter.chapter_number, chapter_id),
+                                key=lambda c: (c.chapter_number, c.chapter_id))
+            chapter = chapters[index] = entry.chapters[chapter_id] = _copy(chapter, scene=list(chapter.scene))
+            self.copied.add(id(chapter))
+        return chapter
+
+    def scene(self, entry: _Entry, scene_id: int):
+        scene = entry.scenes[scene_id]
+        if id(scene) not in self.copied:
+            scenes = self.chapter(entry, scene.chapter).scene
+            index, _ = _position(scenes, scene_id, lambda s: s.scene_id)
+            scene = scenes[index] = entry.scenes[scene_id] = _copy(scene, conversation=list(scene.conversation))
+            self.copied.add(id(scene))
+        return scene
+
+
+def _patching(entity: str, patch):
+    """
+    在锁内修改缓存，失败时清空缓存，不影响已提交的写入
+    """
+    if not _entries:
+        return
+    with _lock:
+        try:
+            patch(_Copies())
+            NOVEL_CACHE_PATCHES.inc(entity=entity)
+        except Exception as e:
+            logging.error("修改小说详情缓存失败，清空缓存: %s", e)
+            clear_novel_cache()
+        NOVEL_CACHE_BYTES.set(_size)
+
+
+def patch_conversations_created(created: Iterable[Tuple[int, CreateConversationDto]]):
+    """
+    :param created: (对话 id, 写入的对话)
+    """
+    def patch(copies: _Copies):
+        touched = set()
+        for conversation_id, conversation in created:
+            novel_id = _scene_novels.get(conversation.scene)
+            if novel_id is None:
+                continue
+            entry = _entries[novel_id]
+            if _position(entry.scenes[conversation.scene].conversation, conversation_id,
+                         lambda c: c.conversation_id)[1]:
+                continue
+            scene = copies.scene(entry, conversation.scene)
+            index, _ = _position(scene.conversation, conversation_id, lambda c: c.conversation_id)
+            if entry.rows:
+                row = ConversationRow(conversation.role, conversation.sender_character,
+                                      conversation.receiver_character, conversation.content,
+                                      conversation.create_time, conversation.parent, conversation.scene, None,
+                                      conversation_id)
+            else:
+                row = ResponseConversationDto(
+                    conversation_id=conversation_id, role=conversation.role,
+                    sender_character=conversation.sender_character,
+                    receiver_character=conversation.receiver_character, content=conversation.content,
+                    create_time=conversation.create_time, parent=conversation.parent, scene=conversation.scene)
+            scene.conversation.insert(index, row)
+            for node in (scene, entry.chapters[scene.chapter], entry.novel):
+                _add(node, conversation.create_time, conversations=1, characters=len(conversation.content))
+            touched.add(novel_id)
+        for novel_id in touched:
+            _resize(_entries[novel_id])
+        _evict()
+
+    _patching("conversation", patch)
+
+
+def patch_conversation_deleted(conversation_id: int, scene_id: int, characters: int):
+    def patch(copies: _Copies):
+        novel_id = _scene_novels.get(scene_id)
+        if novel_id is None:
+            return
+        entry = _entries[novel_id]
+        index, exists = _position(entry.scenes[scene_id].conversation, conversation_id, lambda c: c.conversation_id)
+        if not exists:
+            return
+        scene = copies.scene(entry, scene_id)
+        del scene.conversation[index]
+        for node in (scene, entry.chapters[scene.chapter], entry.novel):
+            _add(node, None, conversations=-1, characters=-characters)
+        # 回复该对话的对话，parent 由外键置空
+        for position in range(index, len(scene.conversation)):
+            if scene.conversation[position].parent == conversation_id:
+                scene.conversation[position] = _copy(scene.conversation[position], parent=None)
+        _resize(entry)
+
+    _patching("conversation", patch)
+
+
+def patch_scenes_created(created: Iterable[Tuple[int, CreateSceneDto]]):
+    """
+    :param created: (情景 id, 写入的情景)，不属于章节的情景不在小说详情中
+    """
+    def patch(copies: _Copies):
+        touched = set()
+        for scene_id, scene in created:
+            novel_id = _chapter_novels.get(scene.chapter)
+            if novel_id is None:
+                continue
+            entry = _entries[novel_id]
+            if scene_id in entry.scenes:
+                continue
+            chapter = copies.chapter(entry, scene.chapter)
+            index, _ = _position(chapter.scene, scene_id, lambda s: s.scene_id)
+            if entry.rows:
+                row = SceneRow(scene_id, scene.scene_name, scene.scene_desc, scene.create_time, scene.parent,
+                               scene.chapter, 0, 0, scene.create_time)
+            else:
+                row = ResponseSceneDto(scene_id=scene_id, scene_name=scene.scene_name, scene_desc=scene.scene_desc,
+                                       create_time=scene.create_time, parent=scene.parent, chapter=scene.chapter,
+                                       last_activity=scene.create_time, conversation=[])
+            chapter.scene.insert(index, row)
+            entry.scenes[scene_id] = row
+            _scene_novels[scene_id] = novel_id
+            for node in (chapter, entry.novel):
+                _add(node, scene.create_time, scenes=1)
+            touched.add(novel_id)
+        for novel_id in touched:
+            _resize(_entries[novel_id])
+        _evict()
+
+    _patching("scene", patch)
+
+
+def patch_chapters_created(created: Iterable[Tuple[int, int, CreateChapterDto]]):
+    """
+    :param created: (章节 id, 章节号, 写入的章节)，章节号为空时由 mapper 分配
+    """
+    def patch(copies: _Copies):
+        touched = set()
+        for chapter_id, chapter_number, chapter in created:
+            entry = _entries.get(chapter.novel)
+            if entry is None or chapter_id in entry.chapters:
+                continue
+            if entry.rows:
+                row = ChapterRow(chapter_id, chapter_number, chapter.chapter_title, chapter.chapter_desc,
+                                 chapter.create_time, chapter.parent, chapter.novel, 0, 0, 0, chapter.create_time)
+            else:
+                row = ResponseAllChapterDto(
+                    chapter_id=chapter_id, chapter_number=chapter_number, chapter_title=chapter.chapter_title,
+                    chapter_desc=chapter.chapter_desc, create_time=chapter.create_time, parent=chapter.parent,
+                    novel=chapter.novel, last_activity=chapter.create_time, scene=[])
+            # 与查询的顺序相同，按章节号、章节 id 排列
+            insort(copies.novel(entry).chapter, row, key=lambda c: (c.chapter_number, c.chapter_id))
+            entry.chapters[chapter_id] = row
+            _chapter_novels[chapter_id] = chapter.novel
+            _add(entry.novel, chapter.create_time, chapters=1)
+            touched.add(chapter.novel)
+        for novel_id in touched:
+            _resize(_entries[novel_id])
+        _evict()
+
+    _patching("chapter", patch)
+
+
+def invalidate_novel_cache(entity: str, entity_id: int):
+    """
+    删除数据后的失效通知，见 CacheInvalidation
+    """
+    if entity == "novel":
+        discard_novel(entity_id)
+    elif entity == "chapter":
+        discard_novel(_chapter_novels.get(entity_id))
+    elif entity == "scene":
+        discard_novel(_scene_novels.get(entity_id))
+
+
+register_cache_invalidator(invalidate_novel_cache)
@@ -0,0 +1,94 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Tuple
+
+from pony.orm.core import local
+
+from core.utils import AppConfig
+from core.utils.LogConfig import get_logger, LogPayload
+from core.utils.Tracer import record_query
+
+logging = get_logger(__name__)
+
+
+class QueryStats:
+    """
+    一段代码内执行的 SQL 统计，按 db_session 区分
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # (sql, 耗时, 所属 db_session 的编号)
+        self.statements: List[Tuple[str, float, int]] = []
+        self._sessions = {}
+
+    def add(self, sql: str, seconds: float, session_key: int):
+        self.count += 1
+        self.seconds += seconds
+        session_index = self._sessions.setdefault(session_key, len(self._sessions))
+        self.statements.append((sql, seconds, session_index))
+
+    @property
+    def session_count(self) -> int:
+        return len(self._sessions)
+
+    def per_session(self) -> List[int]:
+        """
+        每个 db_session 执行的 SQL 数量
+        """
+        counts = [0] * len(self._sessions)
+        for _, _, session_index in self.statements:
+            counts[session_index] += 1
+        return counts
+
+    def __repr__(self):
+        return f"QueryStats(count={self.count}, seconds={self.seconds:.6f}, sessions={self.per_session()})"
+
+
+_collectors: ContextVar[Tuple[QueryStats, ...]] = ContextVar("quicknovel_query_collectors", default=())
+
+
+@contextmanager
+def track_queries():
+    """
+    统计代码块内执行的 SQL，可以嵌套使用
+
+    with track_queries() as stats:
+        mapper.get_novel_by_id(1)
+    assert stats.count == 4
+    """
+    stats = QueryStats()
+    token = _collectors.set(_collectors.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _collectors.reset(token)
+
+
+def install_query_monitor(database):
+    """
+    包装数据库底层的 SQL 执行方法，统计每条 SQL 的耗时，并记录到当前请求链路和 track_queries 中
+    """
+    exec_sql = database._exec_sql
+
+    def monitored_exec_sql(sql, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return exec_sql(sql, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            record_query(seconds)
+
+            collectors = _collectors.get()
+            if collectors:
+                # 每个 db_session 拥有独立的缓存对象，用它来区分不同的会话
+                session_key = id(local.db2cache.get(database))
+                for stats in collectors:
+                    stats.add(sql, seconds, session_key)
+
+            if seconds > AppConfig.SLOW_QUERY_SECONDS:
+                logging.warning("慢查询耗时 %.3f 秒: %s", seconds, LogPayload(sql, 500))
+
+    database._exec_sql = monitored_exec_sql
@@ -0,0 +1,244 @@
+"""
+只读副本的读写分离
+
+配置了 AppConfig.REPLICA 时，用 replica_read 标记的 mapper 读方法在满足以下条件时从只读副本读取，否则读取主库：
+1. 副本落后主库的时间不超过 REPLICA_MAX_LAG_SECONDS。主库定期写入心跳时间，副本上读到的心跳时间即副本的数据位置
+2. 读己之写：当前请求本身是写请求，或客户端最近一次写入的时间晚于副本的数据位置时读取主库，
+   写入时间由 ReadConsistencyMiddleware 通过 Cookie 或 X-QuickNovel-Write-At 请求头在请求之间传递
+3. 已在 db_session 中时沿用当前会话的连接，不切换
+
+路由在连接层完成：包装 Pony 的连接池，新的 db_session 获取连接时按当前上下文返回主库或副本的连接，
+mapper 和实体定义不需要改动。副本连接以只读方式打开，误写入时直接报错。
+"""
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+from pony.orm import db_session
+from pony.orm.core import local
+from pony.orm.dbproviders.sqlite import SQLitePool
+
+from core.utils import AppConfig
+from core.utils.LogConfig import get_logger
+from core.utils.Metrics import Counter
+
+logging = get_logger(__name__)
+
+# 记录主库心跳的表，由迁移创建
+HEARTBEAT_TABLE = "quicknovel_heartbeat"
+
+# 副本的数据位置缓存的秒数，避免每次读取都先查询一次心跳
+POSITION_CACHE_SECONDS = 0.5
+
+REPLICA_READS = Counter("quicknovel_db_reads_total", "读方法实际访问的数据库", ["target", "reason"])
+
+# 当前上下文中新的 db_session 使用的连接
+_use_replica: ContextVar[bool] = ContextVar("quicknovel_use_replica", default=False)
+# 副本的数据位置至少达到该时间才能读取副本，写请求中为无穷大
+_required_position: ContextVar[float] = ContextVar("quicknovel_required_position", default=0.0)
+
+_database = None
+# (检查时间, 副本的数据位置)
+_position_cache = (0.0, None)
+
+
+class RoutingPool:
+    """
+    包装主库的连接池，按上下文返回主库或副本的连接，其他属性沿用主库连接池
+    """
+
+    def __init__(self, primary, replica):
+        self.primary = primary
+        self.replica = replica
+
+    def connect(self):
+        if not _use_replica.get():
+            return self.primary.connect()
+        connection, _ = self.replica.connect()
+        # 不作为新连接返回，Pony 不会对副本连接执行 on_connect 中的设置（例如切换 WAL 模式）
+        return connection, False
+
+    def _owner(self, connection):
+        return self.replica if connection is not None and connection is self.replica.con else self.primary
+
+    def release(self, connection):
+        self._owner(connection).release(connection)
+
+    def drop(self, connection):
+        self._owner(connection).drop(connection)
+
+    def disconnect(self):
+        self.primary.disconnect()
+        self.replica.disconnect()
+
+    def __getattr__(self, name):
+        return getattr(self.primary, name)
+
+
+def _replica_pool(database, replica: str):
+    pool = database.provider.pool
+    if database.provider_name == "sqlite":
+        # 以只读方式打开，副本文件不存在时连接失败，不会创建空数据库
+        uri = f"{Path(replica).absolute().as_uri()}?mode=ro"
+        return SQLitePool(False, uri, True, uri=True, timeout=AppConfig.DATABASE_BUSY_TIMEOUT)
+    # PostgreSQL 的副本使用与主库相同的连接参数，只替换主机名
+    kwargs = {key: value for key, value in pool.kwargs.items() if not key.startswith("pony_")}
+    kwargs["host"] = replica
+    return type(pool)(pool.dbapi_module, *pool.args, **kwargs)
+
+
+def install_read_replica(database, replica: str):
+    """
+    :param database: Pony 数据库对象
+    :param replica: SQLite 为副本文件路径，PostgreSQL 为副本的主机名
+    """
+    global _database
+    _database = database
+    database.provider.pool = RoutingPool(database.provider.pool, _replica_pool(database, replica))
+    logging.info("已启用只读副本 %s，允许落后 %.1f 秒", replica, AppConfig.REPLICA_MAX_LAG_SECONDS)
+
+
+def replica_enabled() -> bool:
+    return _database is not None
+
+
+@contextmanager
+def use_replica():
+    """
+    代码块内新建的 db_session 使用副本的连接
+    """
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def require_position(position: float):
+    """
+    代码块内要求副本至少达到的数据位置，math.inf 表示只读取主库
+    """
+    token = _required_position.set(position)
+    try:
+        yield
+    finally:
+        _required_position.reset(token)
+
+
+def replica_position(refresh: bool = False) -> Optional[float]:
+    """
+    副本上读到的主库心跳时间，读取失败（副本不可用或还没有心跳）时返回 None
+    """
+    global _position_cache
+    checked_at, position = _position_cache
+    now = time.monotonic()
+    if not refresh and now - checked_at < POSITION_CACHE_SECONDS:
+        return position
+
+    try:
+        with use_replica(), db_session:
+            rows = _database.select(f"SELECT beat_at FROM {HEARTBEAT_TABLE} WHERE id = 1")
+        position = rows[0] if rows else None
+    except Exception as e:
+        logging.warning("读取副本的心跳失败，读请求改为访问主库: %s", e)
+        position = None
+    _position_cache = (now, position)
+    return position
+
+
+def _route() -> str:
+    """
+    返回访问副本的原因 "fresh"，或访问主库的原因
+    """
+    required = _required_position.get()
+    if math.isinf(required):
+        return "write_request"
+    position = replica_position()
+    if position is None:
+        return "unavailable"
+    if time.time() - position > AppConfig.REPLICA_MAX_LAG_SECONDS:
+        return "lag"
+    if required > position:
+        return "read_your_writes"
+    return "fresh"
+
+
+def replica_read(func):
+    """
+    标记可以从副本读取的 mapper 方法，放在 @db_session 外层
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _database is None or local.db_session is not None:
+            return func(*args, **kwargs)
+        reason = _route()
+        target = "replica" if reason == "fresh" else "primary"
+        REPLICA_READS.inc(target=target, reason=reason)
+        if target == "primary":
+            return func(*args, **kwargs)
+        with use_replica():
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+@db_session
+def write_heartbeat():
+    now = time.time()
+    _database.execute(f"INSERT INTO {HEARTBEAT_TABLE} (id, beat_at) VALUES (1, $now) "
+                      f"ON CONFLICT (id) DO UPDATE SET beat_at = excluded.beat_at")
+
+
+class _HeartbeatWriter:
+    """
+    后台线程定期在主库写入心跳
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="quicknovel-replica-heartbeat", daemon=True)
+
+    def _run(self):
+        while True:
+            try:
+                write_heartbeat()
+            except Exception as e:
+                logging.warning("写入副本心跳失败: %s", e)
+            if self._stopped.wait(self.interval):
+                return
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+_heartbeat: Optional[_HeartbeatWriter] = None
+
+
+def start_replica_heartbeat():
+    """
+    启用了副本时启动心跳写入线程，需要在生成数据库映射之后调用
+    """
+    global _heartbeat
+    if _database is None or _heartbeat is not None:
+        return
+    _heartbeat = _HeartbeatWriter(AppConfig.REPLICA_HEARTBEAT_SECONDS)
+    _heartbeat.start()
+
+
+def stop_replica_heartbeat():
+    global _heartbeat
+    if _heartbeat is not None:
+        _heartbeat.stop()
+        _heartbeat = None
@@ -0,0 +1,73 @@
+from pathlib import Path
+from typing import Optional
+
+from starlette.responses import FileResponse, Response
+
+from core.utils import AppConfig
+from core.utils.CustomizeException import AvatarNotFoundError
+from core.utils.ImagePipeline import (AVATAR_VARIANTS, VARIANT_FORMATS, avatar_dir, variant_dir, variant_name,
+                                      is_safe_name, schedule_variants)
+from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
+
+logging = get_logger(__name__)
+
+ORIGINAL = "original"
+
+
+class AvatarService:
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = directory or avatar_dir()
+
+    @staticmethod
+    def choose_format(accept: str, image_format: Optional[str]) -> str:
+        """
+        优先使用指定的格式，否则根据 Accept 头选择，浏览器支持时使用 WebP
+        """
+        if image_format in VARIANT_FORMATS:
+            return image_format
+        return "webp" if "image/webp" in (accept or "") else "jpeg"
+
+    @traced()
+    def get_avatar(self, avatar: str, variant: str, accept: str, if_none_match: Optional[str],
+                   image_format: Optional[str] = None) -> Response:
+        """
+        获取头像文件。文件名由内容哈希生成，内容不会变化，可以长期缓存；
+        缩略图还未生成时返回原图，并要求浏览器下次重新验证
+        """
+        if not is_safe_name(avatar) or (variant != ORIGINAL and variant not in AVATAR_VARIANTS):
+            raise AvatarNotFoundError(avatar)
+
+        original = self.directory / avatar
+        if variant == ORIGINAL:
+            return self._file_response(original, avatar, if_none_match, immutable=True)
+
+        image_format = self.choose_format(accept, image_format)
+        name = variant_name(avatar, variant, image_format)
+        path = variant_dir(self.directory) / name
+        if path.is_file():
+            return self._file_response(path, name, if_none_match, immutable=True,
+                                       media_type=VARIANT_FORMATS[image_format][2])
+
+        # 旧头像或缩略图还在生成中，补充生成后先返回原图
+        if original.is_file():
+            schedule_variants(original)
+        return self._file_response(original, avatar, if_none_match, immutable=False)
+
+    @staticmethod
+    def _file_response(path: Path, name: str, if_none_match: Optional[str], immutable: bool,
+                       media_type: Optional[str] = None) -> Response:
+        if not path.is_file():
+            raise AvatarNotFoundError(name)
+
+        etag = f'"{name}"'
+        if immutable:
+            cache_control = f"public, max-age={AppConfig.AVATAR_CACHE_MAX_AGE}, immutable"
+        else:
+            cache_control = "no-cache"
+        headers = {"etag": etag, "cache-control": cache_control, "vary": "Accept"}
+
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        return FileResponse(path, media_type=media_type, headers=headers)
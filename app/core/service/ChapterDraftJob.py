@@ -0,0 +1,106 @@
+"""
+批量起草章节的后台任务
+
+任务类型 chapter_draft，任务需要指定 novel_id，参数为 {"chapter_id": 章节id}，为章节中还没有对话的情景各生成一段开场。
+各情景的 prompt 共用同一段前缀（系统提示、角色、章节信息和全部情景的大纲），只查询和构建一次，
+最后一条消息才是各情景的信息，服务商的前缀缓存对除第一次以外的调用都有效。
+情景之间互不依赖，最多同时调用 CHAPTER_DRAFT_CONCURRENCY 次模型，全部完成后在同一个事务中写入对话，
+任一情景失败时不写入任何对话，任务按 JobService 的规则重试。
+结果为 {"chapter_id", "drafts": [{"scene_id", "conversation_id", "content", "latency_ms"}], "skipped": [已有对话的情景id],
+"wall_ms": 实际耗时, "sequential_ms": 逐个生成的耗时（各次调用耗时之和）}。
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict
+
+from core.entity.dto.ConversationDto import CreateConversationDto
+from core.mapper.ConversationMapper import ConversationMapperInterface
+from core.mapper.NovelMapper import NovelMapperInterface
+from core.service.JobService import JobAbortError, JobContext
+from core.service.PromptLayout import SYSTEM_PROMPT, chapter_prompt, scene_prompt
+from core.service.ProviderService import ProviderService
+from core.utils import AppConfig
+from core.utils.LogConfig import get_logger
+
+logging = get_logger(__name__)
+
+CHAPTER_DRAFT = "chapter_draft"
+
+DRAFT_PROMPT = "请为上面的情景写出开场：交代环境和氛围，让相关角色登场并说出第一句话，不少于300字，只输出正文。"
+
+
+def outline_prompt(chapter) -> str:
+    lines = [f"{i + 1}. {scene.scene_name}: {scene.scene_desc or '无描述'}" for i, scene in enumerate(chapter.scene or [])]
+    return "#### 本章情景大纲\n" + "\n".join(lines) + "\n"
+
+
+class ChapterDraftJob:
+    def __init__(self, novel_mapper: NovelMapperInterface, conversation_mapper: ConversationMapperInterface,
+                 provider_service: ProviderService):
+        self.novel_mapper = novel_mapper
+        self.conversation_mapper = conversation_mapper
+        self.provider_service = provider_service
+
+    async def __call__(self, context: JobContext) -> Dict[str, Any]:
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        chapter_id = context.params.get("chapter_id")
+        if context.novel_id is None or chapter_id is None:
+            raise JobAbortError("起草章节需要指定 novel_id 和参数 chapter_id")
+
+        novel = await context.run(self.novel_mapper.get_novel_by_id, context.novel_id)
+        chapter = next((c for c in novel.chapter or [] if c.chapter_id == chapter_id), None)
+        if chapter is None:
+            raise JobAbortError(f"小说 ID {context.novel_id} 中没有 ID 为{chapter_id}的章节")
+
+        scenes = [scene for scene in chapter.scene or [] if not scene.conversation]
+        skipped = [scene.scene_id for scene in chapter.scene or [] if scene.conversation]
+        if not scenes:
+            return {"chapter_id": chapter_id, "drafts": [], "skipped": skipped, "wall_ms": 0, "sequential_ms": 0}
+
+        # 各情景共用的前缀
+        characters = await context.run(self.provider_service.generate_character_messages, context.novel_id)
+        prefix = [SystemMessage(content=SYSTEM_PROMPT), *characters,
+                  HumanMessage(content=chapter_prompt(novel, chapter) + outline_prompt(chapter))]
+
+        semaphore = asyncio.Semaphore(max(1, AppConfig.CHAPTER_DRAFT_CONCURRENCY))
+        steps, done = len(scenes) + 1, 0
+
+        async def draft(scene) -> Dict[str, Any]:
+            nonlocal done
+            async with semaphore:
+                start = time.perf_counter()
+                content = await self.provider_service.generate_completion(
+                    prefix + [HumanMessage(content=scene_prompt(scene) + DRAFT_PROMPT)],
+                    novel_id=context.novel_id, scene_id=scene.scene_id)
+                latency = time.perf_counter() - start
+            done += 1
+            await context.progress(done / steps, f"已起草情景 {done}/{len(scenes)}")
+            return {"scene_id": scene.scene_id, "content": content, "latency_ms": round(latency * 1000, 3)}
+
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(draft(scene)) for scene in scenes]
+        try:
+            drafts = await asyncio.gather(*tasks)
+        except BaseException:
+            # 一个情景失败后其余情景的结果也不会写入，取消还没完成的调用
+            for task in tasks:
+                task.cancel()
+            raise
+
+        now = datetime.now()
+        created = await context.run(self.conversation_mapper.create_conversations, [
+            CreateConversationDto(role="assistant", content=item["content"], create_time=now, scene=item["scene_id"])
+            for item in drafts])
+        if created.failed:
+            raise JobAbortError(f"写入起草的对话失败，{created.failed}个情景已不存在")
+        for item, result in zip(drafts, created.items):
+            item["conversation_id"] = result.id
+        wall_ms = round((time.perf_counter() - start) * 1000, 3)
+
+        sequential_ms = round(sum(item["latency_ms"] for item in drafts), 3)
+        logging.info("章节 %s 起草完成，共%d个情景，耗时 %.0f ms，逐个生成约 %.0f ms",
+                     chapter_id, len(drafts), wall_ms, sequential_ms)
+        return {"chapter_id": chapter_id, "drafts": drafts, "skipped": skipped, "wall_ms": wall_ms,
+                "sequential_ms": sequential_ms}
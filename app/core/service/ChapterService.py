@@ -1,9 +1,13 @@
 from datetime import datetime
+from typing import List
 
 from core.entity.ResponseEntity import success, ResponseModel
+from core.entity.dto.BatchDto import BatchResultDto
 from core.entity.dto.ChapterDto import CreateChapterDto
 from core.mapper.ChapterMapper import ChapterMapperInterface
+from core.utils.BatchUtils import check_batch_size, raise_if_rejected
 from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
 
 logging = get_logger(__name__)
 
@@ -11,9 +15,21 @@ class ChapterService:
     def __init__(self, chapter_mapper: ChapterMapperInterface):
         self.chapter_mapper = chapter_mapper
 
+    @traced()
     def create_chapter(self, chapter: CreateChapterDto) -> ResponseModel:
         chapter.create_time = datetime.now()
         chapter_id = self.chapter_mapper.create_chapter(chapter)
         logging.info(f"创建章节{chapter.chapter_title}成功，章节ID为{chapter_id}")
         return success(message=f"创建章节{chapter.chapter_title}成功，章节ID为{chapter_id}")
 
+    @traced()
+    def create_chapters(self, chapters: List[CreateChapterDto]) -> ResponseModel[BatchResultDto]:
+        check_batch_size(chapters)
+        now = datetime.now()
+        for chapter in chapters:
+            chapter.create_time = now
+        result = self.chapter_mapper.create_chapters(chapters)
+        raise_if_rejected(result, "章节")
+        logging.info(f"批量创建章节成功，数量为{result.created}")
+        return success(data=result, message=f"批量创建章节成功，数量为{result.created}")
+
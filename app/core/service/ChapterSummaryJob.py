@@ -0,0 +1,65 @@
+"""
+总结章节的后台任务
+
+任务类型 chapter_summary，任务需要指定 novel_id，参数为 {"chapter_id": 章节id}，结果为
+{"chapter_id": 章节id, "scenes": [{"scene_id": 情景id, "summary": 情景总结}], "summary": 章节总结}。
+先逐个总结有对话的情景（每个情景一次模型调用），再把情景总结合并为章节总结，每完成一步更新一次进度。
+"""
+from typing import Any, Dict
+
+from core.mapper.NovelMapper import NovelMapperInterface
+from core.service.JobService import JobAbortError, JobContext
+from core.service.PromptLayout import chapter_prompt, scene_prompt
+from core.service.ProviderService import ProviderService
+from core.utils.LogConfig import get_logger
+
+logging = get_logger(__name__)
+
+CHAPTER_SUMMARY = "chapter_summary"
+
+SCENE_SUMMARY_PROMPT = "你是小说编辑。请用简洁的中文总结下面情景中发生的事件、人物的变化和留下的伏笔，不超过200字，只输出总结。"
+CHAPTER_SUMMARY_PROMPT = "你是小说编辑。下面是同一章节中各个情景的总结，请合并为这一章的总结，不超过400字，只输出总结。"
+
+
+def transcript(scene) -> str:
+    return "\n".join(f"{conv.role}: {conv.content}" for conv in scene.conversation or [])
+
+
+class ChapterSummaryJob:
+    def __init__(self, novel_mapper: NovelMapperInterface, provider_service: ProviderService):
+        self.novel_mapper = novel_mapper
+        self.provider_service = provider_service
+
+    async def __call__(self, context: JobContext) -> Dict[str, Any]:
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        chapter_id = context.params.get("chapter_id")
+        if context.novel_id is None or chapter_id is None:
+            raise JobAbortError("总结章节需要指定 novel_id 和参数 chapter_id")
+
+        novel = await context.run(self.novel_mapper.get_novel_by_id, context.novel_id)
+        chapter = next((c for c in novel.chapter or [] if c.chapter_id == chapter_id), None)
+        if chapter is None:
+            raise JobAbortError(f"小说 ID {context.novel_id} 中没有 ID 为{chapter_id}的章节")
+
+        scenes = [scene for scene in chapter.scene or [] if scene.conversation]
+        steps = len(scenes) + 1
+        header = chapter_prompt(novel, chapter)
+
+        summaries = []
+        for i, scene in enumerate(scenes):
+            summary = await self.provider_service.generate_completion([
+                SystemMessage(content=SCENE_SUMMARY_PROMPT),
+                HumanMessage(content=header + scene_prompt(scene) + "\n" + transcript(scene)),
+            ], novel_id=context.novel_id, scene_id=scene.scene_id)
+            summaries.append({"scene_id": scene.scene_id, "summary": summary})
+            await context.progress((i + 1) / steps, f"已总结情景 {i + 1}/{len(scenes)}")
+
+        summary = ""
+        if summaries:
+            summary = await self.provider_service.generate_completion([
+                SystemMessage(content=CHAPTER_SUMMARY_PROMPT),
+                HumanMessage(content=header + "\n".join(item["summary"] for item in summaries)),
+            ], novel_id=context.novel_id)
+        logging.info("章节 %s 总结完成，共%d个情景", chapter_id, len(summaries))
+        return {"chapter_id": chapter_id, "scenes": summaries, "summary": summary}
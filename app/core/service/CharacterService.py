@@ -1,13 +1,21 @@
-import uuid
 from pathlib import Path
 from typing import List
 
 from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
 
 from core.entity.ResponseEntity import ResponseModel, success, warning
-from core.entity.dto.CharacterDto import CreateCharacterDto, ResponseCharacterDto, UpdateCharacterDto
+from core.entity.dto.BatchDto import BatchResultDto
+from core.entity.dto.CharacterDto import CreateCharacterDto, ResponseCharacterDto, UpdateCharacterDto, CreateTraitDto, \
+    PatchCharacterDto, UpdateCharacterResultDto
 from core.mapper.CharacterMapper import CharacterMapperInterface
+from core.utils import AppConfig
+from core.utils.BatchUtils import check_batch_size, raise_if_rejected
+from core.utils.CustomizeException import UploadError
+from core.utils.FileUtils import sniff_image_extension, save_upload_file
+from core.utils.ImagePipeline import avatar_dir, schedule_variants
 from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
 
 logging = get_logger(__name__)
 
@@ -18,7 +26,7 @@ class CharacterService:
         self.character_mapper = character_mapper
 
         # 配置上传目录
-        self.UPLOAD_DIR = Path("uploads/avatars").absolute()
+        self.UPLOAD_DIR = avatar_dir()
         self.UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
         self.ALLOWED_EXTENSIONS = {".png", ".jpg", ".jpeg"}
 
@@ -26,59 +34,63 @@ class CharacterService:
         """验证文件扩展名是否允许"""
         return Path(filename).suffix.lower() in self.ALLOWED_EXTENSIONS
 
+    @traced()
     def create_character(self, character: CreateCharacterDto) -> ResponseModel:
         character_id = self.character_mapper.create_character(character)
         return success(message=f"创建角色成功, 角色id为{character_id}")
 
+    @traced()
     def select_character_by_id(self, character_id: int) -> ResponseModel[ResponseCharacterDto]:
         character = self.character_mapper.select_character_by_id(character_id)
         return success(data=character, message="获取角色成功")
 
+    @traced()
     def get_all_characters(self) -> ResponseModel[List[ResponseCharacterDto]]:
         characters = self.character_mapper.get_all_characters()
         return success(data=characters, message="获取全部角色成功")
 
-    def delete_character(self, character_id: int) -> ResponseModel:
-        is_delete = self.character_mapper.delete_character_by_id(character_id)
-        if is_delete:
-            return success(message=f"成功删除角色id为{character_id}的角色")
-        return warning(message=f"删除角色id为{character_id}的角色失败")
+    @traced()
+    def update_character(self, character: UpdateCharacterDto) -> ResponseModel[UpdateCharacterResultDto]:
+        # 完整更新也按差异写入：基本信息字段全部显式传入，值为 None 时清空；子表为 None 时不修改
+        return self.patch_character(character.id, PatchCharacterDto(**character.model_dump(exclude={"id"})))
 
-    def update_character(self, character: UpdateCharacterDto) -> ResponseModel:
-        is_update = self.character_mapper.update_character(character)
-        if is_update:
-            return success(message=f"成功更新角色id为{character.id}的角色")
-        return warning(message=f"更新角色id为{character.id}的角色失败")
+    @traced()
+    def patch_character(self, character_id: int, patch: PatchCharacterDto) -> ResponseModel[UpdateCharacterResultDto]:
+        result = self.character_mapper.update_character(character_id, patch)
+        return success(data=result, message=f"成功更新角色id为{character_id}的角色，当前版本为{result.version}")
+
+    @traced()
+    def create_traits(self, traits: List[CreateTraitDto]) -> ResponseModel[BatchResultDto]:
+        check_batch_size(traits)
+        result = self.character_mapper.create_traits(traits)
+        raise_if_rejected(result, "性格特征")
+        return success(data=result, message=f"批量添加性格特征成功，数量为{result.created}")
 
+    @traced()
     async def update_avatar(self, character_id: int, avatar_file: UploadFile) -> ResponseModel:
         # 验证文件扩展名
         if not self.validate_file_extension(avatar_file.filename):
-            raise ValueError("不支持的文件格式，仅允许 PNG、JPG、JPEG")
+            raise UploadError("不支持的文件格式，仅允许 PNG、JPG、JPEG")
 
         logging.info(f"上传文件名为 {avatar_file.filename}")
 
-        # 生成唯一文件名
-        file_extension = Path(avatar_file.filename).suffix.lower()
-        unique_filename = f"character_{character_id}_{uuid.uuid4()}{file_extension}"
-        file_path = self.UPLOAD_DIR / unique_filename
-
-        logging.info(f"上传文件保存路径为 {file_path}")
-
-        # 保存文件
-        try:
-            with open(file_path, "wb") as buffer:
-                content = await avatar_file.read()
-                buffer.write(content)
-        except Exception as e:
-            logging.error(f"文件保存失败: {str(e)}")
-            raise ValueError(f"文件保存失败: {str(e)}")
+        # 扩展名不可信，根据文件头判断真实的图片格式
+        header = await avatar_file.read(AppConfig.UPLOAD_CHUNK_SIZE)
+        file_extension = sniff_image_extension(header)
+        if file_extension is None:
+            raise UploadError("文件内容不是有效的 PNG 或 JPG 图片")
 
-        if not file_path.exists():
-            raise ValueError(f"文件 {file_path} 保存失败")
+        # 分块保存文件，不阻塞事件循环，文件名为内容哈希
+        avatar_name, size = await save_upload_file(avatar_file, self.UPLOAD_DIR, file_extension,
+                                                   AppConfig.AVATAR_MAX_BYTES, AppConfig.UPLOAD_CHUNK_SIZE,
+                                                   first_chunk=header)
+        logging.info(f"头像保存完成，文件名为 {avatar_name}，大小为 {size} 字节")
 
-        avatar_name = file_path.name
+        # 在后台进程中生成缩略图，不等待完成
+        schedule_variants(self.UPLOAD_DIR / avatar_name)
 
-        is_update = self.character_mapper.update_avatar(character_id, avatar_name)
+        # 数据库操作同样放到线程池中执行
+        is_update = await run_in_threadpool(self.character_mapper.update_avatar, character_id, avatar_name)
         if is_update:
             return success(message="上传头像成功")
         return warning(message="上传头像失败")
@@ -1,4 +1,5 @@
 import asyncio
+from contextlib import nullcontext
 from datetime import datetime
 from typing import List
 from fastapi import Request
@@ -7,18 +8,32 @@ from fastapi.responses import StreamingResponse
 from core.entity.ResponseEntity import ResponseModel, success
 from core.entity.dto.ConversationDto import CreateConversationDto, ResponseConversationDto
 from core.mapper.ConversationMapper import ConversationMapperInterface
+from core.service.GenerationScheduler import GenerationScheduler, client_key
+from core.service.MemoryService import MemoryService
 from core.service.ProviderService import ProviderService
 from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
 
 logging = get_logger(__name__)
 
 
 class ConversationService:
-    def __init__(self, conversation_mapper: ConversationMapperInterface, providerService: ProviderService):
+    def __init__(self, conversation_mapper: ConversationMapperInterface, providerService: ProviderService,
+                 scheduler: GenerationScheduler = None, memory_service: MemoryService = None):
         self.conversation_mapper = conversation_mapper
         self.provider_service = providerService
+        # 为空时不限流也不排队
+        self.scheduler = scheduler
+        # 为空时不整理角色记忆
+        self.memory_service = memory_service
 
+    @traced()
     def create_conversation(self, request: Request, conversation: CreateConversationDto) -> StreamingResponse:
+        # 先检查限流，被拒绝的请求不写入用户消息
+        client = client_key(request)
+        if self.scheduler is not None:
+            self.scheduler.admit(client, conversation.novel)
+
         conversation.create_time = datetime.now()
         conversation_id = self.conversation_mapper.create_conversation(conversation)
 
@@ -29,27 +44,40 @@ class ConversationService:
 
         async def event_generator(content: str):
             try:
-                async for chunk in self.provider_service.generate_llm_response(conversation.content, conversation.novel):
-                    if await request.is_disconnected():
-                        print("客户端已断开连接。")
-                        break
-
-                    if chunk == "[DONE]":
-                        # 发送一个表示结束的事件
-                        conversation_id = self.conversation_mapper.create_conversation(CreateConversationDto(
-                            content=content,
-                            role="assistant",
-                            create_time=datetime.now(),
-                            scene=conversation.scene,
-                        ))
-                        # 记录日志
-                        logging.info(f"保存llm对话成功，id为:{conversation_id}")
-                        yield f"event: end\ndata: {chunk}\n\n"
-                        break
-                    else:
-                        # 发送普通的文本事件
-                        content += chunk
-                        yield f"data: {chunk}\n\n"
+                # 本轮的用量记到回复的角色上，没有指定接收者时记到发送者上
+                character_id = conversation.receiver_character or conversation.sender_character
+                # 等待生成名额，排队期间连接保持打开
+                async with self._generation_slot(client):
+                    async for chunk in self.provider_service.generate_llm_response(
+                            conversation.content, conversation.novel, conversation.scene, character_id):
+                        if await request.is_disconnected():
+                            print("客户端已断开连接。")
+                            break
+
+                        if chunk == "[DONE]":
+                            # 发送一个表示结束的事件
+                            conversation_id = self.conversation_mapper.create_conversation(CreateConversationDto(
+                                content=content,
+                                role="assistant",
+                                create_time=datetime.now(),
+                                scene=conversation.scene,
+                            ))
+                            # 记录日志
+                            logging.info(f"保存llm对话成功，id为:{conversation_id}")
+                            # 检查是否需要整理角色记忆需要写入数据库，在线程池中执行，不阻塞事件循环；
+                            # 先发送结束事件再等待完成，客户端断开时写入在线程池中继续
+                            consolidating = None
+                            if self.memory_service is not None:
+                                consolidating = asyncio.get_running_loop().run_in_executor(
+                                    None, self.memory_service.on_turn, conversation.novel)
+                            yield f"event: end\ndata: {chunk}\n\n"
+                            if consolidating is not None:
+                                await consolidating
+                            break
+                        else:
+                            # 发送普通的文本事件
+                            content += chunk
+                            yield f"data: {chunk}\n\n"
             except asyncio.CancelledError:
                 logging.error("请求被取消。")
             except Exception as e:
@@ -59,7 +87,13 @@ class ConversationService:
         # 使用 StreamingResponse 包装事件生成器
         return StreamingResponse(event_generator(content), media_type="text/event-stream")
 
-    def get_conversation_by_scene_id(self, scene_id: str) -> ResponseModel[List[ResponseConversationDto]]:
+    def _generation_slot(self, client: str):
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(client)
+
+    @traced()
+    def get_conversation_by_scene_id(self, scene_id: int) -> ResponseModel[List[ResponseConversationDto]]:
         conversations = self.conversation_mapper.get_conversation_by_scene_id(scene_id)
 
         if not conversations or conversations == []:
@@ -68,3 +102,8 @@ class ConversationService:
         logging.info(f"获取情景 ID 为{scene_id}的对话成功, 对话数量为{len(conversations)}")
 
         return success(message=f"情景 ID 为{scene_id}的对话为空", data=conversations)
+
+    @traced()
+    def delete_conversation(self, conversation_id: int) -> ResponseModel:
+        self.conversation_mapper.delete_conversation(conversation_id)
+        return success(message=f"成功删除对话id为{conversation_id}的对话")
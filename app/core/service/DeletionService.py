@@ -0,0 +1,180 @@
+"""
+删除接口和后台删除进程
+
+删除接口只创建删除任务并立即返回任务进度，DeletionWorker 线程领取任务后分批删除（见 DeletionMapper），
+每批之间暂停 DELETE_BATCH_PAUSE 秒。多进程部署时每个进程都有一个 DeletionWorker，任务通过数据库中的租约分配，
+进程退出或崩溃后任务由其他进程继续执行。
+"""
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from core.entity.ResponseEntity import success, ResponseModel
+from core.entity.dto.DeletionDto import ResponseDeletionJobDto
+from core.mapper.DeletionMapper import DeletionMapper, DeletionMapperInterface, CHARACTER_JOB
+from core.utils import AppConfig
+from core.utils.CacheInvalidation import invalidate_caches
+from core.utils.ImagePipeline import avatar_dir, remove_avatar_files, remove_unreferenced_avatar
+from core.utils.LogConfig import get_logger
+from core.utils.Metrics import Counter
+from core.utils.Tracer import traced
+
+logging = get_logger(__name__)
+
+DELETED_ROWS = Counter("quicknovel_deleted_rows_total", "后台删除任务处理的数据行数", ["entity"])
+DELETION_JOBS = Counter("quicknovel_deletion_jobs_total", "后台删除任务的执行结果", ["entity", "result"])
+
+
+def retry_delay(attempt: int) -> float:
+    """
+    第 attempt 次执行失败后等待的秒数
+    """
+    return min(AppConfig.DELETE_RETRY_BASE_SECONDS * 2 ** (attempt - 1), AppConfig.DELETE_RETRY_MAX_SECONDS)
+
+
+class DeletionService:
+    def __init__(self, deletion_mapper: DeletionMapperInterface):
+        self.deletion_mapper = deletion_mapper
+
+    @traced()
+    def request_deletion(self, entity: str, entity_id: int) -> ResponseModel[ResponseDeletionJobDto]:
+        job = self.deletion_mapper.create_job(entity, entity_id)
+        # 小说在创建任务后就不再出现在列表中，缓存需要立即失效
+        invalidate_caches(entity, entity_id)
+        wake_deletion_worker()
+        return success(data=job, message=f"已开始删除{entity} id为{entity_id}的数据，任务id为{job.job_id}")
+
+    @traced()
+    def get_job(self, job_id: int) -> ResponseModel[ResponseDeletionJobDto]:
+        return success(data=self.deletion_mapper.get_job(job_id))
+
+    def run_next_job(self, owner: str, stopped: Optional[threading.Event] = None) -> bool:
+        """
+        领取并执行一个任务，stopped 被设置时把任务放回队列后返回
+
+        :return: 是否领取到了任务
+        """
+        job_id = self.deletion_mapper.claim_next_job(owner, AppConfig.DELETE_LEASE_SECONDS)
+        if job_id is None:
+            return False
+
+        job = self.deletion_mapper.get_job(job_id)
+        logging.info("开始执行删除任务 %s，删除%s id为%s", job_id, job.entity, job.entity_id)
+        try:
+            while True:
+                if stopped is not None and stopped.is_set():
+                    self.deletion_mapper.release_job(job_id, owner)
+                    logging.info("删除任务 %s 已放回队列", job_id)
+                    return True
+                batch = self.deletion_mapper.delete_batch(job_id, owner, AppConfig.DELETE_BATCH_SIZE,
+                                                          AppConfig.DELETE_LEASE_SECONDS)
+                if batch.lost:
+                    logging.warning("删除任务 %s 已由其他进程执行", job_id)
+                    return True
+                DELETED_ROWS.inc(batch.deleted, entity=job.entity)
+                for avatar in batch.avatars:
+                    remove_unreferenced_avatar(avatar)
+                if batch.done:
+                    break
+                if stopped is not None:
+                    stopped.wait(AppConfig.DELETE_BATCH_PAUSE)
+                else:
+                    time.sleep(AppConfig.DELETE_BATCH_PAUSE)
+        except Exception as e:
+            logging.error("删除任务 %s 执行失败: %s", job_id, e)
+            # 持续出错（例如等待锁超时）时按退避时间重试，不会立即被再次领取
+            retry_at = datetime.now().timestamp() + retry_delay(job.attempts + 1)
+            failed = self.deletion_mapper.fail_job(job_id, owner, str(e), AppConfig.DELETE_MAX_ATTEMPTS, retry_at)
+            DELETION_JOBS.inc(entity=job.entity, result="failed" if failed else "retry")
+            return True
+
+        DELETION_JOBS.inc(entity=job.entity, result="done")
+        invalidate_caches(job.entity, job.entity_id)
+        if job.entity == CHARACTER_JOB:
+            self.remove_orphan_avatars()
+        logging.info("删除任务 %s 执行完成", job_id)
+        return True
+
+    def remove_orphan_avatars(self, directory: Optional[Path] = None) -> int:
+        """
+        删除没有角色引用的头像文件，跳过最近 ORPHAN_AVATAR_GRACE_SECONDS 秒内修改的文件（可能刚上传还没有保存到角色上）
+
+        :return: 删除的头像数量
+        """
+        directory = directory or avatar_dir()
+        if not directory.is_dir():
+            return 0
+        referenced = self.deletion_mapper.referenced_avatars()
+        deadline = time.time() - AppConfig.ORPHAN_AVATAR_GRACE_SECONDS
+        removed = 0
+        for path in directory.iterdir():
+            if path.is_file() and path.name not in referenced and path.stat().st_mtime < deadline:
+                remove_avatar_files(path.name, directory)
+                removed += 1
+        if removed:
+            logging.info("已删除 %d 个没有角色引用的头像", removed)
+        return removed
+
+
+class DeletionWorker:
+    """
+    后台线程依次执行删除任务，没有任务时等待唤醒或每 DELETE_POLL_SECONDS 秒检查一次其他进程创建的任务
+    """
+
+    def __init__(self, service: DeletionService):
+        self.service = service
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopped = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="quicknovel-deletion", daemon=True)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            try:
+                if self.service.run_next_job(self.owner, self._stopped):
+                    continue
+            except Exception as e:
+                logging.error("领取删除任务失败: %s", e)
+            self._wakeup.wait(AppConfig.DELETE_POLL_SECONDS)
+
+    def start(self):
+        self._thread.start()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+
+
+_worker: Optional[DeletionWorker] = None
+
+
+def start_deletion_worker():
+    """
+    启动后台删除线程，需要在生成数据库映射之后调用
+    """
+    global _worker
+    if _worker is not None:
+        return
+    _worker = DeletionWorker(DeletionService(DeletionMapper()))
+    _worker.start()
+
+
+def wake_deletion_worker():
+    if _worker is not None:
+        _worker.wake()
+
+
+def stop_deletion_worker():
+    global _worker
+    if _worker is not None:
+        _worker.stop()
+        _worker = None
@@ -0,0 +1,300 @@
+"""
+模型生成的限流和公平调度，位于 ProviderService 之前
+
+对话接口在写入用户消息之前调用 admit 检查限流，被拒绝的请求不写入任何数据；通过后在流式响应中用 slot 等待生成名额：
+1. 限流：按客户端和按小说各一个令牌桶，每次生成消耗一个令牌。任一桶没有令牌时返回 429，
+   Retry-After 为两个桶中较晚补充出令牌的时间。同一客户端等待中的生成超过 CLIENT_GENERATION_QUEUE_LIMIT 时也返回 429，
+   等待中包括已经通过 admit、还没有进入 slot 的请求，admit 时预留位置，进入 slot 时转为排队
+2. 调度：同时调用模型的生成数量不超过 GENERATION_CONCURRENCY，超出的生成按客户端分别排队。名额空出时按平滑加权轮询
+   （与 nginx upstream 的算法相同）在有排队的客户端之间选择，客户端内部先到先得。一个客户端同时发起大量生成时
+   只占用按权重分到的份额，其他客户端不会一直排在它后面
+
+客户端由请求头 X-Client-Id 标识，没有时使用客户端地址。限流和排队只在进程内生效，多进程部署时每个进程分别计算。
+"""
+import asyncio
+import functools
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, Optional
+
+from core.utils import AppConfig
+from core.utils.CustomizeException import RateLimitError
+from core.utils.LogConfig import get_logger
+from core.utils.Metrics import Counter, Gauge, Histogram
+
+logging = get_logger(__name__)
+
+CLIENT_HEADER = "x-client-id"
+
+GENERATION_QUEUED = Gauge("quicknovel_generation_queued", "排队等待生成名额的请求数")
+GENERATION_ACTIVE = Gauge("quicknovel_generation_active", "正在调用模型的生成数")
+GENERATION_QUEUE_WAIT = Histogram("quicknovel_generation_queue_wait_seconds", "等待生成名额的时间（秒）")
+GENERATION_ADMITTED = Counter("quicknovel_generation_admitted_total", "通过限流的生成数")
+GENERATION_REJECTED = Counter("quicknovel_generation_rejected_total", "被限流拒绝的生成数", ["reason"])
+
+# 令牌桶数量超过该值时清理已经补满的桶，空闲的客户端和小说不会一直占用内存
+_SWEEP_SIZE = 1024
+# admit 预留的位置最多保留的时间（秒）。请求通常在毫秒内进入 slot，客户端在响应开始前断开时流式响应不会执行，
+# 预留的位置到期后不再计入排队数量
+_RESERVATION_SECONDS = 60
+
+
+def client_key(request) -> str:
+    """
+    请求的客户端标识
+    """
+    client_id = request.headers.get(CLIENT_HEADER)
+    if client_id:
+        return client_id
+    return request.client.host if request.client else "unknown"
+
+
+def parse_weights(config: str) -> Dict[str, int]:
+    """
+    解析客户端的权重，格式为 "客户端=权重,客户端=权重"
+    """
+    weights = {}
+    for item in config.split(","):
+        if "=" not in item:
+            continue
+        name, weight = item.rsplit("=", 1)
+        weights[name.strip()] = max(1, int(weight))
+    return weights
+
+
+class TokenBucket:
+    """
+    令牌桶，容量为 burst，每秒补充 rate 个令牌
+    """
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """
+        距离桶中有一个令牌还需要的秒数，有令牌时为 0
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class GenerationScheduler:
+    """
+    :param concurrency: 同时调用模型的生成数量上限，0 表示不限制
+    :param client_rate: 每个客户端每分钟的生成数量，0 表示不限制
+    :param novel_rate: 每部小说每分钟的生成数量，0 表示不限制
+    :param client_queue_limit: 每个客户端最多排队的生成数量，0 表示不限制
+    :param weights: 客户端的权重，未配置的客户端为 1
+    :param clock: 令牌桶使用的时钟，模拟时可以替换
+    """
+
+    def __init__(self, concurrency: int, client_rate: float, client_burst: int, novel_rate: float,
+                 novel_burst: int, client_queue_limit: int, weights: Dict[str, int] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.concurrency = concurrency
+        self.client_rate = client_rate / 60
+        self.client_burst = client_burst
+        self.novel_rate = novel_rate / 60
+        self.novel_burst = novel_burst
+        self.client_queue_limit = client_queue_limit
+        self.weights = weights or {}
+        self._clock = clock
+
+        # admit 在线程池中执行，slot 在事件循环中执行，共用一把锁
+        self._lock = threading.Lock()
+        self._client_buckets: Dict[str, TokenBucket] = {}
+        self._novel_buckets: Dict[int, TokenBucket] = {}
+        # 客户端 -> 排队中的请求，只保存有排队的客户端
+        self._queues: Dict[str, Deque[asyncio.Future]] = {}
+        # 客户端 -> 已通过 admit、还没有进入 slot 的请求预留位置的到期时间，按时间先后排列
+        self._reserved: Dict[str, Deque[float]] = {}
+        # 平滑加权轮询中各客户端的当前权重
+        self._current_weights: Dict[str, int] = {}
+        self._active = 0
+        # 最近生成占用名额的平均时间（秒），用于估算排队已满时的 Retry-After
+        self._average_seconds = 5.0
+
+    def admit(self, client: str, novel_id: Optional[int] = None):
+        """
+        检查并消耗客户端和小说的令牌，超出限制时抛出 RateLimitError。通过时为请求预留一个排队位置，由 slot 取用
+        """
+        with self._lock:
+            now = self._clock()
+            queued = self._reservations(client, now) + len(self._queues.get(client, ()))
+            if self.client_queue_limit and queued >= self.client_queue_limit:
+                self._reject("client_queue", self._average_seconds,
+                             f"客户端排队的生成已达到上限{self.client_queue_limit}个，请稍后重试")
+
+            buckets = []
+            if self.client_rate > 0:
+                buckets.append(("client_rate", self._bucket(self._client_buckets, client, self.client_rate,
+                                                            self.client_burst, now)))
+            if self.novel_rate > 0 and novel_id is not None:
+                buckets.append(("novel_rate", self._bucket(self._novel_buckets, novel_id, self.novel_rate,
+                                                           self.novel_burst, now)))
+            waits = [(bucket.wait_time(now), reason) for reason, bucket in buckets]
+            wait, reason = max(waits, default=(0.0, ""))
+            if wait > 0:
+                target = "客户端" if reason == "client_rate" else f"小说 ID {novel_id}"
+                self._reject(reason, wait, f"{target}发起生成的频率超过限制，请稍后重试")
+            for _, bucket in buckets:
+                bucket.take()
+            self._reserved.setdefault(client, deque()).append(now + _RESERVATION_SECONDS)
+        GENERATION_ADMITTED.inc()
+
+    @asynccontextmanager
+    async def slot(self, client: str):
+        """
+        等待生成名额，退出时交给下一个排队的请求
+        """
+        start = time.perf_counter()
+        await self._acquire(client)
+        granted = time.perf_counter()
+        GENERATION_QUEUE_WAIT.observe(granted - start)
+        GENERATION_ACTIVE.inc()
+        try:
+            yield
+        finally:
+            GENERATION_ACTIVE.dec()
+            with self._lock:
+                # 平滑的平均值，估算一个名额多久会空出来
+                self._average_seconds = 0.8 * self._average_seconds + 0.2 * (time.perf_counter() - granted)
+                self._release()
+
+    def queued(self, client: str = None) -> int:
+        with self._lock:
+            if client is not None:
+                return len(self._queues.get(client, ()))
+            return sum(len(queue) for queue in self._queues.values())
+
+    async def _acquire(self, client: str):
+        with self._lock:
+            # admit 预留的位置转为排队或直接分到名额
+            reserved = self._reserved.get(client)
+            if reserved:
+                reserved.popleft()
+                if not reserved:
+                    del self._reserved[client]
+            if self.concurrency <= 0:
+                return
+            if self._active < self.concurrency and not self._queues:
+                self._active += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._queues.setdefault(client, deque()).append(waiter)
+        GENERATION_QUEUED.inc()
+        try:
+            # 名额由 _release 直接转交，_active 不变
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.done() and not waiter.cancelled():
+                    # 已分到名额但请求被取消（客户端断开），交给下一个
+                    self._release()
+                else:
+                    self._remove(client, waiter)
+            raise
+        finally:
+            GENERATION_QUEUED.dec()
+
+    def _release(self):
+        if self.concurrency <= 0:
+            return
+        waiter = self._next_waiter()
+        if waiter is not None:
+            waiter.set_result(None)
+        else:
+            self._active -= 1
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        """
+        平滑加权轮询：每次选择时所有排队的客户端加上自己的权重，选中当前权重最大的客户端，再减去权重之和
+        """
+        while self._queues:
+            total, chosen = 0, None
+            for client in self._queues:
+                weight = self.weights.get(client, 1)
+                self._current_weights[client] = self._current_weights.get(client, 0) + weight
+                total += weight
+                if chosen is None or self._current_weights[client] > self._current_weights[chosen]:
+                    chosen = client
+            self._current_weights[chosen] -= total
+
+            queue = self._queues[chosen]
+            waiter = queue.popleft()
+            if not queue:
+                del self._queues[chosen]
+                self._current_weights.pop(chosen, None)
+            # 已取消的请求还没来得及从队列中移除时跳过
+            if not waiter.done():
+                return waiter
+        return None
+
+    def _remove(self, client: str, waiter: asyncio.Future):
+        queue = self._queues.get(client)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[client]
+            self._current_weights.pop(client, None)
+
+    def _reservations(self, client: str, now: float) -> int:
+        """
+        客户端预留的位置数量，先清理到期的预留
+        """
+        if len(self._reserved) >= _SWEEP_SIZE:
+            for key in [k for k, r in self._reserved.items() if r[-1] <= now]:
+                del self._reserved[key]
+        reserved = self._reserved.get(client)
+        if not reserved:
+            return 0
+        while reserved and reserved[0] <= now:
+            reserved.popleft()
+        if not reserved:
+            del self._reserved[client]
+        return len(reserved)
+
+    def _bucket(self, buckets: dict, key, rate: float, burst: int, now: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= _SWEEP_SIZE:
+                for full in [k for k, b in buckets.items() if b.is_full(now)]:
+                    del buckets[full]
+            bucket = buckets[key] = TokenBucket(rate, burst, now)
+        return bucket
+
+    @staticmethod
+    def _reject(reason: str, wait: float, message: str):
+        GENERATION_REJECTED.inc(reason=reason)
+        logging.warning("生成被限流: %s，%.1f 秒后可重试", reason, wait)
+        raise RateLimitError(message, reason, max(1, math.ceil(wait)))
+
+
+@functools.lru_cache(maxsize=None)
+def get_generation_scheduler() -> GenerationScheduler:
+    """
+    进程内共用的调度器
+    """
+    return GenerationScheduler(
+        concurrency=AppConfig.GENERATION_CONCURRENCY,
+        client_rate=AppConfig.CLIENT_GENERATION_RATE,
+        client_burst=AppConfig.CLIENT_GENERATION_BURST,
+        novel_rate=AppConfig.NOVEL_GENERATION_RATE,
+        novel_burst=AppConfig.NOVEL_GENERATION_BURST,
+        client_queue_limit=AppConfig.CLIENT_GENERATION_QUEUE_LIMIT,
+        weights=parse_weights(AppConfig.CLIENT_GENERATION_WEIGHTS),
+    )
@@ -0,0 +1,281 @@
+"""
+后台模型任务
+
+总结章节、批量起草情景等耗时较长的模型调用不适合放在对话接口的流式响应中，改为创建后台任务：
+接口创建任务后立即返回任务 id，客户端通过 GET /api/job/{job_id} 轮询进度和结果。
+
+任务类型通过 register_job_handler 注册，执行函数为 async def handler(context: JobContext) -> dict，
+参数为 context.params，返回值作为任务结果保存，执行过程中通过 context.progress 更新进度，
+数据库操作通过 context.run 放到线程池中执行。
+执行函数抛出异常时任务按 JOB_RETRY_BASE_SECONDS 指数退避后重试，达到 JOB_MAX_ATTEMPTS 次后标记为失败，
+抛出 JobAbortError 时（例如参数错误）直接标记为失败。
+
+JobRunner 在服务的事件循环中运行 JOB_CONCURRENCY 个执行协程，数据库操作放到线程池中执行。与后台删除任务相同，
+任务通过数据库中的租约分配（见 LlmJobMapper），执行期间定期延长租约，多进程部署时每个进程都有一个 JobRunner。
+任务通常在写入它依赖的章节、情景后立即创建，执行时副本可能还没有同步这些数据，因此执行函数中的读取只访问主库。
+"""
+import asyncio
+import functools
+import math
+import os
+import socket
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from core.entity.ResponseEntity import success, ResponseModel
+from core.entity.dto.LlmJobDto import ClaimedLlmJobDto, CreateLlmJobDto, ResponseLlmJobDto
+from core.mapper.LlmJobMapper import LlmJobMapper, LlmJobMapperInterface
+from core.mapper.config.ReadReplica import require_position
+from core.utils import AppConfig
+from core.utils.CustomizeException import UnknownJobError
+from core.utils.LogConfig import get_logger
+from core.utils.Metrics import Counter, Gauge, Histogram
+from core.utils.Tracer import traced
+
+logging = get_logger(__name__)
+
+LLM_JOBS = Counter("quicknovel_llm_jobs_total", "后台模型任务的执行结果", ["kind", "result"])
+LLM_JOBS_RUNNING = Gauge("quicknovel_llm_jobs_running", "正在执行的后台模型任务数")
+LLM_JOB_SECONDS = Histogram("quicknovel_llm_job_seconds", "后台模型任务单次执行的耗时（秒）", ["kind"],
+                            buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800))
+
+JobHandler = Callable[["JobContext"], Awaitable[Dict[str, Any]]]
+
+# 任务类型 -> 创建执行函数的工厂，每次执行任务时调用一次，与接口的 Depends 相同，压测时可以替换为使用假模型的实现
+JOB_HANDLERS: Dict[str, Callable[[], JobHandler]] = {}
+
+
+def register_job_handler(kind: str, factory: Callable[[], JobHandler]):
+    JOB_HANDLERS[kind] = factory
+
+
+class JobAbortError(Exception):
+    """
+    任务无法完成（参数错误、引用的数据不存在等），不再重试
+    """
+
+
+class JobLostError(Exception):
+    """
+    任务的租约已过期并由其他进程接手，当前进程停止执行
+    """
+
+
+class JobContext:
+    """
+    传给执行函数的任务信息
+    """
+
+    def __init__(self, job: ClaimedLlmJobDto, owner: str, job_mapper: LlmJobMapperInterface):
+        self.job_id = job.job_id
+        self.kind = job.kind
+        self.params = job.params
+        self.novel_id = job.novel_id
+        self.attempt = job.attempt
+        self.owner = owner
+        self.job_mapper = job_mapper
+        # 租约已被其他进程接手
+        self.lost = False
+
+    async def progress(self, progress: float, message: str = None):
+        """
+        更新进度（0 ~ 1）并延长租约，任务已由其他进程接手时抛出 JobLostError
+        """
+        alive = await asyncio.get_running_loop().run_in_executor(
+            None, self.job_mapper.update_progress, self.job_id, self.owner, min(max(progress, 0.0), 1.0), message,
+            AppConfig.JOB_LEASE_SECONDS)
+        if not alive:
+            self.lost = True
+            raise JobLostError(f"任务 {self.job_id} 已由其他进程执行")
+
+    @staticmethod
+    async def run(func: Callable[..., Any], *args) -> Any:
+        """
+        在线程池中执行数据库操作，只读取主库。run_in_executor 不会把当前上下文带到线程中，
+        因此在线程内设置 require_position
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(_on_primary, func, *args))
+
+
+def _on_primary(func: Callable[..., Any], *args) -> Any:
+    with require_position(math.inf):
+        return func(*args)
+
+
+def retry_delay(attempt: int) -> float:
+    """
+    第 attempt 次执行失败后等待的秒数
+    """
+    return min(AppConfig.JOB_RETRY_BASE_SECONDS * 2 ** (attempt - 1), AppConfig.JOB_RETRY_MAX_SECONDS)
+
+
+class JobService:
+    def __init__(self, job_mapper: LlmJobMapperInterface):
+        self.job_mapper = job_mapper
+
+    @traced()
+    def create_job(self, job: CreateLlmJobDto) -> ResponseModel[ResponseLlmJobDto]:
+        if job.kind not in JOB_HANDLERS:
+            logging.warning("不支持的后台任务类型: %s", job.kind)
+            raise UnknownJobError(job.kind)
+        created = self.job_mapper.create_job(job)
+        wake_job_runner()
+        return success(data=created, message=f"已创建后台任务，任务id为{created.job_id}")
+
+    @traced()
+    def get_job(self, job_id: int) -> ResponseModel[ResponseLlmJobDto]:
+        return success(data=self.job_mapper.get_job(job_id))
+
+    @traced()
+    def get_jobs_by_novel_id(self, novel_id: int) -> ResponseModel[List[ResponseLlmJobDto]]:
+        jobs = self.job_mapper.get_jobs_by_novel_id(novel_id)
+        return success(data=jobs, message=f"获取小说 ID 为{novel_id}的后台任务成功，共{len(jobs)}个")
+
+    async def run_next_job(self, owner: str) -> bool:
+        """
+        领取并执行一个任务。执行协程被取消（服务停止）时把任务放回队列
+
+        :return: 是否领取到了任务
+        """
+        loop = asyncio.get_running_loop()
+        job = await loop.run_in_executor(None, self.job_mapper.claim_next_job, owner, AppConfig.JOB_LEASE_SECONDS)
+        if job is None:
+            return False
+
+        logging.info("开始执行后台任务 %s，类型为%s，第%d次执行", job.job_id, job.kind, job.attempt)
+        context = JobContext(job, owner, self.job_mapper)
+        factory = JOB_HANDLERS.get(job.kind)
+        start = time.perf_counter()
+        LLM_JOBS_RUNNING.inc()
+        handler = keeper = None
+        try:
+            if factory is None:
+                raise JobAbortError(f"不支持的后台任务类型{job.kind}")
+            # 执行函数的任务复制创建时的上下文，在事件循环中的读取同样只访问主库
+            with require_position(math.inf):
+                handler = asyncio.create_task(factory()(context))
+            keeper = asyncio.create_task(self._keep_lease(context, handler))
+            result = await handler
+        except (JobLostError, asyncio.CancelledError) as e:
+            if context.lost:
+                LLM_JOBS.inc(kind=job.kind, result="lost")
+                logging.warning("后台任务 %s 已由其他进程执行", job.job_id)
+                return True
+            if isinstance(e, asyncio.CancelledError):
+                await loop.run_in_executor(None, self.job_mapper.release_job, job.job_id, owner)
+                logging.info("后台任务 %s 已放回队列", job.job_id)
+            raise
+        except Exception as e:
+            abort = isinstance(e, JobAbortError)
+            logging.error("后台任务 %s 执行失败: %s", job.job_id, e)
+            retry_at = datetime.now().timestamp() + retry_delay(job.attempt)
+            failed = await loop.run_in_executor(None, self.job_mapper.fail_job, job.job_id, owner, str(e),
+                                                0 if abort else AppConfig.JOB_MAX_ATTEMPTS, retry_at)
+            LLM_JOBS.inc(kind=job.kind, result="failed" if failed else "retry")
+            return True
+        finally:
+            if keeper is not None:
+                keeper.cancel()
+            LLM_JOBS_RUNNING.dec()
+            LLM_JOB_SECONDS.observe(time.perf_counter() - start, kind=job.kind)
+
+        completed = await loop.run_in_executor(None, self.job_mapper.complete_job, job.job_id, owner, result or {})
+        LLM_JOBS.inc(kind=job.kind, result="done" if completed else "lost")
+        logging.info("后台任务 %s 执行完成", job.job_id)
+        return True
+
+    async def _keep_lease(self, context: JobContext, handler: asyncio.Task):
+        """
+        每隔三分之一租约延长一次，执行函数长时间等待模型回复时任务也不会被其他进程接手
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(AppConfig.JOB_LEASE_SECONDS / 3)
+            alive = await loop.run_in_executor(None, self.job_mapper.update_progress, context.job_id, context.owner,
+                                               None, None, AppConfig.JOB_LEASE_SECONDS)
+            if not alive:
+                context.lost = True
+                handler.cancel()
+                return
+
+
+class JobRunner:
+    """
+    在事件循环中运行 concurrency 个执行协程，没有任务时等待唤醒或每 JOB_POLL_SECONDS 秒检查一次
+    其他进程创建的任务和到期重试的任务
+    """
+
+    def __init__(self, service: JobService, concurrency: int):
+        self.service = service
+        self.concurrency = concurrency
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                if await self.service.run_next_job(self.owner):
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error("领取后台任务失败: %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), AppConfig.JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """
+        需要在事件循环中调用
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._workers = [self._loop.create_task(self._run(), name=f"quicknovel-job-{i}")
+                         for i in range(self.concurrency)]
+
+    def wake(self):
+        """
+        可以在线程池中调用
+        """
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+_runner: Optional[JobRunner] = None
+
+
+def start_job_runner(service: JobService = None, concurrency: int = None):
+    """
+    启动后台任务的执行协程，需要在生成数据库映射之后、在事件循环中调用
+    """
+    global _runner
+    if _runner is not None:
+        return
+    _runner = JobRunner(service or JobService(LlmJobMapper()),
+                        concurrency if concurrency is not None else AppConfig.JOB_CONCURRENCY)
+    _runner.start()
+
+
+def wake_job_runner():
+    if _runner is not None:
+        _runner.wake()
+
+
+async def stop_job_runner():
+    """
+    正在执行的任务放回队列，下次启动或由其他进程继续执行
+    """
+    global _runner
+    if _runner is not None:
+        runner, _runner = _runner, None
+        await runner.stop()
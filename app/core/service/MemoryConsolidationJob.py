@@ -0,0 +1,91 @@
+"""
+整理角色记忆的后台任务
+
+任务类型 memory_consolidation，任务需要指定 novel_id，没有参数。对小说关联的每个角色，
+把上次整理之后的对话和角色已有的记忆交给模型，整理为新的记忆和当前状态，保存到 CharacterNovelEntity.memory、status，
+并记录已整理到的对话 id（memory_until）。之后的对话 prompt 只发送记忆和还没整理的对话，见 ProviderService。
+任务由 MemoryService 在小说新增 MEMORY_CONSOLIDATION_TURNS 轮对话后创建。
+"""
+from typing import Any, Dict, List, Tuple
+
+from core.mapper.CharacterNovelMapper import CharacterNovelMapperInterface
+from core.mapper.NovelMapper import NovelMapperInterface
+from core.service.JobService import JobAbortError, JobContext
+from core.service.PromptLayout import chapter_prompt, scene_prompt
+from core.service.ProviderService import ProviderService
+from core.utils.LogConfig import get_logger
+
+logging = get_logger(__name__)
+
+MEMORY_CONSOLIDATION = "memory_consolidation"
+
+MEMORY_PROMPT = "你是小说的记录员，负责维护角色{name}在这部小说中的记忆。下面是该角色已有的记忆和之后新发生的对话，" \
+                "请只保留{name}亲历或得知的事件、与其他角色关系的变化、做出的承诺和未解决的悬念，合并为新的记忆，" \
+                "不超过500字；再用一句话写出{name}当前的状态（位置、身体和情绪）。\n" \
+                "按以下格式输出，不要输出其他内容：\n记忆：...\n状态：..."
+
+
+def parse_memory(text: str) -> Tuple[str, str]:
+    """
+    把模型的回复拆分为记忆和状态，没有按格式输出时全部作为记忆
+    """
+    memory, _, status = text.partition("状态：")
+    memory = memory.strip()
+    if memory.startswith("记忆："):
+        memory = memory[len("记忆："):].strip()
+    return memory, status.strip()
+
+
+def new_conversations(novel, after: int) -> Tuple[str, int]:
+    """
+    按章节、情景顺序拼接 id 大于 after 的对话
+
+    :return: 对话文本和其中最大的对话 id
+    """
+    parts: List[str] = []
+    last = after
+    for chapter in novel.chapter or []:
+        for scene in chapter.scene or []:
+            conversations = [conv for conv in scene.conversation or [] if conv.conversation_id > after]
+            if not conversations:
+                continue
+            parts.append(chapter_prompt(novel, chapter) + scene_prompt(scene))
+            parts.extend(f"{conv.role}: {conv.content}" for conv in conversations)
+            last = max(last, max(conv.conversation_id for conv in conversations))
+    return "\n".join(parts), last
+
+
+class MemoryConsolidationJob:
+    def __init__(self, novel_mapper: NovelMapperInterface, character_novel_mapper: CharacterNovelMapperInterface,
+                 provider_service: ProviderService):
+        self.novel_mapper = novel_mapper
+        self.character_novel_mapper = character_novel_mapper
+        self.provider_service = provider_service
+
+    async def __call__(self, context: JobContext) -> Dict[str, Any]:
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        if context.novel_id is None:
+            raise JobAbortError("整理角色记忆需要指定 novel_id")
+
+        novel = await context.run(self.novel_mapper.get_novel_by_id, context.novel_id)
+        memories = await context.run(self.character_novel_mapper.get_character_memories, context.novel_id)
+
+        results = []
+        for i, character in enumerate(memories):
+            transcript, last = new_conversations(novel, character.memory_until)
+            if not transcript:
+                continue
+            reply = await self.provider_service.generate_completion([
+                SystemMessage(content=MEMORY_PROMPT.format(name=character.name)),
+                HumanMessage(content=f"已有的记忆：{character.memory or '无'}\n当前状态：{character.status or '未知'}\n\n"
+                                     f"新的对话：\n{transcript}"),
+            ], novel_id=context.novel_id, character_id=character.character_id)
+            memory, status = parse_memory(reply)
+            saved = await context.run(self.character_novel_mapper.save_character_memory,
+                                      context.novel_id, character.character_id, memory, status, last)
+            results.append({"character_id": character.character_id, "memory_until": last, "saved": saved})
+            await context.progress((i + 1) / len(memories), f"已整理角色 {i + 1}/{len(memories)}")
+
+        logging.info("小说 %s 的角色记忆整理完成，共%d个角色", context.novel_id, len(results))
+        return {"characters": results}
@@ -0,0 +1,41 @@
+from typing import List
+
+from core.entity.ResponseEntity import ResponseModel, success
+from core.entity.dto.LlmJobDto import CreateLlmJobDto
+from core.entity.dto.NovelDto import ResponseCharacterMemoryDto
+from core.mapper.CharacterNovelMapper import CharacterNovelMapperInterface
+from core.service.JobService import JobService
+from core.service.MemoryConsolidationJob import MEMORY_CONSOLIDATION
+from core.utils import AppConfig
+from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
+
+logging = get_logger(__name__)
+
+
+class MemoryService:
+    def __init__(self, character_novel_mapper: CharacterNovelMapperInterface, job_service: JobService):
+        self.character_novel_mapper = character_novel_mapper
+        self.job_service = job_service
+
+    @traced()
+    def on_turn(self, novel_id: int):
+        """
+        每轮对话保存回复后调用，小说新增 MEMORY_CONSOLIDATION_TURNS 轮对话时创建整理记忆的后台任务。
+        失败只记录日志，不影响对话
+        """
+        if novel_id is None or AppConfig.MEMORY_CONSOLIDATION_TURNS <= 0:
+            return
+        try:
+            if self.character_novel_mapper.reserve_memory_consolidation(
+                    novel_id, AppConfig.MEMORY_CONSOLIDATION_TURNS * 2):
+                job = self.job_service.create_job(CreateLlmJobDto(kind=MEMORY_CONSOLIDATION, novel_id=novel_id))
+                logging.info("小说 %s 新增对话已达到%d轮，创建整理角色记忆的任务 %s",
+                             novel_id, AppConfig.MEMORY_CONSOLIDATION_TURNS, job.data.job_id)
+        except Exception as e:
+            logging.error("创建整理角色记忆的任务失败: %s", e)
+
+    @traced()
+    def get_character_memories(self, novel_id: int) -> ResponseModel[List[ResponseCharacterMemoryDto]]:
+        memories = self.character_novel_mapper.get_character_memories(novel_id)
+        return success(data=memories, message=f"获取小说 ID 为{novel_id}的角色记忆成功，共{len(memories)}个角色")
@@ -3,28 +3,44 @@ from typing import List
 
 from core.entity.ResponseEntity import success, ResponseModel
 from core.entity.dto.NovelDto import CreateNovelDto, ResponseAllNovelDto, ResponseNovelDto
+from core.mapper.CharacterNovelMapper import CharacterNovelMapperInterface
 from core.mapper.NovelMapper import NovelMapperInterface
 from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
 
 logging = get_logger(__name__)
 
 
 class NovelService:
-    def __init__(self, novel_mapper: NovelMapperInterface):
+    def __init__(self, novel_mapper: NovelMapperInterface, character_novel_mapper: CharacterNovelMapperInterface):
         self.novel_mapper = novel_mapper
+        self.character_novel_mapper = character_novel_mapper
 
+    @traced()
     def create_novel(self, novel: CreateNovelDto) -> ResponseModel:
         novel.create_time = datetime.now()
         novel_id = self.novel_mapper.create_novel(novel)
         logging.info(f"创建小说{novel.novel_name}成功，小说id为{novel_id}")
         return success(message=f"创建小说{novel.novel_name}成功，小说id为{novel_id}")
 
+    @traced()
     def get_novel_by_id(self, novel_id: int) -> ResponseModel[ResponseAllNovelDto]:
         novel = self.novel_mapper.get_novel_by_id(novel_id)
         logging.info(f"获取小说 {novel.novel_name} 成功")
         return success(data=novel, message=f"获取小说 {novel.novel_name} 成功")
 
+    @traced()
     def get_all_novels(self) -> ResponseModel[List[ResponseNovelDto]]:
         novels = self.novel_mapper.get_all_novels()
         logging.info(f"获取全部小说成功，数量为 {len(novels)}")
         return success(data=novels, message=f"获取全部小说成功，数量为 {len(novels)}")
+
+    @traced()
+    def get_novel_summary(self, novel_id: int) -> ResponseModel[ResponseNovelDto]:
+        novel = self.novel_mapper.get_novel_summary(novel_id)
+        return success(data=novel, message=f"获取小说 {novel.novel_name} 的汇总信息成功")
+
+    @traced()
+    def disconnect_character(self, novel_id: int, character_id: int) -> ResponseModel:
+        self.character_novel_mapper.disconnect_character_from_novel(novel_id, character_id)
+        return success(message=f"成功取消角色 {character_id} 与小说 {novel_id} 的关联")
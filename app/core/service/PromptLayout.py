@@ -0,0 +1,108 @@
+"""
+对话 prompt 的固定布局
+
+模型服务商的前缀缓存（例如 DeepSeek 的上下文硬盘缓存）只对与之前请求逐字节相同的开头部分生效，
+因此 prompt 按固定的顺序分为三部分，相邻两轮对话之间，上一轮的全部消息是下一轮的前缀：
+1. 系统提示：固定文本
+2. 角色：按角色 id 排序，每个角色一条消息，子表数据按 id 排序（见 CharacterMapper），只在修改或关联角色时变化。
+   之后是已整理的角色记忆，同样按角色 id 排序，只在后台整理记忆后变化（见 MemoryConsolidationJob）
+3. 历史：按章节号、情景 id、对话 id 排列，新的对话只追加在末尾。本轮用户的输入已先写入数据库，是历史的最后一条。
+   有角色记忆时只包含还没整理进记忆的对话和最近几轮已整理的对话，两次整理之间同样只在末尾追加
+
+以情景为中心构建 prompt 时（AppConfig.PROMPT_SCOPE 为 scene），角色只包含当前情景和父情景的对话中出现的角色，
+历史依次为章节信息（含父章节和同章节其他情景的摘要，见 scene_context_prompt）、父情景和最近几轮对话、当前情景的全部对话。
+在同一情景中对话时同样只在末尾追加；有新角色参与对话或其他情景有新的对话时，从变化的位置开始缓存失效
+
+消息文本只由这里的模板生成，不包含时间等每轮变化的内容。修改模板会使服务商已有的缓存全部失效。
+检查见 benchmark/PromptPrefixCheck.py
+"""
+from typing import List
+
+SYSTEM_PROMPT = """你是一个交互式小说系统，负责扮演故事中的所有角色，并生成对应的交互和场景描述。
+- 每个角色的知识有限，没有角色能完全了解其他角色或事件的真相。
+- 用户可以扮演任何角色，也可以作为上帝视角。
+- 角色应保持一致的性格，展现多样化的情感和反应，避免单一化刻画。
+- 场景描述应包括环境细节、氛围和感官体验，以营造沉浸感。
+- 角色应具有清晰的关系网络和互动模式。
+- 对话应反映每个角色的独特语言风格、词汇习惯和思维方式。
+- 角色应有自己的目标、恐惧和动机，这些会影响他们的决策。
+- 场景应具有连贯性，角色反应需考虑过往互动和个人背景。
+- 对话字数不能过少，时刻注意章节和情景设定，事件之间不能自相矛盾。"""
+
+
+def sort_characters(characters: List) -> List:
+    """
+    关联角色按角色 id 排序，与查询返回的顺序无关
+    """
+    return sorted(characters, key=lambda character: character.id)
+
+
+def character_prompt(character) -> str:
+    prompt = f"角色名称: {character.name}\n"
+    prompt += f"描述: {character.description}\n\n"
+
+    prompt += "背景故事:\n"
+    prompt += f"{character.background_story}\n\n"
+
+    prompt += "性格特征:\n"
+    for trait in character.trait:
+        prompt += f"- {trait.label}: {trait.description}\n"
+    prompt += "\n"
+
+    prompt += "标志性特征:\n"
+    for distinctive in character.distinctive:
+        prompt += f"- {distinctive.name}: {distinctive.content}\n"
+    prompt += "\n"
+
+    prompt += "对话示例:\n"
+    for speak in character.speak:
+        prompt += f"{speak.role}: {speak.content}\n"
+        prompt += f"回复: {speak.reply}\n"
+    return prompt
+
+
+def memory_prompt(memory) -> str:
+    return f"### 角色记忆\n" \
+           f"- **角色名称**: {memory.name}\n" \
+           f"- **记忆**: {memory.memory}\n" \
+           f"- **当前状态**: {memory.status or '未知'}\n"
+
+
+def chapter_prompt(novel, chapter) -> str:
+    chapter_title = chapter.chapter_title or f"章节 {chapter.chapter_number}"
+    chapter_desc = chapter.chapter_desc or "无描述"
+    return f"### 情景信息\n" \
+           f"#### 小说信息\n" \
+           f"- **名字**: {novel.novel_name}\n" \
+           f"- **描述**: {novel.novel_desc}\n\n" \
+           f"#### 章节信息\n" \
+           f"- **章节**: {chapter_title}\n" \
+           f"- **描述**: {chapter_desc}\n\n"
+
+
+def scene_context_prompt(context) -> str:
+    """
+    当前情景所在章节的信息，附带父章节和同章节其他情景的摘要，context 为 ResponseSceneContextDto
+    """
+    prompt = chapter_prompt(context, context.chapter)
+    if context.ancestor_chapters:
+        prompt += "#### 前情章节\n"
+        for chapter in context.ancestor_chapters:
+            prompt += f"- **{chapter.chapter_title or f'章节 {chapter.chapter_number}'}**: " \
+                      f"{chapter.chapter_desc or '无描述'}\n"
+        prompt += "\n"
+    if context.siblings:
+        prompt += "#### 本章其他情景\n"
+        for scene in context.siblings:
+            prompt += f"- **{scene.scene_name}**: {scene.scene_desc or '无描述'}"
+            if scene.last_content:
+                prompt += f"（最近：{scene.last_content}）"
+            prompt += "\n"
+        prompt += "\n"
+    return prompt
+
+
+def scene_prompt(scene) -> str:
+    return f"#### 情景信息\n" \
+           f"- **情景名称**: {scene.scene_name}\n" \
+           f"- **情景描述**: {scene.scene_desc or '无描述'}\n"
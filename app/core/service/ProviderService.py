@@ -1,15 +1,83 @@
 import asyncio
-from typing import AsyncGenerator, List
-
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from langchain_openai import ChatOpenAI
-
+import functools
+import time
+from datetime import datetime
+from typing import AsyncGenerator, List, Optional, TYPE_CHECKING
+
+from core.entity.dto.NovelDto import ResponseCharacterMemoryDto
+from core.entity.dto.SceneContextDto import ResponseSceneContextDto
+from core.entity.dto.TokenUsageDto import CreateTokenUsageDto
 from core.mapper.CharacterNovelMapper import CharacterNovelMapperInterface
 from core.mapper.NovelMapper import NovelMapperInterface
-from core.utils.LogConfig import get_logger
+from core.mapper.SceneMapper import SceneMapperInterface
+from core.mapper.TokenUsageMapper import TokenUsageMapperInterface
+from core.service.PromptLayout import SYSTEM_PROMPT, character_prompt, chapter_prompt, memory_prompt, scene_prompt, \
+    scene_context_prompt, sort_characters
+from core.utils import AppConfig
+from core.utils.LogConfig import get_logger, log_payload
+from core.utils.Metrics import Counter
+from core.utils.CustomizeException import NotFoundError
+from core.utils.TokenCounter import count_messages_tokens, count_tokens, get_tokenizer
+from core.utils.Tracer import traced, span, record_tokens, record_first_token
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 
 logging = get_logger(__name__)
 
+PROMPT_SECTION_TOKENS = Counter("quicknovel_llm_prompt_section_tokens_total",
+                                "prompt 各部分的 token 数量（本地分词器统计）", ["section"])
+CACHED_PROMPT_TOKENS = Counter("quicknovel_llm_cached_prompt_tokens_total",
+                               "命中服务商前缀缓存的 prompt token 数量（模型返回的用量）")
+
+
+# LangChain 与 OpenAI SDK 导入耗时约 1 秒，只在第一次调用模型时才导入，避免拖慢进程启动
+@functools.lru_cache(maxsize=None)
+def get_chat_model(model: str, streaming: bool, temperature: float, base_url: str) -> "BaseChatModel":
+    """
+    按参数缓存模型客户端，复用底层的 HTTP 连接池，避免每个请求都重新创建
+    """
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=model,
+        streaming=streaming,
+        temperature=temperature,
+        base_url=base_url,
+        # 流式输出时在最后一块数据中返回 token 用量
+        stream_usage=True,
+    )
+
+
+def preload_llm_stack():
+    """
+    预先导入 LangChain 相关模块，在 lifespan 启动阶段提交到线程池，与服务开始接受连接并行执行
+    """
+    import langchain_core.messages  # noqa: F401
+    import langchain_openai  # noqa: F401
+
+    # 加载分词器可能需要读取较大的词表文件
+    get_tokenizer()
+
+
+def conversation_messages(conversations) -> List["AIMessage | HumanMessage"]:
+    """
+    对话转换为 LangChain 消息对象，用户的输入为 HumanMessage，模型的回复为 AIMessage
+    """
+    from langchain_core.messages import HumanMessage, AIMessage
+
+    messages = []
+    for conv in conversations:
+        if conv.role == "user":
+            messages.append(HumanMessage(content=conv.content))
+        elif conv.role == "assistant":
+            messages.append(AIMessage(content=conv.content))
+        # 还可以处理其他角色，例如 "system" 角色
+        # else:
+        #     messages.append(HumanMessage(content=f"{conv.role}: {conv.content}"))
+    return messages
+
 
 class ProviderService:
     def __init__(self,
@@ -18,21 +86,41 @@ class ProviderService:
                  model: str,
                  streaming: bool,
                  temperature: float = 1,
-                 base_url: str = "https://api.deepseek.com/"):
+                 base_url: str = "https://api.deepseek.com/",
+                 llm: "BaseChatModel" = None,
+                 usage_mapper: TokenUsageMapperInterface = None,
+                 scene_mapper: SceneMapperInterface = None):
         self.novel_mapper = novel_mapper
         self.character_novel_mapper = character_novel_mapper
-
-        self.llm = ChatOpenAI(
-            model=model,
-            streaming=streaming,
-            temperature=temperature,
-            base_url=base_url,
-        )
-
-    async def generate_llm_response(self, prompt: str, novel_id: int = None) -> AsyncGenerator[str, None]:
+        # 为空时总是发送整部小说的历史，见 AppConfig.PROMPT_SCOPE
+        self.scene_mapper = scene_mapper
+        # 为空时不记录每轮对话的用量
+        self.usage_mapper = usage_mapper
+
+        self.model = model
+        self.streaming = streaming
+        self.temperature = temperature
+        self.base_url = base_url
+        # 允许注入其他的模型实现，例如压测时使用的假模型
+        self._llm = llm
+
+    @property
+    def llm(self) -> "BaseChatModel":
+        if self._llm is None:
+            self._llm = get_chat_model(self.model, self.streaming, self.temperature, self.base_url)
+        return self._llm
+
+    @traced()
+    async def generate_llm_response(self, prompt: str, novel_id: int = None, scene_id: int = None,
+                                    character_id: int = None) -> AsyncGenerator[str, None]:
         """
         使用 LangChain 的 LLM 生成流式响应。
+
+        指定 scene_id 时以该情景为中心构建 prompt（见 AppConfig.PROMPT_SCOPE），character_id 为本轮对话的角色，
+        两者同时用于记录本轮的用量
         """
+        from langchain_core.messages import HumanMessage, SystemMessage
+
         # 定义提示模板（这里不需要 {novel} 和 {prompt} 占位符，而是直接构建消息列表）
         # system_message 和 user_message 会在构建 messages 列表时直接传入
 
@@ -40,125 +128,258 @@ class ProviderService:
 
         novel_messages = []
         characters_info = []
+        memory_messages = []
         if novel_id is not None:
-            novel_messages = self.generate_scene_messages(novel_id)  # 修改这里，返回消息列表
-            characters_info = self.generate_character_messages(novel_id)
-
-        # 构建最终的 messages 列表
-        messages = [
-            SystemMessage(content="""
-你是一个交互式小说系统，负责扮演故事中的所有角色，并生成对应的交互和场景描述。
-- 每个角色的知识有限，没有角色能完全了解其他角色或事件的真相。
-- 用户可以扮演任何角色，也可以作为上帝视角。
-- 角色应保持一致的性格，展现多样化的情感和反应，避免单一化刻画。
-- 场景描述应包括环境细节、氛围和感官体验，以营造沉浸感。
-- 角色应具有清晰的关系网络和互动模式。
-- 对话应反映每个角色的独特语言风格、词汇习惯和思维方式。
-- 角色应有自己的目标、恐惧和动机，这些会影响他们的决策。
-- 场景应具有连贯性，角色反应需考虑过往互动和个人背景。
-- 对话字数不能过少，时刻注意章节和情景设定，事件之间不能自相矛盾。
-            """)
-        ]
-
-        # 添加角色信息
+            with span("ProviderService.build_prompt"):
+                context = self.get_scene_context(scene_id)
+                if context is not None:
+                    # 只包含当前情景相关的历史和参与对话的角色
+                    characters = self.get_involved_characters(context, character_id)
+                    characters_info = self.generate_character_messages(novel_id, characters)
+                    memories = [memory for memory in self.get_character_memories(novel_id)
+                                if characters is None or memory.character_id in characters]
+                    novel_messages = self.generate_context_messages(context)
+                else:
+                    # 有记忆时历史只包含还没整理进记忆的对话和最近几轮已整理的对话
+                    memories = self.get_character_memories(novel_id)
+                    since = min(memory.memory_until for memory in memories) if memories else 0
+                    novel_messages = self.generate_scene_messages(novel_id, since, AppConfig.MEMORY_RECENT_TURNS * 2)
+                    characters_info = self.generate_character_messages(novel_id)
+                memory_messages = [HumanMessage(content=memory_prompt(memory)) for memory in memories if memory.memory]
+
+        # 构建最终的 messages 列表，顺序见 PromptLayout
+        messages = [SystemMessage(content=SYSTEM_PROMPT)]
+
+        # 添加角色信息和角色记忆
         messages.extend(characters_info)
+        messages.extend(memory_messages)
 
         # 添加历史小说消息
         messages.extend(novel_messages)
 
-        logging.info(f"添加历史小说消息:{novel_messages}")
-        logging.info(f"用户消息:{prompt}")
-
-        async for chunk in self.llm.astream(messages):
-            # 提取 LLM 输出的内容
-            content = chunk.content
-            if content:
-                yield content
-                await asyncio.sleep(0.1)  # 模拟生成延迟，保持与原代码一致
+        logging.info("构建 prompt 完成，角色消息 %d 条，角色记忆 %d 条，历史小说消息 %d 条",
+                     len(characters_info), len(memory_messages), len(novel_messages))
+        log_payload(logging, "历史小说消息", novel_messages)
+        log_payload(logging, "用户消息", prompt)
+
+        # prompt 按系统提示、角色、历史三部分统计 token 数量
+        turn = CreateTokenUsageDto(
+            novel_id=novel_id,
+            scene_id=scene_id,
+            character_id=character_id,
+            model=self.model,
+            system_tokens=count_messages_tokens(message.content for message in messages[:1]),
+            # 角色记忆计入角色部分
+            character_tokens=count_messages_tokens(message.content for message in characters_info + memory_messages),
+            history_tokens=count_messages_tokens(message.content for message in novel_messages),
+            create_time=datetime.now(),
+        )
+        turn.prompt_tokens = turn.system_tokens + turn.character_tokens + turn.history_tokens
+        for section in ("system", "character", "history"):
+            PROMPT_SECTION_TOKENS.inc(getattr(turn, f"{section}_tokens"), section=section)
+
+        completion = []
+        usage = None
+        request_start = time.perf_counter()
+        first_token = True
+        saving = None
+
+        try:
+            with span("ProviderService.llm_stream", prompt_tokens=turn.prompt_tokens,
+                      system_tokens=turn.system_tokens, character_tokens=turn.character_tokens,
+                      history_tokens=turn.history_tokens):
+                async for chunk in self.llm.astream(messages):
+                    if chunk.usage_metadata:
+                        usage = chunk.usage_metadata
+                    # 提取 LLM 输出的内容
+                    content = chunk.content
+                    if content:
+                        if first_token:
+                            turn.first_token_ms = round((time.perf_counter() - request_start) * 1000, 3)
+                            record_first_token(time.perf_counter() - request_start)
+                            first_token = False
+                        completion.append(content)
+                        yield content
+                        await asyncio.sleep(0.1)  # 模拟生成延迟，保持与原代码一致
+        finally:
+            # 客户端中途断开时也记录已生成部分的用量
+            saving = self._finish_turn(turn, "".join(completion), usage, request_start)
+
+        # 正常结束时等待写入完成，中途断开时生成器已被关闭，写入在线程池中继续
+        if saving is not None:
+            await saving
         yield "[DONE]"  # 发送结束标记
 
-    def generate_scene_messages(self, novel_id: int) -> List[AIMessage | HumanMessage]:  # 修改返回类型
+    @traced()
+    async def generate_completion(self, messages: List["BaseMessage"], novel_id: int = None, scene_id: int = None,
+                                  character_id: int = None) -> str:
+        """
+        非流式调用模型并返回完整的回复，用于后台任务。prompt 由调用方构建，用量与对话相同按轮记录，
+        系统消息计入 system_tokens，其余消息计入 history_tokens
+        """
+        system = [m.content for m in messages if m.type == "system"]
+        turn = CreateTokenUsageDto(
+            novel_id=novel_id,
+            scene_id=scene_id,
+            character_id=character_id,
+            model=self.model,
+            system_tokens=count_messages_tokens(system),
+            history_tokens=count_messages_tokens(m.content for m in messages if m.type != "system"),
+            create_time=datetime.now(),
+        )
+        turn.prompt_tokens = turn.system_tokens + turn.history_tokens
+
+        response = None
+        request_start = time.perf_counter()
+        try:
+            with span("ProviderService.llm_invoke", prompt_tokens=turn.prompt_tokens):
+                response = await self.llm.ainvoke(messages)
+        finally:
+            saving = self._finish_turn(turn, response.content if response is not None else "",
+                                       getattr(response, "usage_metadata", None), request_start)
+        if saving is not None:
+            await saving
+        return response.content
+
+    def _finish_turn(self, turn: CreateTokenUsageDto, completion: str, usage: Optional[dict],
+                     request_start: float) -> Optional[asyncio.Future]:
+        """
+        统计本轮的耗时和输出的 token 数量，并在线程池中写入用量
+        """
+        turn.latency_ms = round((time.perf_counter() - request_start) * 1000, 3)
+        turn.completion_tokens = count_tokens(completion)
+        # 优先使用服务端返回的用量，没有时退回本地统计
+        if usage:
+            turn.prompt_tokens = usage.get("input_tokens", turn.prompt_tokens)
+            turn.completion_tokens = usage.get("output_tokens", turn.completion_tokens)
+            turn.provider_usage = True
+            # langchain 把 OpenAI 兼容接口返回的 prompt_tokens_details.cached_tokens 放在 cache_read 中
+            turn.cached_tokens = (usage.get("input_token_details") or {}).get("cache_read") or 0
+            CACHED_PROMPT_TOKENS.inc(turn.cached_tokens)
+        record_tokens(prompt_tokens=turn.prompt_tokens, completion_tokens=turn.completion_tokens)
+        return self._save_usage(turn)
+
+    def _save_usage(self, turn: CreateTokenUsageDto) -> Optional[asyncio.Future]:
+        """
+        在线程池中写入本轮的用量，不阻塞事件循环。写入失败只记录日志，不影响对话
+        """
+        if self.usage_mapper is None:
+            return None
+
+        def save():
+            try:
+                self.usage_mapper.record_usage(turn)
+            except Exception as e:
+                logging.error("记录模型用量失败: %s", e)
+
+        return asyncio.get_running_loop().run_in_executor(None, save)
+
+    @traced()
+    def generate_scene_messages(self, novel_id: int, since: int = 0,
+                                keep: int = 0) -> List["AIMessage | HumanMessage"]:  # 修改返回类型
         """
         将 ResponseAllNovelDto 对象转换为 LangChain 消息列表。
 
         Args:
             novel_id: ResponseAllNovelDto 对象，包含小说、章节、情景和对话信息。
+            since: 已整理进角色记忆的对话 id，大于 0 时只包含之后的对话和之前最近的 keep 条对话，
+                   以及这些对话所在的章节和情景
+            keep: 保留的已整理对话的数量
 
         Returns:
             List[BaseMessage]: 历史对话的 LangChain 消息列表。
         """
+        from langchain_core.messages import HumanMessage
+
         novel = self.novel_mapper.get_novel_by_id(novel_id)
 
         messages = []
 
-        # 遍历章节和情景
+        # 保留的第一条对话的 id
+        first = 0
+        if since:
+            earlier = sorted(conv.conversation_id for chapter in novel.chapter or [] for scene in chapter.scene or []
+                             for conv in scene.conversation or [] if conv.conversation_id <= since)
+            first = earlier[max(len(earlier) - keep, 0)] if keep and earlier else since + 1
+
+        # 遍历章节和情景，章节、情景、对话的顺序由 mapper 保证，新的对话只会出现在末尾
         if novel.chapter:
             for chapter in novel.chapter:
-                chapter_title = chapter.chapter_title or f"章节 {chapter.chapter_number}"
-                chapter_desc = chapter.chapter_desc or "无描述"
-
-                # 添加章节和小说信息作为系统消息或特定的 HumanMessage
-                # 为了简洁，这里直接将它们作为 HumanMessage 的一部分，或者合并到情景描述中
-                # 也可以考虑更复杂的处理方式，例如将它们作为单独的 SystemMessage
-
-                if chapter.scene:
-                    chapter_info = f"### 情景信息\n" \
-                                     f"#### 小说信息\n" \
-                                     f"- **名字**: {novel.novel_name}\n" \
-                                     f"- **描述**: {novel.novel_desc}\n\n" \
-                                     f"#### 章节信息\n" \
-                                     f"- **章节**: {chapter_title}\n" \
-                                     f"- **描述**: {chapter_desc}\n\n"
-
-                    messages.append(HumanMessage(content=chapter_info))  # 将章节信息作为一条用户消息
-
-                    for scene in chapter.scene:
-                        # 情景信息作为 HumanMessage 的一部分
-                        scene_info = f"#### 情景信息\n" \
-                                     f"- **情景名称**: {scene.scene_name}\n" \
-                                     f"- **情景描述**: {scene.scene_desc or '无描述'}\n"
-
-                        messages.append(HumanMessage(content=scene_info))  # 将情景信息作为一条用户消息
+                scenes = [(scene, [conv for conv in scene.conversation or [] if conv.conversation_id >= first])
+                          for scene in chapter.scene or []]
+                if first:
+                    # 只使用记忆时省略没有保留对话的情景
+                    scenes = [(scene, conversations) for scene, conversations in scenes if conversations]
+                if scenes:
+                    # 章节和小说信息作为一条用户消息
+                    messages.append(HumanMessage(content=chapter_prompt(novel, chapter)))
+
+                    for scene, conversations in scenes:
+                        # 情景信息作为一条用户消息
+                        messages.append(HumanMessage(content=scene_prompt(scene)))
 
                         # 对话信息转换为 LangChain 消息对象
-                        if scene.conversation:
-                            for conv in scene.conversation:
-                                if conv.role == "user":
-                                    messages.append(HumanMessage(content=conv.content))
-                                elif conv.role == "assistant":
-                                    messages.append(AIMessage(content=conv.content))
-                                # 还可以处理其他角色，例如 "system" 角色
-                                # else:
-                                #     messages.append(HumanMessage(content=f"{conv.role}: {conv.content}"))
+                        messages.extend(conversation_messages(conversations))
 
         return messages
 
-    def generate_character_messages(self, novel_id: int) -> List[HumanMessage]:
-        characters = self.character_novel_mapper.get_connect_characters_by_novel_id(novel_id)
-        messages = []
-        for character in characters:
-            prompt = f"角色名称: {character.name}\n"
-
-            prompt += f"描述: {character.description}\n\n"
-
-            prompt += "背景故事:\n"
-            prompt += f"{character.background_story}\n\n"
-
-            prompt += "性格特征:\n"
-            for trait in character.trait:
-                prompt += f"- {trait.label}: {trait.description}\n"
-            prompt += "\n"
-
-            prompt += "标志性特征:\n"
-            for distinctive in character.distinctive:
-                prompt += f"- {distinctive.name}: {distinctive.content}\n"
-            prompt += "\n"
+    @traced()
+    def get_scene_context(self, scene_id: Optional[int]) -> Optional[ResponseSceneContextDto]:
+        """
+        以情景为中心构建 prompt 需要的数据，不使用该方式、没有指定情景或情景不属于章节时为空，发送整部小说的历史
+        """
+        if AppConfig.PROMPT_SCOPE != "scene" or scene_id is None or self.scene_mapper is None:
+            return None
+        try:
+            return self.scene_mapper.get_scene_context(scene_id, AppConfig.SCENE_ANCESTOR_DEPTH,
+                                                       AppConfig.SCENE_ANCESTOR_TURNS * 2, AppConfig.SCENE_DIGEST_CHARS)
+        except NotFoundError:
+            logging.warning("情景 %s 不存在，发送整部小说的历史", scene_id)
+            return None
+
+    @staticmethod
+    def get_involved_characters(context: ResponseSceneContextDto, character_id: int = None) -> Optional[List[int]]:
+        """
+        当前情景和父情景的对话中出现的角色，加上本轮对话的角色。对话都没有记录角色时为空，发送小说关联的全部角色
+        """
+        characters = set(context.character_ids)
+        if character_id is not None:
+            characters.add(character_id)
+        return sorted(characters) if characters else None
 
-            prompt += "对话示例:\n"
-            for speak in character.speak:
-                prompt += f"{speak.role}: {speak.content}\n"
-                prompt += f"回复: {speak.reply}\n"
+    @traced()
+    def generate_context_messages(self, context: ResponseSceneContextDto) -> List["AIMessage | HumanMessage"]:
+        """
+        将 ResponseSceneContextDto 转换为 LangChain 消息列表：章节信息（含父章节和同章节其他情景的摘要）、
+        父情景和最近几轮对话、当前情景和全部对话
+        """
+        from langchain_core.messages import HumanMessage
 
-            messages.append(HumanMessage(content=prompt))
+        messages = [HumanMessage(content=scene_context_prompt(context))]
+        for scene in context.ancestors + [context.scene]:
+            messages.append(HumanMessage(content=scene_prompt(scene)))
+            messages.extend(conversation_messages(scene.conversation or []))
         return messages
 
+    @traced()
+    def get_character_memories(self, novel_id: int) -> List[ResponseCharacterMemoryDto]:
+        """
+        已整理的角色记忆，不整理记忆或还没有整理过时为空，prompt 发送全部历史
+        """
+        if AppConfig.MEMORY_CONSOLIDATION_TURNS <= 0:
+            return []
+        memories = self.character_novel_mapper.get_character_memories(novel_id)
+        if not any(memory.memory_until for memory in memories):
+            return []
+        return memories
+
+    @traced()
+    def generate_character_messages(self, novel_id: int,
+                                    character_ids: Optional[List[int]] = None) -> List["HumanMessage"]:
+        """
+        :param character_ids: 不为空时只包含其中的角色
+        """
+        from langchain_core.messages import HumanMessage
+
+        characters = self.character_novel_mapper.get_connect_characters_by_novel_id(novel_id, character_ids)
+        return [HumanMessage(content=character_prompt(character)) for character in sort_characters(characters)]
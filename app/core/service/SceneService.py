@@ -1,9 +1,13 @@
 from datetime import datetime
+from typing import List
 
 from core.entity.ResponseEntity import success, ResponseModel
+from core.entity.dto.BatchDto import BatchResultDto
 from core.entity.dto.SceneDto import CreateSceneDto
 from core.mapper.SceneMapper import SceneMapperInterface
+from core.utils.BatchUtils import check_batch_size, raise_if_rejected
 from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
 
 logging = get_logger(__name__)
 
@@ -12,7 +16,19 @@ class SceneService:
     def __init__(self, scene_mapper: SceneMapperInterface):
         self.scene_mapper = scene_mapper
 
+    @traced()
     def create_scene(self, scene: CreateSceneDto) -> ResponseModel:
         scene.create_time = datetime.now()
         scene_id = self.scene_mapper.create_scene(scene)
-        return success(message=f"创建情景{scene.scene_name}成功，ID为{scene_id}")
\ No newline at end of file
+        return success(message=f"创建情景{scene.scene_name}成功，ID为{scene_id}")
+
+    @traced()
+    def create_scenes(self, scenes: List[CreateSceneDto]) -> ResponseModel[BatchResultDto]:
+        check_batch_size(scenes)
+        now = datetime.now()
+        for scene in scenes:
+            scene.create_time = now
+        result = self.scene_mapper.create_scenes(scenes)
+        raise_if_rejected(result, "情景")
+        logging.info(f"批量创建情景成功，数量为{result.created}")
+        return success(data=result, message=f"批量创建情景成功，数量为{result.created}")
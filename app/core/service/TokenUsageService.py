@@ -0,0 +1,43 @@
+from core.entity.ResponseEntity import success, ResponseModel
+from core.entity.dto.TokenUsageDto import ResponseTokenUsageDto, ResponseNovelTokenUsageDto
+from core.mapper.TokenUsageMapper import TokenUsageMapperInterface
+from core.utils import AppConfig
+from core.utils.Tracer import traced
+
+
+def estimate_cost(prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """
+    按每百万 token 的价格估算费用，价格修改后历史用量也按新价格计算。cached_tokens 包含在 prompt_tokens 中，按缓存价格计算
+    """
+    cost = (cached_tokens * AppConfig.LLM_CACHED_PROMPT_PRICE
+            + (prompt_tokens - cached_tokens) * AppConfig.LLM_PROMPT_PRICE
+            + completion_tokens * AppConfig.LLM_COMPLETION_PRICE)
+    return round(cost / 1_000_000, 6)
+
+
+def _with_cost(usage: ResponseTokenUsageDto) -> ResponseTokenUsageDto:
+    usage.cost = estimate_cost(usage.prompt_tokens, usage.completion_tokens, usage.cached_tokens)
+    return usage
+
+
+class TokenUsageService:
+    def __init__(self, usage_mapper: TokenUsageMapperInterface):
+        self.usage_mapper = usage_mapper
+
+    @traced()
+    def get_novel_usage(self, novel_id: int) -> ResponseModel[ResponseNovelTokenUsageDto]:
+        usage = self.usage_mapper.get_novel_usage(novel_id)
+        _with_cost(usage.total)
+        for item in usage.scenes + usage.characters:
+            _with_cost(item)
+        return success(data=usage, message=f"获取小说 ID 为{novel_id}的模型用量成功，共{usage.total.turns}轮对话")
+
+    @traced()
+    def get_scene_usage(self, scene_id: int) -> ResponseModel[ResponseTokenUsageDto]:
+        usage = _with_cost(self.usage_mapper.get_scene_usage(scene_id))
+        return success(data=usage, message=f"获取情景 ID 为{scene_id}的模型用量成功，共{usage.turns}轮对话")
+
+    @traced()
+    def get_character_usage(self, character_id: int) -> ResponseModel[ResponseTokenUsageDto]:
+        usage = _with_cost(self.usage_mapper.get_character_usage(character_id))
+        return success(data=usage, message=f"获取角色 ID 为{character_id}的模型用量成功，共{usage.turns}轮对话")
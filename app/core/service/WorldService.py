@@ -2,17 +2,23 @@ from datetime import datetime
 from typing import List
 
 from core.entity.ResponseEntity import ResponseModel, success
-from core.entity.dto.WorldDto import CreateWorldDto, ResponseWorldDto, ResponseAllWorldDetailDto
+from core.entity.dto.BatchDto import BatchResultDto
+from core.entity.dto.WorldDto import CreateWorldDto, ResponseWorldDto, ResponseAllWorldDetailDto, CreateWorldDetailDto
+from core.mapper.WorldDetailMapper import WorldDetailMapperInterface
 from core.mapper.WorldMapper import WorldMapperInterface
+from core.utils.BatchUtils import check_batch_size, raise_if_rejected
 from core.utils.LogConfig import get_logger
+from core.utils.Tracer import traced
 
 logging = get_logger(__name__)
 
 
 class WorldService:
-    def __init__(self, world_mapper: WorldMapperInterface):
+    def __init__(self, world_mapper: WorldMapperInterface, world_detail_mapper: WorldDetailMapperInterface):
         self.world_mapper = world_mapper
+        self.world_detail_mapper = world_detail_mapper
 
+    @traced()
     def create_world(self, world: CreateWorldDto) -> ResponseModel:
         world.create_time = datetime.now()
         world_id = self.world_mapper.create_world(world)
@@ -20,12 +26,27 @@ class WorldService:
         logging.info(f"创建世界观 {world.world_name} 成功，ID 为 {world_id}")
         return success(message=f"创建世界观 {world.world_name} 成功，ID 为 {world_id}")
 
+    @traced()
     def get_all_worlds(self) -> ResponseModel[List[ResponseWorldDto]]:
         worlds = self.world_mapper.get_all_worlds()
         logging.info(f"获取全部世界成功，数量为 {len(worlds)}")
         return success(data=worlds, message=f"获取全部世界成功，数量为 {len(worlds)}")
 
+    @traced()
     def get_world_by_id(self, world_id: int) -> ResponseModel[ResponseAllWorldDetailDto]:
         all_world = self.world_mapper.get_world_by_id(world_id)
         logging.info(f"获取 ID 为 {world_id} 的世界观成功")
         return success(message=f"获取 ID 为 {world_id} 的世界观成功", data=all_world)
+
+    @traced()
+    def create_world_details(self, world_details: List[CreateWorldDetailDto]) -> ResponseModel[BatchResultDto]:
+        check_batch_size(world_details)
+        result = self.world_detail_mapper.create_world_details(world_details)
+        raise_if_rejected(result, "详细世界观")
+        logging.info(f"批量创建详细世界观成功，数量为 {result.created}")
+        return success(data=result, message=f"批量创建详细世界观成功，数量为 {result.created}")
+
+    @traced()
+    def delete_world_detail(self, world_detail_id: int) -> ResponseModel:
+        self.world_detail_mapper.delete_world_detail(world_detail_id)
+        return success(message=f"成功删除id为{world_detail_id}的详细世界观")
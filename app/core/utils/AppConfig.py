@@ -0,0 +1,191 @@
+import os
+
+
+# 应用配置，统一从环境变量读取，未设置时使用默认值
+
+def get_str(name: str, default: str) -> str:
+    return os.getenv(name, default)
+
+
+def get_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def get_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def get_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# 数据库配置
+# 数据库类型，sqlite 或 postgres
+DATABASE_PROVIDER = get_str("QUICKNOVEL_DB_PROVIDER", "sqlite")
+# SQLite 数据库文件，相对路径以 core/mapper/config 目录为基准
+DATABASE_PATH = get_str("QUICKNOVEL_DB_PATH", "database.sqlite")
+# PostgreSQL 连接参数，使用 psycopg2 连接
+PG_HOST = get_str("QUICKNOVEL_PG_HOST", "127.0.0.1")
+PG_PORT = get_int("QUICKNOVEL_PG_PORT", 5432)
+PG_USER = get_str("QUICKNOVEL_PG_USER", "quicknovel")
+PG_PASSWORD = get_str("QUICKNOVEL_PG_PASSWORD", "")
+PG_DATABASE = get_str("QUICKNOVEL_PG_DATABASE", "quicknovel")
+# 建立连接的超时时间（秒）
+PG_CONNECT_TIMEOUT = get_int("QUICKNOVEL_PG_CONNECT_TIMEOUT", 10)
+# 单条 SQL 的最长执行时间（毫秒），0 表示不限制
+PG_STATEMENT_TIMEOUT_MS = get_int("QUICKNOVEL_PG_STATEMENT_TIMEOUT_MS", 30000)
+# 每个进程同时使用的数据库连接上限。Pony 为每个线程保持一个连接，同步接口在线程池中执行，
+# 因此通过线程池大小限制连接数，部署多个进程时总连接数为 进程数 x 该值
+DATABASE_POOL_SIZE = get_int("QUICKNOVEL_DB_POOL_SIZE", 40)
+# 只读副本，SQLite 为副本文件路径，PostgreSQL 为副本的主机名，为空时全部读写都访问主库
+REPLICA = get_str("QUICKNOVEL_REPLICA", "")
+# 副本允许落后主库的最长时间（秒），超过时读请求改为访问主库
+REPLICA_MAX_LAG_SECONDS = get_float("QUICKNOVEL_REPLICA_MAX_LAG_SECONDS", 5)
+# 主库写入心跳的间隔（秒），副本落后的时间根据副本上读到的心跳计算
+REPLICA_HEARTBEAT_SECONDS = get_float("QUICKNOVEL_REPLICA_HEARTBEAT_SECONDS", 1)
+# 流式响应开始后仍会写入（模型的回复），之后该时长（秒）内同一客户端的读请求访问主库
+READ_YOUR_WRITES_STREAM_SECONDS = get_float("QUICKNOVEL_READ_YOUR_WRITES_STREAM_SECONDS", 120)
+# 单条 SQL 超过该耗时（秒）记为慢查询
+SLOW_QUERY_SECONDS = get_float("QUICKNOVEL_SLOW_QUERY_SECONDS", 0.2)
+# 单个请求允许执行的 SQL 数量，超过时输出警告
+REQUEST_QUERY_BUDGET = get_int("QUICKNOVEL_REQUEST_QUERY_BUDGET", 50)
+# 单个请求允许的 SQL 总耗时（秒），超过时输出警告
+REQUEST_QUERY_TIME_BUDGET = get_float("QUICKNOVEL_REQUEST_QUERY_TIME_BUDGET", 0.5)
+# 等待 SQLite 写锁的最长时间（秒），多个进程同时写入时依次排队
+DATABASE_BUSY_TIMEOUT = get_float("QUICKNOVEL_DB_BUSY_TIMEOUT", 30)
+# 小说详情、角色列表的读取方式：projection 只查询需要的字段并组装为轻量的行对象（见 ProjectionEntity），
+# dto 加载 Pony 实体后逐行转换为 pydantic 对象
+READ_MODE = get_str("QUICKNOVEL_READ_MODE", "projection")
+# 小说详情缓存的内存上限（MB），按对话字数和行数估算，超过时淘汰最久没有访问的小说，0 表示不缓存（见 NovelCache）
+NOVEL_CACHE_MAX_MB = get_float("QUICKNOVEL_NOVEL_CACHE_MAX_MB", 256)
+
+# 日志配置
+# 根日志级别
+LOG_LEVEL = get_str("QUICKNOVEL_LOG_LEVEL", "INFO")
+# 按模块设置日志级别，例如 "core.mapper=WARNING,quicknovel.trace=INFO"
+LOG_MODULE_LEVELS = get_str("QUICKNOVEL_LOG_MODULE_LEVELS", "")
+# 大体积日志内容（prompt、实体等）的最大输出长度
+LOG_PAYLOAD_LIMIT = get_int("QUICKNOVEL_LOG_PAYLOAD_LIMIT", 2000)
+# 大体积日志内容的采样率，0 ~ 1
+LOG_PAYLOAD_SAMPLE_RATE = get_float("QUICKNOVEL_LOG_PAYLOAD_SAMPLE_RATE", 1.0)
+
+# 上传配置
+# 头像文件的最大字节数
+AVATAR_MAX_BYTES = get_int("QUICKNOVEL_AVATAR_MAX_BYTES", 5 * 1024 * 1024)
+# 上传文件每次读取和写入的块大小
+UPLOAD_CHUNK_SIZE = get_int("QUICKNOVEL_UPLOAD_CHUNK_SIZE", 64 * 1024)
+# 生成头像缩略图的进程数
+AVATAR_WORKERS = get_int("QUICKNOVEL_AVATAR_WORKERS", 2)
+# 头像缩略图的压缩质量，1 ~ 100
+AVATAR_QUALITY = get_int("QUICKNOVEL_AVATAR_QUALITY", 80)
+# 头像缓存时间（秒），文件名由内容哈希生成，内容不会变化
+AVATAR_CACHE_MAX_AGE = get_int("QUICKNOVEL_AVATAR_CACHE_MAX_AGE", 365 * 24 * 3600)
+
+# 批量接口配置
+# 单次批量创建的最大条数
+BATCH_MAX_ITEMS = get_int("QUICKNOVEL_BATCH_MAX_ITEMS", 1000)
+
+# 后台删除配置
+# 每个事务删除的最大行数，删除大量数据时不会长时间占用写锁
+DELETE_BATCH_SIZE = get_int("QUICKNOVEL_DELETE_BATCH_SIZE", 500)
+# 两批之间的间隔（秒），让其他写请求有机会获取写锁
+DELETE_BATCH_PAUSE = get_float("QUICKNOVEL_DELETE_BATCH_PAUSE", 0.01)
+# 没有新任务时检查其他进程创建的任务的间隔（秒）
+DELETE_POLL_SECONDS = get_float("QUICKNOVEL_DELETE_POLL_SECONDS", 5)
+# 删除任务的租约（秒），执行任务的进程退出后超过该时间，任务由其他进程接手
+DELETE_LEASE_SECONDS = get_float("QUICKNOVEL_DELETE_LEASE_SECONDS", 60)
+# 删除任务出错后的最大执行次数
+DELETE_MAX_ATTEMPTS = get_int("QUICKNOVEL_DELETE_MAX_ATTEMPTS", 3)
+# 删除任务出错后重试的等待时间（秒），每次失败后翻倍，不超过 DELETE_RETRY_MAX_SECONDS
+DELETE_RETRY_BASE_SECONDS = get_float("QUICKNOVEL_DELETE_RETRY_BASE_SECONDS", 5)
+DELETE_RETRY_MAX_SECONDS = get_float("QUICKNOVEL_DELETE_RETRY_MAX_SECONDS", 300)
+# 清理无引用的头像文件时跳过最近修改的文件（秒），避免删除刚上传、还没有保存到角色上的头像
+ORPHAN_AVATAR_GRACE_SECONDS = get_float("QUICKNOVEL_ORPHAN_AVATAR_GRACE_SECONDS", 3600)
+
+# 后台模型任务配置
+# 每个进程同时执行的任务数量
+JOB_CONCURRENCY = get_int("QUICKNOVEL_JOB_CONCURRENCY", 2)
+# 没有新任务时检查其他进程创建的任务和到期重试的任务的间隔（秒）
+JOB_POLL_SECONDS = get_float("QUICKNOVEL_JOB_POLL_SECONDS", 5)
+# 任务的租约（秒），执行期间每隔三分之一租约延长一次，进程退出后超过该时间，任务由其他进程接手
+JOB_LEASE_SECONDS = get_float("QUICKNOVEL_JOB_LEASE_SECONDS", 120)
+# 任务的最大执行次数
+JOB_MAX_ATTEMPTS = get_int("QUICKNOVEL_JOB_MAX_ATTEMPTS", 3)
+# 失败后重试的等待时间（秒），每次失败后翻倍，不超过 JOB_RETRY_MAX_SECONDS
+JOB_RETRY_BASE_SECONDS = get_float("QUICKNOVEL_JOB_RETRY_BASE_SECONDS", 5)
+JOB_RETRY_MAX_SECONDS = get_float("QUICKNOVEL_JOB_RETRY_MAX_SECONDS", 300)
+# 批量起草章节时同时调用模型的情景数量
+CHAPTER_DRAFT_CONCURRENCY = get_int("QUICKNOVEL_CHAPTER_DRAFT_CONCURRENCY", 4)
+
+# 角色记忆配置
+# 小说新增该轮数的对话（一轮为用户消息和回复两条）后，在后台把新对话整理进各角色的记忆
+# 为 0 时不整理记忆，prompt 发送全部历史
+MEMORY_CONSOLIDATION_TURNS = get_int("QUICKNOVEL_MEMORY_CONSOLIDATION_TURNS", 20)
+# 有记忆时 prompt 只发送记忆和还没整理的对话，另外保留已整理的最近若干轮原文，保证衔接
+MEMORY_RECENT_TURNS = get_int("QUICKNOVEL_MEMORY_RECENT_TURNS", 4)
+
+# Prompt 范围配置
+# scene 为以当前情景为中心构建 prompt：当前情景的全部对话、父情景的最近几轮、父章节和同章节其他情景的摘要，
+# 只包含参与对话的角色；novel 为发送整部小说的历史。没有指定情景或情景不属于章节时按 novel 处理
+PROMPT_SCOPE = get_str("QUICKNOVEL_PROMPT_SCOPE", "scene")
+# 向上追溯的父情景和父章节的层数
+SCENE_ANCESTOR_DEPTH = get_int("QUICKNOVEL_SCENE_ANCESTOR_DEPTH", 3)
+# 每个父情景保留的最近对话轮数
+SCENE_ANCESTOR_TURNS = get_int("QUICKNOVEL_SCENE_ANCESTOR_TURNS", 4)
+# 同章节其他情景的摘要中保留的最后一条对话的字数
+SCENE_DIGEST_CHARS = get_int("QUICKNOVEL_SCENE_DIGEST_CHARS", 100)
+
+# 响应压缩配置
+# 是否压缩响应体，客户端支持时优先使用 brotli（需要安装 brotli），否则使用 gzip
+COMPRESSION_ENABLED = get_bool("QUICKNOVEL_COMPRESSION_ENABLED", True)
+# 小于该字节数的响应体不压缩
+COMPRESS_MIN_BYTES = get_int("QUICKNOVEL_COMPRESS_MIN_BYTES", 4096)
+# gzip 压缩级别，1 ~ 9，级别越高压缩越慢
+GZIP_LEVEL = get_int("QUICKNOVEL_GZIP_LEVEL", 1)
+# brotli 压缩质量，0 ~ 11
+BROTLI_QUALITY = get_int("QUICKNOVEL_BROTLI_QUALITY", 4)
+# 超过该字节数的响应体在线程池中压缩，不阻塞事件循环
+COMPRESS_THREAD_BYTES = get_int("QUICKNOVEL_COMPRESS_THREAD_BYTES", 256 * 1024)
+
+# 模型用量配置
+# 统计 token 数量的分词器，approximate 为按字符估算，其他取值见 core/utils/TokenCounter.py
+TOKENIZER = get_str("QUICKNOVEL_TOKENIZER", "approximate")
+# 每百万 token 的价格，用于估算费用，默认为 deepseek-chat 的价格（元）
+LLM_PROMPT_PRICE = get_float("QUICKNOVEL_LLM_PROMPT_PRICE", 2.0)
+LLM_COMPLETION_PRICE = get_float("QUICKNOVEL_LLM_COMPLETION_PRICE", 8.0)
+# 命中服务商前缀缓存的 prompt token 的价格
+LLM_CACHED_PROMPT_PRICE = get_float("QUICKNOVEL_LLM_CACHED_PROMPT_PRICE", 0.5)
+
+# 生成调度配置，限流和排队只在进程内生效，多进程部署时每个进程分别计算
+# 每个进程同时调用模型的生成数量上限，超出的生成排队等待，0 表示不限制
+GENERATION_CONCURRENCY = get_int("QUICKNOVEL_GENERATION_CONCURRENCY", 8)
+# 每个客户端每分钟允许发起的生成数量和允许的突发数量，速率为 0 表示不限制
+CLIENT_GENERATION_RATE = get_float("QUICKNOVEL_CLIENT_GENERATION_RATE", 30)
+CLIENT_GENERATION_BURST = get_int("QUICKNOVEL_CLIENT_GENERATION_BURST", 10)
+# 每部小说每分钟允许发起的生成数量和允许的突发数量，速率为 0 表示不限制
+NOVEL_GENERATION_RATE = get_float("QUICKNOVEL_NOVEL_GENERATION_RATE", 60)
+NOVEL_GENERATION_BURST = get_int("QUICKNOVEL_NOVEL_GENERATION_BURST", 20)
+# 每个客户端最多排队的生成数量，超过时直接拒绝，0 表示不限制
+CLIENT_GENERATION_QUEUE_LIMIT = get_int("QUICKNOVEL_CLIENT_GENERATION_QUEUE_LIMIT", 4)
+# 客户端在调度中的权重，格式为 "客户端=权重,客户端=权重"，未配置的客户端权重为 1
+CLIENT_GENERATION_WEIGHTS = get_str("QUICKNOVEL_CLIENT_GENERATION_WEIGHTS", "")
+
+# 启动配置
+# 启动时是否在后台线程预先导入 LLM 相关模块（在开始接受连接之前提交，不等待完成）
+PRELOAD_LLM = get_bool("QUICKNOVEL_PRELOAD_LLM", True)
+
+# 部署配置
+# 服务监听的地址和端口
+HOST = get_str("QUICKNOVEL_HOST", "127.0.0.1")
+PORT = get_int("QUICKNOVEL_PORT", 9000)
+# 工作进程数，大于 1 时以多进程方式启动
+WORKERS = get_int("QUICKNOVEL_WORKERS", 1)
+# 多进程部署时各进程写入指标快照的目录，/metrics 汇总目录下全部进程的指标，为空时只输出当前进程的指标
+METRICS_DIR = get_str("QUICKNOVEL_METRICS_DIR", "")
+# 写入指标快照的间隔（秒）
+METRICS_EXPORT_SECONDS = get_float("QUICKNOVEL_METRICS_EXPORT_SECONDS", 5)
@@ -0,0 +1,26 @@
+from typing import List
+
+from core.entity.dto.BatchDto import BatchResultDto, batch_rejected
+from core.utils import AppConfig
+from core.utils.CustomizeException import BatchTooLargeError, BatchValidationError
+from core.utils.Tracer import allow_queries
+
+
+def check_batch_size(items: List):
+    """
+    批量数据不能为空，数量不能超过 AppConfig.BATCH_MAX_ITEMS
+    """
+    if not items:
+        raise BatchValidationError("批量数据为空", batch_rejected(0, {}))
+    if len(items) > AppConfig.BATCH_MAX_ITEMS:
+        raise BatchTooLargeError(AppConfig.BATCH_MAX_ITEMS)
+    # 每条数据插入一次，其余查询仍受请求的 SQL 预算约束
+    allow_queries(len(items))
+
+
+def raise_if_rejected(result: BatchResultDto, name: str):
+    """
+    整批被拒绝时返回 400，data 中包含每条数据的错误
+    """
+    if result.failed:
+        raise BatchValidationError(f"批量创建{name}失败，{result.failed}条数据无效，全部未写入", result)
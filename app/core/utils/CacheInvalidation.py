@@ -0,0 +1,28 @@
+"""
+进程内缓存的失效通知
+
+缓存数据库数据的模块通过 register_cache_invalidator 注册失效函数，删除数据等会使缓存整体失效的操作完成后调用
+invalidate_caches。失效函数只清理本进程的缓存，多进程部署时缓存需要自行校验数据是否已变化。
+"""
+from typing import Callable, List
+
+from core.utils.LogConfig import get_logger
+
+logging = get_logger(__name__)
+
+_invalidators: List[Callable[[str, int], None]] = []
+
+
+def register_cache_invalidator(invalidator: Callable[[str, int], None]):
+    """
+    :param invalidator: 参数为实体类型和实体id，例如 ("novel", 1)
+    """
+    _invalidators.append(invalidator)
+
+
+def invalidate_caches(entity: str, entity_id: int):
+    for invalidator in _invalidators:
+        try:
+            invalidator(entity, entity_id)
+        except Exception as e:
+            logging.error("清理缓存失败，%s id为%s: %s", entity, entity_id, e)
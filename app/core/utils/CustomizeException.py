@@ -1,9 +1,13 @@
 class ApiError(Exception):
 
-    def __init__(self, message: str, status_code: int, error_code: str):
+    def __init__(self, message: str, status_code: int, error_code: str, data=None, headers=None):
         self.message = message
         self.status_code = status_code
         self.error_code = error_code
+        # 随错误一起返回给客户端的数据
+        self.data = data
+        # 额外的响应头
+        self.headers = headers
 
 
 class NotFoundError(ApiError):
@@ -44,3 +48,87 @@ class StreamingError(ApiError):
             status_code=500,
             error_code="STREAMING_OPERATION_ERROR"
         )
+
+
+class UploadError(ApiError):
+
+    def __init__(self, message: str):
+        super().__init__(
+            message,
+            status_code=400,
+            error_code="UPLOAD_ERROR"
+        )
+
+
+class FileTooLargeError(ApiError):
+
+    def __init__(self, max_bytes: int):
+        super().__init__(
+            message=f"文件大小超过限制，最大为{max_bytes // 1024}KB",
+            status_code=413,
+            error_code="FILE_TOO_LARGE"
+        )
+
+
+class AvatarNotFoundError(ApiError):
+
+    def __init__(self, avatar: str):
+        super().__init__(
+            message=f"头像{avatar}不存在",
+            status_code=404,
+            error_code="not found"
+        )
+
+
+class BatchTooLargeError(ApiError):
+
+    def __init__(self, max_items: int):
+        super().__init__(
+            message=f"批量数据的数量超过限制，最多为{max_items}条",
+            status_code=413,
+            error_code="BATCH_TOO_LARGE"
+        )
+
+
+class BatchValidationError(ApiError):
+
+    def __init__(self, message: str, result):
+        super().__init__(
+            message,
+            status_code=400,
+            error_code="BATCH_VALIDATION_ERROR",
+            data=result
+        )
+
+
+class VersionConflictError(ApiError):
+
+    def __init__(self, entity_id: int, expected: int, current: int):
+        super().__init__(
+            message=f"id为{entity_id}的数据已被修改，提交的版本为{expected}，当前版本为{current}，请重新读取后再提交",
+            status_code=409,
+            error_code="VERSION_CONFLICT",
+            data={"version": current}
+        )
+
+
+class RateLimitError(ApiError):
+
+    def __init__(self, message: str, reason: str, retry_after: int):
+        super().__init__(
+            message,
+            status_code=429,
+            error_code="RATE_LIMITED",
+            data={"reason": reason, "retry_after": retry_after},
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+class UnknownJobError(ApiError):
+
+    def __init__(self, kind: str):
+        super().__init__(
+            message=f"不支持的后台任务类型{kind}",
+            status_code=400,
+            error_code="UNKNOWN_JOB_KIND"
+        )
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Optional, Tuple
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from core.utils.CustomizeException import FileTooLargeError, FileError
+from core.utils.LogConfig import get_logger
+
+logging = get_logger(__name__)
+
+# 文件头 -> 扩展名，根据文件内容而不是文件名判断图片格式
+IMAGE_SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": ".png",
+    b"\xff\xd8\xff": ".jpg",
+}
+
+
+def sniff_image_extension(header: bytes) -> Optional[str]:
+    """
+    根据文件头判断图片格式，无法识别时返回 None
+    """
+    for signature, extension in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return extension
+    return None
+
+
+async def save_upload_file(upload: UploadFile, directory: Path, extension: str, max_bytes: int, chunk_size: int,
+                           first_chunk: bytes = b"") -> Tuple[str, int]:
+    """
+    分块保存上传文件，文件名为内容的 sha256，相同内容只保存一份。
+    磁盘写入放到线程池执行，先写入临时文件，完成后再原子地重命名为目标文件
+
+    :param upload: 上传的文件
+    :param directory: 保存目录
+    :param extension: 文件扩展名
+    :param max_bytes: 允许的最大字节数，超出时删除临时文件并抛出 FileTooLargeError
+    :param chunk_size: 每次读取的字节数
+    :param first_chunk: 调用方已经读取的文件开头部分
+    :return: 文件名和文件大小
+    """
+    temp_path = directory / f".{uuid.uuid4().hex}{extension}.part"
+    hasher = hashlib.sha256()
+    size = 0
+    handle = await run_in_threadpool(open, temp_path, "wb")
+    try:
+        chunk = first_chunk or await upload.read(chunk_size)
+        while chunk:
+            size += len(chunk)
+            if size > max_bytes:
+                raise FileTooLargeError(max_bytes)
+            hasher.update(chunk)
+            await run_in_threadpool(handle.write, chunk)
+            chunk = await upload.read(chunk_size)
+
+        await run_in_threadpool(handle.close)
+        filename = f"{hasher.hexdigest()}{extension}"
+        # 目标文件已存在时内容相同，直接覆盖
+        await run_in_threadpool(os.replace, temp_path, directory / filename)
+        return filename, size
+    except FileTooLargeError:
+        await run_in_threadpool(_discard, handle, temp_path)
+        raise
+    except Exception as e:
+        await run_in_threadpool(_discard, handle, temp_path)
+        logging.error(f"文件保存失败: {str(e)}")
+        raise FileError(f"文件保存失败: {str(e)}")
+
+
+def _discard(handle, path: Path):
+    handle.close()
+    path.unlink(missing_ok=True)
@@ -0,0 +1,194 @@
+"""
+头像图片处理
+
+原图以内容哈希命名，相同内容只保存一份；缩略图在进程池中生成，保存在 variants 目录下，
+文件名为 {原图名去掉扩展名}_{尺寸}{格式扩展名}
+"""
+import importlib.util
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from core.utils import AppConfig
+from core.utils.LogConfig import get_logger
+
+logging = get_logger(__name__)
+
+# 缩略图尺寸 -> 边长（像素）
+AVATAR_VARIANTS = {
+    "thumb": 128,
+    "small": 256,
+    "medium": 512,
+}
+
+# 缩略图格式 -> (Pillow 格式名, 扩展名, media type)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", ".webp", "image/webp"),
+    "jpeg": ("JPEG", ".jpg", "image/jpeg"),
+}
+
+# Pillow 是可选依赖，未安装时不生成缩略图，直接使用原图
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+_executor: Optional[ProcessPoolExecutor] = None
+# 正在处理的图片，避免重复提交
+_pending: Dict[str, Future] = {}
+_lock = threading.Lock()
+
+
+def avatar_dir() -> Path:
+    """
+    头像保存目录，与 /uploads 静态目录一致
+    """
+    return Path("uploads/avatars").absolute()
+
+
+def variant_dir(directory: Path) -> Path:
+    return directory / "variants"
+
+
+def is_safe_name(avatar: str) -> bool:
+    """
+    头像名只能是单个文件名，不能包含路径
+    """
+    return bool(avatar) and Path(avatar).name == avatar and not avatar.startswith(".")
+
+
+def variant_name(avatar: str, variant: str, image_format: str) -> str:
+    return f"{Path(avatar).stem}_{variant}{VARIANT_FORMATS[image_format][1]}"
+
+
+def render_variants(source: str, target_dir: str, quality: int) -> List[str]:
+    """
+    生成全部尺寸和格式的缩略图，已经存在的跳过。在子进程中执行
+
+    :param source: 原图路径
+    :param target_dir: 缩略图目录
+    :param quality: 压缩质量
+    :return: 新生成的文件名
+    """
+    from PIL import Image, ImageOps
+
+    created = []
+    target_dir = Path(target_dir)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        for variant, edge in AVATAR_VARIANTS.items():
+            resized = None
+            for image_format, (pil_format, _, _) in VARIANT_FORMATS.items():
+                target = target_dir / variant_name(Path(source).name, variant, image_format)
+                if target.exists():
+                    continue
+                if resized is None:
+                    # 居中裁剪为正方形，不放大小图
+                    edge = min(edge, *image.size)
+                    resized = ImageOps.fit(image, (edge, edge), Image.Resampling.LANCZOS)
+                # 多个工作进程可能同时生成同一张缩略图，临时文件按进程区分
+                temp = target.with_name(f".{target.name}.{os.getpid()}.part")
+                resized.save(temp, pil_format, quality=quality)
+                os.replace(temp, target)
+                created.append(target.name)
+
+    # 生成期间原图已被删除（头像被更换），清理刚生成的缩略图
+    if not Path(source).exists():
+        for name in created:
+            (target_dir / name).unlink(missing_ok=True)
+        return []
+    return created
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # 服务进程中有多个线程，使用 spawn 避免 fork 复制锁的状态
+        _executor = ProcessPoolExecutor(max_workers=AppConfig.AVATAR_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def schedule_variants(source: Path) -> Optional[Future]:
+    """
+    在后台生成缩略图，不等待结果。同一张图片正在处理时返回已有的任务
+
+    :param source: 原图路径
+    :return: 任务，未安装 Pillow 时为 None
+    """
+    if not PILLOW_AVAILABLE:
+        logging.warning("未安装 Pillow，跳过缩略图生成")
+        return None
+
+    key = str(source)
+    with _lock:
+        if key in _pending:
+            return _pending[key]
+        start = time.perf_counter()
+        future = _get_executor().submit(render_variants, key, str(variant_dir(source.parent)),
+                                        AppConfig.AVATAR_QUALITY)
+        _pending[key] = future
+
+    def done(f: Future):
+        with _lock:
+            _pending.pop(key, None)
+        if f.cancelled():
+            return
+        if f.exception() is not None:
+            logging.error("生成缩略图失败，原图为 %s: %s", source.name, f.exception())
+            return
+        logging.info("缩略图生成完成，原图为 %s，新生成 %d 个，耗时 %.3f 秒",
+                     source.name, len(f.result()), time.perf_counter() - start)
+
+    future.add_done_callback(done)
+    return future
+
+
+def remove_avatar_files(avatar: str, directory: Optional[Path] = None):
+    """
+    删除原图及其全部缩略图，文件不存在时忽略
+    """
+    if not is_safe_name(avatar):
+        logging.warning("头像名不合法，跳过删除: %s", avatar)
+        return
+
+    directory = directory or avatar_dir()
+    paths = [directory / avatar]
+    paths += [variant_dir(directory) / variant_name(avatar, variant, image_format)
+              for variant in AVATAR_VARIANTS for image_format in VARIANT_FORMATS]
+    for path in paths:
+        try:
+            path.unlink(missing_ok=True)
+        except OSError as e:
+            logging.error("删除头像文件失败，%s: %s", path, e)
+
+
+def remove_unreferenced_avatar(avatar: str, directory: Optional[Path] = None) -> bool:
+    """
+    删除已经没有角色引用的头像及其缩略图。相同内容的图片可能刚由另一个上传请求保存、还没有写入角色，
+    最近 ORPHAN_AVATAR_GRACE_SECONDS 秒内修改过的文件不删除，留给 DeletionService.remove_orphan_avatars 清理
+
+    :return: 是否删除
+    """
+    directory = directory or avatar_dir()
+    try:
+        modified = (directory / avatar).stat().st_mtime
+    except (OSError, ValueError):
+        # 原图不存在时仍然删除可能残留的缩略图
+        modified = 0
+    if modified >= time.time() - AppConfig.ORPHAN_AVATAR_GRACE_SECONDS:
+        return False
+    remove_avatar_files(avatar, directory)
+    return True
+
+
+def shutdown_image_pool(wait: bool = False):
+    """
+    关闭进程池，wait 为 True 时等待正在处理的图片完成
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait, cancel_futures=not wait)
+        _executor = None
@@ -0,0 +1,95 @@
+"""
+接口的 JSON 响应
+
+FastAPI 默认按返回值注解（response_model）再次校验接口返回的 ResponseModel 后序列化，没有注解的接口则用
+jsonable_encoder 逐个对象转换，几万条对话的小说详情需要将近一秒，并且序列化在事件循环中执行。
+service 返回的 DTO 已经是确定的类型，DtoRoute 把接口返回的 pydantic 对象直接包装为 DtoJSONResponse，
+FastAPI 跳过校验和默认的序列化，返回值注解仍用于生成 OpenAPI 文档。同步接口在线程池中完成序列化，不占用事件循环。
+
+安装了 orjson 时使用 orjson 序列化，否则使用 pydantic 的 JSON 序列化，两者的输出相同。
+"""
+import functools
+import importlib.util
+import inspect
+import json
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+from core.utils.Tracer import span
+
+# orjson 是可选依赖，未安装时使用 pydantic 序列化
+ORJSON_AVAILABLE = importlib.util.find_spec("orjson") is not None
+
+if ORJSON_AVAILABLE:
+    import orjson
+
+
+def _orjson_default(value: Any):
+    # 只展开一层，字段中的 DTO 再次回调，投影模式的行对象（dataclass）由 orjson 直接序列化，不会先转换为 dict
+    if isinstance(value, BaseModel):
+        return {name: getattr(value, name) for name in type(value).model_fields}
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    序列化为 UTF-8 编码的 JSON，不转义非 ASCII 字符，没有多余的空格
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, default=_orjson_default)
+    if isinstance(content, BaseModel):
+        return content.__pydantic_serializer__.to_json(content)
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class DtoJSONResponse(JSONResponse):
+    """
+    content 可以是 pydantic 对象，不经过校验直接序列化
+    """
+
+    def render(self, content: Any) -> bytes:
+        with span("serialize_response") as s:
+            body = dumps(content)
+            if s is not None:
+                s.set("bytes", len(body))
+        return body
+
+
+def _respond_with_dto(endpoint, status_code: int):
+    """
+    接口返回 pydantic 对象时包装为 DtoJSONResponse，返回 Response 时（流式响应、文件）保持不变
+    """
+
+    def to_response(result):
+        if isinstance(result, BaseModel):
+            return DtoJSONResponse(result, status_code=status_code)
+        return result
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            return to_response(await endpoint(*args, **kwargs))
+
+        return async_wrapper
+
+    if inspect.isgeneratorfunction(endpoint) or inspect.isasyncgenfunction(endpoint):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        return to_response(endpoint(*args, **kwargs))
+
+    return wrapper
+
+
+class DtoRoute(APIRoute):
+    """
+    用法: APIRouter(prefix=..., route_class=DtoRoute)
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _respond_with_dto(endpoint, kwargs.get("status_code") or 200), **kwargs)
@@ -1,11 +1,115 @@
 import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
 
-def init_log():
-    logging.basicConfig(
-        level=logging.DEBUG,  # 设置为 DEBUG 以捕获所有日志
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
+from core.utils import AppConfig
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+
+class RawQueueHandler(QueueHandler):
+    """
+    只把原始日志记录放入队列，消息拼接和格式化（包括 LogPayload 的转换）都由后台线程的输出 handler 完成。
+    队列在进程内，记录不需要序列化，因此不像默认实现那样在调用线程中预先格式化
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_module_levels(config: str) -> Dict[str, int]:
+    """
+    解析按模块配置的日志级别，格式为 "模块=级别,模块=级别"
+    """
+    levels = {}
+    for item in config.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+def init_log(level: str = None, module_levels: str = None, stream=None):
+    """
+    初始化日志，日志记录先进入队列，由后台线程负责写出，不阻塞事件循环
+    :param level: 根日志级别，默认读取配置
+    :param module_levels: 按模块配置的日志级别，默认读取配置
+    :param stream: 日志输出流，默认为标准错误
+    """
+    global _listener
+
+    root = logging.getLogger()
+    root.setLevel((level or AppConfig.LOG_LEVEL).upper())
+
+    for name, module_level in parse_module_levels(
+            module_levels if module_levels is not None else AppConfig.LOG_MODULE_LEVELS).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    # 重复初始化时只更新级别
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(RawQueueHandler(log_queue))
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_log():
+    """
+    停止后台日志线程，并写出队列中剩余的日志
+    """
+    global _listener
+
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in logging.getLogger().handlers[:]:
+        if isinstance(handler, QueueHandler):
+            logging.getLogger().removeHandler(handler)
+    _listener = None
 
 
 def get_logger(name: str):
     return logging.getLogger(name)
+
+
+class LogPayload:
+    """
+    延迟格式化的大体积日志内容，只有在日志真正输出时（后台日志线程中）才转换为字符串，并截断到指定长度。
+    记录日志后不应再修改传入的内容
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = None):
+        self.value = value
+        self.limit = limit if limit is not None else AppConfig.LOG_PAYLOAD_LIMIT
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else repr(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}...(已截断，共 {len(text)} 字符)"
+
+    __repr__ = __str__
+
+
+def log_payload(logger: logging.Logger, message: str, payload: Any, level: int = logging.DEBUG):
+    """
+    按采样率记录大体积内容，级别未开启时不做任何格式化
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if AppConfig.LOG_PAYLOAD_SAMPLE_RATE < 1 and random.random() >= AppConfig.LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    logger.log(level, "%s: %s", message, LogPayload(payload))
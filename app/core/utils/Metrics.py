@@ -0,0 +1,296 @@
+"""
+Prometheus 格式的运行指标
+
+每个进程在内存中统计自己的指标。多进程部署时设置 METRICS_DIR，各进程定期把指标快照写入该目录下的
+{pid}.json，/metrics 读取目录中全部快照按标签相加后输出，无论请求落到哪个进程，看到的都是全部进程的合计。
+已退出进程的快照保留在目录中，计数器和直方图的合计不会因为进程重启而减小；瞬时值只汇总仍在运行的进程，
+进程正常退出时还会把瞬时值归零后写入最后一次快照。
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.utils import AppConfig
+
+# 默认的直方图分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        # 标签值 -> 数值，直方图为各分桶计数
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        REGISTRY.register(self)
+
+    def _label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Any]:
+        with self._lock:
+            return {key: list(value) if isinstance(value, list) else value for key, value in self._values.items()}
+
+    def samples(self, values: Optional[Dict[Tuple[str, ...], Any]] = None) -> List[str]:
+        """
+        :param values: 汇总后的数值，为空时输出当前进程的数值
+        """
+        raise NotImplementedError()
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self, values: Optional[Dict[Tuple[str, ...], Any]] = None) -> List[str]:
+        items = (values if values is not None else self.snapshot()).items()
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+
+    def set(self, value: float, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def reset(self):
+        """全部标签的数值归零"""
+        with self._lock:
+            self._values = {key: 0 for key in self._values}
+
+    def samples(self, values: Optional[Dict[Tuple[str, ...], Any]] = None) -> List[str]:
+        items = (values if values is not None else self.snapshot()).items()
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """分桶统计的直方图"""
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [每个分桶的计数..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [0] * (len(self.buckets) + 2)
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self, values: Optional[Dict[Tuple[str, ...], Any]] = None) -> List[str]:
+        items = (values if values is not None else self.snapshot()).items()
+
+        lines = []
+        for key, state in items:
+            for i, bound in enumerate(self.buckets):
+                bucket_labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {state[i]}")
+            inf_labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标 {metric.name} 已注册")
+            self._metrics[metric.name] = metric
+
+    def gauges(self) -> List[Gauge]:
+        with self._lock:
+            return [metric for metric in self._metrics.values() if isinstance(metric, Gauge)]
+
+    def snapshot(self) -> Dict[str, list]:
+        """
+        当前进程全部指标的数值，可以序列化为 JSON
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: [[list(key), value] for key, value in metric.snapshot().items()] for metric in metrics}
+
+    def render(self) -> str:
+        """
+        按 Prometheus 文本格式输出全部指标，设置了 METRICS_DIR 时输出全部进程的合计
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        merged = collect_snapshots(AppConfig.METRICS_DIR) if AppConfig.METRICS_DIR else {}
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples(merged.get(metric.name) if AppConfig.METRICS_DIR else None))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _merge_value(current, value):
+    # 计数器和瞬时值直接相加，直方图按分桶相加（已退出进程的瞬时值在 collect_snapshots 中跳过）
+    if isinstance(current, list):
+        return [a + b for a, b in zip(current, value)]
+    return current + value
+
+
+def _process_alive(pid: int) -> bool:
+    """
+    快照所属的进程是否仍在运行
+    """
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # Windows 上 os.kill 会结束目标进程，不能用信号 0 检查，只依赖进程退出时写入的归零快照
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # 进程存在但属于其他用户
+        return True
+    return True
+
+
+def export_snapshot(directory: str):
+    """
+    把当前进程的指标写入 {directory}/{pid}.json，先写临时文件再替换，读取方不会读到写了一半的文件
+    """
+    target = Path(directory) / f"{os.getpid()}.json"
+    temp = target.with_name(f".{target.name}.part")
+    temp.write_text(json.dumps(REGISTRY.snapshot()), encoding="utf-8")
+    os.replace(temp, target)
+
+
+def collect_snapshots(directory: str) -> Dict[str, Dict[Tuple[str, ...], Any]]:
+    """
+    读取目录中全部进程的快照，按指标和标签相加。当前进程先写入最新的快照。
+    计数器和直方图汇总全部快照；瞬时值（正在执行的请求数、缓存大小等）只汇总仍在运行的进程，
+    否则每次进程重启（包括被强制结束、没有写入归零快照的进程）都会使合计增大且不再减小
+    """
+    export_snapshot(directory)
+    gauges = {gauge.name for gauge in REGISTRY.gauges()}
+    merged: Dict[str, Dict[Tuple[str, ...], Any]] = {}
+    for file in Path(directory).glob("*.json"):
+        try:
+            snapshot = json.loads(file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        alive = not file.stem.isdigit() or _process_alive(int(file.stem))
+        for name, items in snapshot.items():
+            if name in gauges and not alive:
+                continue
+            values = merged.setdefault(name, {})
+            for key, value in items:
+                key = tuple(key)
+                values[key] = _merge_value(values[key], value) if key in values else value
+    return merged
+
+
+class _SnapshotExporter:
+    """
+    后台线程定期写入当前进程的指标快照
+    """
+
+    def __init__(self, directory: str, interval: float):
+        self.directory = directory
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="quicknovel-metrics-export", daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            export_snapshot(self.directory)
+
+    def start(self):
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+        export_snapshot(self.directory)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        # 保留快照文件，进程退出后计数器的合计不会减小；瞬时值归零，不再计入合计
+        for gauge in REGISTRY.gauges():
+            gauge.reset()
+        export_snapshot(self.directory)
+
+
+_exporter: Optional[_SnapshotExporter] = None
+
+
+def start_metrics_export():
+    """
+    设置了 METRICS_DIR 时启动快照写入线程，在每个工作进程启动时调用
+    """
+    global _exporter
+    if not AppConfig.METRICS_DIR or _exporter is not None:
+        return
+    _exporter = _SnapshotExporter(AppConfig.METRICS_DIR, AppConfig.METRICS_EXPORT_SECONDS)
+    _exporter.start()
+
+
+def stop_metrics_export():
+    global _exporter
+    if _exporter is not None:
+        _exporter.stop()
+        _exporter = None
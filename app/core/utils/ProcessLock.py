@@ -0,0 +1,49 @@
+"""
+跨进程的文件锁，多个工作进程启动时用于保证同一时刻只有一个进程执行建表和迁移
+"""
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            # 锁定文件的第一个字节，锁被占用时 msvcrt 重试约 10 秒后抛出异常，继续等待
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            time.sleep(0.1)
+
+
+def _unlock(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def process_lock(path: str):
+    """
+    阻塞直到拿到锁，退出时释放。进程异常退出时操作系统会自动释放锁
+
+    :param path: 锁文件路径，不存在时自动创建，不会被删除
+    """
+    with open(path, "a+b") as file:
+        _lock(file)
+        try:
+            yield
+        finally:
+            _unlock(file)
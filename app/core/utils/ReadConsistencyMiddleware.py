@@ -0,0 +1,77 @@
+import math
+import time
+from http.cookies import SimpleCookie
+
+from core.mapper.config.ReadReplica import replica_enabled, require_position
+from core.utils import AppConfig
+
+# 记录客户端最近一次写入时间的 Cookie
+WRITE_COOKIE = "quicknovel_write_at"
+# 同样记录写入时间的响应头和请求头，前端与接口不同源、不携带 Cookie 时由客户端在之后的请求中原样带回
+WRITE_HEADER = "X-QuickNovel-Write-At"
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class ReadConsistencyMiddleware:
+    """
+    在请求之间实现读己之写：写请求的响应通过 Cookie 和 X-QuickNovel-Write-At 响应头返回写入时间，
+    之后同一客户端的读请求带上 Cookie 或同名请求头（取较晚的时间），只在副本的数据位置不早于该时间时才读取副本。
+    写请求内的全部读取都访问主库
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replica_enabled():
+            await self.app(scope, receive, send)
+            return
+
+        is_write = scope["method"] not in READ_METHODS
+        if not is_write:
+            with require_position(_written_at(scope)):
+                await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = message.setdefault("headers", [])
+                now = time.time()
+                written_at = now
+                if any(name == b"content-type" and value.startswith(b"text/event-stream") for name, value in headers):
+                    # 流式响应在发送完毕后才写入模型的回复，写入时间无法在响应头中确定
+                    written_at = now + AppConfig.READ_YOUR_WRITES_STREAM_SECONDS
+                # 超过该时间后，落后不超过上限的副本一定已包含这次写入，Cookie 随之失效
+                max_age = math.ceil(written_at - now + AppConfig.REPLICA_MAX_LAG_SECONDS)
+                headers.append((b"set-cookie", f"{WRITE_COOKIE}={written_at:.6f}; Max-Age={max_age}; "
+                                               f"Path=/; SameSite=Lax; HttpOnly".encode()))
+                headers.append((WRITE_HEADER.lower().encode(), f"{written_at:.6f}".encode()))
+            await send(message)
+
+        with require_position(math.inf):
+            await self.app(scope, receive, send_wrapper)
+
+
+def _written_at(scope) -> float:
+    """
+    客户端最近一次写入的时间，Cookie 和请求头都存在时取较晚的时间，格式错误时忽略
+    """
+    written_at = 0.0
+    header = WRITE_HEADER.lower().encode()
+    for name, value in scope.get("headers", []):
+        if name == header:
+            written_at = max(written_at, _parse_time(value.decode("latin-1")))
+        elif name == b"cookie":
+            morsel = SimpleCookie(value.decode("latin-1")).get(WRITE_COOKIE)
+            if morsel is not None:
+                written_at = max(written_at, _parse_time(morsel.value))
+    return written_at
+
+
+def _parse_time(value: str) -> float:
+    try:
+        written_at = float(value)
+    except ValueError:
+        return 0.0
+    return written_at if math.isfinite(written_at) else 0.0
@@ -0,0 +1,110 @@
+"""
+token 计数
+
+默认按字符粗略估算，不依赖任何分词器。通过 QUICKNOVEL_TOKENIZER 可以改用真实的分词器：
+1. tiktoken:<编码名>，例如 tiktoken:cl100k_base，需要安装 tiktoken。离线环境需要预先把编码文件放到 TIKTOKEN_CACHE_DIR
+2. tokenizer.json 文件的路径，例如 DeepSeek 发布的分词器，需要安装 tokenizers
+分词器不可用（未安装、文件不存在、离线无法下载）时记录警告并退回估算，不影响对话。
+"""
+import functools
+import importlib.util
+import re
+from typing import Iterable
+
+from core.utils import AppConfig
+from core.utils.LogConfig import get_logger
+
+logging = get_logger(__name__)
+
+# 中日韩字符大致一个字一个 token，其余文本大致四个字符一个 token
+_CJK_PATTERN = re.compile(r"[　-〿぀-ヿ㐀-䶿一-鿿＀-￯]")
+
+# 每条消息额外计入的格式开销（角色标记、分隔符）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数量，不依赖任何分词器
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+class Tokenizer:
+    """
+    分词器接口，默认按字符估算
+    """
+    name = "approximate"
+
+    def count(self, text: str) -> int:
+        return estimate_tokens(text)
+
+
+class TiktokenTokenizer(Tokenizer):
+
+    def __init__(self, encoding: str):
+        import tiktoken
+
+        self.name = f"tiktoken:{encoding}"
+        self._encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+class HuggingFaceTokenizer(Tokenizer):
+
+    def __init__(self, path: str):
+        from tokenizers import Tokenizer as _Tokenizer
+
+        self.name = f"tokenizers:{path}"
+        self._tokenizer = _Tokenizer.from_file(path)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def load_tokenizer(spec: str) -> Tokenizer:
+    """
+    按配置创建分词器，无法创建时退回估算
+    """
+    if not spec or spec == Tokenizer.name:
+        return Tokenizer()
+    try:
+        if spec.startswith("tiktoken:"):
+            if importlib.util.find_spec("tiktoken") is None:
+                raise ImportError("未安装 tiktoken")
+            return TiktokenTokenizer(spec.split(":", 1)[1])
+        if importlib.util.find_spec("tokenizers") is None:
+            raise ImportError("未安装 tokenizers")
+        return HuggingFaceTokenizer(spec)
+    except Exception as e:
+        logging.warning("无法加载分词器 %s，改为按字符估算 token 数量: %s", spec, e)
+        return Tokenizer()
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer() -> Tokenizer:
+    tokenizer = load_tokenizer(AppConfig.TOKENIZER)
+    logging.info("统计 token 数量使用的分词器: %s", tokenizer.name)
+    return tokenizer
+
+
+def count_tokens(text: str) -> int:
+    return get_tokenizer().count(text)
+
+
+def count_messages_tokens(contents: Iterable[str]) -> int:
+    """
+    消息列表的 token 数量，每条消息额外计入少量的格式开销
+    """
+    tokenizer = get_tokenizer()
+    return sum(tokenizer.count(content) + MESSAGE_OVERHEAD_TOKENS for content in contents)
@@ -0,0 +1,36 @@
+from core.utils.Tracer import start_trace, finish_trace
+
+
+class TraceMiddleware:
+    """
+    为每个 HTTP 请求建立链路，流式响应会在最后一块数据发送完毕后才结束链路
+    """
+
+    def __init__(self, app, exclude_paths=("/metrics",)):
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        trace = start_trace(scope["method"], scope["path"])
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # 路由匹配后使用路由模板作为指标标签，避免 id 导致标签数量膨胀
+                route = scope.get("route")
+                trace.route = getattr(route, "path", trace.route)
+                message.setdefault("headers", []).append((b"x-request-id", trace.request_id.encode()))
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish_trace(trace, status)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish_trace(trace, status)
@@ -0,0 +1,260 @@
+import functools
+import inspect
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from core.utils import AppConfig
+from core.utils.LogConfig import get_logger
+from core.utils.Metrics import Counter, Histogram
+
+logging = get_logger(__name__)
+
+# 每个请求的 JSON 日志单独使用一个 logger，方便按需开关或导出
+trace_logging = get_logger("quicknovel.trace")
+
+REQUEST_DURATION = Histogram("quicknovel_request_duration_seconds", "HTTP 请求耗时", ["method", "route", "status"])
+SPAN_DURATION = Histogram("quicknovel_span_duration_seconds", "各阶段耗时", ["span"])
+DB_QUERIES = Counter("quicknovel_db_queries_total", "执行的 SQL 语句数量", ["route"])
+DB_QUERY_DURATION = Counter("quicknovel_db_query_seconds_total", "执行 SQL 语句的总耗时", ["route"])
+LLM_PROMPT_TOKENS = Counter("quicknovel_llm_prompt_tokens_total", "发送给模型的 prompt token 数量")
+LLM_COMPLETION_TOKENS = Counter("quicknovel_llm_completion_tokens_total", "模型输出的 token 数量")
+QUERY_BUDGET_EXCEEDED = Counter("quicknovel_query_budget_exceeded_total", "SQL 数量或耗时超出预算的请求数量", ["route"])
+LLM_FIRST_TOKEN = Histogram("quicknovel_llm_time_to_first_token_seconds", "模型首个 token 的等待时间")
+
+
+class Span:
+
+    def __init__(self, name: str, parent: Optional["Span"], trace: "RequestTrace"):
+        self.name = name
+        self.parent = parent
+        self.trace = trace
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attributes: Dict[str, Any] = {}
+        self._query_count_start = trace.query_count
+        self._query_time_start = trace.query_time
+        self.query_count = 0
+        self.query_time = 0.0
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def finish(self):
+        self.end = time.perf_counter()
+        self.query_count = self.trace.query_count - self._query_count_start
+        self.query_time = self.trace.query_time - self._query_time_start
+        SPAN_DURATION.observe(self.duration, span=self.name)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "parent": self.parent.name if self.parent else None,
+            "offset_ms": round((self.start - self.trace.start) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "query_count": self.query_count,
+            "query_ms": round(self.query_time * 1000, 3),
+            **self.attributes,
+        }
+
+
+class RequestTrace:
+    """
+    单个请求的链路信息，记录各阶段的耗时、SQL 数量以及 token 数量
+    """
+
+    def __init__(self, method: str, path: str):
+        self.request_id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.route = path
+        self.status: Optional[int] = None
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.spans: List[Span] = []
+        self.query_count = 0
+        self.query_time = 0.0
+        # 批量写入等按数据条数执行 SQL 的请求额外允许的 SQL 数量
+        self.query_allowance = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add_query(self, duration: float):
+        with self._lock:
+            self.query_count += 1
+            self.query_time += duration
+
+    def add_tokens(self, prompt_tokens: int = 0, completion_tokens: int = 0):
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def add_span(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "duration_ms": round(self.duration * 1000, 3),
+            "query_count": self.query_count,
+            "query_ms": round(self.query_time * 1000, 3),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "spans": [span.to_dict() for span in sorted(self.spans, key=lambda s: s.start)],
+        }
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("quicknovel_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("quicknovel_span", default=None)
+
+
+def get_current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def get_current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_trace(method: str, path: str) -> RequestTrace:
+    trace = RequestTrace(method, path)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def finish_trace(trace: RequestTrace, status: int):
+    """
+    结束请求链路，写入指标并输出一条 JSON 日志
+    """
+    if trace.end is not None:
+        return
+    trace.end = time.perf_counter()
+    trace.status = status
+
+    REQUEST_DURATION.observe(trace.duration, method=trace.method, route=trace.route, status=status)
+    DB_QUERIES.inc(trace.query_count, route=trace.route)
+    DB_QUERY_DURATION.inc(trace.query_time, route=trace.route)
+
+    query_budget = AppConfig.REQUEST_QUERY_BUDGET + trace.query_allowance
+    if trace.query_count > query_budget or trace.query_time > AppConfig.REQUEST_QUERY_TIME_BUDGET:
+        QUERY_BUDGET_EXCEEDED.inc(route=trace.route)
+        logging.warning("请求 %s %s 执行了 %d 条 SQL，耗时 %.3f 秒，超出预算（%d 条，%.3f 秒），request_id: %s",
+                        trace.method, trace.path, trace.query_count, trace.query_time,
+                        query_budget, AppConfig.REQUEST_QUERY_TIME_BUDGET, trace.request_id)
+
+    trace_logging.info(json.dumps(trace.to_dict(), ensure_ascii=False))
+
+
+def record_query(duration: float):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_query(duration)
+
+
+def allow_queries(count: int):
+    """
+    当前请求额外允许执行 count 条 SQL，用于 SQL 数量随数据条数线性增长的批量请求
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.query_allowance += count
+
+
+def record_tokens(prompt_tokens: int = 0, completion_tokens: int = 0):
+    LLM_PROMPT_TOKENS.inc(prompt_tokens)
+    LLM_COMPLETION_TOKENS.inc(completion_tokens)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_tokens(prompt_tokens, completion_tokens)
+
+
+def record_first_token(seconds: float):
+    LLM_FIRST_TOKEN.observe(seconds)
+    span = _current_span.get()
+    if span is not None:
+        span.set("time_to_first_token_ms", round(seconds * 1000, 3))
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    记录一个阶段的耗时，没有请求链路时不做任何事
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    s = Span(name, _current_span.get(), trace)
+    s.attributes.update(attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    finally:
+        s.finish()
+        trace.add_span(s)
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # 异步生成器可能在其他上下文中被关闭，此时无需恢复
+            pass
+
+
+def traced(name: str = None):
+    """
+    为函数、协程或异步生成器记录阶段耗时的装饰器，默认使用函数的限定名作为阶段名
+    """
+
+    def decorator(func):
+        qualname = name or func.__qualname__
+
+        def span_name(args) -> str:
+            # db_session 等装饰器会丢失限定名，此时用实例的类名补全
+            if "." not in qualname and args and not name:
+                return f"{type(args[0]).__name__}.{qualname}"
+            return qualname
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_gen_wrapper(*args, **kwargs):
+                with span(span_name(args)):
+                    async for item in func(*args, **kwargs):
+                        yield item
+
+            return async_gen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name(args)):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name(args)):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
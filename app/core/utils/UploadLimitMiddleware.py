@@ -0,0 +1,41 @@
+import json
+
+from core.entity.ResponseEntity import error
+
+
+class UploadLimitMiddleware:
+    """
+    上传接口的请求体在进入接口前就会被完整解析到临时文件中，
+    这里根据 Content-Length 提前拒绝明显超出大小的请求，避免无谓地接收整个文件
+    """
+
+    def __init__(self, app, max_bytes: int, path_suffixes=("/avatar",), overhead: int = 64 * 1024):
+        self.app = app
+        self.max_bytes = max_bytes
+        # multipart 的边界和字段头会占用额外的字节
+        self.max_content_length = max_bytes + overhead
+        self.path_suffixes = tuple(path_suffixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"].endswith(self.path_suffixes):
+            content_length = dict(scope["headers"]).get(b"content-length")
+            if content_length is not None:
+                # Content-Length 只能是非负整数，格式错误的请求直接返回 400
+                if not content_length.strip().isdigit():
+                    await self.reject(send, 400, "请求头 Content-Length 格式错误")
+                    return
+                if int(content_length) > self.max_content_length:
+                    await self.reject(send, 413, f"文件大小超过限制，最大为{self.max_bytes // 1024}KB")
+                    return
+
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def reject(send, status: int, message: str):
+        body = json.dumps(error(code=status, message=message).model_dump(), ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,4 +1,4 @@
-import { baseURL } from '../axios/axios';
+import { baseURL, recordWriteAt, WRITE_AT_HEADER, writeAtHeaders } from '../axios/axios';
 import type { CreateConversationDto } from '../entity/ConversationEntity';
 
 const CONVERSATION_API_BASE_PATH = '/api/conversation';
@@ -14,10 +14,12 @@ export const createConversation = async (
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
-        'Accept': 'text/event-stream'
+        'Accept': 'text/event-stream',
+        ...writeAtHeaders()
       },
       body: JSON.stringify(conversation)
     });
+    recordWriteAt(response.headers.get(WRITE_AT_HEADER));
 
     if (!response.ok || !response.body) {
       throw new Error(`流式传输失败: ${response.statusText}`);
@@ -3,6 +3,23 @@ import { showNotify, showNotifyResp } from "../utils/notify";
 
 export const baseURL = import.meta.env.VITE_API_BASE_URL || "http://127.0.0.1:9000";
 
+// 后端配置了只读副本时，写请求的响应头返回写入时间，之后的请求原样带回，保证读到自己的写入。
+// 前端与接口不同源，不依赖 Cookie
+export const WRITE_AT_HEADER = "X-QuickNovel-Write-At";
+let lastWriteAt = 0;
+
+// 记录响应头中的写入时间，只保留最晚的一次
+export const recordWriteAt = (value: unknown) => {
+  const writeAt = Number(value);
+  if (writeAt > lastWriteAt) {
+    lastWriteAt = writeAt;
+  }
+};
+
+// 需要带回的请求头，还没有写入过时为空
+export const writeAtHeaders = (): Record<string, string> =>
+  lastWriteAt ? { [WRITE_AT_HEADER]: lastWriteAt.toFixed(6) } : {};
+
 // 创建 Axios 实例
 const instance = axios.create({
   baseURL: baseURL,
@@ -15,6 +32,9 @@ const instance = axios.create({
 // 请求拦截器
 instance.interceptors.request.use(
   (config) => {
+    for (const [name, value] of Object.entries(writeAtHeaders())) {
+      config.headers.set(name, value);
+    }
     return config;
   },
   (error) => {
@@ -30,6 +50,7 @@ instance.interceptors.request.use(
 // 响应拦截器
 instance.interceptors.response.use(
   (response) => {
+    recordWriteAt(response.headers[WRITE_AT_HEADER.toLowerCase()]);
     const res = response.data;
     // 根据 ResponseModel 结构处理
     if (res.code === 200) {
@@ -1,15 +1,18 @@
 interface Trait {
+  id?: number;
   label: string;
   description: string;
 }
 
 interface Speaking {
+  id?: number;
   role: string;
   content: string;
   reply: string;
 }
 
 interface Distinctive {
+  id?: number;
   name: string;
   content: string;
 }
@@ -24,6 +27,9 @@ export interface CharacterCard {
   trait?: Trait[];
   speak?: Speaking[];
   distinctive?: Distinctive[];
+
+  // 乐观锁版本号，更新时原样提交，角色已被他人修改时返回 409
+  version?: number;
 }
 
 export interface CreateCharacterDto {